@@ -7,16 +7,15 @@ Library Call Demonstrated:  mcculw.ul.a_in_scan() in Background mode with scan
                             mcculw.enums.ScanOptions.SCALEDATA
 
 Purpose:                    Scans a range of A/D Input Channels and stores
-                            the sample data in a file.
+                            the sample data in a binary scan recording
+                            (see mcculw.recorder).
 
 Demonstration:              Stores analog input values on up to four channels
                             in a file.
 
-Other Library Calls:        mcculw.ul.scaled_win_buf_alloc()
-                            mcculw.ul.scaled_win_buf_to_array()
-                            mcculw.ul.win_buf_free()
-                            mcculw.ul.get_status()
-                            mcculw.ul.stop_background()
+Other Library Calls:        mcculw.continuous_scan.ContinuousScan
+                            mcculw.continuous_scan.plan_buffer()
+                            mcculw.recorder.ScanRecorder.write_chunk()
                             mcculw.ul.release_daq_device()
 
 Special Requirements:       Device must have an A/D converter.
@@ -24,15 +23,16 @@ Special Requirements:       Device must have an A/D converter.
 """
 from __future__ import absolute_import, division, print_function
 
-from ctypes import c_double, cast, POINTER, addressof, sizeof
-from time import sleep
-
 from mcculw import ul
-from mcculw.enums import ScanOptions, FunctionType, Status
+from mcculw.enums import ScanOptions
 from mcculw.device_info import DaqDeviceInfo
+from mcculw.continuous_scan import ContinuousScan, plan_buffer
+from mcculw.recorder import ScanRecorder
+import logging
+import numpy as np
 
 try:
-    from tdy_utils.utils_daq import configure_devices, squareWave
+    from tdy_utils.utils_daq import configure_devices
 except ImportError:
     from .tdy_utils.utils_daq import configure_devices
 
@@ -45,8 +45,7 @@ def run_example():
     use_device_detection = True
     dev_id_list = []
     rate = 100
-    file_name = 'scan_data.csv'
-    memhandle = None
+    file_name = 'scan_data.mccol'
 
     # The size of the UL buffer to create, in seconds
     buffer_size_seconds = 1
@@ -65,167 +64,63 @@ def run_example():
         num_chans = high_chan - low_chan + 1
 
         # Create a circular buffer that can hold buffer_size_seconds worth of
-        # data, or at least 10 points (this may need to be adjusted to prevent
-        # a buffer overrun)
+        # data, or at least 10 points, and write 1/10 of it at a time.
+        # plan_buffer rounds both to whole packets, which some hardware
+        # requires.
         points_per_channel = max(rate * buffer_size_seconds, 10)
-
-        # Some hardware requires that the total_count is an integer multiple
-        # of the packet size. For this case, calculate a points_per_channel
-        # that is equal to or just above the points_per_channel selected
-        # which matches that requirement.
-        if ai_info.packet_size != 1:
-            packet_size = ai_info.packet_size
-            remainder = points_per_channel % packet_size
-            if remainder != 0:
-                points_per_channel += packet_size - remainder
-
-        ul_buffer_count = points_per_channel * num_chans
+        write_chunk_size, ul_buffer_count = plan_buffer(
+            rate, num_chans, chunk_size=max(points_per_channel // 10, 1),
+            packet_size=ai_info.packet_size)
+        ul_buffer_count = max(ul_buffer_count,
+                              points_per_channel * num_chans)
+        ul_buffer_count += -ul_buffer_count % (write_chunk_size * num_chans)
 
         # Write the UL buffer to the file num_buffers_to_write times.
         points_to_write = ul_buffer_count * num_buffers_to_write
 
-        # When handling the buffer, we will read 1/10 of the buffer at a time
-        write_chunk_size = int(ul_buffer_count / 10)
-
         ai_range = ai_info.supported_ranges[0]
 
-        scan_options = (ScanOptions.BACKGROUND | ScanOptions.CONTINUOUS |
-                        ScanOptions.SCALEDATA)
-
-        memhandle = ul.scaled_win_buf_alloc(ul_buffer_count)
-
-        # Allocate an array of doubles temporary storage of the data
-        write_chunk_array = (c_double * write_chunk_size)()
-
-        # Check if the buffer was successfully allocated
-        if not memhandle:
-            raise Exception('Failed to allocate memory')
-
-        # Start the scan
-        ul.a_in_scan(
-            devices['USB-202'], low_chan, high_chan, ul_buffer_count,
-            rate, ai_range, memhandle, scan_options)
-
-        status = Status.IDLE
-        # Wait for the scan to start fully
-        while status == Status.IDLE:
-            status, _, _ = ul.get_status(devices['USB-202'], FunctionType.AIFUNCTION)
-
-        # Create a file for storing the data
-        with open(file_name, 'w') as f:
-            print('Writing data to ' + file_name, end='')
-
-            # Write a header to the file
-            for chan_num in range(low_chan, high_chan + 1):
-                f.write('Channel ' + str(chan_num) + ',')
-            f.write(u'\n')
-
-            # Start the write loop
-            prev_count = 0
-            prev_index = 0
-            write_ch_num = low_chan
-            while status != Status.IDLE:
-                # Get the latest counts
-                status, curr_count, _ = ul.get_status(devices['USB-202'],
-                                                      FunctionType.AIFUNCTION)
-
-                new_data_count = curr_count - prev_count
-
-                # Check for a buffer overrun before copying the data, so
-                # that no attempts are made to copy more than a full buffer
-                # of data
-                if new_data_count > ul_buffer_count:
-                    # Print an error and stop writing
-                    ul.stop_background(devices['USB-202'], FunctionType.AIFUNCTION)
-                    print('A buffer overrun occurred')
+        # Start the scan. The ContinuousScan drains the UL buffer on a
+        # background thread, so writing to the file never delays it. It
+        # issues an OverrunWarning if the buffer gets close to an overrun.
+        scan = ContinuousScan(devices['USB-202'], low_chan, high_chan, rate,
+                              ai_range, ScanOptions.SCALEDATA,
+                              chunk_size=write_chunk_size,
+                              buffer_count=ul_buffer_count,
+                              packet_size=ai_info.packet_size)
+
+        # Stream the data to the columnar file as float32, which
+        # mcculw.recorder.ColumnarRecording can memory-map and read any time
+        # window of. Use a file name ending in .npy to get a NumPy file.
+        print('Writing data to ' + file_name, end='')
+        with scan, ScanRecorder(file_name, low_chan, high_chan, ai_range,
+                                scan.rate,
+                                resolution=ai_info.resolution,
+                                storage_dtype=np.float32) as recorder:
+            for chunk in scan:
+                recorder.write_chunk(chunk)
+                print('.', end='')
+                if chunk.first_sample + chunk.data.size >= points_to_write:
                     break
 
-                # Check if a chunk is available
-                if new_data_count > write_chunk_size:
-                    wrote_chunk = True
-                    # Copy the current data to a new array
-
-                    # Check if the data wraps around the end of the UL
-                    # buffer. Multiple copy operations will be required.
-                    if prev_index + write_chunk_size > ul_buffer_count - 1:
-                        first_chunk_size = ul_buffer_count - prev_index
-                        second_chunk_size = (
-                            write_chunk_size - first_chunk_size)
-
-                        # Copy the first chunk of data to the
-                        # write_chunk_array
-                        ul.scaled_win_buf_to_array(
-                            memhandle, write_chunk_array, prev_index,
-                            first_chunk_size)
-
-                        # Create a pointer to the location in
-                        # write_chunk_array where we want to copy the
-                        # remaining data
-                        second_chunk_pointer = cast(addressof(write_chunk_array)
-                                                    + first_chunk_size
-                                                    * sizeof(c_double),
-                                                    POINTER(c_double))
-
-                        # Copy the second chunk of data to the
-                        # write_chunk_array
-                        ul.scaled_win_buf_to_array(
-                            memhandle, second_chunk_pointer,
-                            0, second_chunk_size)
-                    else:
-                        # Copy the data to the write_chunk_array
-                        ul.scaled_win_buf_to_array(
-                            memhandle, write_chunk_array, prev_index,
-                            write_chunk_size)
-
-                    # Check for a buffer overrun just after copying the data
-                    # from the UL buffer. This will ensure that the data was
-                    # not overwritten in the UL buffer before the copy was
-                    # completed. This should be done before writing to the
-                    # file, so that corrupt data does not end up in it.
-                    status, curr_count, _ = ul.get_status(
-                        devices['USB-202'], FunctionType.AIFUNCTION)
-                    if curr_count - prev_count > ul_buffer_count:
-                        # Print an error and stop writing
-                        ul.stop_background(devices['USB-202'], FunctionType.AIFUNCTION)
-                        print('A buffer overrun occurred')
-                        break
-
-                    for i in range(write_chunk_size):
-                        f.write(str(write_chunk_array[i]) + ',')
-                        write_ch_num += 1
-                        if write_ch_num == high_chan + 1:
-                            write_ch_num = low_chan
-                            f.write(u'\n')
-                else:
-                    wrote_chunk = False
-
-                if wrote_chunk:
-                    # Increment prev_count by the chunk size
-                    prev_count += write_chunk_size
-                    # Increment prev_index by the chunk size
-                    prev_index += write_chunk_size
-                    # Wrap prev_index to the size of the UL buffer
-                    prev_index %= ul_buffer_count
-
-                    if prev_count >= points_to_write:
-                        break
-                    print('.', end='')
-                else:
-                    # Wait a short amount of time for more data to be
-                    # acquired.
-                    sleep(0.1)
-
-        ul.stop_background(devices['USB-202'], FunctionType.AIFUNCTION)
+        telemetry = scan.telemetry()
+        print('\nThe UL buffer of {} samples filled to {:.0%} at most'.format(
+            telemetry.buffer_count, telemetry.fill))
+        if scan.overruns:
+            print('{} buffer overruns occurred, {} samples were lost'.format(
+                scan.overruns, scan.lost_samples))
+        if scan.overruns or telemetry.near_overruns:
+            print('Use a buffer_count of at least {} next time'.format(
+                scan.suggested_buffer_count()))
     except Exception as e:
         print('\n', e)
     finally:
         print('Done')
-        if memhandle:
-            # Free the buffer in a finally block to prevent  a memory leak.
-            ul.win_buf_free(memhandle)
         if use_device_detection:
             ul.release_daq_device(devices['USB-202'])
 
 
 if __name__ == '__main__':
+    # Show the board numbers assigned by configure_devices
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     run_example()
@@ -0,0 +1,173 @@
+"""
+Per-call overhead benchmark for the polled wrappers of mcculw.ul.
+
+The UL entry points are replaced by a C function that does nothing, with the
+same prototypes, so that the timings do not depend on the hardware (or on the
+simulator) but still include the marshalling of the ctypes arguments. For
+each wrapper, three timings are taken:
+
+- "raw": the entry point called directly with preallocated arguments, which
+  is the floor any wrapper pays;
+- "allocating": the wrapper as it was written before, allocating new ctypes
+  objects (and converting lists to ctypes arrays) on every call;
+- "current": the wrapper in mcculw.ul, which reuses per-thread ctypes values
+  and passes preconverted arrays through.
+
+The overhead columns subtract "raw", leaving the cost of the Python wrapper
+itself; each is the median of the differences measured in the same rounds.
+
+Usage:
+    python benchmarks/call_overhead.py [--number N] [--repeat N]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+from ctypes import byref, c_float, c_int, c_long, c_short, c_ulong, c_ushort, pythonapi
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from mcculw import ul  # noqa: E402
+from mcculw.enums import (ChannelType, DigitalPortType, FunctionType,  # noqa: E402
+                          Status, ULRange)
+
+
+def allocating_a_in(board_num, channel, ul_range):
+    data_value = c_ushort()
+    ul._check_err(ul._cbw.cbAIn(board_num, channel, ul_range, byref(data_value)))
+    return data_value.value
+
+
+def allocating_v_in(board_num, channel, ul_range, options=0):
+    data_value = c_float()
+    ul._check_err(ul._cbw.cbVIn(board_num, channel, ul_range, byref(data_value), options))
+    return data_value.value
+
+
+def allocating_c_in_32(board_num, counter_num):
+    count = c_ulong()
+    ul._check_err(ul._cbw.cbCIn32(board_num, counter_num, byref(count)))
+    return count.value
+
+
+def allocating_d_in(board_num, port_type):
+    data_value = c_ushort()
+    ul._check_err(ul._cbw.cbDIn(board_num, port_type, byref(data_value)))
+    return data_value.value
+
+
+def allocating_get_status(board_num, function_type):
+    status = c_short()
+    cur_count = c_long()
+    cur_index = c_long()
+    ul._check_err(ul._cbw.cbGetIOStatus(
+        board_num, byref(status), byref(cur_count), byref(cur_index), function_type))
+    return ul.StatusResult(Status(status.value), cur_count.value, cur_index.value)
+
+
+STUBBED = ['cbAIn', 'cbVIn', 'cbCIn32', 'cbDIn', 'cbGetIOStatus']
+
+
+def install_stubs():
+    # Replaces the entry points with a C function that returns 0 (no error)
+    # and ignores its arguments: PyErr_Occurred of the Python C API, which
+    # returns NULL as long as no Python exception is set
+    for name in STUBBED:
+        stub = pythonapi['PyErr_Occurred']
+        stub.argtypes = getattr(ul._cbw, name).argtypes
+        stub.restype = c_int
+        ul._cbw.__dict__[name] = stub
+
+
+def cases(board_num):
+    r = ULRange.BIP10VOLTS
+    aifunction = FunctionType.AIFUNCTION
+    port = DigitalPortType.AUXPORT
+    value_s, value_us, value_f = c_short(), c_ushort(), c_float()
+    value_l, value_l2, value_ul = c_long(), c_long(), c_ulong()
+    cbw = ul._cbw
+    chans = list(range(16))
+    types = [ChannelType.ANALOG] * 16
+    chans_ctypes = (c_short * 16)(*chans)
+    types_ctypes = (c_short * 16)(*types)
+    chans_ndarray = np.array(chans, np.int16)
+    types_ndarray = np.array(types, np.int16)
+    return [
+        ('a_in',
+         lambda: cbw.cbAIn(board_num, 0, r, byref(value_us)),
+         lambda: allocating_a_in(board_num, 0, r),
+         lambda: ul.a_in(board_num, 0, r)),
+        ('v_in',
+         lambda: cbw.cbVIn(board_num, 0, r, byref(value_f), 0),
+         lambda: allocating_v_in(board_num, 0, r),
+         lambda: ul.v_in(board_num, 0, r)),
+        ('c_in_32',
+         lambda: cbw.cbCIn32(board_num, 0, byref(value_ul)),
+         lambda: allocating_c_in_32(board_num, 0),
+         lambda: ul.c_in_32(board_num, 0)),
+        ('d_in',
+         lambda: cbw.cbDIn(board_num, port, byref(value_us)),
+         lambda: allocating_d_in(board_num, port),
+         lambda: ul.d_in(board_num, port)),
+        ('get_status',
+         lambda: cbw.cbGetIOStatus(board_num, byref(value_s), byref(value_l),
+                                   byref(value_l2), aifunction),
+         lambda: allocating_get_status(board_num, aifunction),
+         lambda: ul.get_status(board_num, aifunction)),
+        # Conversion of the channel lists alone, as done by daq_in_scan and
+        # get_tc_values on every call; "current" passes arrays converted once
+        ('lists (16), ctypes',
+         lambda: None,
+         lambda: (ul._to_ctypes_array(chans, c_short), ul._to_ctypes_array(types, c_short)),
+         lambda: (ul._to_ctypes_array(chans_ctypes, c_short),
+                  ul._to_ctypes_array(types_ctypes, c_short))),
+        ('lists (16), ndarray',
+         lambda: None,
+         lambda: (ul._to_ctypes_array(chans, c_short), ul._to_ctypes_array(types, c_short)),
+         lambda: (ul._to_ctypes_array(chans_ndarray, c_short),
+                  ul._to_ctypes_array(types_ndarray, c_short))),
+    ]
+
+
+def overheads(raw, functions, number, repeat):
+    # The time per call of raw, and the median over the rounds of the time per
+    # call of each function minus that of raw in the same round, in ns. The
+    # functions are timed in turn in each round, so that each difference is
+    # taken under the same machine conditions: the overhead of a wrapper is a
+    # few hundred ns on top of a raw call that varies by more than that from
+    # one round to the next, so the difference of two separate minimums is
+    # mostly noise.
+    raw_times = []
+    differences = [[] for _ in functions]
+    for _ in range(repeat):
+        raw_time = timeit.timeit(raw, number=number)
+        raw_times.append(raw_time)
+        for index, function in enumerate(functions):
+            differences[index].append(timeit.timeit(function, number=number) - raw_time)
+    return [min(raw_times) / number * 1e9] + [
+        float(np.median(d)) / number * 1e9 for d in differences]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=10000,
+                        help='calls per timing (default: 10000)')
+    parser.add_argument('--repeat', type=int, default=31,
+                        help='timings per case, the median overhead is kept (default: 31)')
+    args = parser.parse_args()
+
+    install_stubs()
+    board_num = 0
+    print('{:<20}{:>10}{:>16}{:>16}{:>10}'.format(
+        'wrapper', 'raw ns', 'allocating +ns', 'current +ns', 'saved'))
+    for name, raw, allocating, current in cases(board_num):
+        raw_ns, before, after = overheads(raw, [allocating, current], args.number, args.repeat)
+        print('{:<20}{:>10.0f}{:>16.0f}{:>16.0f}{:>9.0%}'.format(
+            name, raw_ns, before, after, 1 - after / before if before > 0 else 0))
+
+
+if __name__ == '__main__':
+    main()
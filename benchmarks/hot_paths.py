@@ -0,0 +1,373 @@
+"""
+Benchmarks of the acquisition and waveform hot paths, run against the simulator.
+
+Cases:
+
+- waveform: filling an AO buffer with tdy_utils.utils_daq.waveform, and
+  generating segments with mcculw.waveforms.WaveformSynth;
+- drain: a ContinuousScan at the maximum rate of the simulated USB-202, with
+  the delay from the end of each chunk to its publication as the latency and
+  the rate at which chunks are copied out of the UL buffer as the throughput;
+- record: writing chunks with ScanRecorder to each file format, to CSV as the
+  example scripts used to, and converting CSV files with convert_csv;
+- get_status: the call overhead of ul.get_status;
+- conversion: ul.to_eng_units/ul.from_eng_units and their array versions;
+- device info: DaqDeviceInfo construction and device enumeration.
+
+Each case reports percentiles of the latency of one iteration, and the
+throughput in items (samples, values or calls) per second. With --history,
+the results of the run are appended to a JSON lines file, together with the
+commit, and compared with the median of the previous runs on the same
+backend; with --check, the script exits with status 1 if the median latency
+of any case regressed by more than --tolerance.
+
+Usage:
+    python benchmarks/hot_paths.py [-k SUBSTRING] [--min-time S]
+                                   [--history PATH [--check] [--tolerance F]]
+
+The simulated backend is used unless MCCULW_BACKEND is set, so the suite runs
+headless on any platform.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _REPO_ROOT)
+os.environ.setdefault('MCCULW_BACKEND', 'sim')
+
+import numpy as np  # noqa: E402
+
+from mcculw import ul, waveforms  # noqa: E402
+from mcculw.continuous_scan import ContinuousScan  # noqa: E402
+from mcculw.device_info import DaqDeviceInfo  # noqa: E402
+from mcculw.enums import FunctionType, InterfaceType, ScanOptions  # noqa: E402
+from mcculw.recorder import ScanRecorder, convert_csv  # noqa: E402
+from tdy_utils import utils_daq  # noqa: E402
+
+CASES = []
+
+# Number of baseline runs the results are compared with
+BASELINE_RUNS = 5
+
+
+def case(name, unit):
+    """Registers a benchmark. The decorated generator function receives the Boards and a
+    working directory, sets up, and yields (function, items): function is timed repeatedly and
+    processes items units per call. Code after the yield tears down.
+
+    A generator can instead yield a Result it measured itself."""
+    def register(function):
+        CASES.append((name, unit, function))
+        return function
+    return register
+
+
+class Result(object):
+    """Latencies of the iterations of a case, in seconds, and its throughput in units/s."""
+    def __init__(self, latencies, throughput):
+        self.latencies = sorted(latencies)
+        self.throughput = throughput
+
+    def percentile(self, p):
+        values = self.latencies
+        return values[min(int(round(p / 100.0 * (len(values) - 1))), len(values) - 1)]
+
+    def summary(self):
+        return {'p50_us': self.percentile(50) * 1e6,
+                'p90_us': self.percentile(90) * 1e6,
+                'p99_us': self.percentile(99) * 1e6,
+                'throughput': self.throughput,
+                'rounds': len(self.latencies)}
+
+
+def time_calls(function, items, min_time, min_rounds=20):
+    """Times calls of function until min_time has passed and min_rounds were timed. Calls
+    faster than about 20 microseconds are timed in batches, whose mean is one round."""
+    function()
+    start = time.perf_counter()
+    function()
+    batch = max(1, int(2e-5 / max(time.perf_counter() - start, 1e-9)))
+    latencies = []
+    deadline = time.perf_counter() + min_time
+    while len(latencies) < min_rounds or time.perf_counter() < deadline:
+        start = time.perf_counter()
+        for _ in range(batch):
+            function()
+        latencies.append((time.perf_counter() - start) / batch)
+    return Result(latencies, items / statistics.mean(latencies))
+
+
+class Boards(object):
+    """The simulated devices, created once for all the cases."""
+    def __init__(self):
+        ul.ignore_instacal()
+        self.ai = self.ao = None
+        for board_num, descriptor in enumerate(
+                ul.get_daq_device_inventory(InterfaceType.ANY)):
+            ul.create_daq_device(board_num, descriptor)
+            info = DaqDeviceInfo(board_num)
+            if self.ai is None and info.supports_analog_input:
+                self.ai = info
+            if self.ao is None and info.supports_analog_output:
+                self.ao = info
+        if self.ai is None or self.ao is None:
+            sys.exit('The benchmarks need a device with analog input and one with analog output')
+
+
+# Waveforms
+
+@case('waveform sine 100k', 'samples')
+def bench_waveform(boards, workdir):
+    info = DaqDeviceInfo(boards.ao.board_num, cached=True)
+    buffer = np.empty(100000, np.uint16)
+    yield (lambda: utils_daq.waveform('sine', info, buffer, 1, len(buffer), 1.0, 100),
+           len(buffer))
+
+
+@case('waveform new frequency', 'samples')
+def bench_waveform_cold(boards, workdir):
+    # Every call misses the table caches
+    info = DaqDeviceInfo(boards.ao.board_num, cached=True)
+    buffer = np.empty(100000, np.uint16)
+    frequencies = iter(range(1, 1 << 30))
+
+    def fill():
+        utils_daq.waveform('sine', info, buffer, 1, len(buffer), 1.0, next(frequencies))
+    yield fill, len(buffer)
+
+
+@case('WaveformSynth 4096', 'samples')
+def bench_synth(boards, workdir):
+    ao_info = boards.ao.get_ao_info()
+    synth = waveforms.WaveformSynth(boards.ao.board_num, 100000, ao_info.supported_ranges[0],
+                                    ao_info.resolution)
+    out = np.empty(4096, synth.dtype)
+    yield lambda: synth.generate(len(out), 'triangle', 1234.5, 2.0, out=out), len(out)
+
+
+# Buffer drain
+
+@case('drain 100 kS/s', 'samples')
+def bench_drain(boards, workdir):
+    ai_info = boards.ai.get_ai_info()
+    rate = 100000
+    scan = ContinuousScan(boards.ai.board_num, 0, 0, rate, ai_info.supported_ranges[0],
+                          ScanOptions.SCALEDATA, chunk_size=1000)
+    latencies = []
+    with scan:
+        deadline = time.monotonic() + 2.0
+        for chunk in scan:
+            # When the last sample of the chunk was acquired
+            end = scan.start_time + (chunk.first_scan + len(chunk.data)) / float(scan.rate)
+            latencies.append(max(chunk.timestamp - end, 0.0))
+            if chunk.timestamp > deadline:
+                break
+    yield Result(latencies, scan.telemetry().drain_rate or 0.0)
+
+
+# Recording
+
+def _chunks(num_chans, chunk_scans):
+    data = np.random.default_rng(0).normal(0, 1, (chunk_scans, num_chans))
+    return data.reshape(-1)
+
+
+def _bench_recorder(boards, workdir, file_name, **kwargs):
+    block = _chunks(4, 4096)
+    recorder = ScanRecorder(os.path.join(workdir, file_name), 0, 3,
+                            boards.ai.get_ai_info().supported_ranges[0], 100000, **kwargs)
+    with recorder:
+        yield lambda: recorder.write(block), block.size
+
+
+@case('record container', 'samples')
+def bench_record_container(boards, workdir):
+    yield from _bench_recorder(boards, workdir, 'bench.mcscan')
+
+
+@case('record npy', 'samples')
+def bench_record_npy(boards, workdir):
+    yield from _bench_recorder(boards, workdir, 'bench.npy')
+
+
+@case('record mccol float32', 'samples')
+def bench_record_columnar(boards, workdir):
+    yield from _bench_recorder(boards, workdir, 'bench.mccol', storage_dtype=np.float32)
+
+
+@case('record csv', 'samples')
+def bench_record_csv(boards, workdir):
+    block = _chunks(4, 4096).reshape(-1, 4)
+    with open(os.path.join(workdir, 'bench.csv'), 'w') as f:
+        f.write('Channel 0,Channel 1,Channel 2,Channel 3\n')
+        yield lambda: np.savetxt(f, block, fmt='%.6f', delimiter=','), block.size
+
+
+@case('convert_csv 100k scans', 'samples')
+def bench_convert_csv(boards, workdir):
+    csv_path = os.path.join(workdir, 'convert.csv')
+    block = _chunks(4, 100000).reshape(-1, 4)
+    np.savetxt(csv_path, block, fmt='%.6f', delimiter=',',
+               header='Channel 0,Channel 1,Channel 2,Channel 3', comments='')
+    yield lambda: convert_csv(csv_path, rate=100000), block.size
+
+
+# UL call overhead
+
+@case('get_status', 'calls')
+def bench_get_status(boards, workdir):
+    board_num = boards.ai.board_num
+    yield lambda: ul.get_status(board_num, FunctionType.AIFUNCTION), 1
+
+
+@case('to_eng_units', 'values')
+def bench_to_eng_units(boards, workdir):
+    board_num = boards.ai.board_num
+    ul_range = boards.ai.get_ai_info().supported_ranges[0]
+    yield lambda: ul.to_eng_units(board_num, ul_range, 2048), 1
+
+
+@case('from_eng_units', 'values')
+def bench_from_eng_units(boards, workdir):
+    board_num = boards.ao.board_num
+    ul_range = boards.ao.get_ao_info().supported_ranges[0]
+    yield lambda: ul.from_eng_units(board_num, ul_range, 1.25), 1
+
+
+@case('to_eng_units_array 100k', 'values')
+def bench_to_eng_units_array(boards, workdir):
+    ai_info = boards.ai.get_ai_info()
+    counts = np.arange(100000) % (1 << ai_info.resolution)
+    yield (lambda: ul.to_eng_units_array(boards.ai.board_num, ai_info.supported_ranges[0],
+                                         counts, ai_info.resolution), len(counts))
+
+
+@case('from_eng_units_array 100k', 'values')
+def bench_from_eng_units_array(boards, workdir):
+    ao_info = boards.ao.get_ao_info()
+    volts = np.linspace(-5, 5, 100000)
+    yield (lambda: ul.from_eng_units_array(boards.ao.board_num, ao_info.supported_ranges[0],
+                                           volts, ao_info.resolution), len(volts))
+
+
+# Device information
+
+@case('DaqDeviceInfo', 'calls')
+def bench_device_info(boards, workdir):
+    board_num = boards.ai.board_num
+
+    def construct():
+        info = DaqDeviceInfo(board_num)
+        return info.product_name, info.get_ai_info().supported_ranges
+    yield construct, 1
+
+
+@case('get_daq_device_inventory', 'calls')
+def bench_inventory(boards, workdir):
+    yield lambda: ul.get_daq_device_inventory(InterfaceType.ANY), 1
+
+
+# Running and history
+
+def run_case(function, boards, workdir, min_time):
+    steps = function(boards, workdir)
+    try:
+        timed = next(steps)
+        if isinstance(timed, Result):
+            return timed
+        return time_calls(timed[0], timed[1], min_time)
+    finally:
+        steps.close()
+
+
+def current_commit():
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                         cwd=_REPO_ROOT, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode().strip()
+
+
+def read_history(path, backend):
+    runs = []
+    with contextlib.suppress(IOError):
+        with open(path) as f:
+            for line in f:
+                run = json.loads(line)
+                if run.get('backend') == backend:
+                    runs.append(run)
+    return runs
+
+
+def baseline(runs, name):
+    """The median p50 latency of the case over the last BASELINE_RUNS runs that have it."""
+    values = [run['results'][name]['p50_us'] for run in runs if name in run['results']]
+    values = values[-BASELINE_RUNS:]
+    return statistics.median(values) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-k', dest='select', default='',
+                        help='only run the cases whose name contains this substring')
+    parser.add_argument('--min-time', type=float, default=0.5,
+                        help='seconds spent timing each case (default: 0.5)')
+    parser.add_argument('--history', help='JSON lines file to compare with and append to')
+    parser.add_argument('--check', action='store_true',
+                        help='exit with status 1 on a regression (requires --history)')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed increase of the median latency (default: 0.25)')
+    args = parser.parse_args()
+
+    backend = type(ul.get_backend()).__name__
+    history = read_history(args.history, backend) if args.history else []
+    boards = Boards()
+    workdir = tempfile.mkdtemp(prefix='mcculw-bench-')
+    results = {}
+    regressions = []
+    print('backend: {}'.format(backend))
+    print('{:<28}{:>11}{:>11}{:>11}{:>21}{:>10}'.format(
+        'case', 'p50 us', 'p90 us', 'p99 us', 'throughput /s', 'vs base'))
+    try:
+        for name, unit, function in CASES:
+            if args.select not in name:
+                continue
+            summary = run_case(function, boards, workdir, args.min_time).summary()
+            summary['unit'] = unit
+            results[name] = summary
+            base = baseline(history, name)
+            ratio = summary['p50_us'] / base if base else None
+            if ratio is not None and ratio > 1 + args.tolerance:
+                regressions.append(name)
+            print('{:<28}{:>11.1f}{:>11.1f}{:>11.1f}{:>12.3g} {:<8}{:>10}'.format(
+                name, summary['p50_us'], summary['p90_us'], summary['p99_us'],
+                summary['throughput'], unit, '' if ratio is None else '{:.2f}x'.format(ratio)))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.history:
+        run = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': current_commit(),
+               'backend': backend, 'python': platform.python_version(),
+               'machine': platform.machine(), 'results': results}
+        with open(args.history, 'a') as f:
+            f.write(json.dumps(run) + '\n')
+    if regressions:
+        print('Slower than the baseline by more than {:.0%}: {}'.format(
+            args.tolerance, ', '.join(regressions)))
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Cold-start benchmark for importing mcculw.ul.
+
+Each case runs in a fresh interpreter, so that nothing is cached between
+runs, and times one phase of the start of a tool after the untimed setup of
+the phases before it:
+
+- "import": importing mcculw.ul, which no longer loads the backend;
+- "backend load": loading the UL DLL (or the simulator, and NumPy with it);
+- "bind every prototype": resolving every declared function and setting its
+  prototype, which the module used to do at import time along with the
+  backend load;
+- "first calls": the three calls a short-lived tool typically makes, which
+  bind only their own prototypes;
+- "eager import (baseline)": the import, backend load and binding of every
+  prototype timed together, which is what importing the module used to cost.
+
+The module used to pay "backend load" and "bind every prototype" at import.
+A tool that never calls the library (or only imports the enums) now saves
+both. A tool that does call it still loads the backend on the first call, so
+it only saves the binding of the prototypes it never uses: the "bind every
+prototype" phase, minus the little binding its own calls do.
+
+Usage:
+    python benchmarks/import_time.py [--runs N]
+
+On platforms other than Windows (or with MCCULW_BACKEND=sim) the simulated
+backend is measured instead of the UL DLL.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_TIMED = '''
+{setup}
+import time
+start = time.perf_counter()
+{body}
+print(time.perf_counter() - start)
+'''
+
+_IMPORT = 'from mcculw import ul'
+_LOAD = _IMPORT + '\nul._cbw._load()'
+_BIND_ALL = '''for name in [n for n in vars(ul._cbw) if not n.startswith('_')]:
+    ul._cbw._resolve(name)'''
+
+# (name, untimed setup, timed body)
+CASES = [
+    ('import', '', _IMPORT),
+    ('backend load', _IMPORT, 'ul._cbw._load()'),
+    ('bind every prototype', _LOAD, _BIND_ALL),
+    ('first calls', _LOAD + '\nfrom mcculw.enums import ErrorCode', '''ul.get_err_msg(ErrorCode.NOERRORS)
+ul.get_board_name(0)
+try:
+    ul.get_config(2, 0, 0, 1)
+except ul.ULError:
+    pass'''),
+    ('import DaqDeviceInfo', '', 'from mcculw.device_info import DaqDeviceInfo'),
+    ('eager import (baseline)', '', _LOAD + '\n' + _BIND_ALL),
+]
+
+
+def time_case(setup, body, runs):
+    code = _TIMED.format(setup=setup, body=body)
+    env = dict(os.environ, PYTHONPATH=_REPO_ROOT)
+    samples = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', code], env=env,
+                                         cwd=_REPO_ROOT)
+        samples.append(float(output.decode().strip().splitlines()[-1]) * 1e3)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=15,
+                        help='fresh interpreters per case (default: 15)')
+    args = parser.parse_args()
+
+    print('{:<28}{:>10}{:>10}{:>10}'.format('case', 'min ms', 'median ms', 'max ms'))
+    medians = {}
+    for name, setup, body in CASES:
+        samples = time_case(setup, body, args.runs)
+        medians[name] = statistics.median(samples)
+        print('{:<28}{:>10.2f}{:>10.2f}{:>10.2f}'.format(
+            name, min(samples), medians[name], max(samples)))
+    print()
+    print('Saved at import, for a tool that never calls the library: {:.2f} ms'.format(
+        medians['eager import (baseline)'] - medians['import']))
+    print('Saved for a tool that calls the library: under {:.2f} ms'.format(
+        medians['bind every prototype']))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,103 +4,108 @@
 '''
 from mcculw import ul
 from mcculw.device_info import DaqDeviceInfo
-from mcculw.enums import ScanOptions, FunctionType, Status, ULRange
-from typing import List
+from mcculw import waveforms
+from mcculw.waveform_output import WaveformOutput
+from mcculw.continuous_scan import ContinuousScan
+from mcculw.sweep import Sweep, SettleCriterion, AdaptiveSteps
+import logging
 import numpy as np
-from time import sleep
-from ctypes import cast, POINTER, c_ushort
 try:
-    from tdy_utils.utils_daq import configure_devices, waveform
+    from tdy_utils.utils_daq import configure_devices
 except ImportError:
     from .tdy_utils.utils_daq import configure_devices
 
 def main():
-    
+
     devices = configure_devices()
     print(devices)
 
-    # usb_202 = DaqDeviceInfo(devices['USB-202'])
-    usb_3101fs = DaqDeviceInfo(devices['USB-3101FS'])
+    usb_202 = DaqDeviceInfo(devices['USB-202'], cached=True)
+    usb_202_ai_info = usb_202.get_ai_info()
+    usb_3101fs = DaqDeviceInfo(devices['USB-3101FS'], cached=True)
     usb_3101fs_ao_info = usb_3101fs.get_ao_info()
     usb_3101fs_range = usb_3101fs_ao_info.supported_ranges[0]
 
-    
-    ### Device 3101fs parameters ###
-    LOW_CHAN = 0
-    HIG_CHAN = 0 #min(3, ao_info.num_chans - 1)
-    NUM_CHAN = HIG_CHAN - LOW_CHAN + 1
 
-    AMPL = 1.0 # Voltage output is ratio of total analog output voltage
-    print(f"Voltage: {AMPL} V")
+    ### Device 3101fs parameters ###
+    CHANNEL = 0
     FREQ = 5_000 #Sample rate 100,000 -> FREQ = 10,000 gives 1 kHz somehow...
     SAMPLE_RATE = 100_000
-    DURATION = 1
-    NUM_SAMPLES = SAMPLE_RATE * DURATION
+    # The square wave table is built for SAMPLE_RATE, but the AO scan runs at
+    # FREQ samples per second, as it always has. Each period of the table
+    # (SAMPLE_RATE / FREQ samples) therefore lasts SAMPLE_RATE / FREQ**2 s:
+    # the excitation is FREQ**2 / SAMPLE_RATE = 250 Hz.
+    AO_RATE = FREQ
+    EXCITATION_FREQ = FREQ * FREQ / SAMPLE_RATE
+    #################################
+
+    ### Device 202 parameters ###
+    AI_CHANNEL = 0 # Intensity readback
+    AI_RATE = 10_000
+    #################################
+
+    ### Sweep parameters ###
+    START, STOP = 0, 2.625 # V
+    STEP = 0.025 # V, shrunk down to MIN_STEP around the breakdown knee
+    MIN_STEP, MAX_STEP = 0.00625, 0.1 # V
+    MAX_INTENSITY_CHANGE = 0.05 # Targeted intensity change per step (V)
+    SETTLE_WINDOW = 0.1 # sec
+    MAX_SLOPE = 0.05 # Settled once the intensity drifts less than this (V/s)
+    MAX_DWELL = 1 # sec, the longest a step is held
     #################################
 
-    memhandle = ul.win_buf_alloc(NUM_SAMPLES)
-    ao_buffer = cast(memhandle, POINTER(c_ushort))
-    
-    waveform(board_num=devices['USB-3101FS'], 
-               buffer=ao_buffer, 
-               ao_range=usb_3101fs_range,
-               amplitude=0.,
-               duration=DURATION,
-               frequency=FREQ,
-               num_samples=NUM_SAMPLES)
-    
-    # Start the scan
-    scan_options = (ScanOptions.BACKGROUND | ScanOptions.CONTINUOUS)
+    # One period of a bipolar square wave with an amplitude of 1 V. The
+    # output engine scales it to the amplitude of each step.
+    square = waveforms.period_table('square', FREQ, SAMPLE_RATE).samples
+
+    # Double-buffered output: only the half of the AO buffer that is not being
+    # output is rewritten, so steps change at a period boundary without
+    # tearing the waveform or stopping the scan
+    output = WaveformOutput(devices['USB-3101FS'], CHANNEL, AO_RATE,
+                            usb_3101fs_range, square,
+                            resolution=usb_3101fs_ao_info.resolution)
+
+    # Intensity readback
+    scan = ContinuousScan(devices['USB-202'], AI_CHANNEL, AI_CHANNEL, AI_RATE,
+                          usb_202_ai_info.supported_ranges[0])
+
+    # Each step moves on as soon as the intensity, averaged over whole periods
+    # of the square wave, stops drifting, or after MAX_DWELL. An amplitude
+    # change reaches the output within two buffer halves.
+    criterion = SettleCriterion(SETTLE_WINDOW, max_slope=MAX_SLOPE,
+                                average=max(int(round(AI_RATE / EXCITATION_FREQ)), 1))
+    sweep = Sweep(output.set_amplitude, scan, criterion, max_dwell=MAX_DWELL,
+                  dead_time=2 * output.half_size / AO_RATE)
+
+    def print_point(point):
+        settled = '' if point.settled else ' (not settled)'
+        print(f"Voltage: {point.voltage:.4} V | Intensity: {point.mean:.5f} V | "
+              f"Dwell: {point.dwell:.2f} s{settled}")
 
     try:
-        ul.a_out_scan(board_num=devices['USB-3101FS'], 
-                        low_chan=LOW_CHAN, 
-                        high_chan=HIG_CHAN, 
-                        num_points= NUM_SAMPLES, 
-                        rate=FREQ,#ULRange.NOTUSED, 
-                        ul_range=usb_3101fs_range, 
-                        memhandle=memhandle, 
-                        options=scan_options
-                    )
-        
-        bv_curve_voltage_steps = np.arange(0, 2.65, 0.025, dtype=float)
-        SLEEP_STEP = 1 # sec
-        print(f"\nStart: {bv_curve_voltage_steps[0]:.2f} V | Stop: {bv_curve_voltage_steps[-1]:.2f} V")
-
-        status = Status.RUNNING
-        while status != Status.IDLE:
-            for v_amplitude in bv_curve_voltage_steps:
-                print(f"Voltage: {v_amplitude:.4} V")
-                waveform(
-                    board_num=devices['USB-3101FS'], 
-                    buffer=ao_buffer, 
-                    ao_range=usb_3101fs_range,
-                    amplitude=v_amplitude,
-                    duration=DURATION,
-                    frequency=FREQ,
-                    num_samples=NUM_SAMPLES
-                )
-                sleep(SLEEP_STEP)
-
-            status, _, _ = ul.get_status(devices['USB-3101FS'], FunctionType.AOFUNCTION)
-            waveform(devices['USB-3101FS'], ao_buffer, usb_3101fs_range, amplitude=0., duration=DURATION, frequency=FREQ, num_samples=NUM_SAMPLES)
-            sleep(SLEEP_STEP)
-            status = Status.IDLE
-
-        print('')
+        print(f"\nStart: {START:.2f} V | Stop: {STOP:.2f} V")
+
+        scan.start()
+        output.start()
+
+        bv_curve = sweep.run(AdaptiveSteps(START, STOP, STEP, MIN_STEP, MAX_STEP,
+                                           MAX_INTENSITY_CHANGE),
+                             on_point=print_point)
+        print(f"\n{len(bv_curve)} points in {sum(point.dwell for point in bv_curve):.1f} s")
 
         print('Scan completed successfully')
     except KeyboardInterrupt:
-        waveform(devices['USB-3101FS'], ao_buffer, usb_3101fs_range, amplitude=0, duration=DURATION, frequency=FREQ, num_samples=NUM_SAMPLES)
+        pass
     finally:
-        if memhandle:
-            waveform(devices['USB-3101FS'], ao_buffer, usb_3101fs_range, amplitude=0, duration=DURATION, frequency=FREQ, num_samples=NUM_SAMPLES)
-            sleep(0.1)
-            ul.win_buf_free(memhandle)
-        
+        # Stops the scans and leaves the output at 0 V
+        output.stop()
+        scan.stop()
+
         print("Releasing DAQ Devices")
-        for board_num, device in enumerate(devices):
+        for board_num in devices.values():
             ul.release_daq_device(board_num)
 
 if __name__ == "__main__":
+    # Show the board numbers assigned by configure_devices
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     main()
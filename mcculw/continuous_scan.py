@@ -0,0 +1,611 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Background draining of continuous scans.
+
+:class:`ContinuousScan` starts a :const:`~mcculw.enums.ScanOptions.BACKGROUND` |
+:const:`~mcculw.enums.ScanOptions.CONTINUOUS` scan, and drains its circular UL buffer on a
+dedicated thread into a preallocated ring of NumPy blocks. Consumers take chunks from the ring with
+:meth:`ContinuousScan.read` (or by iterating over the scan) at their own pace; the drain thread
+never waits for them.
+
+:func:`plan_buffer` sizes the UL buffer, either to a fixed second of data or, given the measured
+rate at which the buffer is drained, to absorb the longest expected stall of the drain with a
+safety margin. While a scan runs, its :meth:`~ContinuousScan.telemetry` reports how full the
+buffer got; an :class:`OverrunWarning` is issued when it nears an overrun, and an adaptive scan
+re-arms a larger buffer when it is restarted.
+
+This module requires NumPy.
+"""
+import collections
+import math
+import threading
+import time
+import warnings
+
+import numpy as np
+
+from mcculw import ul
+from mcculw.enums import ScanOptions, FunctionType, Status, ErrorCode
+from mcculw.ul import ULError
+
+ScanChunk = collections.namedtuple("ScanChunk", "data first_sample timestamp first_scan")
+ScanChunk.__doc__ = """A block of scan data.
+
+data : numpy.ndarray
+    The samples, with shape (scans, channels). The array is a view of a ring block; it remains
+    valid until the next call to :meth:`ContinuousScan.read`.
+first_sample : int
+    Index of the first point of the block in the UL buffer stream, counted over all channels
+    from the start of the scan, as the cur_count of :func:`.get_status`.
+timestamp : float
+    time.monotonic() when the block was drained from the UL buffer.
+first_scan : int
+    Index of the first scan (row) of the block, counted in samples per channel from the start of
+    the scan: first_sample divided by the number of channels. This is the index expected by the
+    first_sample arguments of the stream processors, such as :meth:`.StepStats.update`.
+"""
+
+BufferPlan = collections.namedtuple("BufferPlan", "chunk_size buffer_count")
+BufferPlan.__doc__ = """The sizes chosen by :func:`plan_buffer`.
+
+chunk_size : int
+    Number of scans per chunk.
+buffer_count : int
+    Size of the circular buffer in samples, a multiple of the chunk size in samples.
+"""
+
+BufferTelemetry = collections.namedtuple(
+    "BufferTelemetry",
+    "buffer_count chunk_count pending high_water fill near_overruns overruns lost_samples "
+    "max_poll_gap drain_rate")
+BufferTelemetry.__doc__ = """The occupancy of the UL buffer of a scan, as returned by
+:meth:`ContinuousScan.telemetry`.
+
+buffer_count : int
+    Size of the buffer in samples.
+chunk_count : int
+    Size of a chunk in samples.
+pending : int
+    Samples written by the scan and not drained yet, at the last poll.
+high_water : int
+    The largest number of pending samples seen since the scan started. Above buffer_count, the
+    buffer overran, and high_water is the size it would have needed.
+fill : float
+    high_water as a fraction of buffer_count.
+near_overruns : int
+    Number of times the pending samples rose above the warning level.
+overruns : int
+    Number of times the scan overwrote data before it was drained.
+lost_samples : int
+    Number of samples lost to overruns.
+max_poll_gap : float
+    The longest time between two polls of the buffer, in seconds.
+drain_rate : float
+    The rate at which chunks were copied out of the buffer, in samples per second, or None
+    before the first chunk.
+"""
+
+# Bounds for the drain thread's poll interval, in seconds
+_MIN_POLL_INTERVAL = 0.001
+_MAX_POLL_INTERVAL = 0.1
+
+# Default longest time the buffer may go undrained (scheduling delays, garbage
+# collection, a busy consumer), in seconds
+DEFAULT_MAX_STALL = 0.25
+# Default safety factor on the buffer size required to absorb a stall
+DEFAULT_MARGIN = 2.0
+# Default fraction of the buffer above which a scan nears an overrun
+DEFAULT_WARN_LEVEL = 0.75
+
+
+class OverrunWarning(RuntimeWarning):
+    """Issued when the UL buffer of a scan fills above its warning level."""
+
+
+def plan_buffer(rate, num_chans, chunk_size=None, buffer_count=None, packet_size=1,
+                drain_rate=None, max_stall=DEFAULT_MAX_STALL, margin=DEFAULT_MARGIN):
+    """Chooses the chunk and buffer sizes of a continuous scan.
+
+    By default the buffer holds one second of data. Given the measured drain_rate of the buffer,
+    it is instead sized to hold what the scan produces during a stall of max_stall seconds plus
+    the time to drain one chunk, times margin.
+
+    Parameters
+    ----------
+    rate : int
+        The per-channel sample rate.
+    num_chans : int
+        The number of channels in the scan.
+    chunk_size : int, optional
+        Number of scans per chunk. Defaults to about 50 ms of data. Rounded up to a whole number
+        of packets.
+    buffer_count : int, optional
+        Size of the circular buffer in samples. Defaults to one second of data, and at least
+        eight chunks, or to the size required by drain_rate.
+    packet_size : int, optional
+        The number of samples the device transfers at a time, such as
+        :attr:`AiInfo.packet_size <mcculw.device_info.AiInfo.packet_size>`. Some devices require
+        the buffer to hold a whole number of packets. Defaults to 1.
+    drain_rate : float, optional
+        The rate at which the buffer is drained, in samples per second (all channels), for
+        example the drain_rate of the :meth:`ContinuousScan.telemetry` of a previous run. Must
+        exceed rate * num_chans.
+    max_stall : float, optional
+        The longest time the buffer may go undrained, in seconds, used with drain_rate. Defaults
+        to DEFAULT_MAX_STALL.
+    margin : float, optional
+        Safety factor on the buffer size required by drain_rate and max_stall. Defaults to
+        DEFAULT_MARGIN.
+
+    Returns
+    -------
+    BufferPlan
+        The chunk size and buffer size
+    """
+    sample_rate = rate * num_chans
+    chunk_size = chunk_size or max(rate // 20, 1)
+    # A chunk holds a whole number of packets
+    packet_scans = packet_size // math.gcd(packet_size, num_chans)
+    chunk_size += -chunk_size % packet_scans
+    chunk_count = chunk_size * num_chans
+    if buffer_count is None:
+        if drain_rate is None:
+            buffer_count = max(sample_rate, 8 * chunk_count)
+        else:
+            if drain_rate <= sample_rate:
+                raise ValueError('drain_rate must exceed the sample rate of the scan')
+            required = sample_rate * (max_stall + chunk_count / float(drain_rate)) + chunk_count
+            buffer_count = max(int(math.ceil(margin * required)), 4 * chunk_count)
+        buffer_count += -buffer_count % chunk_count
+    if buffer_count % chunk_count or buffer_count < 2 * chunk_count:
+        raise ValueError('buffer_count must be a multiple of the chunk size in samples, and at '
+                         'least two chunks')
+    return BufferPlan(chunk_size, buffer_count)
+
+
+def alloc_buffer(count, dtype):
+    """Allocates a UL buffer of count samples of dtype: numpy.float64 for scaled data,
+    numpy.uint16, numpy.uint32 or numpy.uint64 for raw data.
+
+    Raises
+    ------
+    ULError
+        With ErrorCode.NOTENOUGHMEMORY if the buffer could not be allocated.
+    """
+    dtype = np.dtype(dtype)
+    if dtype == np.float64:
+        memhandle = ul.scaled_win_buf_alloc(count)
+    elif dtype == np.uint16:
+        memhandle = ul.win_buf_alloc(count)
+    elif dtype == np.uint32:
+        memhandle = ul.win_buf_alloc_32(count)
+    elif dtype == np.uint64:
+        memhandle = ul.win_buf_alloc_64(count)
+    else:
+        raise ValueError('Unsupported buffer dtype: {}'.format(dtype))
+    if not memhandle:
+        raise ULError(ErrorCode.NOTENOUGHMEMORY)
+    return memhandle
+
+
+class ScanCursor(object):
+    """Tracks how far the circular buffer of a continuous scan has been drained (or, for an output
+    scan, refilled), in whole chunks.
+
+    Parameters
+    ----------
+    buffer_count : int
+        Size of the circular buffer in samples.
+    chunk_count : int
+        Size of a chunk in samples. buffer_count must be a multiple of it, so chunks never wrap
+        around the end of the buffer.
+    sample_rate : float
+        The aggregate sample rate of the scan (all channels), used to derive the poll interval.
+    warn_level : float, optional
+        The fraction of the buffer above which pending samples count as a near overrun. Defaults
+        to DEFAULT_WARN_LEVEL.
+
+    Attributes
+    ----------
+    total : int
+        Samples transferred by the scan, from the cur_count values passed to :meth:`update`.
+    drained : int
+        Index of the first sample of the next chunk.
+    overruns : int
+        Number of times the scan overwrote chunks before they were drained.
+    lost_samples : int
+        Number of samples skipped because of overruns.
+    high_water : int
+        The largest number of pending samples seen by :meth:`update`.
+    near_overruns : int
+        Number of times the pending samples rose above warn_level of the buffer.
+    poll_interval : float
+        The suggested time to wait between status checks, in seconds. Adjusted by :meth:`adapt`.
+    """
+    def __init__(self, buffer_count, chunk_count, sample_rate, warn_level=DEFAULT_WARN_LEVEL):
+        self.buffer_count = buffer_count
+        self.chunk_count = chunk_count
+        self.total = 0
+        self.drained = 0
+        self.overruns = 0
+        self.lost_samples = 0
+        self.high_water = 0
+        self.near_overruns = 0
+        self._warn_count = warn_level * buffer_count
+        self._above_warn_level = False
+        self._last_count = 0
+        self.max_interval = min(_MAX_POLL_INTERVAL, buffer_count / float(sample_rate) / 4)
+        self.poll_interval = min(max(chunk_count / float(sample_rate) / 2, _MIN_POLL_INTERVAL),
+                                 self.max_interval)
+
+    def update(self, cur_count):
+        """Accounts for the cur_count returned by :func:`.get_status`. Returns False if the scan
+        overran the chunks that were not drained yet, in which case the cursor skips to the oldest
+        chunk that is still intact, keeping one chunk of margin ahead of the scan."""
+        # cur_count is a 32-bit value that eventually rolls over
+        self.total += (cur_count - self._last_count) & 0xFFFFFFFF
+        self._last_count = cur_count
+        pending = self.total - self.drained
+        if pending > self.high_water:
+            self.high_water = pending
+        above_warn_level = pending > self._warn_count
+        if above_warn_level and not self._above_warn_level:
+            self.near_overruns += 1
+        self._above_warn_level = above_warn_level
+        if pending <= self.buffer_count:
+            return True
+        resync = self.total - self.buffer_count + self.chunk_count
+        resync += -resync % self.chunk_count
+        self.overruns += 1
+        self.lost_samples += resync - self.drained
+        self.drained = resync
+        return False
+
+    @property
+    def pending(self):
+        """Number of samples transferred by the scan and not drained yet."""
+        return self.total - self.drained
+
+    @property
+    def ready(self):
+        """Number of complete chunks waiting to be drained."""
+        return (self.total - self.drained) // self.chunk_count
+
+    @property
+    def index(self):
+        """Buffer index of the next chunk."""
+        return self.drained % self.buffer_count
+
+    def advance(self):
+        """Moves past the next chunk."""
+        self.drained += self.chunk_count
+
+    def adapt(self, ready):
+        """Adjusts the poll interval after a poll that found ready chunks: faster when more than
+        one chunk was waiting, slower when none was."""
+        if ready > 1:
+            self.poll_interval = max(self.poll_interval / 2, _MIN_POLL_INTERVAL)
+        elif ready == 0:
+            self.poll_interval = min(self.poll_interval * 1.25, self.max_interval)
+
+
+class ContinuousScan(object):
+    """Runs a continuous analog input scan and drains it on a background thread.
+
+    Parameters
+    ----------
+    board_num : int
+        The number associated with the board when it was installed with InstaCal or created
+        with :func:`.create_daq_device`.
+    low_chan : int
+        First A/D channel of the scan.
+    high_chan : int
+        Last A/D channel of the scan.
+    rate : int
+        The requested per-channel sample rate. The actual rate is available from :attr:`rate`
+        once the scan is started.
+    ul_range : ULRange
+        The A/D range of the scan.
+    options : ScanOptions, optional
+        Additional scan options. BACKGROUND and CONTINUOUS are always added. With SCALEDATA (the
+        default) chunks hold volts; without it they hold raw counts.
+    chunk_size : int, optional
+        Number of scans (samples per channel) per published chunk. Defaults to about 50 ms of
+        data.
+    buffer_count : int, optional
+        Size of the UL buffer in samples. Defaults to one second of data, and at least eight
+        chunks. Must be a multiple of the chunk size in samples.
+    num_blocks : int, optional
+        Number of chunks the ring can hold for the consumer. Defaults to 16.
+    packet_size : int, optional
+        The packet size of the device in samples, such as
+        :attr:`AiInfo.packet_size <mcculw.device_info.AiInfo.packet_size>`. See
+        :func:`plan_buffer`. Defaults to 1.
+    adaptive : bool, optional
+        If True, each restart of the scan after :meth:`stop` first grows the UL buffer to
+        :meth:`suggested_buffer_count`. Defaults to False.
+    warn_level : float, optional
+        The fraction of the UL buffer above which an :class:`OverrunWarning` is issued. Defaults
+        to DEFAULT_WARN_LEVEL.
+
+    Attributes
+    ----------
+    start_time : float
+        time.monotonic() in the middle of the call that started the scan.
+
+    Notes
+    -----
+    The counters :attr:`overruns` (the UL buffer was overwritten before it was drained) and
+    :attr:`dropped_chunks` (the consumer fell more than num_blocks chunks behind) report data loss
+    instead of stopping the scan. :meth:`telemetry` reports how full the UL buffer got.
+    """
+    function_type = FunctionType.AIFUNCTION
+
+    def __init__(self, board_num, low_chan, high_chan, rate, ul_range,
+                 options=ScanOptions.SCALEDATA, chunk_size=None, buffer_count=None,
+                 num_blocks=16, packet_size=1, adaptive=False, warn_level=DEFAULT_WARN_LEVEL):
+        self.board_num = board_num
+        self.low_chan = low_chan
+        self.high_chan = high_chan
+        self.num_chans = high_chan - low_chan + 1
+        self.rate = rate
+        self.ul_range = ul_range
+        self.options = options | ScanOptions.BACKGROUND | ScanOptions.CONTINUOUS
+        self.packet_size = packet_size
+        self.chunk_size, self.buffer_count = plan_buffer(rate, self.num_chans, chunk_size,
+                                                         buffer_count, packet_size)
+        self.num_blocks = num_blocks
+        self.dtype = self._buffer_dtype()
+        self.adaptive = adaptive
+        self.warn_level = warn_level
+
+        self._new_cursor()
+        self._started = False
+        self.dropped_chunks = 0
+        self.chunks_published = 0
+        self.error = None
+        self.start_time = None
+
+        self._ring = np.empty((num_blocks, self.chunk_size, self.num_chans), self.dtype)
+        self._ring_first_sample = np.zeros(num_blocks, np.int64)
+        self._ring_timestamp = np.zeros(num_blocks)
+        # Single producer/single consumer ring: the drain thread only
+        # advances _write_seq, the consumer only advances _read_seq.
+        self._write_seq = 0
+        self._read_seq = 0
+        self._holding = False
+        self._data_ready = threading.Event()
+        self._stop_requested = threading.Event()
+        self._thread = None
+        self.memhandle = None
+
+    def _new_cursor(self):
+        self.cursor = ScanCursor(self.buffer_count, self.chunk_size * self.num_chans,
+                                 self.rate * self.num_chans, self.warn_level)
+        self._max_poll_gap = 0.0
+        self._drain_time = 0.0
+        self._drained_samples = 0
+
+    def _buffer_dtype(self):
+        if self.options & ScanOptions.SCALEDATA:
+            return np.dtype(np.float64)
+        from mcculw.device_info import AiInfo
+        return np.dtype(np.uint16 if AiInfo(self.board_num).resolution <= 16 else np.uint32)
+
+    def _start_scan(self):
+        return ul.a_in_scan(self.board_num, self.low_chan, self.high_chan, self.buffer_count,
+                            self.rate, self.ul_range, self.memhandle, self.options)
+
+    def _stop_scan(self):
+        ul.stop_background(self.board_num, self.function_type)
+
+    # Control
+
+    def start(self):
+        """Allocates the UL buffer, starts the scan and the drain thread.
+
+        The scan can be started again after :meth:`stop`. Sample indices then restart from 0, and
+        an adaptive scan first grows its UL buffer to :meth:`suggested_buffer_count`.
+        """
+        if self._started:
+            if self.adaptive:
+                self.buffer_count = self.suggested_buffer_count()
+            self._new_cursor()
+            self._stop_requested.clear()
+            self.error = None
+        self._started = True
+        self.memhandle = alloc_buffer(self.buffer_count, self.dtype)
+        try:
+            before = time.monotonic()
+            self.rate = self._start_scan()
+            self.start_time = (before + time.monotonic()) / 2
+        except ULError:
+            ul.win_buf_free(self.memhandle)
+            self.memhandle = None
+            raise
+        self._thread = threading.Thread(target=self._drain, name='ContinuousScan drain')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the scan and the drain thread, and frees the UL buffer. Chunks already in the
+        ring can still be read."""
+        self._stop_requested.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.memhandle:
+            self._stop_scan()
+            ul.win_buf_free(self.memhandle)
+            self.memhandle = None
+        self._data_ready.set()
+
+    @property
+    def overruns(self):
+        """Number of times the scan overwrote data before it was drained."""
+        return self.cursor.overruns
+
+    @property
+    def lost_samples(self):
+        """Number of samples lost to overruns."""
+        return self.cursor.lost_samples
+
+    def telemetry(self):
+        """Returns the :class:`BufferTelemetry` of the UL buffer since the scan was last
+        started."""
+        cursor = self.cursor
+        drain_rate = None
+        if self._drain_time > 0:
+            drain_rate = self._drained_samples / self._drain_time
+        return BufferTelemetry(cursor.buffer_count, cursor.chunk_count, cursor.pending,
+                               cursor.high_water, cursor.high_water / float(cursor.buffer_count),
+                               cursor.near_overruns, cursor.overruns, cursor.lost_samples,
+                               self._max_poll_gap, drain_rate)
+
+    def suggested_buffer_count(self):
+        """Returns the UL buffer size, in samples, that the telemetry of the last run calls for:
+        DEFAULT_MARGIN times its high-water mark, twice the current size after an overrun, and
+        the size :func:`plan_buffer` gives for the measured drain rate with the longest poll gap
+        as the stall. Never less than the current size."""
+        telemetry = self.telemetry()
+        needed = DEFAULT_MARGIN * telemetry.high_water
+        if telemetry.overruns:
+            needed = max(needed, 2 * telemetry.buffer_count)
+        if telemetry.drain_rate and telemetry.max_poll_gap:
+            try:
+                planned = plan_buffer(self.rate, self.num_chans, self.chunk_size,
+                                      packet_size=self.packet_size,
+                                      drain_rate=telemetry.drain_rate,
+                                      max_stall=telemetry.max_poll_gap).buffer_count
+            except ValueError:
+                # The drain is slower than the scan: a larger buffer only
+                # delays the overrun
+                planned = 2 * telemetry.buffer_count
+            needed = max(needed, planned)
+        needed = max(int(math.ceil(needed)), telemetry.buffer_count)
+        return needed + -needed % telemetry.chunk_count
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    # Consumer side
+
+    @property
+    def pending_chunks(self):
+        """Number of published chunks not yet read."""
+        return self._write_seq - self._read_seq - (1 if self._holding else 0)
+
+    def read(self, timeout=None):
+        """Returns the next chunk, waiting up to timeout seconds (forever if None) for one to be
+        published. Returns None on timeout, or once the scan has stopped and every chunk has been
+        read.
+
+        The data of the returned chunk stays valid until the next call to read.
+        """
+        # Release the block returned by the previous call
+        if self._holding:
+            self._read_seq += 1
+            self._holding = False
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._read_seq >= self._write_seq:
+            if self.error is not None:
+                raise self.error
+            if not self.running:
+                return None
+            self._data_ready.clear()
+            if self._read_seq < self._write_seq:
+                break
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            self._data_ready.wait(remaining)
+
+        slot = self._read_seq % self.num_blocks
+        self._holding = True
+        first_sample = int(self._ring_first_sample[slot])
+        return ScanChunk(self._ring[slot], first_sample, float(self._ring_timestamp[slot]),
+                         first_sample // self.num_chans)
+
+    def __iter__(self):
+        while True:
+            chunk = self.read()
+            if chunk is None:
+                return
+            yield chunk
+
+    # Drain thread
+
+    def _copy_to_ring(self, block):
+        slot = self._write_seq % self.num_blocks
+        self._ring[slot].reshape(-1)[:] = block
+        return slot
+
+    def _publish(self, slot, first_sample, timestamp):
+        self._ring_first_sample[slot] = first_sample
+        self._ring_timestamp[slot] = timestamp
+        self._write_seq += 1
+        self.chunks_published += 1
+        self._data_ready.set()
+
+    def _drain(self):
+        try:
+            self._drain_loop()
+        except ULError as e:
+            self.error = e
+        finally:
+            self._data_ready.set()
+
+    def _drain_loop(self):
+        data = ul.buffer_as_ndarray(self.memhandle, self.buffer_count, self.dtype)
+        cursor = self.cursor
+        near_overruns = 0
+        last_poll = None
+        while not self._stop_requested.is_set():
+            status, cur_count, _ = ul.get_status(self.board_num, self.function_type)
+            poll = time.monotonic()
+            if last_poll is not None:
+                self._max_poll_gap = max(self._max_poll_gap, poll - last_poll)
+            last_poll = poll
+            cursor.update(cur_count)
+
+            ready = cursor.ready
+            for _ in range(ready):
+                first_sample = cursor.drained
+                timestamp = time.monotonic()
+                if self._write_seq - self._read_seq >= self.num_blocks:
+                    # The consumer is a full ring behind: drop this chunk
+                    # rather than wait for it or overwrite unread blocks
+                    self.dropped_chunks += 1
+                else:
+                    slot = self._copy_to_ring(
+                        data[cursor.index:cursor.index + cursor.chunk_count])
+                    # Make sure the block was not overwritten while it was
+                    # being copied before the consumer can see it
+                    _, cur_count, _ = ul.get_status(self.board_num, self.function_type)
+                    self._drain_time += time.monotonic() - timestamp
+                    self._drained_samples += cursor.chunk_count
+                    if not cursor.update(cur_count):
+                        break
+                    self._publish(slot, first_sample, timestamp)
+                cursor.advance()
+
+            if cursor.near_overruns != near_overruns:
+                near_overruns = cursor.near_overruns
+                warnings.warn('The UL buffer of board {} reached {:.0%} of its size; a larger '
+                              'buffer_count avoids overruns'.format(
+                                  self.board_num, cursor.high_water / float(cursor.buffer_count)),
+                              OverrunWarning)
+            if status == Status.IDLE:
+                break
+            cursor.adapt(ready)
+            self._stop_requested.wait(cursor.poll_interval)
@@ -0,0 +1,152 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Rates, periods and totals from the cumulative counts of counter scans.
+
+:func:`.c_in_scan` fills its buffer (allocated with :func:`.win_buf_alloc_32` or
+:func:`.win_buf_alloc_64`) with the raw value of each counter at each sample, and those values
+roll over when they pass the width of the counter. :class:`CounterAnalyzer` turns chunks of such
+values into the counts of each sample interval, modulo the counter width so that a rollover
+between two samples is counted correctly, and from them the count rate, the mean period and the
+running total::
+
+    analyzer = CounterAnalyzer(rate=1000, num_counters=2, bits=32)
+    data = ul.buffer_as_ndarray(memhandle, count, numpy.uint32).reshape(-1, 2)
+    result = analyzer.update(data)
+    print(result.rates[-1], analyzer.totals)
+
+The state carried from one chunk to the next makes the results of a stream processed chunk by
+chunk identical to those of the whole stream processed at once. Counters read by
+:func:`.daq_in_scan` as 16-bit words (CTR32LOW and CTR32HIGH, or CTRBANK0 to CTRBANK3) can be
+recombined with :func:`.daq_columns` of :mod:`mcculw.demux` first.
+
+This module requires NumPy.
+"""
+import collections
+
+import numpy as np
+
+CounterUpdate = collections.namedtuple("CounterUpdate", "deltas rates periods totals")
+CounterUpdate.__doc__ = """The results of :meth:`CounterAnalyzer.update`, one row per sample of
+the chunk and one column per counter.
+
+deltas : numpy.ndarray
+    The counts since the previous sample, as uint64.
+rates : numpy.ndarray
+    The count rates over the interval since the previous sample, in counts per second.
+periods : numpy.ndarray
+    The mean periods of the counted signal over the same interval, in seconds, or infinity for
+    intervals without counts.
+totals : numpy.ndarray
+    The counts since the start of the analysis up to and including each sample, as uint64.
+"""
+
+
+class CounterAnalyzer(object):
+    """Computes the counts, rates, periods and totals of counter scan data, chunk by chunk.
+
+    Parameters
+    ----------
+    rate : float
+        The sample rate of the scan, in samples per second per counter.
+    num_counters : int, optional
+        The number of counters in the data, 1 by default.
+    bits : int, optional
+        The width of the counters: 16, 32, 48 or 64 bits, or any width up to 64. A value
+        decreasing by less than the full width from one sample to the next is taken as a
+        rollover. Defaults to 32.
+    count_down : bool, optional
+        True for counters that count down.
+    clear_on_read : bool, optional
+        True if the counters are cleared after each sample (for example with the
+        CLEAR_ON_READ option of :func:`.c_config_scan`), so that each value is already the count
+        of its interval.
+    initial_count : int or sequence of int, optional
+        The value of the counters when the scan started, 0 by default. If None, the first sample
+        is the reference: its delta is 0 and its rate unknown (NaN).
+
+    Attributes
+    ----------
+    totals : numpy.ndarray
+        The counts since the start of the analysis, per counter.
+    samples : int
+        Number of samples processed per counter.
+    """
+    def __init__(self, rate, num_counters=1, bits=32, count_down=False, clear_on_read=False,
+                 initial_count=0):
+        if not 0 < bits <= 64:
+            raise ValueError('bits must be between 1 and 64')
+        self.rate = float(rate)
+        self.num_counters = num_counters
+        self.bits = bits
+        self.count_down = count_down
+        self.clear_on_read = clear_on_read
+        self.initial_count = initial_count
+        self._mask = np.uint64((1 << bits) - 1)
+        self.reset()
+
+    def reset(self):
+        """Forgets the samples processed."""
+        self.totals = np.zeros(self.num_counters, np.uint64)
+        self.samples = 0
+        if self.initial_count is None:
+            self._last = None
+        else:
+            self._last = np.broadcast_to(
+                np.asarray(self.initial_count, np.uint64), (self.num_counters,)).copy()
+        self._last_sample = -1
+
+    def update(self, data, first_sample=None):
+        """Processes a chunk of counter values.
+
+        Parameters
+        ----------
+        data : array_like
+            The raw counter values, with shape (samples, counters), or (samples,) for one
+            counter.
+        first_sample : int, optional
+            Index of the first sample of data, counted in samples per counter from the start of
+            the scan, such as ScanChunk.first_scan (not ScanChunk.first_sample, which counts the
+            points of all counters). Defaults to the sample following the previous chunk. After a
+            gap, the first interval spans the missing samples: its count is still exact as long
+            as the counter did not roll over more than once in the gap.
+
+        Returns
+        -------
+        CounterUpdate
+            The results for each sample of data
+        """
+        values = np.asarray(data).reshape(-1, self.num_counters).astype(np.uint64)
+        n = len(values)
+        first = self._last_sample + 1 if first_sample is None else int(first_sample)
+
+        # Number of sample intervals each row spans, 1 except after a gap
+        intervals = np.ones((n, 1))
+        if n:
+            intervals[0] = first - self._last_sample
+
+        if self.clear_on_read:
+            deltas = values & self._mask
+        else:
+            previous = np.empty_like(values)
+            if n:
+                previous[0] = values[0] if self._last is None else self._last
+                previous[1:] = values[:-1]
+            if self.count_down:
+                deltas = (previous - values) & self._mask
+            else:
+                deltas = (values - previous) & self._mask
+            if n:
+                self._last = values[-1].copy()
+        if n and self.initial_count is None and self.samples == 0 and not self.clear_on_read:
+            intervals[0] = np.nan
+
+        totals = np.cumsum(deltas, axis=0, dtype=np.uint64) + self.totals
+        rates = deltas * (self.rate / intervals)
+        with np.errstate(divide='ignore'):
+            periods = 1.0 / rates
+        if n:
+            self.totals = totals[-1].copy()
+            self._last_sample = first + n - 1
+        self.samples += n
+        return CounterUpdate(deltas, rates, periods, totals)
@@ -0,0 +1,191 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Demultiplexing of the interleaved data of multi-channel scans.
+
+The buffers filled by :func:`.a_in_scan` and :func:`.daq_in_scan` hold one point per channel
+in turn (ch0, ch1, ... chN, ch0, ...). :func:`demux` turns a region of such a buffer, usually
+the array returned by :func:`.buffer_as_ndarray`, into a (samples, channels) array: a view of
+the buffer when the region is contiguous, or a single copy when it wraps around the end of the
+circular buffer. :func:`channels` returns the per-channel columns of that array as strided views,
+and :func:`latest` the most recent complete scans of a running scan::
+
+    data = ul.buffer_as_ndarray(memhandle, buffer_count)
+    status, cur_count, cur_index = ul.get_status(board_num, FunctionType.AIFUNCTION)
+    rows = demux.latest(data, num_chans, cur_count, 100)
+    for chan, values in enumerate(demux.channels(rows)):
+        ...
+
+For :func:`.daq_in_scan`, :func:`daq_columns` splits the rows into one typed column per
+channel, recombining the 16-bit words of 32-bit and 64-bit counters.
+
+This module requires NumPy.
+"""
+import collections
+
+import numpy as np
+
+from mcculw.enums import ChannelType
+
+DaqColumn = collections.namedtuple("DaqColumn", "chan_type channel data")
+DaqColumn.__doc__ = """One channel of a :func:`.daq_in_scan`, as returned by :func:`daq_columns`.
+
+chan_type : ChannelType
+    The type of the channel, without the SETPOINT_ENABLE flag. A counter read as several 16-bit
+    words is reported with the type of its first word (CTR32LOW or CTRBANK0).
+channel : int
+    The channel number, from chan_list.
+data : numpy.ndarray
+    The values of the channel: a view of the buffer, except for the recombined counters, which
+    are uint32 (CTR32LOW and CTR32HIGH) or uint64 (CTRBANK0 to CTRBANK3).
+"""
+
+_COUNTER_WORDS = {
+    ChannelType.CTR32LOW: (ChannelType.CTR32LOW, 0),
+    ChannelType.CTR32HIGH: (ChannelType.CTR32LOW, 1),
+    ChannelType.CTRBANK0: (ChannelType.CTRBANK0, 0),
+    ChannelType.CTRBANK1: (ChannelType.CTRBANK0, 1),
+    ChannelType.CTRBANK2: (ChannelType.CTRBANK0, 2),
+    ChannelType.CTRBANK3: (ChannelType.CTRBANK0, 3),
+}
+
+
+def demux(buffer, num_chans, first_point=0, count=None, out=None):
+    """Returns a region of an interleaved buffer as a (samples, channels) array.
+
+    Parameters
+    ----------
+    buffer : numpy.ndarray
+        The one-dimensional scan buffer, for example from :func:`.buffer_as_ndarray`. It is
+        treated as circular.
+    num_chans : int
+        The number of points per scan.
+    first_point : int, optional
+        Index of the first point of the region; column 0 is the channel sampled at this point.
+        Indices past the end of the buffer wrap around.
+    count : int, optional
+        Number of points in the region, a multiple of num_chans. Defaults to the points from
+        first_point to the end of the buffer.
+    out : numpy.ndarray, optional
+        Array of shape (count // num_chans, num_chans) and the dtype of buffer to copy the region
+        into. By default the region is returned as a view of buffer when it does not wrap, and
+        copied into a new array when it does.
+
+    Returns
+    -------
+    numpy.ndarray
+        The region, one row per scan and one column per channel
+    """
+    size = len(buffer)
+    first_point %= size
+    if count is None:
+        count = size - first_point
+    if count % num_chans or not 0 <= count <= size:
+        raise ValueError('count must be a multiple of num_chans, and at most the buffer size')
+    head = min(count, size - first_point)
+    if out is None and head == count:
+        return buffer[first_point:first_point + count].reshape(-1, num_chans)
+
+    if out is None:
+        out = np.empty((count // num_chans, num_chans), buffer.dtype)
+    elif out.shape != (count // num_chans, num_chans):
+        raise ValueError('out must have the shape ({}, {})'.format(count // num_chans,
+                                                                   num_chans))
+    flat = out.reshape(-1)
+    flat[:head] = buffer[first_point:first_point + head]
+    flat[head:] = buffer[:count - head]
+    return out
+
+
+def channels(rows):
+    """Returns the columns of a (samples, channels) array, such as one returned by
+    :func:`demux`, as a list of one strided view per channel."""
+    return [rows[:, chan] for chan in range(rows.shape[1])]
+
+
+def latest(buffer, num_chans, cur_count, samples, out=None):
+    """Returns the most recent complete scans of a circular scan buffer.
+
+    Parameters
+    ----------
+    buffer : numpy.ndarray
+        The one-dimensional scan buffer. Its size must be a multiple of num_chans, as required
+        for :const:`~mcculw.enums.ScanOptions.CONTINUOUS` scans.
+    num_chans : int
+        The number of points per scan.
+    cur_count : int
+        The number of points collected so far, as returned by :func:`.get_status`.
+    samples : int
+        The number of scans to return.
+    out : numpy.ndarray, optional
+        Array of shape (samples, num_chans) to copy the scans into; see :func:`demux`.
+
+    Returns
+    -------
+    numpy.ndarray
+        The scans, one row per scan and one column per channel, the most recent last
+    """
+    size = len(buffer)
+    if size % num_chans:
+        raise ValueError('The buffer size must be a multiple of num_chans')
+    end = cur_count - cur_count % num_chans
+    count = samples * num_chans
+    if count > min(end, size):
+        raise ValueError('Only {} complete scans are available'.format(min(end, size) //
+                                                                       num_chans))
+    return demux(buffer, num_chans, end - count, count, out)
+
+
+def daq_columns(rows, chan_list, chan_type_list):
+    """Splits the rows of a :func:`.daq_in_scan` into one typed column per channel.
+
+    Analog, digital and 16-bit or full-width counter channels are returned as views of rows.
+    The words of a counter read as CTR32LOW and CTR32HIGH, or as CTRBANK0 to CTRBANK3, are
+    combined into a single column holding the full count; the words can be anywhere in the
+    channel list, and are matched by channel number. PADZERO channels are left out.
+
+    Parameters
+    ----------
+    rows : numpy.ndarray
+        The scan data, of shape (samples, len(chan_list)), for example from :func:`demux`.
+    chan_list : list of int
+        The chan_list passed to :func:`.daq_in_scan`.
+    chan_type_list : list of ChannelType
+        The chan_type_list passed to :func:`.daq_in_scan`.
+
+    Returns
+    -------
+    list of DaqColumn
+        The columns, in the order of the first entry of each channel in chan_list
+    """
+    if rows.ndim != 2 or rows.shape[1] != len(chan_list) or len(chan_type_list) != len(
+            chan_list):
+        raise ValueError('rows must have one column per entry of chan_list and chan_type_list')
+    columns = []
+    counters = {}
+    for index, (channel, chan_type) in enumerate(zip(chan_list, chan_type_list)):
+        chan_type = ChannelType(int(chan_type) & ~ChannelType.SETPOINT_ENABLE)
+        if chan_type == ChannelType.PADZERO:
+            continue
+        words = _COUNTER_WORDS.get(chan_type)
+        if words is None:
+            columns.append(DaqColumn(chan_type, channel, rows[:, index]))
+            continue
+        first_type, word = words
+        key = (first_type, channel)
+        if key not in counters:
+            counters[key] = {}
+            # Placeholder, replaced once all the words are known
+            columns.append(key)
+        counters[key][word] = index
+
+    for position, column in enumerate(columns):
+        if isinstance(column, DaqColumn):
+            continue
+        first_type, channel = column
+        dtype = np.uint32 if first_type == ChannelType.CTR32LOW else np.uint64
+        data = np.zeros(len(rows), dtype)
+        for word, index in sorted(counters[column].items()):
+            data |= rows[:, index].astype(dtype) << dtype(16 * word)
+        columns[position] = DaqColumn(first_type, channel, data)
+    return columns
@@ -1,10 +1,29 @@
-from .daq_device_info import DaqDeviceInfo
-from .ai_info import AiInfo
-from .ao_info import AoInfo
-from .ctr_info import CtrInfo
-from .daqi_info import DaqiInfo
-from .daqo_info import DaqoInfo
-from .dio_info import DioInfo
+from importlib import import_module
+
+# The info classes are imported on first access, so that importing one of
+# them does not import (and set up) all of the others.
+_modules = {
+    'DaqDeviceInfo': '.daq_device_info',
+    'AiInfo': '.ai_info',
+    'AoInfo': '.ao_info',
+    'CtrInfo': '.ctr_info',
+    'DaqiInfo': '.daqi_info',
+    'DaqoInfo': '.daqo_info',
+    'DioInfo': '.dio_info',
+}
 
 __all__ = ['DaqDeviceInfo', 'AiInfo', 'AoInfo', 'CtrInfo', 'DaqiInfo',
            'DaqoInfo', 'DioInfo']
+
+
+def __getattr__(name):
+    if name not in _modules:
+        raise AttributeError(
+            "module '{}' has no attribute '{}'".format(__name__, name))
+    value = getattr(import_module(_modules[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -5,6 +5,7 @@ from mcculw import ul
 from mcculw.ul import ULError
 from mcculw.enums import (InfoType, BoardInfo, ULRange, FunctionType,
                           ErrorCode, TrigType, ScanOptions)
+from .info_cache import cached_property
 
 
 class AiInfo:
@@ -21,18 +22,32 @@ class AiInfo:
     board_num : int
         The board number associated with the device when created with
         :func:`.create_daq_device` or configured with Instacal.
+    cache : InfoCache, optional
+        Memoizes the property values instead of querying the device on every
+        access. See :class:`.DaqDeviceInfo`.
     """
-    def __init__(self, board_num):
+    def __init__(self, board_num, cache=None):
         self._board_num = board_num
-        # Get the board type from UL
-        self._board_type = ul.get_config(InfoType.BOARDINFO, self._board_num,
-                                         0, BoardInfo.BOARDTYPE)
+        self._cache = cache
+        if cache is None:
+            # Get the board type from UL
+            self._uncached_board_type = self._get_board_type()
+
+    @cached_property()
+    def _board_type(self):
+        if self._cache is None:
+            return self._uncached_board_type
+        return self._get_board_type()
+
+    def _get_board_type(self):
+        return ul.get_config(InfoType.BOARDINFO, self._board_num, 0,
+                             BoardInfo.BOARDTYPE)
 
     @property
     def board_num(self):
         return self._board_num
 
-    @property
+    @cached_property()
     def num_chans(self):
         return ul.get_config(InfoType.BOARDINFO, self._board_num, 0,
                              BoardInfo.NUMADCHANS)
@@ -41,7 +56,7 @@ class AiInfo:
     def is_supported(self):
         return self.num_chans > 0
 
-    @property
+    @cached_property()
     def num_temp_chans(self):
         return ul.get_config(InfoType.BOARDINFO, self._board_num, 0,
                              BoardInfo.NUMTEMPCHANS)
@@ -50,12 +65,12 @@ class AiInfo:
     def temp_supported(self):
         return self.num_temp_chans > 0
 
-    @property
+    @cached_property()
     def resolution(self):
         return ul.get_config(InfoType.BOARDINFO, self._board_num, 0,
                              BoardInfo.ADRES)
 
-    @property
+    @cached_property()
     def supports_scan(self):
         scan_supported = True
         try:
@@ -64,7 +79,7 @@ class AiInfo:
             scan_supported = False
         return scan_supported
 
-    @property
+    @cached_property(ULRange)
     def supported_ranges(self):
         result = []
 
@@ -117,7 +132,7 @@ class AiInfo:
 
         return packet_size
 
-    @property
+    @cached_property()
     def supports_v_in(self):
         v_in_supported = True
         ai_ranges = self.supported_ranges
@@ -151,7 +166,7 @@ class AiInfo:
 
         return trigger_resolution
 
-    @property
+    @cached_property(ULRange)
     def analog_trig_range(self):
         # Get the analog trigger source
         try:
@@ -167,7 +182,7 @@ class AiInfo:
 
         return trigger_range
 
-    @property
+    @cached_property()
     def supports_analog_trig(self):
         analog_trig_supported = True
         try:
@@ -176,7 +191,7 @@ class AiInfo:
             analog_trig_supported = False
         return analog_trig_supported
 
-    @property
+    @cached_property(ScanOptions)
     def supported_scan_options(self):
         if self.supports_scan:
             scan_options_supported = ScanOptions(ul.get_config(
@@ -186,7 +201,7 @@ class AiInfo:
             scan_options_supported = None
         return scan_options_supported
 
-    @property
+    @cached_property()
     def supports_gain_queue(self):
         gain_queue_supported = True
         try:
@@ -4,6 +4,7 @@ from builtins import *  # @UnusedWildImport
 from mcculw import ul
 from mcculw.ul import ULError
 from mcculw.enums import BoardInfo, InfoType, ULRange, ErrorCode, ScanOptions
+from .info_cache import cached_property
 
 
 class AoInfo:
@@ -20,15 +21,19 @@ class AoInfo:
     board_num : int
         The board number associated with the device when created with
         :func:`.create_daq_device` or configured with Instacal.
+    cache : InfoCache, optional
+        Memoizes the property values instead of querying the device on every
+        access. See :class:`.DaqDeviceInfo`.
     """
-    def __init__(self, board_num):
+    def __init__(self, board_num, cache=None):
         self._board_num = board_num
+        self._cache = cache
 
     @property
     def board_num(self):
         return self._board_num
 
-    @property
+    @cached_property()
     def num_chans(self):
         return ul.get_config(InfoType.BOARDINFO, self._board_num, 0,
                              BoardInfo.NUMDACHANS)
@@ -37,7 +42,7 @@ class AoInfo:
     def is_supported(self):
         return self.num_chans > 0
 
-    @property
+    @cached_property()
     def resolution(self):
         return ul.get_config(InfoType.BOARDINFO, self._board_num, 0,
                              BoardInfo.DACRES)
@@ -46,7 +51,7 @@ class AoInfo:
     def supports_scan(self):
         return ScanOptions.CONTINUOUS in self.supported_scan_options
 
-    @property
+    @cached_property(ScanOptions)
     def supported_scan_options(self):
         try:
             scan_options_supported = ScanOptions(ul.get_config(
@@ -57,7 +62,7 @@ class AoInfo:
 
         return scan_options_supported
 
-    @property
+    @cached_property(ULRange)
     def supported_ranges(self):
         result = []
         # Check if the range is ignored by passing a bogus range in
@@ -93,7 +98,7 @@ class AoInfo:
 
         return result
 
-    @property
+    @cached_property()
     def supports_v_out(self):
         ranges_supported = self.supported_ranges
         v_out_supported = False
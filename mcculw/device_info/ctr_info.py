@@ -4,6 +4,7 @@ from builtins import *  # @UnusedWildImport
 from mcculw import ul
 from mcculw.enums import (InfoType, BoardInfo, CounterInfo, CounterChannelType,
                           ScanOptions)
+from .info_cache import cached_property
 
 
 class CtrInfo:
@@ -20,11 +21,17 @@ class CtrInfo:
     board_num : int
         The board number associated with the device when created with
         :func:`.create_daq_device` or configured with Instacal.
+    cache : InfoCache, optional
+        Memoizes the property values instead of querying the device on every
+        access. See :class:`.DaqDeviceInfo`.
     """
-    def __init__(self, board_num):
+    _probe_children = ('chan_info',)
+
+    def __init__(self, board_num, cache=None):
         self._board_num = board_num
+        self._cache = cache
 
-    @property
+    @cached_property()
     def num_chans(self):
         return ul.get_config(InfoType.BOARDINFO, self._board_num, 0,
                              BoardInfo.CINUMDEVS)
@@ -37,29 +44,36 @@ class CtrInfo:
     def chan_info(self):
         chan_info_list = []
         for chan_index in range(self.num_chans):
-            channel_info = CtrChanInfo(self._board_num, chan_index)
+            channel_info = CtrChanInfo(self._board_num, chan_index,
+                                       self._child_cache(chan_index))
             chan_info_list.append(channel_info)
         return chan_info_list
 
+    def _child_cache(self, chan_index):
+        if self._cache is None:
+            return None
+        return self._cache.child('chan_info', chan_index)
+
 
 class CtrChanInfo:
-    def __init__(self, board_num, chan_index):
+    def __init__(self, board_num, chan_index, cache=None):
         self._board_num = board_num
         self._chan_index = chan_index
+        self._cache = cache
 
-    @property
+    @cached_property()
     def channel_num(self):
         return ul.get_config(InfoType.COUNTERINFO, self._board_num,
                              self._chan_index, CounterInfo.CTRNUM)
 
-    @property
+    @cached_property(CounterChannelType)
     def type(self):
         return CounterChannelType(ul.get_config(InfoType.COUNTERINFO,
                                                 self._board_num,
                                                 self._chan_index,
                                                 CounterInfo.CTRTYPE))
 
-    @property
+    @cached_property(ScanOptions)
     def supported_scan_options(self):
         return ScanOptions(ul.get_config(InfoType.BOARDINFO, self._board_num,
                                          self._chan_index,
@@ -1,5 +1,7 @@
 from __future__ import absolute_import, division, print_function
 from builtins import *  # @UnusedWildImport
+import json
+import os
 
 from mcculw import ul
 from mcculw.ul import ULError
@@ -11,6 +13,9 @@ from .ctr_info import CtrInfo
 from .daqi_info import DaqiInfo
 from .daqo_info import DaqoInfo
 from .dio_info import DioInfo
+from .info_cache import InfoCache, cached_property, probe
+
+PROFILE_VERSION = 1
 
 
 class DaqDeviceInfo:
@@ -27,82 +32,171 @@ class DaqDeviceInfo:
     board_num : int
         The board number associated with the device when created with
         :func:`.create_daq_device` or configured with Instacal.
+    cached : bool, optional
+        If True, each property queries the device once, on first access, and
+        returns the same value afterwards; this includes the properties of
+        the info objects returned by the get_xxx_info() methods. Use
+        :meth:`invalidate` to query the device again. Defaults to False.
+    profile : dict, optional
+        Values returned by :meth:`snapshot`, used as the cached values instead
+        of querying the device. Implies cached=True.
+
+    Notes
+    -----
+    Cached values can be saved to a JSON profile file with
+    :meth:`save_profile`, keyed by the unique ID of the device. Later,
+    :meth:`load_profile` returns a cached DaqDeviceInfo that takes its values
+    from the file instead of probing the device.
     """
+    _probe_children = ('exp_info',)
 
-    def __init__(self, board_num):
+    def __init__(self, board_num, cached=False, profile=None):
         self._board_num = board_num
         self._board_type = ul.get_config(InfoType.BOARDINFO, board_num, 0,
                                          BoardInfo.BOARDTYPE)
         if self._board_type == 0:
             raise ULError(ErrorCode.BADBOARD)
+        self._cache = (InfoCache(profile) if cached or profile is not None
+                       else None)
 
-        self._ai_info = AiInfo(self._board_num)
-        self._ao_info = AoInfo(self._board_num)
-        self._ctr_info = CtrInfo(self._board_num)
-        self._daqi_info = DaqiInfo(self._board_num)
-        self._daqo_info = DaqoInfo(self._board_num)
-        self._dio_info = DioInfo(self._board_num)
+        # The info objects are created on first use
+        self._ai_info = None
+        self._ao_info = None
+        self._ctr_info = None
+        self._daqi_info = None
+        self._daqo_info = None
+        self._dio_info = None
 
     @property
     def board_num(self):  # -> int
         return self._board_num
 
-    @property
+    @classmethod
+    def from_profile(cls, board_num, profile):
+        """Returns a cached DaqDeviceInfo that takes its values from profile,
+        a dict returned by :meth:`snapshot`."""
+        return cls(board_num, profile=profile)
+
+    @classmethod
+    def load_profile(cls, board_num, path):
+        """Returns a cached DaqDeviceInfo for the device, with the values
+        saved in the profile file at path for the unique ID of the device. If
+        the file does not exist or has no profile for the device, the values
+        are read from the device on first access."""
+        info = cls(board_num, cached=True)
+        profile = _read_profiles(path).get(info.unique_id)
+        if profile is not None:
+            info = cls.from_profile(board_num, profile)
+        return info
+
+    def save_profile(self, path):
+        """Reads all of the values (see :meth:`snapshot`) and stores them in
+        the profile file at path, under the unique ID of the device. Profiles
+        of other devices in the file are kept."""
+        profile = self.snapshot()
+        profiles = _read_profiles(path)
+        profiles[profile['unique_id']] = profile
+        with open(path, 'w') as f:
+            json.dump({'version': PROFILE_VERSION, 'devices': profiles}, f,
+                      indent=2, sort_keys=True)
+
+    def snapshot(self):  # -> dict
+        """Reads every property of the device and of its info objects, and
+        returns their values as a dict that can be serialized to JSON."""
+        if self._cache is None:
+            return DaqDeviceInfo(self._board_num, cached=True).snapshot()
+        probe(self)
+        for info in (self.get_ai_info(), self.get_ao_info(),
+                     self.get_ctr_info(), self.get_daqi_info(),
+                     self.get_daqo_info(), self.get_dio_info()):
+            probe(info)
+        return self._cache.to_profile()
+
+    def invalidate(self):
+        """Discards the cached values, so that the next access of each
+        property queries the device again."""
+        if self._cache is not None:
+            self._cache.clear()
+
+    def _child_cache(self, name, index=None):
+        if self._cache is None:
+            return None
+        return self._cache.child(name, index)
+
+    @cached_property()
     def product_name(self):  # -> str
         return ul.get_board_name(self._board_num)
 
-    @property
+    @cached_property()
     def unique_id(self):  # -> str
         return ul.get_config_string(InfoType.BOARDINFO, self._board_num, 0,
                                     BoardInfo.DEVUNIQUEID, 32)
 
     @property
     def supports_analog_input(self):  # -> boolean
-        return self._ai_info.is_supported
+        return self.get_ai_info().is_supported
 
     @property
     def supports_temp_input(self):  # -> boolean
-        return self._ai_info.temp_supported
+        return self.get_ai_info().temp_supported
 
     def get_ai_info(self):  # -> AiInfo
+        if self._ai_info is None:
+            self._ai_info = AiInfo(self._board_num,
+                                   self._child_cache('ai'))
         return self._ai_info
 
     @property
     def supports_analog_output(self):  # -> boolean
-        return self._ao_info.is_supported
+        return self.get_ao_info().is_supported
 
     def get_ao_info(self):  # -> AoInfo
+        if self._ao_info is None:
+            self._ao_info = AoInfo(self._board_num,
+                                   self._child_cache('ao'))
         return self._ao_info
 
     @property
     def supports_counters(self):  # -> boolean
-        return self._ctr_info.is_supported
+        return self.get_ctr_info().is_supported
 
     def get_ctr_info(self):  # -> CtrInfo
+        if self._ctr_info is None:
+            self._ctr_info = CtrInfo(self._board_num,
+                                     self._child_cache('ctr'))
         return self._ctr_info
 
     @property
     def supports_daq_input(self):  # -> boolean
-        return self._daqi_info.is_supported
+        return self.get_daqi_info().is_supported
 
     def get_daqi_info(self):  # -> DaqiInfo
+        if self._daqi_info is None:
+            self._daqi_info = DaqiInfo(self._board_num,
+                                       self._child_cache('daqi'))
         return self._daqi_info
 
     @property
     def supports_daq_output(self):  # -> boolean
-        return self._daqo_info.is_supported
+        return self.get_daqo_info().is_supported
 
     def get_daqo_info(self):  # -> DaqoInfo
+        if self._daqo_info is None:
+            self._daqo_info = DaqoInfo(self._board_num,
+                                       self._child_cache('daqo'))
         return self._daqo_info
 
     @property
     def supports_digital_io(self):  # -> boolean
-        return self._dio_info.is_supported
+        return self.get_dio_info().is_supported
 
     def get_dio_info(self):  # -> DioInfo
+        if self._dio_info is None:
+            self._dio_info = DioInfo(self._board_num,
+                                     self._child_cache('dio'))
         return self._dio_info
 
-    @property
+    @cached_property(EventType)
     def supported_event_types(self):  # -> list[EventType]
         event_types = []
 
@@ -115,7 +209,7 @@ class DaqDeviceInfo:
 
         return event_types
 
-    @property
+    @cached_property()
     def num_expansions(self):  # -> int
         return ul.get_config(InfoType.BOARDINFO, self.board_num, 0,
                              BoardInfo.NUMEXPS)
@@ -124,21 +218,34 @@ class DaqDeviceInfo:
     def exp_info(self):  # -> list[ExpInfo]
         exp_info = []
         for expansion_num in range(self.num_expansions):
-            exp_info.append(ExpInfo(self._board_num, expansion_num))
+            exp_info.append(ExpInfo(
+                self._board_num, expansion_num,
+                self._child_cache('exp_info', expansion_num)))
         return exp_info
 
 
 class ExpInfo:
-    def __init__(self, board_num, expansion_num):
+    def __init__(self, board_num, expansion_num, cache=None):
         self._board_num = board_num
         self._expansion_num = expansion_num
+        self._cache = cache
 
-    @property
+    @cached_property()
     def board_type(self):
         return ul.get_config(InfoType.EXPANSIONINFO, self._board_num,
                              self._expansion_num, ExpansionInfo.BOARDTYPE)
 
-    @property
+    @cached_property()
     def mux_ad_chan(self):
         return ul.get_config(InfoType.EXPANSIONINFO, self._board_num,
                              self._expansion_num, ExpansionInfo.MUX_AD_CHAN1)
+
+
+def _read_profiles(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        contents = json.load(f)
+    if contents.get('version') != PROFILE_VERSION:
+        return {}
+    return contents.get('devices', {})
@@ -4,6 +4,7 @@ from builtins import *  # @UnusedWildImport
 from mcculw import ul
 from mcculw.ul import ULError
 from mcculw.enums import FunctionType, InfoType, BoardInfo, ChannelType
+from .info_cache import cached_property
 
 
 class DaqiInfo:
@@ -20,11 +21,15 @@ class DaqiInfo:
     board_num : int
         The board number associated with the device when created with
         :func:`.create_daq_device` or configured with Instacal.
+    cache : InfoCache, optional
+        Memoizes the property values instead of querying the device on every
+        access. See :class:`.DaqDeviceInfo`.
     """
-    def __init__(self, board_num):
+    def __init__(self, board_num, cache=None):
         self._board_num = board_num
+        self._cache = cache
 
-    @property
+    @cached_property()
     def is_supported(self):
         daqi_supported = True
         try:
@@ -33,7 +38,7 @@ class DaqiInfo:
             daqi_supported = False
         return daqi_supported
 
-    @property
+    @cached_property(ChannelType)
     def supported_channel_types(self):
         chan_types = []
 
@@ -48,7 +53,7 @@ class DaqiInfo:
 
         return chan_types
 
-    @property
+    @cached_property()
     def supports_setpoints(self):
         setpoints_supported = False
         if self.is_supported:
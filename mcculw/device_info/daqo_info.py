@@ -4,6 +4,7 @@ from builtins import *  # @UnusedWildImport
 from mcculw import ul
 from mcculw.ul import ULError
 from mcculw.enums import FunctionType, InfoType, BoardInfo, ChannelType
+from .info_cache import cached_property
 
 
 class DaqoInfo:
@@ -20,11 +21,15 @@ class DaqoInfo:
     board_num : int
         The board number associated with the device when created with
         :func:`.create_daq_device` or configured with Instacal.
+    cache : InfoCache, optional
+        Memoizes the property values instead of querying the device on every
+        access. See :class:`.DaqDeviceInfo`.
     """
-    def __init__(self, board_num):
+    def __init__(self, board_num, cache=None):
         self._board_num = board_num
+        self._cache = cache
 
-    @property
+    @cached_property()
     def is_supported(self):
         daqo_supported = True
         try:
@@ -33,7 +38,7 @@ class DaqoInfo:
             daqo_supported = False
         return daqo_supported
 
-    @property
+    @cached_property(ChannelType)
     def supported_channel_types(self):
         chan_types = []
 
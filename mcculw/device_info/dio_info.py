@@ -5,6 +5,7 @@ from mcculw import ul
 from mcculw.ul import ULError
 from mcculw.enums import (InfoType, BoardInfo, DigitalInfo, DigitalPortType,
                           DigitalIODirection, FunctionType)
+from .info_cache import cached_property
 
 
 class DioInfo:
@@ -21,11 +22,17 @@ class DioInfo:
     board_num : int
         The board number associated with the device when created with
         :func:`.create_daq_device` or configured with Instacal.
+    cache : InfoCache, optional
+        Memoizes the property values instead of querying the device on every
+        access. See :class:`.DaqDeviceInfo`.
     """
-    def __init__(self, board_num):
+    _probe_children = ('port_info',)
+
+    def __init__(self, board_num, cache=None):
         self._board_num = board_num
+        self._cache = cache
 
-    @property
+    @cached_property()
     def num_ports(self):
         try:
             port_count = ul.get_config(InfoType.BOARDINFO, self._board_num, 0,
@@ -43,31 +50,38 @@ class DioInfo:
     def port_info(self):
         port_info_list = []
         for port_index in range(self.num_ports):
-            port_info_list.append(PortInfo(self._board_num, port_index))
+            port_info_list.append(PortInfo(self._board_num, port_index,
+                                           self._child_cache(port_index)))
         return port_info_list
 
+    def _child_cache(self, port_index):
+        if self._cache is None:
+            return None
+        return self._cache.child('port_info', port_index)
+
 
 class PortInfo:
-    def __init__(self, board_num, port_index):
+    def __init__(self, board_num, port_index, cache=None):
         self._board_num = board_num
         self._port_index = port_index
+        self._cache = cache
 
-    @property
+    @cached_property()
     def num_bits(self):
         return ul.get_config(InfoType.DIGITALINFO, self._board_num,
                              self._port_index, DigitalInfo.NUMBITS)
 
-    @property
+    @cached_property()
     def in_mask(self):
         return ul.get_config(InfoType.DIGITALINFO, self._board_num,
                              self._port_index, DigitalInfo.INMASK)
 
-    @property
+    @cached_property()
     def out_mask(self):
         return ul.get_config(InfoType.DIGITALINFO, self._board_num,
                              self._port_index, DigitalInfo.OUTMASK)
 
-    @property
+    @cached_property(DigitalPortType)
     def type(self):
         dev_type = ul.get_config(InfoType.DIGITALINFO, self._board_num,
                                  self._port_index, DigitalInfo.DEVTYPE)
@@ -87,7 +101,7 @@ class PortInfo:
     def supports_input(self):
         return self.in_mask > 0 or self.is_port_configurable
 
-    @property
+    @cached_property()
     def supports_input_scan(self):
         input_scan_supported = True
         try:
@@ -96,7 +110,7 @@ class PortInfo:
             input_scan_supported = False
         return input_scan_supported
 
-    @property
+    @cached_property()
     def supports_output_scan(self):
         output_scan_supported = True
         try:
@@ -109,7 +123,7 @@ class PortInfo:
     def supports_output(self):
         return self.out_mask > 0 or self.is_port_configurable
 
-    @property
+    @cached_property()
     def is_bit_configurable(self):
         bit_configurable = False
         if self.in_mask & self.out_mask == 0:
@@ -126,7 +140,7 @@ class PortInfo:
                     bit_configurable = False
         return bit_configurable
 
-    @property
+    @cached_property()
     def is_port_configurable(self):
         port_configurable = False
         if self.in_mask & self.out_mask == 0:
@@ -0,0 +1,133 @@
+from mcculw.ul import ULError
+
+
+class InfoCache:
+    """Memoized property values of an info object, and of the info objects
+    it creates.
+
+    A cache starts out empty, or with the values of a profile created by
+    :meth:`to_profile`. Values from a profile are decoded on first access.
+
+    Parameters
+    ----------
+    profile : dict, optional
+        A profile created by :meth:`to_profile`.
+    """
+    def __init__(self, profile=None):
+        self._values = {}
+        self._profile = profile or {}
+        self._children = {}
+
+    def get(self, name, probe, decode=None):
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+        if name in self._profile:
+            value = _decode(self._profile[name], decode)
+        else:
+            value = probe()
+        self._values[name] = value
+        return value
+
+    def child(self, name, index=None):
+        """Returns the cache of the info object stored under name (and index,
+        for one of a list of info objects)."""
+        key = name if index is None else (name, index)
+        cache = self._children.get(key)
+        if cache is None:
+            profile = self._profile.get(name)
+            if index is not None:
+                profile = profile[index] if profile and index < len(profile) else None
+            cache = InfoCache(profile)
+            self._children[key] = cache
+        return cache
+
+    def clear(self):
+        """Discards all values, including the ones loaded from a profile."""
+        self._values.clear()
+        self._profile = {}
+        for cache in self._children.values():
+            cache.clear()
+
+    def to_profile(self):
+        """Returns the cached values as a dict that can be serialized to JSON.
+        Enum values are stored as ints."""
+        profile = dict(self._profile)
+        for name, value in self._values.items():
+            profile[name] = _encode(value)
+        for key, cache in self._children.items():
+            if isinstance(key, tuple):
+                name, index = key
+                items = profile.get(name)
+                items = list(items) if isinstance(items, list) else []
+                items.extend({} for _ in range(index + 1 - len(items)))
+                items[index] = cache.to_profile()
+                profile[name] = items
+            else:
+                profile[key] = cache.to_profile()
+        return profile
+
+
+class CachedProperty(property):
+    """A property whose value is memoized in the InfoCache of its instance
+    (the ``_cache`` attribute), if the instance has one. See
+    :func:`cached_property`."""
+
+
+def cached_property(decode=None):
+    """Returns a decorator that turns a method of an info class into a
+    :class:`CachedProperty`.
+
+    Parameters
+    ----------
+    decode : callable, optional
+        Converts a value loaded from a profile back to its type, for example
+        ULRange. For lists, decode is applied to each item.
+    """
+    def decorator(func):
+        name = func.__name__.lstrip('_')
+
+        def getter(self):
+            if self._cache is None:
+                return func(self)
+            return self._cache.get(name, lambda: func(self), decode)
+
+        getter.__doc__ = func.__doc__
+        return CachedProperty(getter)
+
+    return decorator
+
+
+def probe(info):
+    """Reads every cached property of info, and of the info objects returned
+    by the properties named in its ``_probe_children`` attribute, so that
+    they are all in its cache."""
+    cls = type(info)
+    for name in dir(cls):
+        if isinstance(getattr(cls, name), CachedProperty):
+            try:
+                getattr(info, name)
+            except ULError:
+                # Not available on this device; left out of the cache
+                pass
+    for name in getattr(cls, '_probe_children', ()):
+        for child in getattr(info, name):
+            probe(child)
+
+
+def _encode(value):
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    if isinstance(value, int) and not isinstance(value, bool):
+        # Plain ints for IntEnum and IntFlag values
+        return int(value)
+    return value
+
+
+def _decode(value, decode):
+    if value is None or decode is None:
+        return value
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    return decode(value)
@@ -0,0 +1,195 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Edge detection and timestamping for digital input scans.
+
+:func:`.d_in_scan` fills its buffer with one port word per sample. :class:`EdgeDetector`
+reduces chunks of such words to the changes of their bits: each chunk is XORed with itself
+shifted by one sample, and only the samples where a bit changed are examined, so a long scan of
+a mostly idle port becomes a short array of events::
+
+    detector = EdgeDetector(num_bits=8, debounce=5)
+    for chunk in scan:
+        events = detector.update(chunk.data)
+        for sample, bit, rising in events:
+            ...
+    print(detector.edge_counts)
+
+Each event is a record of :data:`EVENT_DTYPE`: the index of the sample where the bit changed,
+the bit number and whether the edge is rising. A per-bit debounce ignores the pulses shorter
+than a number of samples; an edge is then reported once the new level has lasted that long, but
+still with the index of the sample where it started.
+
+This module requires NumPy.
+"""
+
+import numpy as np
+
+EVENT_DTYPE = np.dtype([('sample', np.int64), ('bit', np.uint8), ('rising', np.bool_)])
+"""The record type of the events returned by :meth:`EdgeDetector.update`."""
+
+
+class EdgeDetector(object):
+    """Detects the edges of the bits of a stream of digital port words, chunk by chunk.
+
+    Parameters
+    ----------
+    num_bits : int, optional
+        The width of the port: 8 for a DIGITAL8 port, 16 by default.
+    mask : int, optional
+        The bits to watch. Defaults to all the bits of the port.
+    debounce : int or sequence of int, optional
+        The number of samples a new level must last to count as an edge, for all bits or per
+        bit. 0 (the default) reports every change.
+    initial : int, optional
+        The port word before the first sample. If None (the default), the first sample sets the
+        initial levels without reporting edges.
+    keep_log : bool, optional
+        If True, the events are also kept for :meth:`event_log`.
+
+    Attributes
+    ----------
+    edge_counts : numpy.ndarray
+        The number of rising (column 0) and falling (column 1) edges of each bit, of shape
+        (num_bits, 2).
+    samples : int
+        Number of samples processed.
+    """
+    def __init__(self, num_bits=16, mask=None, debounce=0, initial=None, keep_log=False):
+        self.num_bits = num_bits
+        self.mask = (1 << num_bits) - 1 if mask is None else mask
+        self.debounce = np.broadcast_to(np.asarray(debounce, np.int64), (num_bits,)).copy()
+        self.initial = initial
+        self.keep_log = keep_log
+        self.reset()
+
+    def reset(self):
+        """Forgets the samples processed and the events counted."""
+        self.edge_counts = np.zeros((self.num_bits, 2), np.int64)
+        self.samples = 0
+        self._log = []
+        self._next_sample = 0
+        # The last raw word, and per bit the debounced level and the start and
+        # level of the last run of equal raw levels
+        self._last_word = None if self.initial is None else int(self.initial)
+        if self._last_word is not None:
+            self._set_levels(self._last_word, 0)
+
+    def _set_levels(self, word, sample):
+        levels = (word >> np.arange(self.num_bits)) & 1
+        self._levels = levels.astype(np.int8)
+        self._run_levels = levels.astype(np.int8)
+        self._run_starts = np.full(self.num_bits, sample, np.int64)
+
+    @property
+    def levels(self):
+        """The debounced level of each bit, or None before the first sample."""
+        return None if self._last_word is None else self._levels.copy()
+
+    def update(self, data, first_sample=None):
+        """Processes a chunk of port words.
+
+        Parameters
+        ----------
+        data : array_like
+            The port words, one per sample.
+        first_sample : int, optional
+            Index of the first sample of data, counted in samples per channel from the start of
+            the scan, such as ScanChunk.first_scan. Defaults to the sample following the previous
+            chunk. A change across a gap is reported at the first sample after the gap.
+
+        Returns
+        -------
+        numpy.ndarray
+            The events found, as records of EVENT_DTYPE ordered by sample, then by bit
+        """
+        words = np.asarray(data).reshape(-1).astype(np.int64) & self.mask
+        n = len(words)
+        first = self._next_sample if first_sample is None else int(first_sample)
+        if not n:
+            return np.empty(0, EVENT_DTYPE)
+        if self._last_word is None:
+            self._last_word = int(words[0])
+            self._set_levels(self._last_word, first)
+
+        previous = np.empty_like(words)
+        previous[0] = self._last_word
+        previous[1:] = words[:-1]
+        changed_rows = np.flatnonzero(words ^ previous)
+        if self.debounce.any():
+            events = self._debounced(words, changed_rows, first)
+        else:
+            events = self._immediate(words, previous, changed_rows, first)
+            if len(changed_rows):
+                self._levels = ((words[-1] >> np.arange(self.num_bits)) & 1).astype(np.int8)
+
+        self._last_word = int(words[-1])
+        self._next_sample = first + n
+        self.samples += n
+        if len(events):
+            np.add.at(self.edge_counts, (events['bit'], (~events['rising']).astype(np.intp)), 1)
+            if self.keep_log:
+                self._log.append(events)
+        return events
+
+    def _immediate(self, words, previous, changed_rows, first):
+        # Every change of the changed rows is an edge
+        bits = np.arange(self.num_bits)
+        flips = ((words[changed_rows] ^ previous[changed_rows])[:, None] >> bits) & 1
+        rows, bit = np.nonzero(flips)
+        events = np.empty(len(rows), EVENT_DTYPE)
+        events['sample'] = changed_rows[rows] + first
+        events['bit'] = bit
+        events['rising'] = (words[changed_rows[rows]] >> bit) & 1
+        return events
+
+    def _debounced(self, words, changed_rows, first):
+        n = len(words)
+        samples, bits, rising = [], [], []
+        for bit in range(self.num_bits):
+            if not (self.mask >> bit) & 1:
+                continue
+            raw = (words >> bit) & 1
+            # Starts and levels of the runs of equal levels, continuing the
+            # last run of the previous chunk
+            starts = self._bit_changes(raw, changed_rows, bit)
+            run_starts = np.concatenate(([self._run_starts[bit]], starts + first))
+            run_levels = np.concatenate(([self._run_levels[bit]], raw[starts])).astype(np.int8)
+            run_ends = np.append(run_starts[1:], first + n)
+            confirmed = run_ends - run_starts >= self.debounce[bit]
+            levels = run_levels[confirmed]
+            if len(levels):
+                before = np.concatenate(([self._levels[bit]], levels[:-1]))
+                edges = np.flatnonzero(levels != before)
+                samples.append(run_starts[confirmed][edges])
+                bits.append(np.full(len(edges), bit, np.uint8))
+                rising.append(levels[edges] == 1)
+                self._levels[bit] = levels[-1]
+            self._run_starts[bit] = run_starts[-1]
+            self._run_levels[bit] = run_levels[-1]
+
+        if not samples:
+            return np.empty(0, EVENT_DTYPE)
+        events = np.empty(sum(len(s) for s in samples), EVENT_DTYPE)
+        events['sample'] = np.concatenate(samples)
+        events['bit'] = np.concatenate(bits)
+        events['rising'] = np.concatenate(rising)
+        return events[np.lexsort((events['bit'], events['sample']))]
+
+    def _bit_changes(self, raw, changed_rows, bit):
+        # The rows among changed_rows where this bit differs from the sample before
+        before = np.empty(len(changed_rows), raw.dtype)
+        if len(changed_rows):
+            before[:] = raw[changed_rows - 1]
+            if changed_rows[0] == 0:
+                before[0] = (self._last_word >> bit) & 1
+        return changed_rows[raw[changed_rows] != before]
+
+    def event_log(self):
+        """Returns all the events found since the start, or the last reset, when keep_log is
+        True."""
+        if not self._log:
+            return np.empty(0, EVENT_DTYPE)
+        if len(self._log) > 1:
+            self._log = [np.concatenate(self._log)]
+        return self._log[0]
@@ -0,0 +1,285 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Opt-in statistics about the Universal Library calls made by :mod:`mcculw.ul`.
+
+Once :func:`enable` is called, every call to a UL entry point is timed and counted, along with the
+error codes it returns, and every :class:`~mcculw.ul.ULError` raised is counted by error code.
+:func:`snapshot` returns the statistics gathered so far, and :func:`to_prometheus` and
+:func:`to_json` format them for a metrics endpoint or a log::
+
+    from mcculw import instrumentation
+
+    instrumentation.enable()
+    run_acquisition()
+    stats = instrumentation.snapshot()
+    print(stats.functions['cbGetIOStatus'].p99)
+    print(instrumentation.to_prometheus())
+
+Latencies are kept in fixed histogram buckets, so recording a call costs the same however long the
+program runs, and percentiles are interpolated within a bucket. When instrumentation is disabled
+(the default), the calls go straight to the backend and cost nothing extra.
+"""
+import bisect
+import collections
+import json
+import threading
+import time
+
+from mcculw import ul
+from mcculw.enums import ErrorCode
+
+# Upper bounds of the latency histogram buckets, in seconds: 1-2-5 steps from
+# 100 ns to 50 s, plus an overflow bucket
+BUCKET_BOUNDS = tuple(m * 10.0 ** e for e in range(-7, 2) for m in (1, 2, 5))
+
+CallStats = collections.namedtuple(
+    "CallStats", "calls errors total_time min_time max_time p50 p90 p99 error_codes buckets")
+CallStats.__doc__ = """Statistics of the calls to one UL entry point. Times are in seconds.
+
+calls : int
+    Number of calls.
+errors : int
+    Number of calls that returned an error code.
+total_time : float
+    Time spent in the calls.
+min_time, max_time : float
+    The shortest and longest call.
+p50, p90, p99 : float
+    Percentiles of the call time, interpolated within the histogram buckets.
+error_codes : dict
+    Number of calls that returned each error code, keyed by ErrorCode (or int for codes that
+    ErrorCode does not know).
+buckets : tuple of int
+    Number of calls that took up to each bound of BUCKET_BOUNDS, not cumulative, followed by the
+    number of longer calls.
+"""
+
+Snapshot = collections.namedtuple("Snapshot", "functions raised duration")
+Snapshot.__doc__ = """The statistics returned by :func:`snapshot`.
+
+functions : dict
+    A :class:`CallStats` per UL entry point called, keyed by name (such as ``'cbAIn'``).
+raised : dict
+    Number of ULError exceptions created, keyed by ErrorCode. This includes the errors detected
+    by mcculw.ul itself rather than returned by the library.
+duration : float
+    Seconds since instrumentation was enabled or last reset.
+"""
+
+
+class _Recorder(object):
+    # Accumulates the calls of one entry point
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.min_time = float('inf')
+        self.max_time = 0.0
+        self.error_codes = collections.Counter()
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+
+    def record(self, elapsed, errcode):
+        bucket = bisect.bisect_left(BUCKET_BOUNDS, elapsed)
+        with self.lock:
+            self.calls += 1
+            self.total_time += elapsed
+            if elapsed < self.min_time:
+                self.min_time = elapsed
+            if elapsed > self.max_time:
+                self.max_time = elapsed
+            self.buckets[bucket] += 1
+            if errcode:
+                self.errors += 1
+                self.error_codes[errcode] += 1
+
+    def stats(self):
+        with self.lock:
+            buckets = tuple(self.buckets)
+            error_codes = dict((_error_code(code), count)
+                               for code, count in self.error_codes.items())
+            calls, errors, total_time = self.calls, self.errors, self.total_time
+            min_time, max_time = self.min_time, self.max_time
+        percentiles = [_percentile(buckets, calls, q, min_time, max_time)
+                       for q in (0.5, 0.9, 0.99)]
+        return CallStats(calls, errors, total_time, min_time if calls else 0.0, max_time,
+                         percentiles[0], percentiles[1], percentiles[2], error_codes, buckets)
+
+
+_lock = threading.Lock()
+_recorders = {}
+_raised = collections.Counter()
+_start_time = time.monotonic()
+_enabled = False
+
+
+def _recorder(name):
+    with _lock:
+        recorder = _recorders.get(name)
+        if recorder is None:
+            recorder = _recorders[name] = _Recorder()
+        return recorder
+
+
+def _wrap(name, function, returns_errcode):
+    record = _recorder(name).record
+    perf_counter = time.perf_counter
+
+    def call(*args):
+        start = perf_counter()
+        try:
+            result = function(*args)
+        except Exception:
+            # ctypes rejected the arguments
+            record(perf_counter() - start, 0)
+            raise
+        record(perf_counter() - start, result if returns_errcode else 0)
+        return result
+
+    call.__name__ = name
+    call.__wrapped__ = function
+    return call
+
+
+def _on_error(errorcode):
+    with _lock:
+        _raised[errorcode] += 1
+
+
+def _error_code(code):
+    try:
+        return ErrorCode(code)
+    except ValueError:
+        return code
+
+
+def _percentile(buckets, calls, q, min_time, max_time):
+    # Interpolates linearly within the bucket holding the q quantile
+    if not calls:
+        return 0.0
+    rank = q * calls
+    cumulative = 0
+    for index, count in enumerate(buckets):
+        if count and cumulative + count >= rank:
+            low = BUCKET_BOUNDS[index - 1] if index else 0.0
+            high = BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else max_time
+            low, high = max(low, min_time), min(high, max_time)
+            return low + (high - low) * (rank - cumulative) / count
+        cumulative += count
+    return max_time
+
+
+def enable():
+    """Starts recording statistics about the UL calls. Statistics gathered before are kept; see
+    :func:`reset`."""
+    global _enabled
+    _enabled = True
+    ul.set_call_hooks(_wrap, _on_error)
+
+
+def disable():
+    """Stops recording statistics. The statistics gathered remain available."""
+    global _enabled
+    _enabled = False
+    ul.set_call_hooks()
+
+
+def is_enabled():
+    """Returns True if statistics are being recorded."""
+    return _enabled
+
+
+def reset():
+    """Forgets the statistics gathered so far."""
+    global _start_time
+    with _lock:
+        for recorder in _recorders.values():
+            with recorder.lock:
+                recorder.clear()
+        _raised.clear()
+        _start_time = time.monotonic()
+
+
+def snapshot():
+    """Returns the :class:`Snapshot` of the statistics gathered so far."""
+    with _lock:
+        recorders = dict(_recorders)
+        raised = dict((_error_code(code), count) for code, count in _raised.items())
+        duration = time.monotonic() - _start_time
+    functions = dict((name, recorder.stats()) for name, recorder in sorted(recorders.items())
+                     if recorder.calls)
+    return Snapshot(functions, raised, duration)
+
+
+def _code_name(code):
+    return code.name if isinstance(code, ErrorCode) else str(code)
+
+
+def to_json(stats=None, indent=None):
+    """Formats a :class:`Snapshot` (by default, a new one) as JSON. Times are in seconds."""
+    stats = snapshot() if stats is None else stats
+    functions = {}
+    for name, call_stats in stats.functions.items():
+        entry = call_stats._asdict()
+        entry['error_codes'] = dict((_code_name(code), count)
+                                    for code, count in call_stats.error_codes.items())
+        entry['buckets'] = dict(zip([str(bound) for bound in BUCKET_BOUNDS] + ['+Inf'],
+                                    call_stats.buckets))
+        functions[name] = entry
+    return json.dumps({'duration': stats.duration, 'functions': functions,
+                       'raised': dict((_code_name(code), count)
+                                      for code, count in stats.raised.items())},
+                      indent=indent, sort_keys=True)
+
+
+def to_prometheus(stats=None, prefix='mcculw_ul'):
+    """Formats a :class:`Snapshot` (by default, a new one) in the Prometheus text exposition
+    format: a counter of calls and of errors per entry point, a histogram of call times, and a
+    counter of the ULError exceptions raised per error code."""
+    stats = snapshot() if stats is None else stats
+    lines = [
+        '# HELP {}_calls_total Calls to each Universal Library function.'.format(prefix),
+        '# TYPE {}_calls_total counter'.format(prefix),
+    ]
+    for name, call_stats in stats.functions.items():
+        lines.append('{}_calls_total{{function="{}"}} {}'.format(prefix, name, call_stats.calls))
+
+    lines += [
+        '# HELP {}_call_errors_total Error codes returned by each Universal Library '
+        'function.'.format(prefix),
+        '# TYPE {}_call_errors_total counter'.format(prefix),
+    ]
+    for name, call_stats in stats.functions.items():
+        for code, count in sorted(call_stats.error_codes.items()):
+            lines.append('{}_call_errors_total{{function="{}",code="{}",error="{}"}} {}'.format(
+                prefix, name, int(code), _code_name(code), count))
+
+    lines += [
+        '# HELP {}_call_seconds Time spent in each Universal Library function.'.format(prefix),
+        '# TYPE {}_call_seconds histogram'.format(prefix),
+    ]
+    for name, call_stats in stats.functions.items():
+        cumulative = 0
+        for bound, count in zip(BUCKET_BOUNDS, call_stats.buckets):
+            cumulative += count
+            lines.append('{}_call_seconds_bucket{{function="{}",le="{:g}"}} {}'.format(
+                prefix, name, bound, cumulative))
+        lines.append('{}_call_seconds_bucket{{function="{}",le="+Inf"}} {}'.format(
+            prefix, name, call_stats.calls))
+        lines.append('{}_call_seconds_sum{{function="{}"}} {!r}'.format(
+            prefix, name, call_stats.total_time))
+        lines.append('{}_call_seconds_count{{function="{}"}} {}'.format(
+            prefix, name, call_stats.calls))
+
+    lines += [
+        '# HELP {}_errors_raised_total ULError exceptions raised.'.format(prefix),
+        '# TYPE {}_errors_raised_total counter'.format(prefix),
+    ]
+    for code, count in sorted(stats.raised.items()):
+        lines.append('{}_errors_raised_total{{code="{}",error="{}"}} {}'.format(
+            prefix, int(code), _code_name(code), count))
+    return '\n'.join(lines) + '\n'
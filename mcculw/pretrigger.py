@@ -0,0 +1,328 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Software pretrigger for boards without hardware pretrigger support.
+
+:func:`.a_pretrig` needs trigger circuitry that keeps collecting samples while waiting for the
+trigger, which boards such as the USB-202 do not have. :class:`PretriggerCapture` provides the
+same result from a continuous scan: it keeps the last samples of every channel in a preallocated
+ring, evaluates a :class:`SoftwareTrigger` on one channel of each chunk of data, and emits a
+window of ``pretrig_count`` samples before and ``posttrig_count`` samples from each trigger::
+
+    scan = ContinuousScan(board_num, 0, 1, 100000, ULRange.BIP10VOLTS,
+                          options=ScanOptions.SCALEDATA)
+    capture = PretriggerCapture(SoftwareTrigger(TrigType.TRIG_ABOVE, high_threshold=1.0),
+                                num_chans=2, pretrig_count=1000, posttrig_count=4000)
+    with scan:
+        for chunk in scan:
+            for event in capture.update(chunk.data, chunk.first_scan):
+                process(event.data)
+
+The trigger types are those of :func:`.set_trigger`, applied to the samples of the trigger
+channel instead of a trigger input, with the thresholds in the units of the data (volts for
+scaled data, counts otherwise). The trigger re-arms as soon as it fires, so events can follow
+each other faster than their windows: overlapping windows share the samples of the ring, and no
+sample is dropped.
+
+This module requires NumPy.
+"""
+import collections
+
+import numpy as np
+
+from mcculw.demux import demux
+from mcculw.enums import TrigType
+
+PretriggerEvent = collections.namedtuple("PretriggerEvent", "trigger_sample first_sample data")
+PretriggerEvent.__doc__ = """A window of data around a trigger, as returned by
+:meth:`PretriggerCapture.update`.
+
+trigger_sample : int
+    Index of the sample that met the trigger condition, counted in samples per channel from the
+    start of the scan.
+first_sample : int
+    Index of the first sample of data, trigger_sample - pretrig_count.
+data : numpy.ndarray
+    The samples, with shape (pretrig_count + posttrig_count, channels). Row pretrig_count is the
+    trigger sample.
+"""
+
+# Trigger types that fire on a change of the input; the others fire as soon
+# as their condition holds, including on the first sample
+_EDGE_TYPES = frozenset([TrigType.TRIG_ABOVE, TrigType.TRIG_BELOW, TrigType.TRIG_RISING,
+                         TrigType.TRIG_FALLING, TrigType.TRIG_POS_EDGE, TrigType.TRIG_NEG_EDGE])
+
+# Trigger types with hysteresis: the condition turns on past one threshold
+# and off past the other, and the value is the state it starts in
+_HYSTERESIS_TYPES = {TrigType.TRIG_RISING: True, TrigType.TRIG_FALLING: True,
+                     TrigType.GATE_NEG_HYS: False, TrigType.GATE_POS_HYS: False}
+
+_PATTERN_TYPES = frozenset([TrigType.TRIG_PATTERN_EQ, TrigType.TRIG_PATTERN_NE,
+                            TrigType.TRIG_PATTERN_ABOVE, TrigType.TRIG_PATTERN_BELOW])
+
+
+class SoftwareTrigger(object):
+    """A trigger condition evaluated on the samples of one channel.
+
+    Parameters
+    ----------
+    trig_type : TrigType
+        The condition, as described for :func:`.set_trigger`:
+
+        - TRIG_ABOVE and TRIG_BELOW fire when the input crosses high_threshold upwards, or
+          low_threshold downwards.
+        - TRIG_RISING and TRIG_FALLING fire when the input goes from below low_threshold to above
+          high_threshold, or from above high_threshold to below low_threshold.
+        - GATE_ABOVE, GATE_BELOW, GATE_IN_WINDOW and GATE_OUT_WINDOW fire when the input enters
+          the region above high_threshold, below low_threshold, between the thresholds or outside
+          them. GATE_NEG_HYS fires when the input goes above high_threshold, and again only after
+          it has gone below low_threshold; GATE_POS_HYS is its opposite.
+        - TRIG_HIGH, GATE_HIGH, TRIG_POS_EDGE and their LOW and NEG_EDGE counterparts treat the
+          input as a logic level: high when it is at least high_threshold, or non-zero if
+          high_threshold is None. The HIGH and LOW types also fire on the first sample if the
+          level already holds.
+        - The TRIG_PATTERN types compare the input AND the mask high_threshold with the pattern
+          low_threshold AND the mask.
+
+        The GATE types do not stop the capture; they fire where the gate would open.
+    low_threshold : float, optional
+        The low threshold, or the pattern value.
+    high_threshold : float, optional
+        The high threshold, the logic level, or the pattern mask.
+    channel : int, optional
+        The position of the trigger channel in the scan, 0 by default.
+    """
+    def __init__(self, trig_type, low_threshold=None, high_threshold=None, channel=0):
+        self.trig_type = TrigType(trig_type)
+        self.low_threshold = low_threshold
+        self.high_threshold = high_threshold
+        self.channel = channel
+        needs_low = self.trig_type in (
+            TrigType.TRIG_BELOW, TrigType.GATE_BELOW, TrigType.GATE_IN_WINDOW,
+            TrigType.GATE_OUT_WINDOW) or self.trig_type in _HYSTERESIS_TYPES or (
+            self.trig_type in _PATTERN_TYPES)
+        needs_high = self.trig_type in (
+            TrigType.TRIG_ABOVE, TrigType.GATE_ABOVE, TrigType.GATE_IN_WINDOW,
+            TrigType.GATE_OUT_WINDOW) or self.trig_type in _HYSTERESIS_TYPES
+        if (needs_low and low_threshold is None) or (needs_high and high_threshold is None):
+            raise ValueError('{} needs {}'.format(self.trig_type.name, ' and '.join(
+                name for name, needed in (('low_threshold', needs_low),
+                                          ('high_threshold', needs_high)) if needed)))
+        self.reset()
+
+    def reset(self):
+        """Forgets the samples evaluated so far."""
+        if self.trig_type in _HYSTERESIS_TYPES:
+            self._state = _HYSTERESIS_TYPES[self.trig_type]
+        else:
+            self._state = self.trig_type in _EDGE_TYPES
+
+    def _condition(self, values):
+        trig_type = self.trig_type
+        low, high = self.low_threshold, self.high_threshold
+        if trig_type in (TrigType.TRIG_ABOVE, TrigType.GATE_ABOVE):
+            return values > high if trig_type == TrigType.GATE_ABOVE else values >= high
+        if trig_type in (TrigType.TRIG_BELOW, TrigType.GATE_BELOW):
+            return values < low if trig_type == TrigType.GATE_BELOW else values <= low
+        if trig_type == TrigType.GATE_IN_WINDOW:
+            return (values > low) & (values < high)
+        if trig_type == TrigType.GATE_OUT_WINDOW:
+            return (values < low) | (values > high)
+        if trig_type in _PATTERN_TYPES:
+            mask = ~0 if high is None else int(high)
+            masked = values.astype(np.int64) & mask
+            pattern = int(low) & mask
+            if trig_type == TrigType.TRIG_PATTERN_EQ:
+                return masked == pattern
+            if trig_type == TrigType.TRIG_PATTERN_NE:
+                return masked != pattern
+            if trig_type == TrigType.TRIG_PATTERN_ABOVE:
+                return masked > pattern
+            return masked < pattern
+        level = values != 0 if high is None else values >= high
+        if trig_type in (TrigType.GATE_LOW, TrigType.TRIG_LOW, TrigType.TRIG_NEG_EDGE):
+            return ~level
+        return level
+
+    def _hysteresis(self, values):
+        # 1 past the threshold that turns the condition on, 0 past the one
+        # that turns it off, -1 in between, where the last state holds
+        n = len(values)
+        on_above = self.trig_type in (TrigType.TRIG_RISING, TrigType.GATE_NEG_HYS)
+        above, below = values > self.high_threshold, values < self.low_threshold
+        marks = np.full(n, -1, np.int8)
+        marks[above] = 1 if on_above else 0
+        marks[below] = 0 if on_above else 1
+        last = np.where(marks >= 0, np.arange(n), -1)
+        np.maximum.accumulate(last, out=last)
+        return np.where(last >= 0, marks[last] == 1, self._state)
+
+    def find(self, values):
+        """Returns the indices of values where the trigger fires, carrying the state of the
+        input over from the previous call."""
+        values = np.asarray(values)
+        if not len(values):
+            return np.empty(0, np.intp)
+        if self.trig_type in _HYSTERESIS_TYPES:
+            condition = self._hysteresis(values)
+        else:
+            condition = self._condition(values)
+        previous = np.empty_like(condition)
+        previous[0] = self._state
+        previous[1:] = condition[:-1]
+        self._state = bool(condition[-1])
+        return np.flatnonzero(condition & ~previous)
+
+
+class PretriggerCapture(object):
+    """Captures windows of data around the triggers found in a stream of scan data.
+
+    Parameters
+    ----------
+    trigger : SoftwareTrigger
+        The trigger condition.
+    num_chans : int
+        The number of channels in the data.
+    pretrig_count : int
+        Number of samples per channel before each trigger. A trigger fires only once this many
+        samples of history are available.
+    posttrig_count : int
+        Number of samples per channel from each trigger, including the trigger sample. Must be at
+        least 1.
+    holdoff : int, optional
+        Minimum number of samples between two triggers. 0 (the default) accepts every trigger,
+        even within the window of the previous one.
+    single_shot : bool, optional
+        If True, the trigger disarms after it fires, until :meth:`arm` is called.
+    capacity : int, optional
+        Size of the ring in samples per channel. It must be larger than the window; chunks longer
+        than capacity minus the window are processed in pieces. Defaults to twice the window
+        plus 4096 samples.
+    dtype : numpy.dtype, optional
+        The data type of the ring. Defaults to that of the first chunk.
+
+    Attributes
+    ----------
+    events : int
+        Number of windows emitted.
+    lost_events : int
+        Number of triggers whose window could not be completed because of a gap in the data.
+    """
+    def __init__(self, trigger, num_chans, pretrig_count, posttrig_count, holdoff=0,
+                 single_shot=False, capacity=None, dtype=None):
+        if posttrig_count < 1 or pretrig_count < 0:
+            raise ValueError('posttrig_count must be at least 1, and pretrig_count at least 0')
+        self.trigger = trigger
+        self.num_chans = num_chans
+        self.pretrig_count = pretrig_count
+        self.posttrig_count = posttrig_count
+        self.holdoff = holdoff
+        self.single_shot = single_shot
+        window = pretrig_count + posttrig_count
+        self.capacity = 2 * window + 4096 if capacity is None else capacity
+        if self.capacity <= window:
+            raise ValueError('capacity must exceed pretrig_count + posttrig_count')
+        self._ring = None if dtype is None else self._alloc(dtype)
+        self.reset()
+
+    def _alloc(self, dtype):
+        return np.zeros(self.capacity * self.num_chans, dtype)
+
+    def reset(self):
+        """Forgets the data processed and the pending triggers, and arms the trigger."""
+        self.trigger.reset()
+        self.armed = True
+        self.events = 0
+        self.lost_events = 0
+        self._next_sample = 0
+        self._history_start = 0
+        self._last_trigger = None
+        self._pending = collections.deque()
+
+    def arm(self):
+        """Arms a single-shot trigger again."""
+        self.armed = True
+
+    @property
+    def pending_events(self):
+        """Number of triggers whose window is not complete yet."""
+        return len(self._pending)
+
+    def update(self, data, first_sample=None):
+        """Processes a chunk of samples.
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            The samples, with shape (samples, channels).
+        first_sample : int, optional
+            Index of the first sample of data, counted in samples per channel from the start of
+            the scan, such as ScanChunk.first_scan (not ScanChunk.first_sample, which counts the
+            points of all channels). Defaults to the sample following the previous chunk. If data
+            does not follow the previous chunk, the history restarts.
+
+        Returns
+        -------
+        list of PretriggerEvent
+            The windows completed by this chunk
+        """
+        data = np.asarray(data).reshape(-1, self.num_chans)
+        if self._ring is None:
+            self._ring = self._alloc(data.dtype)
+        if first_sample is not None and first_sample != self._next_sample:
+            # A gap (or a new scan): the history no longer leads up to data
+            self.lost_events += len(self._pending)
+            self._pending.clear()
+            self.trigger.reset()
+            self._next_sample = self._history_start = first_sample
+
+        completed = []
+        step = self.capacity - self.pretrig_count - self.posttrig_count
+        for start in range(0, len(data), step):
+            self._process(data[start:start + step], completed)
+        return completed
+
+    def _process(self, block, completed):
+        n = len(block)
+        first = self._next_sample
+        position = first % self.capacity
+        flat = block.reshape(-1)
+        head = min(n, self.capacity - position) * self.num_chans
+        self._ring[position * self.num_chans:position * self.num_chans + head] = flat[:head]
+        self._ring[:len(flat) - head] = flat[head:]
+        self._next_sample = first + n
+
+        triggers = self.trigger.find(block[:, self.trigger.channel]) + first
+        if self.armed and len(triggers):
+            # Triggers need pretrig_count samples of history
+            earliest = self._history_start + self.pretrig_count
+            if self._last_trigger is not None and self.holdoff:
+                earliest = max(earliest, self._last_trigger + self.holdoff)
+            triggers = triggers[triggers >= earliest]
+            if self.holdoff and len(triggers) > 1:
+                triggers = self._apply_holdoff(triggers)
+            if self.single_shot:
+                triggers = triggers[:1]
+            if len(triggers):
+                self._pending.extend(triggers.tolist())
+                self._last_trigger = int(triggers[-1])
+                if self.single_shot:
+                    self.armed = False
+
+        window = self.pretrig_count + self.posttrig_count
+        while self._pending and self._pending[0] + self.posttrig_count <= self._next_sample:
+            trigger_sample = self._pending.popleft()
+            first_sample = trigger_sample - self.pretrig_count
+            data = demux(self._ring, self.num_chans, first_sample * self.num_chans,
+                         window * self.num_chans,
+                         np.empty((window, self.num_chans), self._ring.dtype))
+            completed.append(PretriggerEvent(trigger_sample, first_sample, data))
+            self.events += 1
+
+    def _apply_holdoff(self, triggers):
+        kept = [int(triggers[0])]
+        while True:
+            index = np.searchsorted(triggers, kept[-1] + self.holdoff, 'left')
+            if index >= len(triggers):
+                return np.array(kept, triggers.dtype)
+            kept.append(int(triggers[index]))
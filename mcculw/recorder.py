@@ -0,0 +1,600 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Streaming binary recording of continuous scans.
+
+:class:`ScanRecorder` drains the circular buffer of a
+:const:`~mcculw.enums.ScanOptions.BACKGROUND` | :const:`~mcculw.enums.ScanOptions.CONTINUOUS`
+scan in chunks and writes each chunk to disk as raw little-endian data, straight from the UL
+buffer (see :func:`.buffer_as_ndarray`). Three output formats are supported:
+
+- The scan container (any file name not ending in ``.npy``): a self-describing file made of a
+  header and a sequence of chunks. Read it back with :func:`read_recording`.
+
+  ======  ===============================================================================
+  Offset  Content
+  ======  ===============================================================================
+  0       Magic bytes ``MCCSCAN1``
+  8       Header length in bytes, uint32
+  12      Header: UTF-8 JSON object with the channels, range, rate, start time and dtype
+  ...     Chunks: ``CHNK``, sample count (uint32), index of the first sample (uint64),
+          followed by the samples, interleaved by channel
+  ======  ===============================================================================
+
+- A NumPy ``.npy`` file of shape (scans, channels), which can be memory-mapped with
+  ``numpy.load(path, mmap_mode='r')``. The header is written to a ``.json`` file alongside it.
+
+- The columnar format (file names ending in ``.mccol``): the samples are stored in blocks of a
+  fixed number of scans, each block holding one contiguous column per channel, followed by an
+  index of the blocks. Open it with :class:`ColumnarRecording`, which memory-maps the blocks and
+  uses the index to read any time window without reading the rest of the file.
+
+  ======  ===============================================================================
+  Offset  Content
+  ======  ===============================================================================
+  0       Magic bytes ``MCCCOL01``
+  8       Header length in bytes, uint32
+  12      Header: UTF-8 JSON object, as for the scan container, plus ``block_scans``
+  ...     Padding to a multiple of 64 bytes
+  ...     Blocks: (channels, block_scans) samples each. The last block, and blocks before
+          a gap left by an overrun, can be partly filled.
+  ...     Index: one record per block, see INDEX_DTYPE
+  end-24  ``MCCIDX01``, offset of the index (uint64), number of blocks (uint64)
+  ======  ===============================================================================
+
+  If the file was not closed, the index is missing and the complete blocks are assumed to be
+  contiguous from the start of the scan.
+
+Any format can store the samples with a different data type than the UL buffer, for example
+numpy.float32 for scaled data, which halves the file size.
+
+:func:`convert_csv` converts the CSV files written by earlier versions of the example scripts to
+the columnar format.
+
+This module requires NumPy.
+"""
+import collections
+import datetime
+import json
+import struct
+import time
+
+import numpy as np
+
+from mcculw import ul
+from mcculw.enums import ErrorCode, FunctionType, Status
+from mcculw.ul import ULError
+
+MAGIC = b'MCCSCAN1'
+_CHUNK_MARKER = b'CHNK'
+_CHUNK_HEADER = struct.Struct('<4sIQ')
+_FILE_HEADER_LEN = struct.Struct('<I')
+
+# Fixed size of the .npy header, so it can be rewritten in place with the
+# final shape when the recording is closed.
+_NPY_HEADER_SIZE = 128
+
+COLUMNAR_MAGIC = b'MCCCOL01'
+_INDEX_TRAILER = struct.Struct('<8sQQ')
+_INDEX_MAGIC = b'MCCIDX01'
+_DATA_ALIGNMENT = 64
+DEFAULT_BLOCK_SCANS = 4096
+
+INDEX_DTYPE = np.dtype([('first_scan', '<i8'), ('scans', '<i8'), ('time', '<f8'),
+                        ('offset', '<i8')])
+"""The index records of the columnar format: the scan index of the first scan of the block, the
+number of scans in the block, the time of its first scan in seconds from the start of the scan,
+and the file offset of the block."""
+
+Recording = collections.namedtuple("Recording", "header data")
+Window = collections.namedtuple("Window", "times data")
+
+
+class ScanRecorder(object):
+    """Writes the data of a scan to a binary file, chunk by chunk.
+
+    Parameters
+    ----------
+    path : str
+        The output file. A path ending in ``.npy`` selects NumPy output, a path ending in
+        ``.mccol`` the columnar format, and anything else the scan container format.
+    low_chan : int
+        First channel of the scan.
+    high_chan : int
+        Last channel of the scan.
+    ul_range : ULRange
+        The range the scan was started with, or None if it is not known.
+    rate : int
+        The per-channel sample rate returned by the scan function.
+    dtype : numpy.dtype, optional
+        The data type of the UL buffer: numpy.float64 for buffers from
+        :func:`.scaled_win_buf_alloc` (the default), numpy.uint16, numpy.uint32 or numpy.uint64
+        for raw counts.
+    resolution : int, optional
+        The converter resolution in bits, recorded in the header so that raw counts can be
+        converted later.
+    storage_dtype : numpy.dtype, optional
+        The data type of the samples in the file. Defaults to dtype.
+    block_scans : int, optional
+        Number of scans per block in the columnar format. Defaults to 4096.
+
+    Notes
+    -----
+    Use the recorder as a context manager, or call :meth:`close` when done, so that the file is
+    finalized.
+    """
+    def __init__(self, path, low_chan, high_chan, ul_range, rate, dtype=np.float64,
+                 resolution=None, storage_dtype=None, block_scans=DEFAULT_BLOCK_SCANS):
+        self.path = path
+        self.low_chan = low_chan
+        self.high_chan = high_chan
+        self.num_chans = high_chan - low_chan + 1
+        self.ul_range = ul_range
+        self.rate = rate
+        self.buffer_dtype = np.dtype(dtype)
+        self.dtype = np.dtype(dtype if storage_dtype is None else storage_dtype).newbyteorder('<')
+        self.resolution = resolution
+        self.block_scans = block_scans
+        self.samples_written = 0
+        self.start_time = time.time()
+        self.is_npy = path.lower().endswith('.npy')
+        self.is_columnar = path.lower().endswith('.mccol')
+
+        self._file = open(path, 'w+b')
+        if self.is_npy:
+            self._file.write(b'\0' * _NPY_HEADER_SIZE)
+            with open(path[:-4] + '.json', 'w') as f:
+                json.dump(self.header, f, indent=2)
+        else:
+            header = json.dumps(self.header).encode('utf-8')
+            self._file.write(COLUMNAR_MAGIC if self.is_columnar else MAGIC)
+            self._file.write(_FILE_HEADER_LEN.pack(len(header)))
+            self._file.write(header)
+        if self.is_columnar:
+            self._file.write(b'\0' * (-self._file.tell() % _DATA_ALIGNMENT))
+            self._block = np.zeros((self.num_chans, block_scans), self.dtype)
+            self._staged = 0
+            self._block_first = 0
+            self._next_scan = 0
+            self._index = []
+
+    @property
+    def header(self):
+        """The metadata describing the recording, as a dict."""
+        return {
+            'version': 1,
+            'low_chan': self.low_chan,
+            'high_chan': self.high_chan,
+            'channels': list(range(self.low_chan, self.high_chan + 1)),
+            'range': getattr(self.ul_range, 'name', str(self.ul_range)),
+            'range_min': getattr(self.ul_range, 'range_min', None),
+            'range_max': getattr(self.ul_range, 'range_max', None),
+            'rate': self.rate,
+            'start_time': self.start_time,
+            'start_time_iso': datetime.datetime.fromtimestamp(
+                self.start_time).isoformat(),
+            'dtype': self.dtype.str,
+            'scaled': self.buffer_dtype.kind == 'f',
+            'resolution': self.resolution,
+            'block_scans': self.block_scans if self.is_columnar else None,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, *blocks):
+        """Writes one chunk made up of one or more consecutive blocks of interleaved samples.
+        Passing the two halves of a chunk that wraps around the end of the UL buffer as separate
+        blocks avoids joining them in memory."""
+        count = sum(len(block) for block in blocks)
+        if count == 0:
+            return
+        if self.is_columnar:
+            self._append_columns(np.concatenate(blocks) if len(blocks) > 1 else blocks[0],
+                                 self.samples_written // self.num_chans)
+            self.samples_written += count
+            return
+        if not self.is_npy:
+            self._file.write(_CHUNK_HEADER.pack(_CHUNK_MARKER, count, self.samples_written))
+        for block in blocks:
+            block = np.ascontiguousarray(block, dtype=self.dtype)
+            self._file.write(memoryview(block).cast('B'))
+        self.samples_written += count
+
+    def write_chunk(self, chunk):
+        """Writes a :class:`~mcculw.continuous_scan.ScanChunk`. In the scan container format the
+        chunk keeps its own first sample index, so gaps left by overruns are visible in the
+        file."""
+        data = chunk.data.reshape(-1)
+        if self.is_columnar:
+            self._append_columns(data, chunk.first_scan)
+            self.samples_written += len(data)
+            return
+        if not self.is_npy:
+            self._file.write(_CHUNK_HEADER.pack(_CHUNK_MARKER, len(data), chunk.first_sample))
+        self._file.write(memoryview(np.ascontiguousarray(data, dtype=self.dtype)).cast('B'))
+        self.samples_written += len(data)
+
+    def _append_columns(self, samples, first_scan):
+        rows = samples.reshape(-1, self.num_chans)
+        if first_scan != self._next_scan:
+            # A gap: the next block starts at first_scan
+            self._flush_block()
+        pos = 0
+        while pos < len(rows):
+            if self._staged == 0:
+                self._block_first = first_scan + pos
+            count = min(self.block_scans - self._staged, len(rows) - pos)
+            self._block[:, self._staged:self._staged + count] = rows[pos:pos + count].T
+            self._staged += count
+            pos += count
+            if self._staged == self.block_scans:
+                self._flush_block()
+        self._next_scan = first_scan + len(rows)
+
+    def _flush_block(self):
+        if self._staged == 0:
+            return
+        self._block[:, self._staged:] = 0
+        self._index.append((self._block_first, self._staged,
+                            self._block_first / float(self.rate), self._file.tell()))
+        self._file.write(memoryview(self._block).cast('B'))
+        self._staged = 0
+
+    def mark(self):
+        """Returns a position that :meth:`rollback` can return the file to."""
+        if self.is_columnar:
+            return (self._file.tell(), self.samples_written, self._staged, self._block_first,
+                    self._next_scan, len(self._index))
+        return self._file.tell(), self.samples_written
+
+    def rollback(self, position):
+        """Discards everything written after :meth:`mark` returned position."""
+        offset, samples_written = position[:2]
+        if self.is_columnar:
+            self._staged, self._block_first, self._next_scan, num_blocks = position[2:]
+            if len(self._index) > num_blocks:
+                # The block staged at the mark was written since: read it back
+                self._file.seek(offset)
+                block = np.frombuffer(self._file.read(self._block.nbytes), self.dtype)
+                self._block[:] = block.reshape(self._block.shape)
+                del self._index[num_blocks:]
+        self._file.seek(offset)
+        self._file.truncate()
+        self.samples_written = samples_written
+
+    def close(self):
+        """Finalizes and closes the file."""
+        if self._file.closed:
+            return
+        if self.is_columnar:
+            self._flush_block()
+            index_offset = self._file.tell()
+            self._file.write(np.array(self._index, INDEX_DTYPE).tobytes())
+            self._file.write(_INDEX_TRAILER.pack(_INDEX_MAGIC, index_offset, len(self._index)))
+        if self.is_npy:
+            scans = self.samples_written // self.num_chans
+            self._file.seek(0)
+            self._file.write(_npy_header(self.dtype, (scans, self.num_chans)))
+        self._file.close()
+
+    def record(self, board_num, memhandle, buffer_count, chunk_size, total_count=None,
+               function_type=FunctionType.AIFUNCTION, on_chunk=None):
+        """Drains a running continuous scan into the file until total_count samples have been
+        written or the scan stops.
+
+        Parameters
+        ----------
+        board_num : int
+            The board the scan is running on.
+        memhandle : int
+            The buffer the scan was started with.
+        buffer_count : int
+            The num_points the scan was started with (the size of the circular buffer).
+        chunk_size : int
+            Number of samples written per chunk. Must be a multiple of the channel count and no
+            more than half of buffer_count. The last chunk is shorter if total_count is not a
+            multiple of chunk_size, or if the scan stops in the middle of a chunk.
+        total_count : int, optional
+            Number of samples to record, a multiple of the channel count. If omitted (or None),
+            recording continues until the scan stops.
+        function_type : FunctionType, optional
+            The function type of the scan, FunctionType.AIFUNCTION by default.
+        on_chunk : callable, optional
+            Called with the total number of samples written after every chunk.
+
+        Returns
+        -------
+        int
+            The number of samples written
+
+        Raises
+        ------
+        ULError
+            With ErrorCode.OVERRUN if the scan overwrote data before it was written. The chunk that
+            was being written when the overrun was detected is removed from the file, so that the
+            file only contains valid data.
+        """
+        if chunk_size % self.num_chans or not 0 < chunk_size <= buffer_count // 2:
+            raise ValueError('chunk_size must be a multiple of the channel count and no more '
+                             'than half of buffer_count')
+        if total_count is not None and total_count % self.num_chans:
+            raise ValueError('total_count must be a multiple of the channel count')
+
+        data = ul.buffer_as_ndarray(memhandle, buffer_count, self.buffer_dtype)
+        # Sleep for about half of the time it takes to fill a chunk between
+        # status checks
+        poll_interval = chunk_size / (2.0 * self.rate * self.num_chans)
+        prev_count = 0
+        prev_index = 0
+        status = Status.RUNNING
+        while total_count is None or prev_count < total_count:
+            status, curr_count, _ = ul.get_status(board_num, function_type)
+            available = curr_count - prev_count
+            if available > buffer_count:
+                raise ULError(ErrorCode.OVERRUN)
+            size = chunk_size
+            if total_count is not None:
+                # The last chunk stops at total_count
+                size = min(size, total_count - prev_count)
+            if available < size:
+                if status != Status.IDLE:
+                    time.sleep(poll_interval)
+                    continue
+                # The scan stopped: write the samples it acquired since the
+                # last chunk
+                size = available - available % self.num_chans
+                if size == 0:
+                    break
+
+            position = self.mark()
+            end_index = prev_index + size
+            if end_index > buffer_count:
+                self.write(data[prev_index:], data[:end_index - buffer_count])
+            else:
+                self.write(data[prev_index:end_index])
+
+            # Make sure the data was not overwritten while it was being
+            # written
+            _, curr_count, _ = ul.get_status(board_num, function_type)
+            if curr_count - prev_count > buffer_count:
+                self.rollback(position)
+                raise ULError(ErrorCode.OVERRUN)
+
+            prev_count += size
+            prev_index = end_index % buffer_count
+            if on_chunk is not None:
+                on_chunk(self.samples_written)
+        return self.samples_written
+
+
+def read_recording(path, mmap=True):
+    """Reads a file written by :class:`ScanRecorder`.
+
+    Parameters
+    ----------
+    path : str
+        The file to read.
+    mmap : bool, optional
+        For ``.npy`` files, map the file into memory instead of reading it. Defaults to True.
+        Columnar files are always mapped, and their data is copied into the returned array; use
+        :class:`ColumnarRecording` to read parts of them.
+
+    Returns
+    -------
+    header : dict
+        The metadata of the recording (see :attr:`ScanRecorder.header`)
+    data : numpy.ndarray
+        The samples, with shape (scans, channels)
+    """
+    if path.lower().endswith('.npy'):
+        with open(path[:-4] + '.json') as f:
+            header = json.load(f)
+        return Recording(header, np.load(path, mmap_mode='r' if mmap else None))
+    if path.lower().endswith('.mccol'):
+        recording = ColumnarRecording(path)
+        return Recording(recording.header, recording.window().data)
+
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a scan recording'.format(path))
+        header_len, = _FILE_HEADER_LEN.unpack(f.read(_FILE_HEADER_LEN.size))
+        header = json.loads(f.read(header_len).decode('utf-8'))
+        dtype = np.dtype(header['dtype'])
+        num_chans = len(header['channels'])
+        blocks = []
+        while True:
+            chunk_header = f.read(_CHUNK_HEADER.size)
+            if len(chunk_header) < _CHUNK_HEADER.size:
+                break
+            marker, count, _ = _CHUNK_HEADER.unpack(chunk_header)
+            if marker != _CHUNK_MARKER:
+                raise ValueError('Corrupt chunk in {}'.format(path))
+            blocks.append(np.fromfile(f, dtype, count))
+    data = np.concatenate(blocks) if blocks else np.empty(0, dtype)
+    return Recording(header, data[:len(data) - len(data) % num_chans].reshape(-1, num_chans))
+
+
+class ColumnarRecording(object):
+    """A recording in the columnar format, memory-mapped for reading.
+
+    Parameters
+    ----------
+    path : str
+        The ``.mccol`` file to open.
+
+    Attributes
+    ----------
+    header : dict
+        The metadata of the recording (see :attr:`ScanRecorder.header`).
+    index : numpy.ndarray
+        The block index, an array of INDEX_DTYPE records.
+    blocks : numpy.memmap
+        The blocks, with shape (blocks, channels, block_scans).
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+                raise ValueError('{} is not a columnar scan recording'.format(path))
+            header_len, = _FILE_HEADER_LEN.unpack(f.read(_FILE_HEADER_LEN.size))
+            self.header = json.loads(f.read(header_len).decode('utf-8'))
+            data_offset = len(COLUMNAR_MAGIC) + _FILE_HEADER_LEN.size + header_len
+            data_offset += -data_offset % _DATA_ALIGNMENT
+
+            dtype = np.dtype(self.header['dtype'])
+            self.channels = self.header['channels']
+            block_scans = self.header['block_scans']
+            block_bytes = dtype.itemsize * len(self.channels) * block_scans
+
+            f.seek(0, 2)
+            size = f.tell()
+            trailer = b''
+            if size >= data_offset + _INDEX_TRAILER.size:
+                f.seek(size - _INDEX_TRAILER.size)
+                trailer = f.read(_INDEX_TRAILER.size)
+            if trailer[:len(_INDEX_MAGIC)] == _INDEX_MAGIC:
+                _, index_offset, num_blocks = _INDEX_TRAILER.unpack(trailer)
+                f.seek(index_offset)
+                self.index = np.fromfile(f, INDEX_DTYPE, num_blocks)
+            else:
+                # Not closed: assume contiguous complete blocks
+                num_blocks = (size - data_offset) // block_bytes
+                self.index = np.zeros(num_blocks, INDEX_DTYPE)
+                self.index['first_scan'] = np.arange(num_blocks) * block_scans
+                self.index['scans'] = block_scans
+                self.index['time'] = self.index['first_scan'] / float(self.header['rate'])
+                self.index['offset'] = data_offset + np.arange(num_blocks) * block_bytes
+
+        if len(self.index):
+            self.blocks = np.memmap(path, dtype, 'r', offset=data_offset,
+                                    shape=(len(self.index), len(self.channels), block_scans))
+        else:
+            self.blocks = np.empty((0, len(self.channels), block_scans), dtype)
+        self._block_ends = self.index['first_scan'] + self.index['scans']
+
+    @property
+    def rate(self):
+        return self.header['rate']
+
+    @property
+    def num_scans(self):
+        """Number of scans in the file, not counting gaps."""
+        return int(self.index['scans'].sum())
+
+    @property
+    def duration(self):
+        """Time from the start of the scan to the end of the last block, in seconds."""
+        return self._block_ends[-1] / float(self.rate) if len(self.index) else 0.0
+
+    def window(self, start=None, stop=None, channels=None):
+        """Reads the scans sampled from start to stop seconds after the start of the scan.
+
+        Parameters
+        ----------
+        start : float, optional
+            Start of the window in seconds. Defaults to the start of the recording.
+        stop : float, optional
+            End of the window (excluded) in seconds. Defaults to the end of the recording.
+        channels : list of int, optional
+            The channels to read. Defaults to all of them.
+
+        Returns
+        -------
+        times : numpy.ndarray
+            The time of each scan, in seconds from the start of the scan
+        data : numpy.ndarray
+            The samples, with shape (scans, channels)
+        """
+        first = 0 if start is None else int(np.ceil(start * self.rate))
+        last = (int(self._block_ends[-1]) if len(self.index) else 0) if stop is None \
+            else int(np.ceil(stop * self.rate))
+        columns = (slice(None) if channels is None
+                   else [self.channels.index(channel) for channel in channels])
+
+        # Only the blocks that overlap the window are touched
+        begin = np.searchsorted(self._block_ends, first, 'right')
+        end = np.searchsorted(self.index['first_scan'], last, 'left')
+        scans = []
+        parts = []
+        for block in range(begin, end):
+            block_first = int(self.index['first_scan'][block])
+            low = max(first - block_first, 0)
+            high = min(last - block_first, int(self.index['scans'][block]))
+            if high > low:
+                parts.append(self.blocks[block, columns, low:high])
+                scans.append(np.arange(block_first + low, block_first + high))
+        if not parts:
+            num_chans = len(self.channels) if channels is None else len(channels)
+            return Window(np.empty(0), np.empty((0, num_chans), self.blocks.dtype))
+        return Window(np.concatenate(scans) / float(self.rate),
+                      np.concatenate(parts, axis=1).T)
+
+    def to_volts(self, counts):
+        """Converts raw counts read from the recording to volts, using the range and resolution
+        in the header, as :func:`.to_eng_units_array` does."""
+        range_min = self.header['range_min']
+        full_scale = (self.header['range_max'] - range_min) / float(
+            (1 << self.header['resolution']) - 1)
+        return np.asarray(counts, np.float64) * full_scale + range_min
+
+
+def convert_csv(csv_path, out_path=None, rate=1, ul_range=None, dtype=np.float32,
+                block_scans=DEFAULT_BLOCK_SCANS, batch_scans=65536):
+    """Converts a CSV file of scan data, with a header row of column names such as ``Channel 0``
+    and one row per scan, to the columnar format. Trailing commas are ignored.
+
+    Parameters
+    ----------
+    csv_path : str
+        The CSV file.
+    out_path : str, optional
+        The columnar file to write. Defaults to csv_path with the extension ``.mccol``.
+    rate : float, optional
+        The per-channel sample rate of the data, which the CSV files do not record. Defaults to 1,
+        so that times are scan indices.
+    ul_range : ULRange, optional
+        The range of the scan, recorded in the header if given.
+    dtype : numpy.dtype, optional
+        The data type of the samples in the file, numpy.float32 by default.
+    block_scans : int, optional
+        Number of scans per block.
+    batch_scans : int, optional
+        Number of rows parsed at a time, which bounds the memory used.
+
+    Returns
+    -------
+    str
+        The path of the columnar file
+    """
+    import itertools
+    import os
+
+    if out_path is None:
+        out_path = os.path.splitext(csv_path)[0] + '.mccol'
+    with open(csv_path) as f:
+        names = [name.strip() for name in f.readline().split(',') if name.strip()]
+        try:
+            low_chan = int(names[0].split()[-1])
+        except ValueError:
+            low_chan = 0
+        with ScanRecorder(out_path, low_chan, low_chan + len(names) - 1, ul_range, rate,
+                          np.float64, storage_dtype=dtype, block_scans=block_scans) as recorder:
+            while True:
+                lines = list(itertools.islice(f, batch_scans))
+                if not lines:
+                    break
+                rows = np.loadtxt(lines, delimiter=',', usecols=range(len(names)), ndmin=2)
+                recorder.write(rows.reshape(-1))
+    return out_path
+
+
+def _npy_header(dtype, shape):
+    header = "{{'descr': '{}', 'fortran_order': False, 'shape': {}, }}".format(
+        dtype.str, repr(tuple(shape)))
+    prefix = b'\x93NUMPY\x01\x00' + struct.pack('<H', _NPY_HEADER_SIZE - 10)
+    padding = _NPY_HEADER_SIZE - len(prefix) - len(header) - 1
+    return prefix + header.encode('latin1') + b' ' * padding + b'\n'
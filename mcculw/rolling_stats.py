@@ -0,0 +1,286 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Streaming statistics over scan data.
+
+:class:`RollingStats` computes the rolling mean, standard deviation, minimum and maximum over the
+last ``window`` samples of each channel, and :class:`StepStats` aggregates the samples that fall
+in each step of a stepped excitation, such as the voltage steps of a BV curve. Both are fed chunk
+by chunk (for example the :class:`~mcculw.continuous_scan.ScanChunk` objects of a
+:class:`~mcculw.continuous_scan.ContinuousScan`), process each chunk with a few vectorized NumPy
+operations, and never revisit data they have already processed.
+
+:class:`RollingStats` splits the stream into blocks of ``window`` samples. A window always spans
+the end of one block and the start of the next, so its statistics combine the suffix aggregates
+of the previous block, computed once when the block completes, with the running prefix
+aggregates of the current one. Each sample costs O(1) work regardless of the window length, and
+the sums restart at every block, so they do not drift over long runs.
+
+This module requires NumPy.
+"""
+import collections
+
+import numpy as np
+
+RollingWindow = collections.namedtuple("RollingWindow", "mean std min max")
+RollingWindow.__doc__ = """Rolling statistics, one row per sample processed and one column per
+channel. Rows for samples that do not have a full window behind them yet are NaN."""
+
+StepPoint = collections.namedtuple("StepPoint", "step voltage mean std min max count")
+StepPoint.__doc__ = """The aggregates of one completed step of a :class:`StepStats`.
+
+step : int
+    Index of the step.
+voltage : float
+    The voltage of the step.
+mean, std, min, max : numpy.ndarray
+    Per-channel statistics of the samples of the step. std is the sample standard deviation.
+count : int
+    Number of samples aggregated.
+"""
+
+
+def _as_columns(data, num_chans):
+    return np.asarray(data, np.float64).reshape(-1, num_chans)
+
+
+class RollingStats(object):
+    """Rolling mean, standard deviation, minimum and maximum over the last window samples of each
+    channel, updated chunk by chunk.
+
+    The results match those of ``pandas.Series.rolling(window)`` with ``mean()``, ``std()``,
+    ``min()`` and ``max()``.
+
+    Parameters
+    ----------
+    window : int
+        The number of samples per window. Must be at least 2.
+    num_chans : int, optional
+        The number of channels in the data, 1 by default.
+    """
+    def __init__(self, window, num_chans=1):
+        if window < 2:
+            raise ValueError('window must be at least 2')
+        self.window = window
+        self.num_chans = num_chans
+        self.reset()
+
+    def reset(self):
+        """Forgets all the samples processed."""
+        w, chans = self.window, self.num_chans
+        self.count = 0
+        self._shift = None
+        self._block = np.empty((w, chans))
+        # Suffix aggregates of the previous block; row w is the identity, for
+        # windows that lie entirely in the current block
+        self._suffix_sum = np.zeros((w + 1, chans))
+        self._suffix_sq = np.zeros((w + 1, chans))
+        self._suffix_min = np.full((w + 1, chans), np.inf)
+        self._suffix_max = np.full((w + 1, chans), -np.inf)
+        self._reset_prefix()
+
+    def _reset_prefix(self):
+        chans = self.num_chans
+        self._prefix_sum = np.zeros(chans)
+        self._prefix_sq = np.zeros(chans)
+        self._prefix_min = np.full(chans, np.inf)
+        self._prefix_max = np.full(chans, -np.inf)
+
+    def update(self, data):
+        """Processes a chunk of samples.
+
+        Parameters
+        ----------
+        data : array_like
+            The samples, with shape (samples, channels), or (samples,) for one channel.
+
+        Returns
+        -------
+        RollingWindow
+            The statistics of the window ending at each sample of data
+        """
+        x = _as_columns(data, self.num_chans)
+        n = len(x)
+        w = self.window
+        if self._shift is None and n:
+            # Sums of squares are taken about the first sample, which keeps
+            # the variance accurate for signals with a large offset
+            self._shift = x[0].copy()
+        x = x - self._shift
+
+        sums = np.empty_like(x)
+        squares = np.empty_like(x)
+        mins = np.empty_like(x)
+        maxs = np.empty_like(x)
+        pos = 0
+        while pos < n:
+            # The samples up to the end of the current block
+            j = self.count % w
+            m = min(w - j, n - pos)
+            seg = x[pos:pos + m]
+            self._block[j:j + m] = seg
+
+            prefix_sum = self._prefix_sum + np.cumsum(seg, axis=0)
+            prefix_sq = self._prefix_sq + np.cumsum(seg * seg, axis=0)
+            prefix_min = np.minimum(self._prefix_min, np.minimum.accumulate(seg, axis=0))
+            prefix_max = np.maximum(self._prefix_max, np.maximum.accumulate(seg, axis=0))
+
+            rows = slice(j + 1, j + m + 1)
+            sums[pos:pos + m] = self._suffix_sum[rows] + prefix_sum
+            squares[pos:pos + m] = self._suffix_sq[rows] + prefix_sq
+            mins[pos:pos + m] = np.minimum(self._suffix_min[rows], prefix_min)
+            maxs[pos:pos + m] = np.maximum(self._suffix_max[rows], prefix_max)
+
+            self.count += m
+            pos += m
+            if j + m == w:
+                self._complete_block()
+            else:
+                self._prefix_sum = prefix_sum[-1]
+                self._prefix_sq = prefix_sq[-1]
+                self._prefix_min = prefix_min[-1]
+                self._prefix_max = prefix_max[-1]
+
+        mean = sums / w
+        var = np.maximum(squares - sums * mean, 0) / (w - 1)
+        result = RollingWindow(mean + self._shift, np.sqrt(var), mins + self._shift,
+                               maxs + self._shift)
+        # Samples before the first full window
+        warmup = w - 1 - (self.count - n)
+        if warmup > 0:
+            for values in result:
+                values[:warmup] = np.nan
+        return result
+
+    def _complete_block(self):
+        block = self._block[::-1]
+        w = self.window
+        self._suffix_sum[:w] = np.cumsum(block, axis=0)[::-1]
+        self._suffix_sq[:w] = np.cumsum(block * block, axis=0)[::-1]
+        self._suffix_min[:w] = np.minimum.accumulate(block, axis=0)[::-1]
+        self._suffix_max[:w] = np.maximum.accumulate(block, axis=0)[::-1]
+        self._reset_prefix()
+
+
+class StepStats(object):
+    """Aggregates scan data per step of a stepped excitation, and reports each step as soon as
+    the data covering it has been processed.
+
+    Steps are given as ranges of sample indices of the analyzed scan; use :meth:`add_step` or
+    :meth:`add_steps`. A sample that falls in no step is ignored.
+
+    Parameters
+    ----------
+    num_chans : int, optional
+        The number of channels in the data, 1 by default.
+    settle_samples : int, optional
+        Number of samples at the start of each step to leave out, while the response settles.
+
+    Attributes
+    ----------
+    points : list of StepPoint
+        The completed steps, in order.
+    """
+    def __init__(self, num_chans=1, settle_samples=0):
+        self.num_chans = num_chans
+        self.settle_samples = settle_samples
+        self.points = []
+        self._steps = collections.deque()
+        self._next_step = 0
+        self._processed = 0
+        self._reset_step()
+
+    def _reset_step(self):
+        chans = self.num_chans
+        self._count = 0
+        self._shift = None
+        self._sum = np.zeros(chans)
+        self._sq = np.zeros(chans)
+        self._min = np.full(chans, np.inf)
+        self._max = np.full(chans, -np.inf)
+
+    def add_step(self, voltage, start, stop):
+        """Adds a step covering the samples from index start to stop (excluded). Steps must be
+        added in order and must not overlap."""
+        self._steps.append((self._next_step, float(voltage), int(start), int(stop)))
+        self._next_step += 1
+
+    def add_steps(self, voltages, step_samples, start=0):
+        """Adds consecutive steps, the first one starting at sample index start.
+
+        Parameters
+        ----------
+        voltages : sequence of float
+            The voltage of each step.
+        step_samples : int or sequence of int
+            The number of samples of each step.
+        start : int, optional
+            Index of the first sample of the first step.
+        """
+        lengths = np.broadcast_to(step_samples, (len(voltages),))
+        bounds = start + np.concatenate(([0], np.cumsum(lengths)))
+        for voltage, first, last in zip(voltages, bounds[:-1], bounds[1:]):
+            self.add_step(voltage, first, last)
+
+    @property
+    def pending_steps(self):
+        """Number of steps not completed yet."""
+        return len(self._steps)
+
+    def update(self, data, first_sample=None):
+        """Processes a chunk of samples.
+
+        Parameters
+        ----------
+        data : array_like
+            The samples, with shape (samples, channels), or (samples,) for one channel.
+        first_sample : int, optional
+            Index of the first sample of data, counted in samples per channel from the start of
+            the scan, such as ScanChunk.first_scan. Defaults to the sample following the previous
+            chunk.
+
+        Returns
+        -------
+        list of StepPoint
+            The steps completed by this chunk
+        """
+        x = _as_columns(data, self.num_chans)
+        first = self._processed if first_sample is None else first_sample
+        end = first + len(x)
+        completed = []
+        while self._steps:
+            step, voltage, start, stop = self._steps[0]
+            low = max(start + self.settle_samples, first)
+            high = min(stop, end)
+            if high > low:
+                self._accumulate(x[low - first:high - first])
+            if stop > end:
+                break
+            self._steps.popleft()
+            completed.append(self._complete(step, voltage))
+        self._processed = end
+        self.points.extend(completed)
+        return completed
+
+    def _accumulate(self, seg):
+        if self._shift is None:
+            self._shift = seg[0].copy()
+        seg = seg - self._shift
+        self._count += len(seg)
+        self._sum += seg.sum(axis=0)
+        self._sq += (seg * seg).sum(axis=0)
+        self._min = np.minimum(self._min, seg.min(axis=0))
+        self._max = np.maximum(self._max, seg.max(axis=0))
+
+    def _complete(self, step, voltage):
+        count = self._count
+        if count:
+            mean = self._sum / count
+            var = np.maximum(self._sq - self._sum * mean, 0) / max(count - 1, 1)
+            point = StepPoint(step, voltage, mean + self._shift, np.sqrt(var),
+                              self._min + self._shift, self._max + self._shift, count)
+        else:
+            nan = np.full(self.num_chans, np.nan)
+            point = StepPoint(step, voltage, nan, nan, nan, nan, 0)
+        self._reset_step()
+        return point
@@ -0,0 +1,1396 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Deterministic, in-process stand-in for the Universal Library DLL.
+
+:class:`SimulatedLibrary` implements the ``cbXxx`` entry points used by :mod:`mcculw.ul` in pure
+Python, so that the package can be imported, exercised and benchmarked on machines without
+cbw64.dll or any MCC hardware attached. It is selected by :mod:`mcculw.ul` when the
+``MCCULW_BACKEND`` environment variable is set to ``sim``, or automatically on platforms other than
+Windows.
+
+Background scans started with :func:`.a_in_scan` (with or without :func:`.a_load_queue`),
+:func:`.a_out_scan`, :func:`.c_in_scan`, :func:`.d_in_scan` and :func:`.daq_in_scan` advance
+``cur_count`` and ``cur_index`` at the requested rate against a clock, and input scans fill their
+buffer from the signals assigned with :meth:`SimulatedLibrary.set_signal`,
+:meth:`~SimulatedLibrary.set_counter_signal`, :meth:`~SimulatedLibrary.set_digital_signal` and
+:meth:`~SimulatedLibrary.set_temperature`. With the default :class:`RealClock` the scan runs in
+wall-clock time; with :class:`VirtualClock` time only moves when the clock is advanced, so every
+run produces the same data and status sequence. Events enabled with :func:`.enable_event` are
+delivered from a simulator thread with a :class:`RealClock`, and from
+:meth:`SimulatedLibrary.advance` with a :class:`VirtualClock`.
+
+The default devices are the two documented in docs/. Counter and digital scans,
+:func:`.daq_in_scan`, the channel/gain queue and the temperature inputs of :func:`.t_in`,
+:func:`.t_in_scan` and :func:`.get_tc_values` are only available on :data:`SIM_DAQ`, a
+fictitious device with every feature the simulator implements; select it with
+:meth:`SimulatedLibrary.set_profiles` or the ``MCCULW_SIM_DEVICES`` environment variable.
+
+This module requires NumPy.
+"""
+import os
+import threading
+import time
+from ctypes import (Array, _Pointer, addressof, cast, c_void_p, c_float, c_ushort, c_ulong,
+                    c_ulonglong, c_double)
+
+import numpy as np
+
+from mcculw.enums import (ErrorCode, InfoType, BoardInfo, DigitalInfo, CounterInfo,
+                          ULRange, ScanOptions, FunctionType, Status, InterfaceType,
+                          DigitalPortType, CounterChannelType, ChannelType, EventType,
+                          TempScale, DigitalIODirection)
+from mcculw.structs import DaqDeviceDescriptor
+
+
+class DeviceProfile(object):
+    """Static description of a simulated DAQ device.
+
+    Parameters
+    ----------
+    product_name : str
+        The product name reported by the device descriptor and :func:`.get_board_name`.
+    product_id : int
+        The product ID reported as BoardInfo.BOARDTYPE.
+    unique_id : str
+        The serial number reported by the device descriptor and BoardInfo.DEVUNIQUEID.
+    num_ad_chans, ad_resolution, ad_ranges, ad_max_rate, ad_scan_options
+        Analog input channel count, resolution in bits, supported ranges, maximum aggregate scan
+        rate in samples per second and supported scan options. ad_max_rate of 0 means that the
+        analog inputs can only be read with single-point functions.
+    num_da_chans, da_resolution, da_ranges, da_max_rate, da_scan_options
+        The same for analog output.
+    num_dio_bits : int
+        Number of bits of the configurable AUXPORT, or 0 if there is no digital I/O.
+    num_counters : int
+        Number of event counters.
+    counter_bits : int
+        Width of the counters, 32 by default.
+    queue_size : int
+        Number of elements of the channel/gain queue, or 0 (the default) if there is none.
+    ctr_max_rate, di_max_rate, daqi_max_rate : int
+        Maximum aggregate rate of :func:`.c_in_scan`, :func:`.d_in_scan` and
+        :func:`.daq_in_scan`, or 0 (the default) if the scan is not supported.
+    num_temp_chans : int
+        Number of thermocouple channels, 0 by default.
+    temp_range : tuple of float
+        The lowest and highest temperatures the thermocouple channels can read, in degrees
+        Celsius. Defaults to the range of a type K thermocouple.
+    """
+    def __init__(self, product_name, product_id, unique_id,
+                 num_ad_chans=0, ad_resolution=12, ad_ranges=(), ad_max_rate=0,
+                 ad_scan_options=ScanOptions(0),
+                 num_da_chans=0, da_resolution=12, da_ranges=(), da_max_rate=0,
+                 da_scan_options=ScanOptions(0),
+                 num_dio_bits=0, num_counters=0, counter_bits=32, queue_size=0,
+                 ctr_max_rate=0, di_max_rate=0, daqi_max_rate=0, num_temp_chans=0,
+                 temp_range=(-270.0, 1372.0)):
+        self.product_name = product_name
+        self.product_id = product_id
+        self.unique_id = unique_id
+        self.num_ad_chans = num_ad_chans
+        self.ad_resolution = ad_resolution
+        self.ad_ranges = tuple(ad_ranges)
+        self.ad_max_rate = ad_max_rate
+        self.ad_scan_options = ad_scan_options
+        self.num_da_chans = num_da_chans
+        self.da_resolution = da_resolution
+        self.da_ranges = tuple(da_ranges)
+        self.da_max_rate = da_max_rate
+        self.da_scan_options = da_scan_options
+        self.num_dio_bits = num_dio_bits
+        self.num_counters = num_counters
+        self.counter_bits = counter_bits
+        self.queue_size = queue_size
+        self.ctr_max_rate = ctr_max_rate
+        self.di_max_rate = di_max_rate
+        self.daqi_max_rate = daqi_max_rate
+        self.num_temp_chans = num_temp_chans
+        self.temp_range = tuple(temp_range)
+
+
+_SCAN_OPTIONS = (ScanOptions.BACKGROUND | ScanOptions.CONTINUOUS | ScanOptions.EXTCLOCK
+                 | ScanOptions.SCALEDATA)
+
+# Profiles of the devices documented in docs/
+USB_202 = DeviceProfile(
+    'USB-202', 0x12B, '01D2F2A0',
+    num_ad_chans=8, ad_resolution=12, ad_ranges=(ULRange.BIP10VOLTS,),
+    ad_max_rate=100000, ad_scan_options=_SCAN_OPTIONS | ScanOptions.EXTTRIGGER,
+    num_da_chans=2, da_resolution=12, da_ranges=(ULRange.UNI5VOLTS,),
+    num_dio_bits=8, num_counters=1)
+
+USB_3101FS = DeviceProfile(
+    'USB-3101FS', 224, '02127D12',
+    num_da_chans=4, da_resolution=16, da_ranges=(ULRange.BIP10VOLTS, ULRange.UNI10VOLTS),
+    da_max_rate=100000, da_scan_options=_SCAN_OPTIONS | ScanOptions.SIMULTANEOUS,
+    num_dio_bits=8, num_counters=1)
+
+# Not a real product: a device with every feature the simulator implements
+SIM_DAQ = DeviceProfile(
+    'SIM-DAQ', 0xF00, 'F0000001',
+    num_ad_chans=8, ad_resolution=16, ad_ranges=(ULRange.BIP10VOLTS, ULRange.BIP1VOLTS),
+    ad_max_rate=400000, ad_scan_options=_SCAN_OPTIONS | ScanOptions.EXTTRIGGER,
+    num_da_chans=2, da_resolution=16, da_ranges=(ULRange.BIP10VOLTS,),
+    da_max_rate=100000, da_scan_options=_SCAN_OPTIONS,
+    num_dio_bits=16, num_counters=4, counter_bits=48, queue_size=16,
+    ctr_max_rate=400000, di_max_rate=400000, daqi_max_rate=400000, num_temp_chans=8)
+
+DEFAULT_PROFILES = (USB_3101FS, USB_202)
+
+PROFILES = {profile.product_name: profile for profile in (USB_3101FS, USB_202, SIM_DAQ)}
+"""The profiles that can be selected by name with ``MCCULW_SIM_DEVICES``."""
+
+_CTR_SCAN_OPTIONS = (ScanOptions.BACKGROUND | ScanOptions.CONTINUOUS | ScanOptions.EXTCLOCK
+                     | ScanOptions.CTR32BIT | ScanOptions.CTR48BIT | ScanOptions.CTR64BIT
+                     | ScanOptions.NOCLEAR)
+
+_DAQI_CHAN_TYPES = (ChannelType.ANALOG, ChannelType.DIGITAL8, ChannelType.DIGITAL16,
+                    ChannelType.CTR16, ChannelType.CTR32LOW, ChannelType.CTR32HIGH,
+                    ChannelType.CJC, ChannelType.TC, ChannelType.CTRBANK0, ChannelType.CTRBANK1,
+                    ChannelType.CTRBANK2, ChannelType.CTRBANK3, ChannelType.PADZERO)
+
+# The value stored for a temperature the simulator could not read
+_FAILED_TEMPERATURE = -9999.0
+
+# Thermocouple samples of daq_in_scan are stored as (celsius + 300) * 32,
+# which fits 16 bits over the whole temp_range, with 0xFFFF for an open
+# connection
+_TC_OFFSET = 300.0
+_TC_COUNTS_PER_DEGREE = 32.0
+_TC_OPEN = 0xFFFF
+
+# How often the event thread checks the scans, in seconds
+_EVENT_INTERVAL = 0.005
+
+# The events the simulator can deliver (ON_SCAN_ERROR never occurs), and
+# whether the end of scan events are for the output scan
+_EVENT_TYPE_BITS = (EventType.ON_SCAN_ERROR, EventType.ON_DATA_AVAILABLE,
+                    EventType.ON_END_OF_INPUT_SCAN, EventType.ON_END_OF_OUTPUT_SCAN)
+_EVENT_TYPES = sum(int(event_type) for event_type in _EVENT_TYPE_BITS)
+_END_EVENTS = {EventType.ON_END_OF_INPUT_SCAN: False, EventType.ON_END_OF_OUTPUT_SCAN: True}
+
+_INPUT_FUNCTIONS = (FunctionType.AIFUNCTION, FunctionType.CTRFUNCTION, FunctionType.DIFUNCTION,
+                    FunctionType.DAQIFUNCTION)
+
+
+def _max_rate(profile, function_type):
+    return {
+        FunctionType.AIFUNCTION: profile.ad_max_rate,
+        FunctionType.CTRFUNCTION: profile.ctr_max_rate,
+        FunctionType.DIFUNCTION: profile.di_max_rate,
+        FunctionType.DAQIFUNCTION: profile.daqi_max_rate,
+    }[function_type]
+
+
+class RealClock(object):
+    """Clock that follows wall-clock time."""
+    def time(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class VirtualClock(object):
+    """Clock that only moves when :meth:`advance` (or :meth:`sleep`) is called."""
+    def __init__(self, start=0.0):
+        self._now = float(start)
+
+    def time(self):
+        return self._now
+
+    def advance(self, seconds):
+        self._now += seconds
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+
+def default_signal(channel, t):
+    """The analog input signal used for channels that have no signal or loopback assigned: a
+    sine wave of (channel + 1) Hz and 0.5 * (channel + 1) V amplitude."""
+    return 0.5 * (channel + 1) * np.sin(2 * np.pi * (channel + 1) * t)
+
+
+def default_temperature(channel, t):
+    """The temperature read by thermocouple channels that have no signal assigned: a constant
+    (20 + channel) degrees Celsius."""
+    return np.full(np.shape(t), 20.0 + channel)
+
+
+class _EntryPoint(object):
+    # Stands in for a ctypes function pointer of the DLL. argtypes and
+    # restype are accepted (and ignored) so that mcculw.ul can declare the
+    # prototypes the same way for both backends.
+    def __init__(self, name, func):
+        self.__name__ = name
+        self.argtypes = None
+        self.restype = None
+        self._func = func
+
+    def __call__(self, *args):
+        return self._func(*args)
+
+
+class _Scan(object):
+    def __init__(self, clock, low_chan, high_chan, count, rate, ul_range,
+                 buffer, options, resolution, function_type=FunctionType.AIFUNCTION,
+                 sampler=None):
+        self.function_type = function_type
+        # Called as sampler(sample_nums, t) with the point numbers of the
+        # samples to acquire and their times, returns the buffer values
+        self.sampler = sampler
+        self.low_chan = low_chan
+        self.num_chans = high_chan - low_chan + 1
+        self.count = count
+        self.rate = rate
+        self.ul_range = ul_range
+        self.buffer = buffer
+        self.options = options
+        self.resolution = resolution
+        self.start_time = clock.time()
+        self.transferred = 0
+        self.stopped = False
+
+    @property
+    def continuous(self):
+        return bool(self.options & ScanOptions.CONTINUOUS)
+
+    @property
+    def scaled(self):
+        return bool(self.options & ScanOptions.SCALEDATA)
+
+    def due(self, now):
+        # Samples transferred by the device at time now, in whole channel
+        # scans
+        if self.stopped:
+            return self.transferred
+        scans = int((now - self.start_time) * self.rate + 1e-9)
+        due = scans * self.num_chans
+        if not self.continuous:
+            due = min(due, self.count)
+        return due
+
+    def running(self, now):
+        return not self.stopped and (self.continuous or self.due(now) < self.count)
+
+    def status(self, now):
+        cur_count = self.due(now)
+        cur_index = (cur_count - self.num_chans) % self.count if cur_count > 0 else -1
+        return cur_count, cur_index
+
+
+class _Board(object):
+    def __init__(self, board_num, profile, descriptor):
+        self.board_num = board_num
+        self.profile = profile
+        self.descriptor = descriptor
+        # The input scan (of any function type, as only one can run at a
+        # time) and the output scan
+        self.in_scan = None
+        self.ao_scan = None
+        self.ao_values = [0.0] * profile.num_da_chans
+        self.dio_value = 0
+        self.dio_direction = 0
+        # Per counter, the count loaded or cleared and the time it was
+        self.counters = [(0, 0.0)] * profile.num_counters
+        self.queue = None
+        self.config = {}
+        self.events = {}
+
+
+class _Event(object):
+    # An event enabled with cbEnableEvent, and how far it has been reported
+    # for the current scan
+    def __init__(self, param, callback, user_data):
+        self.param = param
+        self.callback = callback
+        self.user_data = user_data
+        self.scan = None
+        self.reported = 0
+        self.ended = False
+
+
+class SimulatedLibrary(object):
+    """In-process implementation of the Universal Library entry points.
+
+    Parameters
+    ----------
+    profiles : list of DeviceProfile, optional
+        The devices reported by :func:`.get_daq_device_inventory`. Defaults to
+        :data:`DEFAULT_PROFILES` (a USB-3101FS and a USB-202).
+    clock : RealClock or VirtualClock, optional
+        The clock that paces background scans. Defaults to :class:`RealClock`.
+    """
+    def __init__(self, profiles=None, clock=None):
+        self.clock = clock if clock is not None else RealClock()
+        self._profiles = list(DEFAULT_PROFILES if profiles is None else profiles)
+        self._lock = threading.RLock()
+        self._boards = {}
+        self._buffers = {}
+        self._signals = {}
+        self._links = {}
+        self._counter_signals = {}
+        self._digital_signals = {}
+        self._temperatures = {}
+        self._event_thread = None
+
+    @classmethod
+    def from_environment(cls):
+        """Creates a simulator configured from the environment. Setting ``MCCULW_SIM_CLOCK`` to
+        ``virtual`` selects a :class:`VirtualClock`, and setting ``MCCULW_SIM_DEVICES`` to a
+        comma-separated list of product names of :data:`PROFILES` selects the devices."""
+        clock = None
+        if os.environ.get('MCCULW_SIM_CLOCK', 'real').lower() == 'virtual':
+            clock = VirtualClock()
+        profiles = None
+        names = os.environ.get('MCCULW_SIM_DEVICES')
+        if names:
+            profiles = [PROFILES[name.strip()] for name in names.split(',')]
+        return cls(profiles, clock)
+
+    def __getattr__(self, name):
+        # Only called for names that are not found normally, i.e. the first
+        # time each cbXxx entry point is looked up.
+        if not name.startswith('cb'):
+            raise AttributeError(name)
+        impl = getattr(self, '_' + name, None)
+        if impl is None:
+            impl = self._not_supported
+        entry_point = _EntryPoint(name, self._locked(impl))
+        self.__dict__[name] = entry_point
+        return entry_point
+
+    def _locked(self, impl):
+        def call(*args):
+            with self._lock:
+                try:
+                    self._sample_inputs()
+                    return impl(*args)
+                except _SimError as e:
+                    return e.errorcode
+        return call
+
+    # Simulation control
+
+    def reset(self):
+        """Releases all boards and frees all buffers."""
+        with self._lock:
+            self._boards.clear()
+            self._buffers.clear()
+            self._signals.clear()
+            self._links.clear()
+            self._counter_signals.clear()
+            self._digital_signals.clear()
+            self._temperatures.clear()
+
+    def set_profiles(self, profiles):
+        """Replaces the devices reported by :func:`.get_daq_device_inventory`. Boards already
+        created are not affected."""
+        with self._lock:
+            self._profiles = list(profiles)
+
+    def advance(self, seconds):
+        """Advances a :class:`VirtualClock` by the given number of seconds, then delivers the
+        events that became due."""
+        self.clock.advance(seconds)
+        self._fire_events()
+
+    def set_signal(self, board_num, channel, signal):
+        """Assigns the signal read by an analog input channel.
+
+        signal is called as signal(t) with a NumPy array of clock times in seconds and must
+        return the input voltages at those times.
+        """
+        with self._lock:
+            self._signals[(board_num, channel)] = signal
+
+    def connect(self, ao_board_num, ao_channel, ai_board_num, ai_channel, gain=1.0,
+                offset=0.0):
+        """Wires an analog output channel to an analog input channel, so that the input reads
+        gain * output + offset."""
+        with self._lock:
+            self._links[(ai_board_num, ai_channel)] = (ao_board_num, ao_channel, gain, offset)
+
+    def set_counter_signal(self, board_num, counter_num, counts):
+        """Assigns the events counted by a counter.
+
+        counts is called as counts(t) with a NumPy array of clock times in seconds and must
+        return the number of events up to those times, nondecreasing in t. A counter without a
+        signal counts no events.
+        """
+        with self._lock:
+            self._counter_signals[(board_num, counter_num)] = counts
+
+    def set_digital_signal(self, board_num, signal):
+        """Assigns the levels read by the input bits of the AUXPORT.
+
+        signal is called as signal(t) with a NumPy array of clock times in seconds and must
+        return the port words at those times. Without a signal, input bits read the last values
+        written to the port.
+        """
+        with self._lock:
+            self._digital_signals[board_num] = signal
+
+    def set_temperature(self, board_num, channel, signal):
+        """Assigns the temperature read by a thermocouple channel.
+
+        signal is called as signal(t) with a NumPy array of clock times in seconds and must
+        return the temperatures at those times in degrees Celsius, NaN standing for an open
+        connection. Temperatures outside the temp_range of the profile read as out of range.
+        """
+        with self._lock:
+            self._temperatures[(board_num, channel)] = signal
+
+    # Helpers
+
+    def _board(self, board_num):
+        board = self._boards.get(board_num)
+        if board is None:
+            raise _SimError(ErrorCode.BADBOARD)
+        return board
+
+    def _not_supported(self, *args):
+        return ErrorCode.BADBOARDTYPE
+
+    def _buffer(self, memhandle):
+        buffer = self._buffers.get(memhandle)
+        if buffer is None:
+            raise _SimError(ErrorCode.BADPOINTER)
+        return buffer
+
+    def _alloc(self, num_points, dtype):
+        if num_points <= 0:
+            return None
+        buffer = np.zeros(num_points, dtype)
+        handle = buffer.ctypes.data
+        self._buffers[handle] = buffer
+        return handle
+
+    def _input_volts(self, board_num, channel, t):
+        link = self._links.get((board_num, channel))
+        if link is not None:
+            ao_board_num, ao_channel, gain, offset = link
+            ao_board = self._boards.get(ao_board_num)
+            if ao_board is not None:
+                return gain * self._output_volts(ao_board, ao_channel, t) + offset
+        signal = self._signals.get((board_num, channel))
+        if signal is not None:
+            return np.broadcast_to(np.asarray(signal(t), dtype=np.float64), t.shape)
+        return default_signal(channel, t)
+
+    def _output_volts(self, board, channel, t):
+        scan = board.ao_scan
+        offset = channel - scan.low_chan if scan is not None else -1
+        if scan is None or not 0 <= offset < scan.num_chans:
+            return np.full(t.shape, board.ao_values[channel])
+        scans = np.floor((t - scan.start_time) * scan.rate + 1e-9).astype(np.int64)
+        samples_per_chan = scan.count // scan.num_chans
+        if scan.continuous:
+            scans %= samples_per_chan
+        else:
+            np.clip(scans, 0, samples_per_chan - 1, out=scans)
+        values = scan.buffer[scans * scan.num_chans + offset]
+        if scan.scaled:
+            volts = values.astype(np.float64)
+        else:
+            volts = _to_volts(values, scan.ul_range, scan.resolution)
+        # Before the scan starts the output holds its previous value
+        return np.where(t < scan.start_time, board.ao_values[channel], volts)
+
+    def _sample_inputs(self):
+        # Sample every running input scan up to now before each call, as a
+        # device does continuously. The output buffers then still hold what
+        # was output at those times: the caller only refills the parts of
+        # an output buffer that the call reports as output.
+        for board in self._boards.values():
+            self._update(board)
+
+    def _update(self, board):
+        # Move the data a running input scan has acquired up to now into
+        # its buffer
+        scan = board.in_scan
+        if scan is None:
+            return
+        due = scan.due(self.clock.time())
+        if due <= scan.transferred:
+            return
+        first = max(scan.transferred, due - scan.count)
+        sample_nums = np.arange(first, due, dtype=np.int64)
+        t = scan.start_time + (sample_nums // scan.num_chans) / scan.rate
+        scan.buffer[sample_nums % scan.count] = scan.sampler(sample_nums, t)
+        scan.transferred = due
+
+    def _new_scan(self, function_type, chan_count, count, rate_ptr, memhandle, options, max_rate,
+                  dtypes, sampler=None, low_chan=0, ul_range=None, resolution=None):
+        # The checks shared by all scans. dtypes are the buffer types the
+        # scan accepts.
+        if max_rate == 0:
+            raise _SimError(ErrorCode.BADBOARDTYPE)
+        buffer = self._buffers.get(memhandle)
+        if buffer is None:
+            raise _SimError(ErrorCode.BADPOINTER)
+        if count <= 0 or count > len(buffer):
+            raise _SimError(ErrorCode.BADCOUNT)
+        if (options & ScanOptions.CONTINUOUS) and not (options & ScanOptions.BACKGROUND):
+            raise _SimError(ErrorCode.FORECONTINUOUS)
+        if buffer.dtype not in dtypes:
+            raise _SimError(ErrorCode.BADBUFFERSIZE)
+        rate_obj = _deref(rate_ptr)
+        rate = rate_obj.value
+        if rate <= 0 or rate * chan_count > max_rate:
+            raise _SimError(ErrorCode.BADRATE)
+        scan = _Scan(self.clock, low_chan, low_chan + chan_count - 1, count, rate, ul_range,
+                     buffer, options, resolution, function_type, sampler)
+        rate_obj.value = rate
+        return scan
+
+    def _start_scan(self, function_type, low_chan, high_chan, count, rate_ptr, ul_range,
+                    memhandle, options, num_chans, resolution, ranges, max_rate, bad_chan):
+        # An analog input or output scan of the channels low_chan to high_chan
+        if num_chans == 0:
+            raise _SimError(ErrorCode.NOTADCONF)
+        if max_rate == 0:
+            raise _SimError(ErrorCode.BADBOARDTYPE)
+        if not 0 <= low_chan <= high_chan < num_chans:
+            raise _SimError(bad_chan)
+        if ul_range not in [int(r) for r in ranges]:
+            raise _SimError(ErrorCode.BADRANGE)
+        scaled = bool(options & ScanOptions.SCALEDATA)
+        dtypes = (np.float64,) if scaled else (np.uint16, np.uint32)
+        return self._new_scan(function_type, high_chan - low_chan + 1, count, rate_ptr,
+                              memhandle, options, max_rate, dtypes, low_chan=low_chan,
+                              ul_range=ULRange(ul_range), resolution=resolution)
+
+    def _start_input(self, board, scan):
+        if board.in_scan is not None and board.in_scan.running(self.clock.time()):
+            raise _SimError(ErrorCode.ALREADYACTIVE)
+        board.in_scan = scan
+        if not scan.options & ScanOptions.BACKGROUND:
+            self.clock.sleep(scan.count / scan.num_chans / scan.rate)
+            self._update(board)
+        return ErrorCode.NOERRORS
+
+    # Signals, as the columns of the scans that sample them. A column is
+    # called with the times of its samples and returns their values.
+
+    def _analog_column(self, board_num, channel, ul_range, resolution, scaled):
+        def column(t):
+            counts = _to_counts(self._input_volts(board_num, channel, t), ul_range, resolution)
+            return _to_volts(counts, ul_range, resolution) if scaled else counts
+        return column
+
+    def _counter_values(self, board, counter_num, t):
+        # The values of a counter at times t, as uint64 before masking to its
+        # width
+        count, since = board.counters[counter_num]
+        counts = self._counter_signals.get((board.board_num, counter_num))
+        values = np.full(np.shape(t), count, np.uint64)
+        if counts is not None:
+            events = np.floor(np.asarray(counts(np.append(t, since)), np.float64))
+            values += (events[:-1] - events[-1]).astype(np.int64).astype(np.uint64)
+        return values
+
+    def _counter_column(self, board, counter_num, shift=0, bits=64):
+        # bits bits of the counter value from bit shift up
+        width = np.uint64((1 << board.profile.counter_bits) - 1)
+        mask = np.uint64((1 << bits) - 1)
+        return lambda t: ((self._counter_values(board, counter_num, t) & width)
+                          >> np.uint64(shift)) & mask
+
+    def _port_words(self, board, t):
+        words = np.full(np.shape(t), board.dio_value, np.int64)
+        signal = self._digital_signals.get(board.board_num)
+        if signal is not None:
+            inputs = ~board.dio_direction & ((1 << board.profile.num_dio_bits) - 1)
+            words = (words & board.dio_direction) | (np.asarray(signal(t), np.int64) & inputs)
+        return words
+
+    def _temperatures_at(self, board, channel, t):
+        # Degrees Celsius at times t: NaN for an open connection and infinity
+        # out of range
+        signal = self._temperatures.get((board.board_num, channel))
+        if signal is None:
+            celsius = default_temperature(channel, t)
+        else:
+            celsius = np.broadcast_to(np.asarray(signal(t), np.float64), np.shape(t))
+        low, high = board.profile.temp_range
+        with np.errstate(invalid='ignore'):
+            return np.where((celsius < low) | (celsius > high), np.inf, celsius)
+
+    def _tc_column(self, board, channel):
+        def column(t):
+            celsius = self._temperatures_at(board, channel, t)
+            counts = np.full(len(celsius), _TC_OPEN, np.int64)
+            valid = np.isfinite(celsius)
+            counts[valid] = np.round((celsius[valid] + _TC_OFFSET) * _TC_COUNTS_PER_DEGREE)
+            return counts
+        return column
+
+    def _check_temp_chan(self, board, channel):
+        if board.profile.num_temp_chans == 0:
+            raise _SimError(ErrorCode.BADBOARDTYPE)
+        if not 0 <= channel < board.profile.num_temp_chans:
+            raise _SimError(ErrorCode.BADADCHAN)
+
+    # Device discovery and configuration
+
+    def _cbIgnoreInstaCal(self):
+        return ErrorCode.NOERRORS
+
+    def _cbGetDaqDeviceInventory(self, interface_type, devices, number_of_devices):
+        number = _deref(number_of_devices)
+        found = 0
+        if interface_type & InterfaceType.USB:
+            for profile in self._profiles[:number.value]:
+                devices[found] = _descriptor(profile)
+                found += 1
+        number.value = found
+        return ErrorCode.NOERRORS
+
+    def _cbGetNetDeviceDescriptor(self, host, port, descriptor, timeout):
+        return ErrorCode.NETDEVNOTFOUND
+
+    def _cbCreateDaqDevice(self, board_num, descriptor):
+        if board_num in self._boards:
+            return ErrorCode.BOARDNUMINUSE
+        for profile in self._profiles:
+            if (profile.product_id == descriptor.product_id
+                    and profile.unique_id == descriptor.unique_id):
+                self._boards[board_num] = _Board(board_num, profile, _descriptor(profile))
+                return ErrorCode.NOERRORS
+        return ErrorCode.BADBOARD
+
+    def _cbReleaseDaqDevice(self, board_num):
+        self._boards.pop(board_num, None)
+        return ErrorCode.NOERRORS
+
+    def _cbGetBoardNumber(self, descriptor):
+        for board_num, board in self._boards.items():
+            if board.descriptor.unique_id == descriptor.unique_id:
+                return board_num
+        return -1
+
+    def _cbGetBoardName(self, board_num, name):
+        board = self._boards.get(board_num)
+        name.value = board.profile.product_name.encode('utf-8') if board else b''
+        return ErrorCode.NOERRORS
+
+    def _cbGetErrMsg(self, error_code, msg):
+        try:
+            text = ErrorCode(error_code).name
+        except ValueError:
+            text = 'Unknown error'
+        msg.value = text.encode('utf-8')
+        return ErrorCode.NOERRORS
+
+    def _cbFlashLED(self, board_num):
+        self._board(board_num)
+        return ErrorCode.NOERRORS
+
+    def _cbGetConfig(self, info_type, board_num, dev_num, config_item, config_val):
+        board = self._boards.get(board_num)
+        if board is None:
+            if info_type == InfoType.BOARDINFO and config_item == BoardInfo.BOARDTYPE:
+                _deref(config_val).value = 0
+                return ErrorCode.NOERRORS
+            return ErrorCode.BADBOARD
+        value = board.config.get((info_type, dev_num, config_item))
+        if value is None:
+            value = _config_value(board.profile, info_type, dev_num, config_item)
+        if value is None:
+            return ErrorCode.BADCONFIGITEM
+        _deref(config_val).value = value
+        return ErrorCode.NOERRORS
+
+    def _cbSetConfig(self, info_type, board_num, dev_num, config_item, config_val):
+        self._board(board_num).config[(info_type, dev_num, config_item)] = config_val
+        return ErrorCode.NOERRORS
+
+    def _cbGetConfigString(self, info_type, board_num, dev_num, config_item, config_val,
+                           max_config_len):
+        board = self._board(board_num)
+        if config_item in (BoardInfo.DEVUNIQUEID, BoardInfo.DEVSERIALNUM):
+            config_val.value = board.profile.unique_id.encode('utf-8')
+        elif config_item == BoardInfo.USERDEVID:
+            config_val.value = board.profile.product_name.encode('utf-8')
+        else:
+            return ErrorCode.BADCONFIGITEM
+        return ErrorCode.NOERRORS
+
+    # Memory buffers
+
+    def _cbWinBufAlloc(self, num_points):
+        return self._alloc(num_points, np.uint16)
+
+    def _cbWinBufAlloc32(self, num_points):
+        return self._alloc(num_points, np.uint32)
+
+    def _cbWinBufAlloc64(self, num_points):
+        return self._alloc(num_points, np.uint64)
+
+    def _cbScaledWinBufAlloc(self, num_points):
+        return self._alloc(num_points, np.float64)
+
+    def _cbWinBufFree(self, memhandle):
+        if self._buffers.pop(memhandle, None) is None:
+            return ErrorCode.BADPOINTER
+        return ErrorCode.NOERRORS
+
+    def _copy_from_buffer(self, memhandle, data_array, first_point, count, ctype):
+        buffer = self._buffer(memhandle)
+        for board in self._boards.values():
+            if board.in_scan is not None and board.in_scan.buffer is buffer:
+                self._update(board)
+        _as_ndarray(data_array, ctype, count)[:] = buffer[first_point:first_point + count]
+        return ErrorCode.NOERRORS
+
+    def _copy_to_buffer(self, data_array, memhandle, first_point, count, ctype):
+        buffer = self._buffer(memhandle)
+        buffer[first_point:first_point + count] = _as_ndarray(data_array, ctype, count)
+        return ErrorCode.NOERRORS
+
+    def _cbWinBufToArray(self, memhandle, data_array, first_point, count):
+        return self._copy_from_buffer(memhandle, data_array, first_point, count, c_ushort)
+
+    def _cbWinBufToArray32(self, memhandle, data_array, first_point, count):
+        return self._copy_from_buffer(memhandle, data_array, first_point, count, c_ulong)
+
+    def _cbWinBufToArray64(self, memhandle, data_array, first_point, count):
+        return self._copy_from_buffer(memhandle, data_array, first_point, count, c_ulonglong)
+
+    def _cbScaledWinBufToArray(self, memhandle, data_array, first_point, count):
+        return self._copy_from_buffer(memhandle, data_array, first_point, count, c_double)
+
+    def _cbWinArrayToBuf(self, data_array, memhandle, first_point, count):
+        return self._copy_to_buffer(data_array, memhandle, first_point, count, c_ushort)
+
+    def _cbWinArrayToBuf32(self, data_array, memhandle, first_point, count):
+        return self._copy_to_buffer(data_array, memhandle, first_point, count, c_ulong)
+
+    def _cbScaledWinArrayToBuf(self, data_array, memhandle, first_point, count):
+        return self._copy_to_buffer(data_array, memhandle, first_point, count, c_double)
+
+    # Analog input
+
+    def _read_input(self, board_num, channel, ul_range):
+        board = self._board(board_num)
+        profile = board.profile
+        if profile.num_ad_chans == 0:
+            raise _SimError(ErrorCode.NOTADCONF)
+        if not 0 <= channel < profile.num_ad_chans:
+            raise _SimError(ErrorCode.BADADCHAN)
+        if ul_range not in [int(r) for r in profile.ad_ranges]:
+            raise _SimError(ErrorCode.BADRANGE)
+        ul_range = ULRange(ul_range)
+        volts = self._input_volts(board_num, channel, np.array([self.clock.time()]))
+        counts = _to_counts(volts, ul_range, profile.ad_resolution)
+        return int(counts[0]), ul_range, profile.ad_resolution
+
+    def _cbAIn(self, board_num, channel, ul_range, data_value):
+        counts, _, _ = self._read_input(board_num, channel, ul_range)
+        _deref(data_value).value = counts
+        return ErrorCode.NOERRORS
+
+    def _cbAIn32(self, board_num, channel, ul_range, data_value, options):
+        return self._cbAIn(board_num, channel, ul_range, data_value)
+
+    def _cbVIn(self, board_num, channel, ul_range, data_value, options):
+        counts, ul_range, resolution = self._read_input(board_num, channel, ul_range)
+        _deref(data_value).value = float(_to_volts(np.array([counts]), ul_range,
+                                                   resolution)[0])
+        return ErrorCode.NOERRORS
+
+    def _cbVIn32(self, board_num, channel, ul_range, data_value, options):
+        return self._cbVIn(board_num, channel, ul_range, data_value, options)
+
+    def _cbALoadQueue(self, board_num, chan_list, gain_list, count):
+        board = self._board(board_num)
+        profile = board.profile
+        if not profile.queue_size:
+            return ErrorCode.NOQUEUE
+        if count == 0:
+            board.queue = None
+            return ErrorCode.NOERRORS
+        if not 0 < count <= profile.queue_size:
+            return ErrorCode.BADCOUNT
+        channels = [chan_list[index] for index in range(count)]
+        ranges = [gain_list[index] for index in range(count)]
+        if not all(0 <= channel < profile.num_ad_chans for channel in channels):
+            return ErrorCode.BADADCHAN
+        if not all(ul_range in [int(r) for r in profile.ad_ranges] for ul_range in ranges):
+            return ErrorCode.BADRANGE
+        board.queue = (channels, [ULRange(ul_range) for ul_range in ranges])
+        return ErrorCode.NOERRORS
+
+    def _cbAInScan(self, board_num, low_chan, high_chan, num_points, rate, ul_range,
+                   memhandle, options):
+        board = self._board(board_num)
+        profile = board.profile
+        scaled = bool(options & ScanOptions.SCALEDATA)
+        if board.queue is not None:
+            # The queue sets the channels and ranges, low_chan and high_chan
+            # are ignored
+            channels, ranges = board.queue
+            low_chan, high_chan, ul_range = 0, 0, ranges[0]
+        else:
+            channels = list(range(low_chan, high_chan + 1))
+        scan = self._start_scan(
+            FunctionType.AIFUNCTION, low_chan, high_chan, num_points, rate, ul_range, memhandle,
+            options, profile.num_ad_chans, profile.ad_resolution, profile.ad_ranges,
+            profile.ad_max_rate, ErrorCode.BADADCHAN)
+        if board.queue is not None:
+            if scan.rate * len(channels) > profile.ad_max_rate:
+                return ErrorCode.BADRATE
+            scan.num_chans = len(channels)
+        else:
+            ranges = [scan.ul_range] * len(channels)
+        scan.sampler = _sampler([
+            self._analog_column(board_num, channel, chan_range, profile.ad_resolution, scaled)
+            for channel, chan_range in zip(channels, ranges)], scan.buffer.dtype)
+        return self._start_input(board, scan)
+
+    # Analog output
+
+    def _check_output(self, board_num, channel, ul_range):
+        board = self._board(board_num)
+        profile = board.profile
+        if profile.num_da_chans == 0:
+            raise _SimError(ErrorCode.NOTDACONF)
+        if not 0 <= channel < profile.num_da_chans:
+            raise _SimError(ErrorCode.BADDACHAN)
+        if ul_range not in [int(r) for r in profile.da_ranges]:
+            raise _SimError(ErrorCode.BADRANGE)
+        return board, ULRange(ul_range)
+
+    def _cbAOut(self, board_num, channel, ul_range, data_value):
+        board, ul_range = self._check_output(board_num, channel, ul_range)
+        board.ao_values[channel] = float(_to_volts(
+            np.array([data_value]), ul_range, board.profile.da_resolution)[0])
+        return ErrorCode.NOERRORS
+
+    def _cbVOut(self, board_num, channel, ul_range, data_value, options):
+        board, ul_range = self._check_output(board_num, channel, ul_range)
+        resolution = board.profile.da_resolution
+        counts = _to_counts(np.array([data_value]), ul_range, resolution)
+        board.ao_values[channel] = float(_to_volts(counts, ul_range, resolution)[0])
+        return ErrorCode.NOERRORS
+
+    def _cbAOutScan(self, board_num, low_chan, high_chan, num_points, rate, ul_range,
+                    memhandle, options):
+        board = self._board(board_num)
+        profile = board.profile
+        if profile.num_da_chans == 0:
+            return ErrorCode.NOTDACONF
+        if board.ao_scan is not None and board.ao_scan.running(self.clock.time()):
+            return ErrorCode.ALREADYACTIVE
+        scan = self._start_scan(
+            FunctionType.AOFUNCTION, low_chan, high_chan, num_points, rate, ul_range, memhandle,
+            options, profile.num_da_chans, profile.da_resolution, profile.da_ranges,
+            profile.da_max_rate, ErrorCode.BADDACHAN)
+        board.ao_scan = scan
+        if not options & ScanOptions.BACKGROUND:
+            self.clock.sleep(num_points / scan.num_chans / scan.rate)
+            self._finish_output(board)
+        return ErrorCode.NOERRORS
+
+    def _finish_output(self, board):
+        # Latch the last value written by the output scan, as the D/A holds
+        # it after the scan stops
+        scan = board.ao_scan
+        now = np.array([self.clock.time()])
+        for offset in range(scan.num_chans):
+            channel = scan.low_chan + offset
+            board.ao_values[channel] = float(self._output_volts(board, channel, now)[0])
+        board.ao_scan = None
+
+    # Background operations
+
+    def _cbGetIOStatus(self, board_num, status, cur_count, cur_index, function_type):
+        board = self._boards.get(board_num)
+        if board is None:
+            return ErrorCode.BADBOARD
+        now = self.clock.time()
+        if function_type == FunctionType.AOFUNCTION:
+            if board.profile.da_max_rate == 0:
+                return ErrorCode.BADBOARDTYPE
+            scan = board.ao_scan
+        elif function_type in _INPUT_FUNCTIONS:
+            if _max_rate(board.profile, function_type) == 0:
+                return ErrorCode.BADBOARDTYPE
+            scan = board.in_scan
+            if scan is not None and scan.function_type != function_type:
+                scan = None
+            self._update(board)
+        else:
+            return ErrorCode.BADBOARDTYPE
+
+        if scan is None:
+            _deref(status).value = Status.IDLE
+            _deref(cur_count).value = 0
+            _deref(cur_index).value = -1
+            return ErrorCode.NOERRORS
+        count, index = scan.status(now)
+        _deref(status).value = Status.RUNNING if scan.running(now) else Status.IDLE
+        _deref(cur_count).value = count
+        _deref(cur_index).value = index
+        return ErrorCode.NOERRORS
+
+    def _cbStopIOBackground(self, board_num, function_type):
+        board = self._board(board_num)
+        scan = board.in_scan
+        if scan is not None and scan.function_type == function_type:
+            self._update(board)
+            scan.stopped = True
+        elif function_type == FunctionType.AOFUNCTION and board.ao_scan is not None:
+            self._finish_output(board)
+        return ErrorCode.NOERRORS
+
+    # Events
+
+    def _cbEnableEvent(self, board_num, event_type, event_param, callback, user_data):
+        board = self._board(board_num)
+        if event_type & ~_EVENT_TYPES:
+            return ErrorCode.BADEVENTTYPE
+        user_data = _deref(user_data)
+        if user_data is not None and not isinstance(user_data, int):
+            user_data = addressof(user_data)
+        for bit in _EVENT_TYPE_BITS:
+            if event_type & bit:
+                board.events[bit] = _Event(event_param, callback, user_data)
+        if not isinstance(self.clock, VirtualClock) and self._event_thread is None:
+            self._event_thread = threading.Thread(target=self._run_events,
+                                                  name='SimulatedLibrary events')
+            self._event_thread.daemon = True
+            self._event_thread.start()
+        return ErrorCode.NOERRORS
+
+    def _cbDisableEvent(self, board_num, event_type):
+        board = self._board(board_num)
+        for bit in list(board.events):
+            if event_type & bit:
+                del board.events[bit]
+        return ErrorCode.NOERRORS
+
+    def _run_events(self):
+        while True:
+            with self._lock:
+                if not any(board.events for board in self._boards.values()):
+                    self._event_thread = None
+                    return
+            self._fire_events()
+            self.clock.sleep(_EVENT_INTERVAL)
+
+    def _fire_events(self):
+        # The callbacks run without the lock, so that they can call the
+        # library from any thread
+        with self._lock:
+            calls = self._due_events()
+        for callback, args in calls:
+            callback(*args)
+
+    def _due_events(self):
+        now = self.clock.time()
+        calls = []
+        for board in self._boards.values():
+            for event_type, event in board.events.items():
+                is_output = _END_EVENTS.get(event_type, False)
+                scan = board.ao_scan if is_output else board.in_scan
+                if scan is None:
+                    continue
+                if event.scan is not scan:
+                    event.scan, event.reported, event.ended = scan, 0, False
+                # Stopping a scan generates no events
+                if scan.stopped:
+                    continue
+                count = scan.due(now)
+                if event_type == EventType.ON_DATA_AVAILABLE:
+                    if count - event.reported < max(event.param, 1):
+                        continue
+                    event.reported = count
+                    self._update(board)
+                elif event_type in _END_EVENTS:
+                    if event.ended or scan.running(now):
+                        continue
+                    event.ended = True
+                    if not is_output:
+                        self._update(board)
+                else:
+                    continue
+                calls.append((event.callback,
+                              (board.board_num, int(event_type), count, event.user_data)))
+        return calls
+
+    # Engineering units
+
+    def _resolution(self, board_num, prefer_output):
+        board = self._boards.get(board_num)
+        if board is None:
+            return 12
+        profile = board.profile
+        ordered = ([(profile.num_da_chans, profile.da_resolution),
+                    (profile.num_ad_chans, profile.ad_resolution)])
+        if not prefer_output:
+            ordered.reverse()
+        for num_chans, resolution in ordered:
+            if num_chans > 0:
+                return resolution
+        return 12
+
+    def _cbFromEngUnits(self, board_num, ul_range, eng_units_value, data_value):
+        counts = _to_counts(np.array([eng_units_value], dtype=np.float32), ULRange(ul_range),
+                            self._resolution(board_num, True))
+        _deref(data_value).value = int(counts[0])
+        return ErrorCode.NOERRORS
+
+    def _cbToEngUnits(self, board_num, ul_range, data_value, eng_units_value):
+        volts = _to_volts(np.array([data_value]), ULRange(ul_range),
+                          self._resolution(board_num, False))
+        _deref(eng_units_value).value = float(volts[0])
+        return ErrorCode.NOERRORS
+
+    def _cbToEngUnits32(self, board_num, ul_range, data_value, eng_units_value):
+        return self._cbToEngUnits(board_num, ul_range, data_value, eng_units_value)
+
+    # Digital I/O and counters
+
+    def _check_port(self, board_num, port_type):
+        board = self._board(board_num)
+        if board.profile.num_dio_bits == 0:
+            raise _SimError(ErrorCode.BADBOARDTYPE)
+        if port_type != DigitalPortType.AUXPORT:
+            raise _SimError(ErrorCode.BADPORTNUM)
+        return board
+
+    def _cbDConfigPort(self, board_num, port_type, direction):
+        board = self._check_port(board_num, port_type)
+        output = direction == DigitalIODirection.OUT
+        board.dio_direction = (1 << board.profile.num_dio_bits) - 1 if output else 0
+        return ErrorCode.NOERRORS
+
+    def _cbDConfigBit(self, board_num, port_type, bit_num, direction):
+        board = self._check_port(board_num, port_type)
+        if direction == DigitalIODirection.OUT:
+            board.dio_direction |= 1 << bit_num
+        else:
+            board.dio_direction &= ~(1 << bit_num)
+        return ErrorCode.NOERRORS
+
+    def _port_word(self, board):
+        return int(self._port_words(board, np.array([self.clock.time()]))[0])
+
+    def _cbDIn(self, board_num, port_type, data_value):
+        board = self._check_port(board_num, port_type)
+        _deref(data_value).value = self._port_word(board)
+        return ErrorCode.NOERRORS
+
+    def _cbDOut(self, board_num, port_type, data_value):
+        board = self._check_port(board_num, port_type)
+        mask = board.dio_direction
+        board.dio_value = (board.dio_value & ~mask) | (data_value & mask)
+        return ErrorCode.NOERRORS
+
+    def _cbDBitIn(self, board_num, port_type, bit_num, bit_value):
+        board = self._check_port(board_num, port_type)
+        _deref(bit_value).value = (self._port_word(board) >> bit_num) & 1
+        return ErrorCode.NOERRORS
+
+    def _cbDBitOut(self, board_num, port_type, bit_num, bit_value):
+        board = self._check_port(board_num, port_type)
+        if not (board.dio_direction >> bit_num) & 1:
+            return ErrorCode.WRONGDIGCONFIG
+        if bit_value:
+            board.dio_value |= 1 << bit_num
+        else:
+            board.dio_value &= ~(1 << bit_num)
+        return ErrorCode.NOERRORS
+
+    def _check_counter(self, board_num, counter_num):
+        board = self._board(board_num)
+        if not 0 <= counter_num < board.profile.num_counters:
+            raise _SimError(ErrorCode.BADCOUNTERDEVNUM)
+        return board
+
+    def _counter_value(self, board, counter_num, bits):
+        column = self._counter_column(board, counter_num, bits=bits)
+        return int(column(np.array([self.clock.time()]))[0])
+
+    def _cbCClear(self, board_num, counter_num):
+        board = self._check_counter(board_num, counter_num)
+        board.counters[counter_num] = (0, self.clock.time())
+        return ErrorCode.NOERRORS
+
+    def _cbCIn32(self, board_num, counter_num, count):
+        board = self._check_counter(board_num, counter_num)
+        _deref(count).value = self._counter_value(board, counter_num, 32)
+        return ErrorCode.NOERRORS
+
+    def _cbCIn(self, board_num, counter_num, count):
+        board = self._check_counter(board_num, counter_num)
+        _deref(count).value = self._counter_value(board, counter_num, 16)
+        return ErrorCode.NOERRORS
+
+    def _cbCInScan(self, board_num, first_ctr, last_ctr, count, rate, memhandle, options):
+        board = self._board(board_num)
+        profile = board.profile
+        if not 0 <= first_ctr <= last_ctr < profile.num_counters:
+            return ErrorCode.BADCOUNTERDEVNUM
+        if options & ScanOptions.CTR64BIT:
+            bits, dtype = 64, np.uint64
+        elif options & ScanOptions.CTR48BIT:
+            bits, dtype = 48, np.uint64
+        elif options & ScanOptions.CTR32BIT:
+            bits, dtype = 32, np.uint32
+        else:
+            bits, dtype = 16, np.uint16
+        scan = self._new_scan(
+            FunctionType.CTRFUNCTION, last_ctr - first_ctr + 1, count, rate, memhandle, options,
+            profile.ctr_max_rate, (dtype,), low_chan=first_ctr)
+        if not options & ScanOptions.NOCLEAR:
+            for counter_num in range(first_ctr, last_ctr + 1):
+                board.counters[counter_num] = (0, scan.start_time)
+        scan.sampler = _sampler([self._counter_column(board, counter_num, bits=bits)
+                                 for counter_num in range(first_ctr, last_ctr + 1)], dtype)
+        return self._start_input(board, scan)
+
+    def _cbDInScan(self, board_num, port_type, count, rate, memhandle, options):
+        board = self._check_port(board_num, port_type)
+        dtype = np.uint32 if options & ScanOptions.DWORDXFER else np.uint16
+        scan = self._new_scan(FunctionType.DIFUNCTION, 1, count, rate, memhandle, options,
+                              board.profile.di_max_rate, (dtype,))
+        scan.sampler = _sampler([lambda t: self._port_words(board, t)], dtype)
+        return self._start_input(board, scan)
+
+    # Mixed input scans
+
+    def _daq_column(self, board, channel, chan_type, ul_range, scaled):
+        profile = board.profile
+        chan_type = int(chan_type) & ~ChannelType.SETPOINT_ENABLE
+        if chan_type in (ChannelType.ANALOG, ChannelType.ANALOG_SE, ChannelType.ANALOG_DIFF):
+            if not 0 <= channel < profile.num_ad_chans:
+                raise _SimError(ErrorCode.BADADCHAN)
+            if ul_range not in [int(r) for r in profile.ad_ranges]:
+                raise _SimError(ErrorCode.BADRANGE)
+            return self._analog_column(board.board_num, channel, ULRange(ul_range),
+                                       profile.ad_resolution, scaled)
+        if chan_type in (ChannelType.DIGITAL8, ChannelType.DIGITAL16, ChannelType.DIGITAL):
+            self._check_port(board.board_num, channel)
+            mask = 0xFF if chan_type == ChannelType.DIGITAL8 else 0xFFFF
+            return lambda t: self._port_words(board, t) & mask
+        if chan_type in _COUNTER_WORDS:
+            if not 0 <= channel < profile.num_counters:
+                raise _SimError(ErrorCode.BADCOUNTERDEVNUM)
+            shift, bits = _COUNTER_WORDS[chan_type]
+            return self._counter_column(board, channel, shift, bits)
+        if chan_type == ChannelType.TC:
+            self._check_temp_chan(board, channel)
+            return self._tc_column(board, channel)
+        if chan_type == ChannelType.CJC:
+            # A constant 25 degrees Celsius, stored as a thermocouple sample
+            return lambda t: np.full(len(t), (25.0 + _TC_OFFSET) * _TC_COUNTS_PER_DEGREE)
+        if chan_type in (ChannelType.PADZERO, ChannelType.SETPOINTSTATUS):
+            return lambda t: np.zeros(len(t))
+        raise _SimError(ErrorCode.BADCHANTYPE)
+
+    def _cbDaqInScan(self, board_num, chan_list, chan_type_list, gain_list, chan_count, rate,
+                     pretrig_count, total_count, memhandle, options):
+        board = self._board(board_num)
+        if chan_count <= 0:
+            return ErrorCode.BADCOUNT
+        scaled = bool(options & ScanOptions.SCALEDATA)
+        dtypes = (np.float64,) if scaled else (np.uint16, np.uint32, np.uint64)
+        count = _deref(total_count).value
+        scan = self._new_scan(FunctionType.DAQIFUNCTION, chan_count, count, rate, memhandle,
+                              options, board.profile.daqi_max_rate, dtypes)
+        scan.sampler = _sampler([
+            self._daq_column(board, chan_list[index], chan_type_list[index], gain_list[index],
+                             scaled)
+            for index in range(chan_count)], scan.buffer.dtype)
+        _deref(pretrig_count).value = 0
+        return self._start_input(board, scan)
+
+    # Temperature
+
+    def _cbTIn(self, board_num, channel, scale, temp_value, options):
+        board = self._board(board_num)
+        self._check_temp_chan(board, channel)
+        celsius = self._temperatures_at(board, channel, np.array([self.clock.time()]))
+        values, err_code = self._convert_temperatures(celsius, scale)
+        _deref(temp_value).value = float(values[0])
+        return err_code
+
+    def _cbTInScan(self, board_num, low_chan, high_chan, scale, data_array, options):
+        board = self._board(board_num)
+        self._check_temp_chan(board, low_chan)
+        self._check_temp_chan(board, high_chan)
+        t = np.array([self.clock.time()])
+        celsius = np.concatenate([self._temperatures_at(board, channel, t)
+                                  for channel in range(low_chan, high_chan + 1)])
+        values, err_code = self._convert_temperatures(celsius, scale)
+        _as_ndarray(data_array, c_float, len(values))[:] = values
+        return err_code
+
+    def _convert_temperatures(self, celsius, scale):
+        # The values in scale, with the failed ones set to _FAILED_TEMPERATURE,
+        # and the error code of the first one that failed
+        values = _from_celsius(np.where(np.isfinite(celsius), celsius, 0.0), scale)
+        failed = np.flatnonzero(~np.isfinite(celsius))
+        values[failed] = _FAILED_TEMPERATURE
+        err_code = ErrorCode.NOERRORS
+        if len(failed):
+            err_code = (ErrorCode.OPENCONNECTION if np.isnan(celsius[failed[0]])
+                        else ErrorCode.OUTOFRANGE)
+        return values, err_code
+
+    def _cbGetTCValues(self, board_num, chan_list, chan_type_list, chan_count, memhandle,
+                       first_point, count, scale, data_array):
+        self._board(board_num)
+        buffer = self._buffer(memhandle)
+        for board in self._boards.values():
+            if board.in_scan is not None and board.in_scan.buffer is buffer:
+                self._update(board)
+        positions = [index for index in range(chan_count)
+                     if int(chan_type_list[index]) & ~ChannelType.SETPOINT_ENABLE
+                     == ChannelType.TC]
+        rows = buffer[first_point * chan_count:(first_point + count) * chan_count]
+        if len(rows) < count * chan_count:
+            return ErrorCode.BADCOUNT
+        counts = rows.reshape(count, chan_count)[:, positions].astype(np.float64).reshape(-1)
+        celsius = counts / _TC_COUNTS_PER_DEGREE - _TC_OFFSET
+        celsius[counts == _TC_OPEN] = np.inf
+        values, err_code = self._convert_temperatures(celsius, scale)
+        _as_ndarray(data_array, c_float, len(values))[:] = values
+        # The conversion only tells that some channels failed
+        return ErrorCode.OUTOFRANGE if err_code else ErrorCode.NOERRORS
+
+
+class _SimError(Exception):
+    def __init__(self, errorcode):
+        super(_SimError, self).__init__(errorcode)
+        self.errorcode = errorcode
+
+
+def _descriptor(profile):
+    descriptor = DaqDeviceDescriptor()
+    descriptor.product_name = profile.product_name
+    descriptor.product_id = profile.product_id
+    descriptor.interface_type = InterfaceType.USB
+    descriptor.dev_string = profile.product_name
+    descriptor.unique_id = profile.unique_id
+    descriptor.nuid = int(profile.unique_id, 16)
+    return descriptor
+
+
+# The bit offset and width of the counter words of daq_in_scan
+_COUNTER_WORDS = {
+    ChannelType.CTR16: (0, 16),
+    ChannelType.CTR32LOW: (0, 16),
+    ChannelType.CTR32HIGH: (16, 16),
+    ChannelType.CTRBANK0: (0, 16),
+    ChannelType.CTRBANK1: (16, 16),
+    ChannelType.CTRBANK2: (32, 16),
+    ChannelType.CTRBANK3: (48, 16),
+    ChannelType.CTR: (0, 32),
+}
+
+
+def _sampler(columns, dtype):
+    # A scan sampler that samples position p of each channel scan with
+    # columns[p]
+    def sample(sample_nums, t):
+        positions = sample_nums % len(columns)
+        data = np.empty(len(sample_nums), dtype)
+        for position, column in enumerate(columns):
+            mask = positions == position
+            if mask.any():
+                data[mask] = column(t[mask])
+        return data
+    return sample
+
+
+def _from_celsius(celsius, scale):
+    if scale == TempScale.CELSIUS:
+        return celsius
+    if scale == TempScale.FAHRENHEIT:
+        return celsius * 1.8 + 32.0
+    if scale == TempScale.KELVIN:
+        return celsius + 273.15
+    if scale == TempScale.VOLTS:
+        # About the sensitivity of a type K thermocouple
+        return celsius * 41e-6
+    if scale == TempScale.NOSCALE:
+        return (celsius + _TC_OFFSET) * _TC_COUNTS_PER_DEGREE
+    raise _SimError(ErrorCode.BADTEMPSCALE)
+
+
+def _config_value(profile, info_type, dev_num, config_item):
+    if info_type == InfoType.BOARDINFO:
+        ad_range = profile.ad_ranges[0] if len(profile.ad_ranges) == 1 else -1
+        return {
+            BoardInfo.BOARDTYPE: profile.product_id,
+            BoardInfo.NUMADCHANS: profile.num_ad_chans,
+            BoardInfo.NUMDACHANS: profile.num_da_chans,
+            BoardInfo.ADRES: profile.ad_resolution if profile.num_ad_chans else 0,
+            BoardInfo.DACRES: profile.da_resolution if profile.num_da_chans else 0,
+            BoardInfo.RANGE: int(ad_range),
+            BoardInfo.DACRANGE: int(profile.da_ranges[0]) if profile.da_ranges else -1,
+            BoardInfo.NUMTEMPCHANS: profile.num_temp_chans,
+            BoardInfo.NUMEXPS: 0,
+            BoardInfo.ADTRIGSRC: 0,
+            BoardInfo.ADMAXRATE: profile.ad_max_rate,
+            BoardInfo.ADSCANOPTIONS: int(profile.ad_scan_options),
+            BoardInfo.DACSCANOPTIONS: int(profile.da_scan_options),
+            BoardInfo.DINUMDEVS: 1 if profile.num_dio_bits else 0,
+            BoardInfo.CINUMDEVS: profile.num_counters,
+            BoardInfo.CTRSCANOPTIONS: int(_CTR_SCAN_OPTIONS) if profile.ctr_max_rate else 0,
+            BoardInfo.DAQINUMCHANTYPES: len(_DAQI_CHAN_TYPES) if profile.daqi_max_rate else 0,
+            BoardInfo.DAQICHANTYPE: (int(_DAQI_CHAN_TYPES[dev_num])
+                                     if profile.daqi_max_rate
+                                     and 0 <= dev_num < len(_DAQI_CHAN_TYPES) else None),
+            BoardInfo.DAQONUMCHANTYPES: 0,
+        }.get(config_item)
+    if info_type == InfoType.DIGITALINFO and dev_num == 0 and profile.num_dio_bits:
+        return {
+            DigitalInfo.DEVTYPE: int(DigitalPortType.AUXPORT),
+            DigitalInfo.NUMBITS: profile.num_dio_bits,
+            DigitalInfo.INMASK: 0,
+            DigitalInfo.OUTMASK: 0,
+        }.get(config_item)
+    if info_type == InfoType.COUNTERINFO and 0 <= dev_num < profile.num_counters:
+        return {
+            CounterInfo.CTRTYPE: int(CounterChannelType.CTREVENT),
+            CounterInfo.CTRNUM: dev_num,
+        }.get(config_item)
+    return None
+
+
+def _deref(ptr):
+    # byref() passes a CArgObject; the referenced ctypes instance is _obj.
+    # pointer() passes a pointer instance, whose contents is that instance.
+    if isinstance(ptr, _Pointer):
+        return ptr.contents
+    return getattr(ptr, '_obj', ptr)
+
+
+def _as_ndarray(data_array, ctype, count):
+    if isinstance(data_array, Array):
+        address = addressof(data_array)
+    else:
+        address = cast(data_array, c_void_p).value
+    return np.ctypeslib.as_array((ctype * count).from_address(address))
+
+
+def _to_counts(volts, ul_range, resolution):
+    full_scale_counts = (1 << resolution) - 1
+    full_scale_eng = ul_range.range_max - ul_range.range_min
+    counts = np.floor((np.asarray(volts, dtype=np.float64) - ul_range.range_min)
+                      * (full_scale_counts / full_scale_eng) + 0.5)
+    return np.clip(counts, 0, full_scale_counts).astype(np.int64)
+
+
+def _to_volts(counts, ul_range, resolution):
+    full_scale_counts = (1 << resolution) - 1
+    full_scale_eng = ul_range.range_max - ul_range.range_min
+    return (np.asarray(counts, dtype=np.float64) * (full_scale_eng / full_scale_counts)
+            + ul_range.range_min)
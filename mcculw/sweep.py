@@ -0,0 +1,274 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Step-and-measure sweeps that advance as soon as the response settles.
+
+:class:`Sweep` sets an output level, then watches the data of a running
+:class:`~mcculw.continuous_scan.ContinuousScan` until a :class:`SettleCriterion` is met (or a
+maximum dwell time passes), records a :class:`SweepPoint` and moves on to the next level. The
+levels come from any iterable of voltages, or from :class:`AdaptiveSteps`, which shortens the
+step where the response changes quickly (such as around the breakdown knee of a BV curve) and
+lengthens it where the response is flat::
+
+    scan = ContinuousScan(ai_board, 0, 0, 10000, ULRange.BIP10VOLTS)
+    sweep = Sweep(dc_output(ao_board, 0, ULRange.BIP10VOLTS), scan,
+                  SettleCriterion(0.05, max_slope=0.01), max_dwell=2.0)
+    with scan:
+        points = sweep.run(AdaptiveSteps(0, 2.65, 0.025, max_change=0.05))
+
+This module requires NumPy.
+"""
+import collections
+import math
+import time
+
+import numpy as np
+
+from mcculw import ul
+
+SweepPoint = collections.namedtuple("SweepPoint", "voltage mean std slope dwell settled")
+SweepPoint.__doc__ = """The measurement at one level of a :class:`Sweep`.
+
+voltage : float
+    The output level.
+mean : float
+    The mean of the response over the settle window.
+std : float
+    The standard deviation of the response over the settle window.
+slope : float
+    The slope of the response over the settle window, in volts per second.
+dwell : float
+    The time from setting the level to the end of the settle window, in seconds.
+settled : bool
+    False if the maximum dwell time passed before the criterion was met; mean, std and slope are
+    then those of the last window.
+"""
+
+
+def dc_output(board_num, channel, ul_range):
+    """Returns a function that sets a D/A channel to a voltage with :func:`.v_out`, for use as the
+    set_level of a :class:`Sweep`."""
+    def set_level(voltage):
+        ul.v_out(board_num, channel, ul_range, voltage)
+    return set_level
+
+
+class SettleCriterion(object):
+    """Decides whether a response has settled, from the last window of samples.
+
+    Parameters
+    ----------
+    window : float
+        The length of the window, in seconds.
+    max_slope : float, optional
+        The largest absolute slope of a line fitted to the window, in volts per second.
+    max_std : float, optional
+        The largest standard deviation of the window.
+    average : int, optional
+        Number of consecutive samples averaged before the window is evaluated, for example one
+        period of a periodic excitation, so that its ripple is not mistaken for drift or noise.
+        Defaults to 1.
+    """
+    def __init__(self, window, max_slope=None, max_std=None, average=1):
+        self.window = window
+        self.max_slope = max_slope
+        self.max_std = max_std
+        self.average = average
+        self._fit = {}
+
+    def window_samples(self, rate):
+        """Number of samples in the window at rate samples per second."""
+        return max(int(round(self.window * rate / self.average)), 2) * self.average
+
+    def evaluate(self, data, rate):
+        """Evaluates a window of samples, as returned by :meth:`window_samples`.
+
+        Returns
+        -------
+        settled : bool
+            True if the criterion is met
+        mean, std, slope : float
+            The statistics of the window
+        """
+        values = data.reshape(-1, self.average).mean(axis=1)
+        n = len(values)
+        weights = self._fit.get((n, rate))
+        if weights is None:
+            # Least-squares slope of values against time, as a dot product
+            t = np.arange(n) * (self.average / float(rate))
+            t -= t.mean()
+            weights = self._fit[(n, rate)] = t / np.dot(t, t)
+        mean = float(values.mean())
+        std = float(values.std(ddof=1))
+        slope = float(np.dot(weights, values))
+        settled = ((self.max_slope is None or abs(slope) <= self.max_slope)
+                   and (self.max_std is None or std <= self.max_std))
+        return settled, mean, std, slope
+
+
+class AdaptiveSteps(object):
+    """Levels from start to stop whose step adapts to the response: each step is scaled so that
+    the response changes by about max_change, within min_step and max_step.
+
+    Parameters
+    ----------
+    start : float
+        The first level.
+    stop : float
+        The last level.
+    step : float
+        The first step, and the step used while the change of the response is unknown.
+    min_step : float, optional
+        The smallest step. Defaults to step / 4.
+    max_step : float, optional
+        The largest step. Defaults to step * 4.
+    max_change : float, optional
+        The targeted change of the response mean between consecutive levels. Without it, the
+        step is fixed.
+    """
+    def __init__(self, start, stop, step, min_step=None, max_step=None, max_change=None):
+        self.start = float(start)
+        self.stop = float(stop)
+        self.step = abs(step)
+        self.min_step = self.step / 4 if min_step is None else min_step
+        self.max_step = self.step * 4 if max_step is None else max_step
+        self.max_change = max_change
+        self._direction = 1 if stop >= start else -1
+
+    def next_level(self, points):
+        """Returns the level following points, or None at the end of the sweep."""
+        if not points:
+            return self.start
+        last = points[-1].voltage
+        if (self.stop - last) * self._direction <= 1e-12:
+            return None
+        step = self.step
+        if self.max_change is not None and len(points) > 1:
+            change = abs(points[-1].mean - points[-2].mean)
+            previous = abs(last - points[-2].voltage)
+            if change > 0:
+                step = previous * self.max_change / change
+            else:
+                step = self.max_step
+            step = min(max(step, self.min_step), self.max_step)
+        level = last + self._direction * step
+        # Finish exactly on stop
+        if (level - self.stop) * self._direction > 0:
+            level = self.stop
+        return level
+
+
+class Sweep(object):
+    """Steps an output through levels, measuring the response of each once it has settled.
+
+    Parameters
+    ----------
+    set_level : callable
+        Called with each level, in volts. For example the function returned by
+        :func:`dc_output`, or the set_amplitude method of a
+        :class:`~mcculw.waveform_output.WaveformOutput`.
+    scan : ContinuousScan
+        The running input scan that measures the response. The sweep reads its chunks, so nothing
+        else may read them during the sweep.
+    criterion : SettleCriterion
+        When a level counts as settled.
+    max_dwell : float, optional
+        The longest time a level is held waiting for the criterion, in seconds. Defaults to 5.
+    dead_time : float, optional
+        Time after setting a level during which the response is ignored, in seconds, for example
+        the latency of a WaveformOutput. Defaults to 0.
+    channel : int, optional
+        The position of the response channel in the scan, 0 by default.
+
+    Attributes
+    ----------
+    points : list of SweepPoint
+        The points measured by :meth:`run`.
+    """
+    def __init__(self, set_level, scan, criterion, max_dwell=5.0, dead_time=0.0, channel=0):
+        self.set_level = set_level
+        self.scan = scan
+        self.criterion = criterion
+        self.max_dwell = max_dwell
+        self.dead_time = dead_time
+        self.channel = channel
+        self.points = []
+
+    def run(self, levels, on_point=None):
+        """Runs the sweep.
+
+        Parameters
+        ----------
+        levels : iterable of float, or AdaptiveSteps
+            The levels, or an object whose next_level(points) method returns each level from the
+            points measured so far, and None at the end.
+        on_point : callable, optional
+            Called with each SweepPoint as soon as it is measured.
+
+        Returns
+        -------
+        list of SweepPoint
+            The points measured
+        """
+        next_level = getattr(levels, 'next_level', None)
+        if next_level is None:
+            iterator = iter(levels)
+            next_level = lambda points: next(iterator, None)
+        while True:
+            level = next_level(self.points)
+            if level is None:
+                break
+            point = self.measure(level)
+            self.points.append(point)
+            if on_point is not None:
+                on_point(point)
+        return self.points
+
+    def measure(self, level):
+        """Sets one level and returns its SweepPoint."""
+        scan = self.scan
+        rate = scan.rate
+        window = self.criterion.window_samples(rate)
+        capacity = max(int(math.ceil(self.max_dwell * rate)), window)
+        values = np.empty(capacity)
+        count = 0
+
+        self.set_level(level)
+        set_time = time.monotonic()
+        # Index of the first scan sampled after the dead time
+        start = int(math.ceil((set_time + self.dead_time - scan.start_time) * rate))
+        first = end = start
+        expected = None
+        settled, mean, std, slope = False, float('nan'), float('nan'), float('nan')
+        while end - start < capacity:
+            chunk = scan.read(timeout=self.max_dwell + self.dead_time)
+            if chunk is None:
+                if scan.error is not None:
+                    raise scan.error
+                raise RuntimeError('The scan stopped during the sweep')
+            chunk_first = chunk.first_scan
+            if expected is not None and chunk_first != expected:
+                # Samples were lost (an overrun or a dropped chunk): a window
+                # must not join the samples on both sides of the gap
+                count = 0
+            expected = chunk_first + len(chunk.data)
+            skip = max(first - chunk_first, 0)
+            data = chunk.data[skip:, self.channel]
+            if not len(data):
+                continue
+            first = expected
+            taken = min(len(data), capacity - count, start + capacity - (chunk_first + skip))
+            if taken <= 0:
+                # The gap went past the maximum dwell time
+                end = start + capacity
+                break
+            values[count:count + taken] = data[:taken]
+            count += taken
+            end = chunk_first + skip + taken
+            if count >= window:
+                settled, mean, std, slope = self.criterion.evaluate(
+                    values[count - window:count], rate)
+                if settled:
+                    break
+        dwell = self.dead_time + (end - start) / float(rate)
+        return SweepPoint(float(level), mean, std, slope, dwell, settled)
@@ -0,0 +1,464 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Synchronized continuous scans on several boards.
+
+:class:`SyncScan` runs continuous analog input and output scans on several boards at one rate, and
+services all of them from a single scheduler thread. The data of every scan is cut into chunks of
+the same number of scans, and the chunks with the same index are published together as one
+:class:`SyncRecord`, so that the excitation written to an output and the response read from an
+input over the same stretch of samples end up in the same record::
+
+    devices = configure_devices()
+    synth = WaveformSynth(devices['USB-3101FS'], 10000, ULRange.BIP10VOLTS)
+    acquisition = SyncScan(10000)
+    acquisition.add_output('excitation', devices['USB-3101FS'], 0, 0, ULRange.BIP10VOLTS,
+                           lambda out, first_sample: synth.generate(
+                               out.size, 'sine', 100, 1.0, out=out.reshape(-1)))
+    acquisition.add_input('response', devices['USB-202'], 0, 0, ULRange.BIP10VOLTS)
+    with acquisition:
+        for record in acquisition:
+            process(record.data['excitation'], record.data['response'])
+
+The scans are started back to back once every buffer is allocated and every output buffer is
+filled, and the time each start call took is recorded, so that the start skew between the boards
+can be checked (:attr:`SyncScan.start_skew`). Every board must accept the requested rate exactly:
+:meth:`SyncScan.start` fails if the actual rates of the scans differ. The boards run from their
+own clocks; for sample-exact alignment, share a clock or trigger between them and pass the
+matching EXTCLOCK or EXTTRIGGER scan options.
+
+This module requires NumPy.
+"""
+import collections
+import threading
+import time
+
+import numpy as np
+
+from mcculw import ul
+from mcculw.continuous_scan import ScanCursor, alloc_buffer, plan_buffer
+from mcculw.enums import ScanOptions, FunctionType, Status
+
+SyncRecord = collections.namedtuple("SyncRecord", "index first_sample timestamp data")
+SyncRecord.__doc__ = """The chunks of all the scans of a :class:`SyncScan` over the same samples.
+
+index : int
+    Index of the record, counted from the start of the scans.
+first_sample : int
+    Index of the first scan (sample per channel) of the record.
+timestamp : float
+    The time.monotonic() value at which the first scan of the record was sampled, on the shared
+    time base: the start of the first scan plus first_sample divided by the rate.
+data : dict
+    Maps the name of each scan to its samples, with shape (chunk_size, channels). For outputs,
+    these are the values that were written to the UL buffer. The arrays are views of ring blocks;
+    they remain valid until the next call to :meth:`SyncScan.read`.
+"""
+
+
+class _Scan(object):
+    # One of the scans of a SyncScan
+
+    def __init__(self, name, board_num, low_chan, high_chan, ul_range, options, source):
+        self.name = name
+        self.board_num = board_num
+        self.low_chan = low_chan
+        self.high_chan = high_chan
+        self.num_chans = high_chan - low_chan + 1
+        self.ul_range = ul_range
+        self.options = options | ScanOptions.BACKGROUND | ScanOptions.CONTINUOUS
+        self.source = source
+        self.is_output = source is not None
+        self.function_type = FunctionType.AOFUNCTION if self.is_output else FunctionType.AIFUNCTION
+        self.rate = None
+        self.start_window = None
+        self.memhandle = None
+        self.data = None
+        self.cursor = None
+        self.ring = None
+        self.late_chunks = 0
+
+    @property
+    def dtype(self):
+        if self.options & ScanOptions.SCALEDATA:
+            return np.dtype(np.float64)
+        from mcculw.device_info import AiInfo, AoInfo
+        info = AoInfo(self.board_num) if self.is_output else AiInfo(self.board_num)
+        return np.dtype(np.uint16 if info.resolution <= 16 else np.uint32)
+
+    def start(self, rate, buffer_count):
+        if self.is_output:
+            return ul.a_out_scan(self.board_num, self.low_chan, self.high_chan, buffer_count,
+                                 rate, self.ul_range, self.memhandle, self.options)
+        return ul.a_in_scan(self.board_num, self.low_chan, self.high_chan, buffer_count, rate,
+                            self.ul_range, self.memhandle, self.options)
+
+
+class SyncScan(object):
+    """Runs continuous scans on several boards at one rate, and publishes their data in aligned
+    records.
+
+    Parameters
+    ----------
+    rate : int
+        The requested per-channel sample rate of every scan.
+    chunk_size : int, optional
+        Number of scans (samples per channel) per record. Defaults to about 50 ms of data.
+    buffer_chunks : int, optional
+        Size of each UL buffer, in chunks. Defaults to one second of data, and at least eight
+        chunks. Outputs are written this far ahead of the samples being output.
+    num_records : int, optional
+        Number of records the ring can hold for the consumer. Defaults to 16.
+
+    Attributes
+    ----------
+    rate : float
+        The per-channel sample rate of every scan: the requested rate until :meth:`start`, then
+        the actual rate of the scans.
+    start_time : float
+        time.monotonic() at the start of the first scan, the origin of the shared time base.
+    start_offsets : dict
+        Maps the name of each scan to the time its scan started, relative to start_time, in
+        seconds. Each start time is the middle of the start call; see :attr:`start_uncertainty`.
+    start_skew : float
+        The largest difference between the start times of two scans, in seconds.
+    start_uncertainty : float
+        The duration of the longest start call, an upper bound on the error of each start time.
+    overruns : int
+        Number of times an input scan overwrote data before it was drained. The records it
+        overwrote are skipped on every input.
+    lost_records : int
+        Number of records skipped because of overruns.
+    late_chunks : int
+        Number of output chunks the scheduler failed to refill before they were output; the
+        records over those chunks do not hold what was output.
+    dropped_records : int
+        Number of records dropped because the consumer fell more than num_records records
+        behind.
+    error : Exception
+        The exception that stopped the scheduler thread, if any. It is raised by :meth:`read`.
+    """
+    def __init__(self, rate, chunk_size=None, buffer_chunks=None, num_records=16):
+        self.rate = rate
+        chunk_size = chunk_size or max(rate // 20, 1)
+        self.chunk_size, buffer_count = plan_buffer(
+            rate, 1, chunk_size, None if buffer_chunks is None else buffer_chunks * chunk_size)
+        self.buffer_chunks = buffer_count // self.chunk_size
+        self.num_records = num_records
+        self.scans = collections.OrderedDict()
+
+        self.start_time = None
+        self.start_offsets = {}
+        self.start_skew = None
+        self.start_uncertainty = None
+        self.overruns = 0
+        self.lost_records = 0
+        self.late_chunks = 0
+        self.dropped_records = 0
+        self.error = None
+
+        self._ring_index = np.zeros(num_records, np.int64)
+        # Single producer/single consumer ring, as in ContinuousScan
+        self._write_seq = 0
+        self._read_seq = 0
+        self._holding = False
+        self._next_record = 0
+        self._data_ready = threading.Event()
+        self._stop_requested = threading.Event()
+        self._thread = None
+
+    # Configuration
+
+    def add_input(self, name, board_num, low_chan, high_chan, ul_range,
+                  options=ScanOptions.SCALEDATA):
+        """Adds an analog input scan. With SCALEDATA (the default) its data is in volts, otherwise
+        in counts. BACKGROUND and CONTINUOUS are always added to options."""
+        self._add(_Scan(name, board_num, low_chan, high_chan, ul_range, options, None))
+
+    def add_output(self, name, board_num, low_chan, high_chan, ul_range, source, options=0):
+        """Adds an analog output scan.
+
+        Parameters
+        ----------
+        source : callable
+            Called as ``source(out, first_sample)`` from the scheduler thread (and from
+            :meth:`start`) to fill each chunk before it is output. out is a (chunk_size, channels)
+            array of counts, or of volts with the SCALEDATA option; first_sample is the index of
+            the scan its first row will be output as. It must return quickly: the buffer is
+            refilled one chunk at a time as it is output.
+        options : ScanOptions, optional
+            Additional scan options. BACKGROUND and CONTINUOUS are always added.
+        """
+        self._add(_Scan(name, board_num, low_chan, high_chan, ul_range, options, source))
+
+    def _add(self, scan):
+        if self._thread is not None:
+            raise RuntimeError('Scans cannot be added once started')
+        if scan.name in self.scans:
+            raise ValueError('Duplicate scan name: {}'.format(scan.name))
+        self.scans[scan.name] = scan
+
+    @property
+    def inputs(self):
+        return [scan for scan in self.scans.values() if not scan.is_output]
+
+    @property
+    def outputs(self):
+        return [scan for scan in self.scans.values() if scan.is_output]
+
+    # Control
+
+    def start(self):
+        """Allocates and fills the UL buffers, starts every scan, then starts the scheduler
+        thread.
+
+        Raises
+        ------
+        ValueError
+            If the boards did not all start at the same actual rate. The scans are stopped
+            first.
+        """
+        if not self.inputs:
+            raise ValueError('A SyncScan needs at least one input')
+        try:
+            for scan in self.scans.values():
+                self._prepare(scan)
+            # Nothing but the start calls between the first and last start
+            for scan in self.scans.values():
+                before = time.monotonic()
+                scan.rate = scan.start(self.rate, scan.cursor.buffer_count)
+                scan.start_window = (before, time.monotonic())
+        except BaseException:
+            self._release()
+            raise
+
+        rates = collections.OrderedDict((name, scan.rate) for name, scan in self.scans.items())
+        if len(set(rates.values())) > 1:
+            self._release()
+            raise ValueError('The scans run at different rates, so their records would drift '
+                             'apart: {}'.format(', '.join(
+                                 '{} at {}'.format(name, rate) for name, rate in rates.items())))
+
+        starts = {name: sum(scan.start_window) / 2 for name, scan in self.scans.items()}
+        self.start_time = min(starts.values())
+        self.start_offsets = {name: start - self.start_time for name, start in starts.items()}
+        self.start_skew = max(self.start_offsets.values())
+        self.start_uncertainty = max(scan.start_window[1] - scan.start_window[0]
+                                     for scan in self.scans.values())
+        self.rate = next(iter(rates.values()))
+        # An output that started before the inputs is ahead of them by up to
+        # the start skew, so it needs that many more chunks kept in its ring
+        margin = int(np.ceil((self.start_skew + self.start_uncertainty) * self.rate
+                             / self.chunk_size))
+        for scan in self.outputs:
+            self._grow_ring(scan, margin)
+
+        self._thread = threading.Thread(target=self._schedule, name='SyncScan scheduler')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def _prepare(self, scan):
+        chunk_count = self.chunk_size * scan.num_chans
+        buffer_count = self.buffer_chunks * chunk_count
+        dtype = scan.dtype
+        scan.cursor = ScanCursor(buffer_count, chunk_count, self.rate * scan.num_chans)
+        scan.memhandle = alloc_buffer(buffer_count, dtype)
+        scan.data = ul.buffer_as_ndarray(scan.memhandle, buffer_count, dtype).reshape(
+            self.buffer_chunks, self.chunk_size, scan.num_chans)
+        if scan.is_output:
+            # Chunks are written buffer_chunks records ahead of the inputs,
+            # so their copies are kept until the consumer reads them, with a
+            # couple of chunks of margin for the polling; start() adds the
+            # start skew once it is measured
+            scan.ring = np.zeros((self._output_ring_size(0), self.chunk_size, scan.num_chans),
+                                 dtype)
+            for index in range(self.buffer_chunks):
+                self._fill(scan, index)
+        else:
+            scan.ring = np.empty((self.num_records, self.chunk_size, scan.num_chans), dtype)
+
+    def _output_ring_size(self, skew_chunks):
+        return self.buffer_chunks + self.num_records + 2 + skew_chunks
+
+    def _grow_ring(self, scan, skew_chunks):
+        size = self._output_ring_size(skew_chunks)
+        if size > len(scan.ring):
+            # Only the first buffer_chunks chunks are filled yet, each in the
+            # slot of its own index in both rings
+            ring = np.zeros((size,) + scan.ring.shape[1:], scan.ring.dtype)
+            ring[:self.buffer_chunks] = scan.ring[:self.buffer_chunks]
+            scan.ring = ring
+
+    def _fill(self, scan, index):
+        block = scan.data[index % self.buffer_chunks]
+        scan.source(block, index * self.chunk_size)
+        scan.ring[index % len(scan.ring)] = block
+
+    def stop(self):
+        """Stops the scheduler thread and every scan, and frees the UL buffers. Records already
+        in the ring can still be read."""
+        self._stop_requested.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._release()
+        self._data_ready.set()
+
+    def _release(self):
+        for scan in self.scans.values():
+            if scan.memhandle:
+                try:
+                    if scan.rate is not None:
+                        ul.stop_background(scan.board_num, scan.function_type)
+                finally:
+                    scan.data = None
+                    ul.win_buf_free(scan.memhandle)
+                    scan.memhandle = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    # Consumer side
+
+    @property
+    def pending_records(self):
+        """Number of published records not yet read."""
+        return self._write_seq - self._read_seq - (1 if self._holding else 0)
+
+    def read(self, timeout=None):
+        """Returns the next :class:`SyncRecord`, waiting up to timeout seconds (forever if None)
+        for one to be published. Returns None on timeout, or once the scans have stopped and
+        every record has been read.
+
+        The data of the returned record stays valid until the next call to read.
+        """
+        if self._holding:
+            self._read_seq += 1
+            self._holding = False
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._read_seq >= self._write_seq:
+            if self.error is not None:
+                raise self.error
+            if not self.running:
+                return None
+            self._data_ready.clear()
+            if self._read_seq < self._write_seq:
+                break
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            self._data_ready.wait(remaining)
+
+        slot = self._read_seq % self.num_records
+        self._holding = True
+        index = int(self._ring_index[slot])
+        data = {}
+        for name, scan in self.scans.items():
+            data[name] = scan.ring[(index if scan.is_output else slot) % len(scan.ring)]
+        first_sample = index * self.chunk_size
+        return SyncRecord(index, first_sample, self.start_time + first_sample / float(self.rate),
+                          data)
+
+    def __iter__(self):
+        while True:
+            record = self.read()
+            if record is None:
+                return
+            yield record
+
+    # Scheduler thread
+
+    def _schedule(self):
+        try:
+            self._schedule_loop()
+        except Exception as e:
+            self.error = e
+        finally:
+            self._data_ready.set()
+
+    def _update(self, scan):
+        status, cur_count, _ = ul.get_status(scan.board_num, scan.function_type)
+        return status, scan.cursor.update(cur_count)
+
+    def _schedule_loop(self):
+        inputs = self.inputs
+        outputs = self.outputs
+        cursors = [scan.cursor for scan in self.scans.values()]
+        while not self._stop_requested.is_set():
+            idle = False
+            for scan in outputs:
+                self._refill(scan)
+            for scan in inputs:
+                status, intact = self._update(scan)
+                idle = idle or status == Status.IDLE
+                if not intact:
+                    self.overruns += 1
+            self._align(inputs)
+
+            ready = min(scan.cursor.ready for scan in inputs)
+            for _ in range(ready):
+                if not self._publish(inputs):
+                    break
+
+            if idle:
+                break
+            for scan in inputs:
+                scan.cursor.adapt(ready)
+            self._stop_requested.wait(min(cursor.poll_interval for cursor in cursors))
+
+    def _refill(self, scan):
+        cursor = scan.cursor
+        _, intact = self._update(scan)
+        if not intact:
+            # The scan output chunks before they were refilled
+            late = cursor.lost_samples // cursor.chunk_count - scan.late_chunks
+            scan.late_chunks += late
+            self.late_chunks += late
+        for _ in range(cursor.ready):
+            self._fill(scan, (cursor.drained + cursor.buffer_count) // cursor.chunk_count)
+            cursor.advance()
+
+    def _align(self, inputs):
+        # An overrun moves one input ahead; skip the same records on the
+        # others so that every input drains the same record next
+        record = max(scan.cursor.drained // scan.cursor.chunk_count for scan in inputs)
+        if record == self._next_record:
+            return
+        self.lost_records += record - self._next_record
+        self._next_record = record
+        for scan in inputs:
+            scan.cursor.drained = record * scan.cursor.chunk_count
+
+    def _publish(self, inputs):
+        # Returns False if an input overran the record while it was copied
+        index = self._next_record
+        if self._write_seq - self._read_seq >= self.num_records:
+            # The consumer is a full ring behind: drop this record rather
+            # than wait for it or overwrite unread records
+            self.dropped_records += 1
+        else:
+            slot = self._write_seq % self.num_records
+            for scan in inputs:
+                scan.ring[slot] = scan.data[scan.cursor.index // scan.cursor.chunk_count]
+            # Make sure no block was overwritten while it was being copied
+            # before the consumer can see the record
+            for scan in inputs:
+                if not self._update(scan)[1]:
+                    self.overruns += 1
+                    return False
+            self._ring_index[slot] = index
+            self._write_seq += 1
+            self._data_ready.set()
+        for scan in inputs:
+            scan.cursor.advance()
+        self._next_record += 1
+        return True
@@ -0,0 +1,222 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Repeated temperature readings without per-call allocations.
+
+:class:`TemperatureReader` binds a set of temperature channels once, either a range of channels
+read with :func:`.t_in_scan` or the TC channels of a :func:`.daq_in_scan` converted with
+:func:`.get_tc_values`, and reuses the same ctypes buffers on every read. Each read returns NumPy
+views of those buffers, with a per-channel flag array in place of the single error code of the
+library, and can be kept in a ring of recent readings for trending::
+
+    reader = TemperatureReader(board_num, 0, 31, TempScale.CELSIUS, history=36000)
+    while True:
+        reading = reader.read()
+        if reading.flags.any():
+            report(numpy.flatnonzero(reading.flags))
+        time.sleep(0.1)
+    trend = reader.history(600)
+
+This module requires NumPy.
+"""
+import collections
+import time
+from ctypes import c_float, c_short
+
+import numpy as np
+
+from mcculw import ul
+from mcculw.demux import latest
+from mcculw.enums import ChannelType, ErrorCode
+
+# The value the library stores for a channel it could not convert
+FAILED_VALUE = -9999.0
+
+TemperatureReading = collections.namedtuple("TemperatureReading", "values flags timestamp")
+TemperatureReading.__doc__ = """The result of :meth:`TemperatureReader.read`. The arrays are
+views of buffers reused by the next read; copy them to keep them.
+
+values : numpy.ndarray
+    The temperatures, float32, one per channel (or of shape (count, channels) for
+    :meth:`TemperatureReader.for_daq_in_scan`). Failed channels are NaN.
+flags : numpy.ndarray
+    The error code of each temperature: ErrorCode.NOERRORS (0), ErrorCode.OUTOFRANGE or
+    ErrorCode.OPENCONNECTION, as int16, with the shape of values. See
+    :meth:`TemperatureReader.read` for how the code of each failed channel is found.
+timestamp : float
+    time.monotonic() when the read completed.
+"""
+
+TemperatureHistory = collections.namedtuple("TemperatureHistory", "timestamps values flags")
+TemperatureHistory.__doc__ = """Recent readings, as returned by :meth:`TemperatureReader.history`,
+oldest first.
+
+timestamps : numpy.ndarray
+    The timestamp of each reading, of shape (readings,).
+values : numpy.ndarray
+    The temperatures, of shape (readings, channels).
+flags : numpy.ndarray
+    The error codes, of shape (readings, channels).
+"""
+
+
+class TemperatureReader(object):
+    """Reads a fixed set of temperature channels repeatedly with :func:`.t_in_scan`, reusing its
+    buffers.
+
+    Parameters
+    ----------
+    board_num : int
+        The number associated with the board when it was installed with InstaCal or created
+        with :func:`.create_daq_device`.
+    low_chan : int
+        Low channel of the scan.
+    high_chan : int
+        High channel of the scan.
+    scale : TempScale
+        The temperature scale of the readings.
+    options : TInOptions, optional
+        The options passed to :func:`.t_in_scan`.
+    history : int, optional
+        Number of recent readings kept for :meth:`history`. 0 (the default) keeps none.
+
+    Attributes
+    ----------
+    reads : int
+        Number of reads done.
+    failures : numpy.ndarray
+        Number of failed readings of each channel.
+    """
+    def __init__(self, board_num, low_chan, high_chan, scale, options=0, history=0):
+        if low_chan > high_chan:
+            raise ValueError('low_chan must not exceed high_chan')
+        self.board_num = board_num
+        self.low_chan = low_chan
+        self.high_chan = high_chan
+        self.scale = scale
+        self.options = options
+        self.memhandle = None
+        self._init_buffers((high_chan - low_chan + 1,), history)
+
+    @classmethod
+    def for_daq_in_scan(cls, board_num, chan_list, chan_type_list, memhandle, scale, count=1,
+                        history=0):
+        """Returns a reader that converts the TC channels of a :func:`.daq_in_scan` buffer with
+        :func:`.get_tc_values`, reading count samples per channel from the point given to
+        :meth:`read`.
+
+        chan_list and chan_type_list must be those of the scan; they are converted to ctypes
+        arrays once. Each reading holds count rows, and the history keeps the last row of each
+        read.
+        """
+        reader = cls.__new__(cls)
+        reader.board_num = board_num
+        reader.scale = scale
+        reader.memhandle = memhandle
+        reader.count = count
+        reader._chan_list = (c_short * len(chan_list))(*chan_list)
+        reader._chan_type_list = (c_short * len(chan_type_list))(*chan_type_list)
+        num_tc_chans = sum((int(chan_type) & ~ChannelType.SETPOINT_ENABLE) == ChannelType.TC
+                           for chan_type in chan_type_list)
+        reader._init_buffers((count, num_tc_chans), history)
+        return reader
+
+    def _init_buffers(self, shape, history):
+        size = int(np.prod(shape))
+        self._c_values = (c_float * size)()
+        self._values = np.ctypeslib.as_array(self._c_values).reshape(shape)
+        self._flags = np.zeros(shape, np.int16)
+        self.num_chans = shape[-1]
+        self.reads = 0
+        self.failures = np.zeros(self.num_chans, np.int64)
+        self.history_size = history
+        if history:
+            self._history_times = np.zeros(history)
+            self._history_values = np.zeros(history * self.num_chans, np.float32)
+            self._history_flags = np.zeros(history * self.num_chans, np.int16)
+
+    def read(self, first_point=0):
+        """Reads the temperatures.
+
+        Parameters
+        ----------
+        first_point : int, optional
+            For a reader returned by :meth:`for_daq_in_scan`, the index of the first sample per
+            channel to convert. Ignored otherwise.
+
+        Returns
+        -------
+        TemperatureReading
+            The temperatures and their flags
+
+        Raises
+        ------
+        ULError
+            For the errors other than ErrorCode.OUTOFRANGE and ErrorCode.OPENCONNECTION, which
+            are reported per channel in flags.
+
+        Notes
+        -----
+        - The library returns a single error code per call and marks the failed channels with
+          the value -9999. A reader of a channel range reads each failed channel again with
+          :func:`.t_in` to find its own error code, so that OUTOFRANGE and OPENCONNECTION
+          channels of the same read are told apart; this costs one call per failed channel, and
+          only when a channel failed. :func:`.get_tc_values` has no per-channel equivalent, so a
+          reader returned by :meth:`for_daq_in_scan` flags every failed channel with the code of
+          the call.
+        """
+        if self.memhandle is not None:
+            err_code = ul.get_tc_values(
+                self.board_num, self._chan_list, self._chan_type_list, len(self._chan_list),
+                self.memhandle, first_point, self.count, self.scale, self._c_values).err_code
+        else:
+            err_code = ul.t_in_scan(self.board_num, self.low_chan, self.high_chan, self.scale,
+                                    self.options, self._c_values).err_code
+        timestamp = time.monotonic()
+
+        values, flags = self._values, self._flags
+        flags.fill(ErrorCode.NOERRORS)
+        if err_code:
+            failed = values <= FAILED_VALUE
+            flags[failed] = err_code
+            if self.memhandle is None:
+                for index in np.flatnonzero(failed):
+                    flags[index] = self._channel_error(self.low_chan + index, err_code)
+            values[failed] = np.nan
+            self.failures += failed.reshape(-1, self.num_chans).sum(axis=0)
+        if self.history_size:
+            self._record(timestamp, values.reshape(-1, self.num_chans)[-1],
+                         flags.reshape(-1, self.num_chans)[-1])
+        self.reads += 1
+        return TemperatureReading(values, flags, timestamp)
+
+    def _channel_error(self, channel, err_code):
+        # The error code of one channel, or err_code if it reads fine again
+        try:
+            ul.t_in(self.board_num, channel, self.scale, self.options)
+        except ul.ULError as e:
+            if e.errorcode not in (ErrorCode.OUTOFRANGE, ErrorCode.OPENCONNECTION):
+                raise
+            return e.errorcode
+        return err_code
+
+    def _record(self, timestamp, values, flags):
+        slot = self.reads % self.history_size
+        chans = self.num_chans
+        self._history_times[slot] = timestamp
+        self._history_values[slot * chans:(slot + 1) * chans] = values
+        self._history_flags[slot * chans:(slot + 1) * chans] = flags
+
+    def history(self, readings=None):
+        """Returns the last readings kept, by default all of them, oldest first, as a
+        :class:`TemperatureHistory` of copies."""
+        available = min(self.reads, self.history_size)
+        readings = available if readings is None else min(readings, available)
+        chans = self.num_chans
+        if not readings:
+            return TemperatureHistory(np.empty(0), np.empty((0, chans), np.float32),
+                                      np.empty((0, chans), np.int16))
+        timestamps = latest(self._history_times, 1, self.reads, readings).reshape(-1)
+        values = latest(self._history_values, chans, self.reads * chans, readings)
+        flags = latest(self._history_flags, chans, self.reads * chans, readings)
+        return TemperatureHistory(timestamps.copy(), values.copy(), flags.copy())
@@ -5,14 +5,23 @@ Wraps all of the methods from UL for use in Python.
 """
 from __future__ import absolute_import, division, print_function
 import collections
+import os
 import struct
+import threading
+import weakref
 from ctypes import *  # @UnusedWildImport
 from ctypes.wintypes import HGLOBAL
-from ctypes.util import find_library
 from builtins import *  # @UnusedWildImport
 
+try:
+    from ctypes import WinDLL, WINFUNCTYPE
+except ImportError:
+    # Not running on Windows, so only the simulated backend is available
+    WinDLL = None
+    WINFUNCTYPE = CFUNCTYPE
+
 from mcculw.enums import (ErrorCode, Status, ChannelType, TimerIdleState,
-                          PulseOutOptions, TInOptions)
+                          PulseOutOptions, TInOptions, InfoType, BoardInfo, ScanOptions)
 from mcculw.structs import DaqDeviceDescriptor
 
 
@@ -21,6 +30,8 @@ class ULError(Exception):
         super(ULError, self).__init__()
         self.errorcode = errorcode
         self.message = get_err_msg(errorcode)
+        if _error_hook is not None:
+            _error_hook(errorcode)
 
     def __str__(self):
         return "Error " + str(self.errorcode) + ": " + self.message
@@ -32,10 +43,142 @@ _BOARDNAMELEN = 64
 # Load the correct library based on the Python architecture in use
 is_32bit = struct.calcsize("P") == 4
 dll_file_name = 'cbw32.dll' if is_32bit else 'cbw64.dll'
-dll_absolute_path = find_library(dll_file_name)
-if dll_absolute_path is None:
-    dll_absolute_path = dll_file_name
-_cbw = WinDLL(dll_absolute_path)
+dll_absolute_path = None
+
+
+def _load_backend():
+    # The MCCULW_BACKEND environment variable selects between the UL DLL
+    # ('dll') and the in-process simulator ('sim'). The DLL is the default
+    # wherever it can be loaded. Called once, on first use of the library.
+    global dll_absolute_path
+    backend = os.environ.get('MCCULW_BACKEND', 'dll' if WinDLL else 'sim')
+    if backend.lower() == 'sim':
+        from mcculw.simulator import SimulatedLibrary
+        return SimulatedLibrary.from_environment()
+
+    from ctypes.util import find_library
+    dll_absolute_path = find_library(dll_file_name)
+    if dll_absolute_path is None:
+        dll_absolute_path = dll_file_name
+    return WinDLL(dll_absolute_path)
+
+
+class _LazyLibrary(object):
+    # Stands in for the backend until its entry points are used. The
+    # prototypes declared below (_cbw.cbXxx.argtypes = [...]) are recorded on
+    # placeholder objects; the backend is loaded, and each function is
+    # resolved and bound to its prototype, on the first call. The resolved
+    # function then replaces the placeholder, so later calls go straight to
+    # the backend, unless a wrapper installed by set_call_hooks stands in
+    # front of it.
+    def __init__(self, loader):
+        self._loader = loader
+        self._backend = None
+        self._load_lock = threading.Lock()
+        # name -> (resolved function, whether it returns an error code)
+        self._functions = {}
+        self._wrapper = None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        prototype = _Prototype(self, name)
+        self.__dict__[name] = prototype
+        return prototype
+
+    def _load(self):
+        # The lock makes concurrent first calls load the backend only once;
+        # once it is loaded, it is returned without taking the lock.
+        if self._backend is None:
+            with self._load_lock:
+                if self._backend is None:
+                    self._backend = self._loader()
+        return self._backend
+
+    def _resolve(self, name):
+        prototype = self.__dict__.get(name)
+        if not isinstance(prototype, _Prototype):
+            return prototype
+        function = getattr(self._load(), name)
+        if prototype.argtypes is not None:
+            function.argtypes = prototype.argtypes
+        if prototype.restype is not _Prototype.UNSET:
+            function.restype = prototype.restype
+        returns_errcode = prototype.restype is _Prototype.UNSET
+        self._functions[name] = (function, returns_errcode)
+        if self._wrapper is not None:
+            function = self._wrapper(name, function, returns_errcode)
+        self.__dict__[name] = function
+        return function
+
+    def _set_wrapper(self, wrapper):
+        self._wrapper = wrapper
+        for name, (function, returns_errcode) in list(self._functions.items()):
+            if wrapper is not None:
+                function = wrapper(name, function, returns_errcode)
+            self.__dict__[name] = function
+
+
+class _Prototype(object):
+    UNSET = object()
+
+    def __init__(self, library, name):
+        self._library = library
+        self._name = name
+        self.argtypes = None
+        self.restype = _Prototype.UNSET
+
+    def __call__(self, *args):
+        return self._library._resolve(self._name)(*args)
+
+
+_cbw = _LazyLibrary(_load_backend)
+_error_hook = None
+
+
+def get_backend():
+    """Returns the object that implements the Universal Library entry points for this module:
+    either the loaded cbw32.dll/cbw64.dll, or a :class:`~mcculw.simulator.SimulatedLibrary` when
+    the simulated backend is in use.
+
+    The backend is chosen when it is first used. Set the ``MCCULW_BACKEND``
+    environment variable to ``sim`` to use the simulator, or to ``dll`` to use the Universal
+    Library. If the variable is not set, the Universal Library is used on Windows and the
+    simulator on all other platforms.
+
+    Returns
+    -------
+    WinDLL or SimulatedLibrary
+        The active backend
+
+    Notes
+    -----
+    - The backend is loaded on the first call to a function of this module (or to this
+      function), rather than when the module is imported.
+    """
+    return _cbw._load()
+
+
+def set_call_hooks(wrapper=None, error_hook=None):
+    """Installs hooks that observe the Universal Library calls made by this module, such as the
+    ones of :mod:`mcculw.instrumentation`. Calling this function without arguments removes them.
+
+    Without hooks, calls go straight to the backend and cost nothing extra.
+
+    Parameters
+    ----------
+    wrapper : callable, optional
+        Called as ``wrapper(name, function, returns_errcode)`` for each UL entry point, now and
+        when it is first used later, where function calls the backend and returns_errcode is
+        False for the few entry points (such as cbWinBufAlloc) that do not return an error
+        code. The callable it returns is called instead of function.
+    error_hook : callable, optional
+        Called with the error code of every :class:`ULError` created.
+    """
+    global _error_hook
+    _error_hook = error_hook
+    _cbw._set_wrapper(wrapper)
+
 
 _cbw.cbAChanInputMode.argtypes = [c_int, c_int, c_int]
 
@@ -81,9 +224,10 @@ def a_in(board_num, channel, ul_range):
     int
         The A/D value
     """
-    data_value = c_ushort()
-    _check_err(_cbw.cbAIn(
-        board_num, channel, ul_range, byref(data_value)))
+    data_value, pointer_ = _scratch_value(c_ushort)
+    errcode = _cbw.cbAIn(board_num, channel, ul_range, pointer_)
+    if errcode:
+        raise ULError(errcode)
     return data_value.value
 
 
@@ -121,6 +265,59 @@ def a_in_32(board_num, channel, ul_range, options=0):
     return data_value.value
 
 
+def a_in_many(board_num, channels, ul_ranges, out=None, scan=None, rate=10000):
+    """Reads several A/D input channels, and returns their 16-bit A/D values. This is the batch
+    equivalent of :func:`.a_in`, for polling loops that read the same channels on every cycle.
+    This function requires NumPy.
+
+    When the board allows it, the channels are sampled by one short foreground
+    :func:`.a_in_scan` of one sample per channel, loading the channel/gain queue with
+    :func:`.a_load_queue` if the channels are not consecutive or the ranges differ; the queue is
+    disabled again afterwards. Otherwise each channel is read in turn as :func:`.a_in` does, with
+    one ctypes value reused for all of them. This is always the case while a queue loaded with
+    :func:`.a_load_queue` is active, which a scan would follow and then disable.
+
+    Parameters
+    ----------
+    board_num : int
+        The number associated with the board when it was installed with InstaCal or created with
+        :func:`.create_daq_device`.
+    channels : list of int
+        The A/D input channel numbers, in the order of the returned values.
+    ul_ranges : ULRange or list of ULRange
+        A/D range code for all of the channels, or one per channel.
+    out : numpy.ndarray, optional
+        An array of numpy.uint16 with one element per channel to store the values in, so that a
+        polling loop does not allocate one per cycle. By default a new array is returned.
+    scan : bool, optional
+        True to always read with a scan, raising its errors, and False to always read channel by
+        channel. By default a scan is tried first; if the board does not support it (for example
+        with ErrorCode.NOQUEUE or BADBOARDTYPE), the board is read channel by channel on this and
+        later calls. Other errors of the scan are raised.
+    rate : int, optional
+        The per-channel sample rate of the scan, in samples per second. The scan takes about one
+        sample period.
+
+    Returns
+    -------
+    numpy.ndarray
+        The A/D values, as numpy.uint16
+    """
+    import numpy as np
+
+    channels, ul_ranges, out = _batch_arguments(channels, ul_ranges, out, np.uint16)
+    if _scan_many(board_num, channels, ul_ranges, out, scan, rate, False):
+        return out
+    data_value, pointer_ = _scratch_value(c_ushort)
+    read = _cbw._resolve('cbAIn')
+    for index, (channel, ul_range) in enumerate(zip(channels, ul_ranges)):
+        errcode = read(board_num, channel, ul_range, pointer_)
+        if errcode:
+            raise ULError(errcode)
+        out[index] = data_value.value
+    return out
+
+
 _cbw.cbAInScan.argtypes = [c_int, c_int, c_int, c_long, POINTER(c_long),
                            c_int, HGLOBAL, c_int]
 
@@ -447,6 +644,14 @@ def a_load_queue(board_num, chan_list, gain_list, count):
         the board's channel/gain queue. The maximum value is specific to the queue size of the
         A/D board's channel gain queue.
     """
+    _load_queue(board_num, chan_list, gain_list, count)
+    if count:
+        _user_queues.add(board_num)
+    else:
+        _user_queues.discard(board_num)
+
+
+def _load_queue(board_num, chan_list, gain_list, count):
     _check_err(_cbw.cbALoadQueue(
         board_num, _to_ctypes_array(chan_list, c_short),
         _to_ctypes_array(gain_list, c_short), count))
@@ -1413,8 +1618,10 @@ def c_in_32(board_num, counter_num):
     significant) bits will be truncated.
 
     """
-    count = c_ulong()
-    _check_err(_cbw.cbCIn32(board_num, counter_num, byref(count)))
+    count, pointer_ = _scratch_value(c_ulong)
+    errcode = _cbw.cbCIn32(board_num, counter_num, pointer_)
+    if errcode:
+        raise ULError(errcode)
     return count.value
 
 
@@ -1455,6 +1662,41 @@ def c_in_64(board_num, counter_num):
     return count.value
 
 
+def c_in_many(board_num, counter_nums, out=None):
+    """Reads the current count of several counter channels. This is the batch equivalent of
+    :func:`.c_in_32`, for polling loops that read the same counters on every cycle: the counters
+    are read in turn with one ctypes value reused for all of them. This function requires NumPy.
+
+    Parameters
+    ----------
+    board_num : int
+        The number associated with the board when it was installed with InstaCal or created
+        with :func:`.create_daq_device`.
+    counter_nums : list of int
+        The counters to read, in the order of the returned values.
+    out : numpy.ndarray, optional
+        An array of numpy.uint32 with one element per counter to store the counts in. By default
+        a new array is returned.
+
+    Returns
+    -------
+    numpy.ndarray
+        The counter values, as numpy.uint32
+    """
+    import numpy as np
+
+    if out is None:
+        out = np.empty(len(counter_nums), np.uint32)
+    count, pointer_ = _scratch_value(c_ulong)
+    read = _cbw._resolve('cbCIn32')
+    for index, counter_num in enumerate(counter_nums):
+        errcode = read(board_num, counter_num, pointer_)
+        if errcode:
+            raise ULError(errcode)
+        out[index] = count.value
+    return out
+
+
 _cbw.cbCInScan.argtypes = [c_int, c_int, c_int, c_long, POINTER(c_long),
                            HGLOBAL, c_ulong]
 
@@ -1858,6 +2100,10 @@ def daq_in_scan(board_num, chan_list, chan_type_list, gain_list, chan_count,
         analog input channel, the range code for this channel is ignored.
     chan_count : int
         Number of elements in each of the three lists - chan_list, chan_type_list, and gain_list.
+
+        The three lists can also be given as ctypes arrays of c_short, or as writable
+        C-contiguous numpy.int16 arrays, which are passed to the library without conversion.
+        Converting them once saves time when the same scan is started repeatedly.
     rate : int
         The sample rate at which samples are acquired, in samples per second per channel.
 
@@ -2047,6 +2293,10 @@ def daq_out_scan(board_num, chan_list, chan_type_list, gain_list, chan_count,
         analog input channel, the range code for this channel is ignored.
     chan_count : int
         Number of elements in each of the three lists - chan_list, chan_type_list, and gain_list.
+
+        The three lists can also be given as ctypes arrays of c_short, or as writable
+        C-contiguous numpy.int16 arrays, which are passed to the library without conversion.
+        Converting them once saves time when the same scan is started repeatedly.
     rate : int
         Sample rate in scans per second. The actual sampling rate in some cases will vary a small
         amount from the requested rate. The actual rate is returned.
@@ -2701,8 +2951,10 @@ def d_in(board_num, port_type):
 
     - Refer to the board-specific information for valid PortType values.
     """
-    data_value = c_ushort()
-    _check_err(_cbw.cbDIn(board_num, port_type, byref(data_value)))
+    data_value, pointer_ = _scratch_value(c_ushort)
+    errcode = _cbw.cbDIn(board_num, port_type, pointer_)
+    if errcode:
+        raise ULError(errcode)
     return data_value.value
 
 
@@ -2778,6 +3030,41 @@ def d_in_array(board_num, low_port, high_port, data_array=None):
     return data_array
 
 
+def d_in_many(board_num, port_types, out=None):
+    """Reads several digital input ports. This is the batch equivalent of :func:`.d_in`, for
+    polling loops that read the same ports on every cycle: the ports are read in turn with one
+    ctypes value reused for all of them. This function requires NumPy.
+
+    Parameters
+    ----------
+    board_num : int
+        The number associated with the board when it was installed with InstaCal or created
+        with :func:`.create_daq_device`.
+    port_types : list of DigitalPortType
+        The digital ports to read, in the order of the returned values.
+    out : numpy.ndarray, optional
+        An array of numpy.uint16 with one element per port to store the values in. By default a
+        new array is returned.
+
+    Returns
+    -------
+    numpy.ndarray
+        The digital input values, as numpy.uint16
+    """
+    import numpy as np
+
+    if out is None:
+        out = np.empty(len(port_types), np.uint16)
+    data_value, pointer_ = _scratch_value(c_ushort)
+    read = _cbw._resolve('cbDIn')
+    for index, port_type in enumerate(port_types):
+        errcode = read(board_num, port_type, pointer_)
+        if errcode:
+            raise ULError(errcode)
+        out[index] = data_value.value
+    return out
+
+
 _cbw.cbDInScan.argtypes = [c_int, c_int,
                            c_long, POINTER(c_long), HGLOBAL, c_int]
 
@@ -3380,6 +3667,55 @@ def from_eng_units(board_num, ul_range, eng_units_value):
     return data_value.value
 
 
+def from_eng_units_array(board_num, ul_range, eng_units_values, resolution=None):
+    """Converts an array of voltage (or current) values in engineering units to integer count
+    values in a single vectorized pass. This is the batch equivalent of :func:`.from_eng_units`,
+    and is typically used to fill an output buffer allocated with :func:`.win_buf_alloc` for use
+    with :func:`.a_out_scan`. This function requires NumPy.
+
+    Parameters
+    ----------
+    board_num : int
+        The number associated with the board when it was installed with InstaCal or created
+        with :func:`.create_daq_device`.
+    ul_range : ULRange
+        The voltage (or current) range to use for the conversion to counts. The range_min and
+        range_max bounds of the :class:`~mcculw.enums.ULRange` value are used for the conversion.
+    eng_units_values : array_like of float
+        The voltage (or current) values to convert to counts. Values outside of the range specified
+        by the ul_range parameter are clipped to the minimum or maximum count.
+    resolution : int, optional
+        The resolution of the converter in bits, such as the value of
+        :attr:`AoInfo.resolution <mcculw.device_info.AoInfo.resolution>`. If this parameter is
+        omitted (or None), the resolution is read from the board once per call, following the same
+        rules as :func:`.from_eng_units`.
+
+    Returns
+    -------
+    numpy.ndarray
+        The count values, as numpy.uint16 for resolutions of 16 bits or less and numpy.uint32
+        otherwise
+
+    Notes
+    -----
+    - The values are rounded to single precision before conversion, matching the c_float argument
+      of :func:`.from_eng_units`, so that both functions return the same counts.
+
+    - If the device referenced by board_num has both analog input and analog output, the resolution
+      of the D/A converter on the device is used.
+    """
+    import numpy as np
+
+    if resolution is None:
+        resolution = _conversion_resolution(board_num, BoardInfo.DACRES)
+    full_scale_eng, full_scale_counts = _conversion_scale(ul_range, resolution)
+
+    values = np.asarray(eng_units_values, dtype=np.float32).astype(np.float64)
+    counts = np.floor((values - ul_range.range_min) * (full_scale_counts / full_scale_eng) + 0.5)
+    np.clip(counts, 0, full_scale_counts, out=counts)
+    return counts.astype(np.uint16 if resolution <= 16 else np.uint32)
+
+
 _cbw.cbGetBoardName.argtypes = [c_int, c_char_p]
 
 
@@ -4041,6 +4377,8 @@ def get_err_msg(error_code):
 
 StatusResult = collections.namedtuple(
     "StatusResult", "status cur_count cur_index")
+# Status members by value, looked up faster than calling Status()
+_statuses = {int(status): status for status in Status}
 _cbw.cbGetIOStatus.argtypes = [c_int, POINTER(
     c_short), POINTER(c_long), POINTER(c_long), c_int]
 
@@ -4121,12 +4459,15 @@ def get_status(board_num, function_type):
         DAQOFUNCTION  Specifies a synchronous output scan started with :func:`.daq_out_scan`. 
         ============  =============================================================================
     """
-    status = c_short()
-    cur_count = c_long()
-    cur_index = c_long()
-    _check_err(_cbw.cbGetIOStatus(
-        board_num, byref(status), byref(cur_count), byref(cur_index), function_type))
-    return StatusResult(Status(status.value), cur_count.value, cur_index.value)
+    (status, cur_count, cur_index), pointers = _scratch_values(c_short, c_long, c_long)
+    errcode = _cbw.cbGetIOStatus(board_num, *pointers, function_type)
+    if errcode:
+        raise ULError(errcode)
+    status_value = status.value
+    status = _statuses.get(status_value)
+    if status is None:
+        status = Status(status_value)
+    return StatusResult(status, cur_count.value, cur_index.value)
 
 
 _cbw.cbGetNetDeviceDescriptor.argtypes = [
@@ -4201,10 +4542,11 @@ def get_tc_values(board_num, chan_list, chan_type_list, chan_count, memhandle, f
     scale : TempScale
         Specifies the temperature scale that the input will be converted to. Choices are
         TempScale.CELSIUS, TempScale.FAHRENHEIT and TempScale.KELVIN.
-    data_array : POINTER(c_float), optional
-        Pointer to the temperature data array. If this parameter is omitted (or None), the array
-        will be allocated by this function. Reusing the array by passing it in as the parameter may
-        be useful as an optimization to prevent excessive allocations, saving memory and CPU time.
+    data_array : POINTER(c_float) or numpy.ndarray, optional
+        Pointer to the temperature data array, or a writable C-contiguous numpy.float32 array to
+        store the temperatures in. If this parameter is omitted (or None), the array will be allocated by
+        this function. Reusing the array by passing it in as the parameter may be useful as an
+        optimization to prevent excessive allocations, saving memory and CPU time.
 
         This array must be large enough to hold count samples * the number of temperature channels.
 
@@ -4214,22 +4556,35 @@ def get_tc_values(board_num, chan_list, chan_type_list, chan_count, memhandle, f
         The error code, which will either be ErrorCode.OUTOFRANGE or ErrorCode.NOERRORS.
         ErrorCode.OUTOFRANGE will be returned if any of the converted data is out of range. This
         typically indicates an open TC connection. All other errors will raise a ULError as usual.
-    data_array : POINTER(c_float)
-        A pointer to the C array containing the converted temperature data
+    data_array : POINTER(c_float) or numpy.ndarray
+        A pointer to the C array containing the converted temperature data, or the array passed
+        as the data_array parameter
+
+    Notes
+    -----
+    - chan_list and chan_type_list can also be given as ctypes arrays of c_short, or as writable
+      C-contiguous numpy.int16 arrays, which are passed to the library without conversion.
+      Converting them once saves time when the same channels are converted repeatedly.
     """
 
-    if data_array == None:
+    if data_array is None:
         # Find the number of TC channels
         num_tc_chans = sum(
             chan_type == ChannelType.TC for chan_type in chan_type_list)
         # Create the buffer
         data_array = (c_float * int(num_tc_chans * count))()
 
+    data_pointer = data_array
+    if hasattr(data_array, 'dtype'):
+        data_pointer = _ndarray_as_ctypes(data_array, c_float)
+        if data_pointer is None:
+            raise ValueError('data_array must be a writable C-contiguous numpy.float32 array')
+
     err_code = _cbw.cbGetTCValues(
         board_num, _to_ctypes_array(chan_list, c_short),
         _to_ctypes_array(
             chan_type_list, c_short), chan_count, memhandle, first_point,
-        count, scale, data_array)
+        count, scale, data_pointer)
     if err_code != ErrorCode.OUTOFRANGE:
         _check_err(err_code)
     return TCValuesResult(err_code, data_array)
@@ -4349,6 +4704,7 @@ def release_daq_device(board_num):
         with :func:`.create_daq_device`.
     """
     _cbw.cbReleaseDaqDevice(board_num)
+    _user_queues.discard(board_num)
 
 
 _cbw.cbScaledWinArrayToBuf.argtypes = [
@@ -5324,10 +5680,11 @@ def t_in_scan(board_num, low_chan, high_chan, scale, options=0, data_array=None)
     options : TInOptions, optional
         Flags that control various options. Refer to the constants in the
         "options parameter values" section below.
-    data_array : POINTER(c_float)
-        Pointer to the temperature data array. If this parameter is omitted (or None), the array
-        will be allocated by this function. Reusing the array by passing it in as the parameter may
-        be useful as an optimization to prevent excessive allocations, saving memory and CPU time.
+    data_array : POINTER(c_float) or numpy.ndarray, optional
+        Pointer to the temperature data array, or a writable C-contiguous numpy.float32 array to
+        store the temperatures in. If this parameter is omitted (or None), the array will be
+        allocated by this function. Reusing the array by passing it in as the parameter may be
+        useful as an optimization to prevent excessive allocations, saving memory and CPU time.
 
     Returns
     -------
@@ -5336,8 +5693,9 @@ def t_in_scan(board_num, low_chan, high_chan, scale, options=0, data_array=None)
         ErrorCode.NOERRORS. ErrorCode.OUTOFRANGE will be returned if any of the converted data is
         out of range. This typically indicates an open TC connection. All other errors will raise
         a ULError as usual.
-    data_array : POINTER(c_float)
-        A pointer to the C array containing the converted temperature data
+    data_array : POINTER(c_float) or numpy.ndarray
+        A pointer to the C array containing the converted temperature data, or the array passed
+        as the data_array parameter
 
 
     .. table:: **options parameter values**
@@ -5374,10 +5732,17 @@ def t_in_scan(board_num, low_chan, high_chan, scale, options=0, data_array=None)
     if low_chan > high_chan:
         raise ULError(ErrorCode.BADADCHAN)
 
-    if data_array == None:
+    if data_array is None:
         data_array = (c_float * (high_chan - low_chan + 1))()
+
+    data_pointer = data_array
+    if hasattr(data_array, 'dtype'):
+        data_pointer = _ndarray_as_ctypes(data_array, c_float)
+        if data_pointer is None:
+            raise ValueError('data_array must be a writable C-contiguous numpy.float32 array')
+
     err_code = _cbw.cbTInScan(
-        board_num, low_chan, high_chan, scale, data_array, options)
+        board_num, low_chan, high_chan, scale, data_pointer, options)
     if err_code != ErrorCode.OUTOFRANGE and err_code != ErrorCode.OPENCONNECTION:
         _check_err(err_code)
     return TInScanResults(err_code, data_array)
@@ -5474,6 +5839,51 @@ def to_eng_units_32(board_num, ul_range, data_value):
     return eng_units.value
 
 
+def to_eng_units_array(board_num, ul_range, data_values, resolution=None):
+    """Converts an array of integer count values to equivalent voltage (or current) values in a
+    single vectorized pass. This is the batch equivalent of :func:`.to_eng_units` and
+    :func:`.to_eng_units_32`, and is typically used on data copied out of a buffer filled by
+    :func:`.a_in_scan`. This function requires NumPy.
+
+    Parameters
+    ----------
+    board_num : int
+        The number associated with the board when it was installed with InstaCal or created
+        with :func:`.create_daq_device`.
+    ul_range : ULRange
+        Voltage (or current) range to use for the conversion to engineering units. The range_min
+        and range_max bounds of the :class:`~mcculw.enums.ULRange` value are used for the
+        conversion.
+    data_values : array_like of int
+        The count values (typically, ones returned from an A/D board).
+    resolution : int, optional
+        The resolution of the converter in bits, such as the value of
+        :attr:`AiInfo.resolution <mcculw.device_info.AiInfo.resolution>`. If this parameter is
+        omitted (or None), the resolution is read from the board once per call, following the same
+        rules as :func:`.to_eng_units`.
+
+    Returns
+    -------
+    numpy.ndarray
+        The engineering units values, as numpy.float32 for resolutions of 16 bits or less (matching
+        :func:`.to_eng_units`) and numpy.float64 otherwise (matching :func:`.to_eng_units_32`)
+
+    Notes
+    -----
+    - If the device referenced by board_num has both analog input and analog output, the resolution
+      of the A/D converter on the device is used.
+    """
+    import numpy as np
+
+    if resolution is None:
+        resolution = _conversion_resolution(board_num, BoardInfo.ADRES)
+    full_scale_eng, full_scale_counts = _conversion_scale(ul_range, resolution)
+
+    counts = np.asarray(data_values, dtype=np.float64)
+    eng_units = counts * (full_scale_eng / full_scale_counts) + ul_range.range_min
+    return eng_units.astype(np.float32 if resolution <= 16 else np.float64)
+
+
 _cbw.cbVIn.argtypes = [c_int, c_int, c_int, POINTER(c_float), c_int]
 
 
@@ -5504,9 +5914,10 @@ def v_in(board_num, channel, ul_range, options=0):
     float
         The value in volts of the A/D sample
     """
-    data_value = c_float()
-    _check_err(_cbw.cbVIn(
-        board_num, channel, ul_range, byref(data_value), options))
+    data_value, pointer_ = _scratch_value(c_float)
+    errcode = _cbw.cbVIn(board_num, channel, ul_range, pointer_, options)
+    if errcode:
+        raise ULError(errcode)
     return data_value.value
 
 
@@ -5548,6 +5959,60 @@ def v_in_32(board_num, channel, ul_range, options=0):
     return data_value.value
 
 
+def v_in_many(board_num, channels, ul_ranges, out=None, scan=None, rate=10000):
+    """Reads several A/D input channels, and returns their values in volts. This is the batch
+    equivalent of :func:`.v_in`, for polling loops that read the same channels on every cycle.
+    This function requires NumPy.
+
+    When the board allows it, the channels are sampled by one short foreground
+    :func:`.a_in_scan` of one sample per channel with
+    :const:`~mcculw.enums.ScanOptions.SCALEDATA`, loading the channel/gain queue with
+    :func:`.a_load_queue` if the channels are not consecutive or the ranges differ; the queue is
+    disabled again afterwards. Otherwise each channel is read in turn as :func:`.v_in` does, with
+    one ctypes value reused for all of them. This is always the case while a queue loaded with
+    :func:`.a_load_queue` is active, which a scan would follow and then disable.
+
+    Parameters
+    ----------
+    board_num : int
+        The number associated with the board when it was installed with InstaCal or created
+        with :func:`.create_daq_device`.
+    channels : list of int
+        A/D channel numbers, in the order of the returned values.
+    ul_ranges : ULRange or list of ULRange
+        A/D range code for all of the channels, or one per channel.
+    out : numpy.ndarray, optional
+        An array of numpy.float64 with one element per channel to store the values in, so that a
+        polling loop does not allocate one per cycle. By default a new array is returned.
+    scan : bool, optional
+        True to always read with a scan, raising its errors, and False to always read channel by
+        channel. By default a scan is tried first; if the board does not support it (for example
+        with ErrorCode.NOQUEUE or BADBOARDTYPE), the board is read channel by channel on this and
+        later calls. Other errors of the scan are raised.
+    rate : int, optional
+        The per-channel sample rate of the scan, in samples per second. The scan takes about one
+        sample period.
+
+    Returns
+    -------
+    numpy.ndarray
+        The values in volts, as numpy.float64
+    """
+    import numpy as np
+
+    channels, ul_ranges, out = _batch_arguments(channels, ul_ranges, out, np.float64)
+    if _scan_many(board_num, channels, ul_ranges, out, scan, rate, True):
+        return out
+    data_value, pointer_ = _scratch_value(c_float)
+    read = _cbw._resolve('cbVIn')
+    for index, (channel, ul_range) in enumerate(zip(channels, ul_ranges)):
+        errcode = read(board_num, channel, ul_range, pointer_, 0)
+        if errcode:
+            raise ULError(errcode)
+        out[index] = data_value.value
+    return out
+
+
 _cbw.cbVOut.argtypes = [c_int, c_int, c_int, c_float, c_int]
 
 
@@ -5785,6 +6250,85 @@ def win_buf_alloc_64(num_points):
     return _cbw.cbWinBufAlloc64(num_points)
 
 
+class _BufferLease(object):
+    # Shared by every NumPy view created by buffer_as_ndarray for a memhandle.
+    # win_buf_free only marks the lease; the buffer is released to the driver
+    # once the last view referencing the lease is garbage collected. Until
+    # then the marked lease stays in _buffer_leases, so that the memhandle is
+    # known to be freed.
+    def __init__(self, memhandle):
+        self.memhandle = memhandle
+        self.free_requested = False
+
+    def __del__(self):
+        if self.free_requested:
+            _cbw.cbWinBufFree(self.memhandle)
+
+
+_buffer_leases = weakref.WeakValueDictionary()
+
+
+def buffer_as_ndarray(memhandle, count, dtype=None):
+    """Returns a NumPy array that aliases a Windows memory buffer, without copying the data. This
+    function requires NumPy.
+
+    Writes to the array go directly to the buffer, so an output buffer can be filled in place
+    before (or during) a :func:`.a_out_scan`, and the data of an input scan can be read while a
+    :const:`~mcculw.enums.ScanOptions.BACKGROUND` scan continues to collect new data.
+
+    Parameters
+    ----------
+    memhandle : int
+        This must be a memory handle that was returned by :func:`.win_buf_alloc`,
+        :func:`.win_buf_alloc_32`, :func:`.win_buf_alloc_64` or :func:`.scaled_win_buf_alloc`
+        when the buffer was allocated.
+    count : int
+        The number of points in the buffer to expose. This must not exceed the number of points
+        the buffer was allocated with.
+    dtype : numpy.dtype, optional
+        The data type of the buffer: numpy.uint16 for :func:`.win_buf_alloc` (the default),
+        numpy.uint32 for :func:`.win_buf_alloc_32`, numpy.uint64 for :func:`.win_buf_alloc_64`
+        or numpy.float64 for :func:`.scaled_win_buf_alloc`.
+
+    Returns
+    -------
+    numpy.ndarray
+        A one-dimensional array of count elements backed by the memory buffer
+
+    Notes
+    -----
+    - The array (and any view of it) keeps the buffer alive. If :func:`.win_buf_free` is called
+      while such arrays still exist, the buffer is released when the last of them is garbage
+      collected instead of immediately, so the array can never refer to freed memory. No new
+      array can be created for the buffer in the meantime: this raises a ULError with
+      ErrorCode.BADPOINTER.
+    """
+    import numpy as np
+
+    dtype = np.dtype(np.uint16 if dtype is None else dtype)
+    ctypes_types = {np.dtype(np.uint16): c_ushort,
+                    np.dtype(np.uint32): c_uint32,
+                    np.dtype(np.uint64): c_uint64,
+                    np.dtype(np.float64): c_double}
+    if dtype not in ctypes_types:
+        raise ValueError('dtype must be one of uint16, uint32, uint64 or float64')
+    if not memhandle:
+        raise ULError(ErrorCode.BADPOINTER)
+
+    lease = _buffer_leases.get(memhandle)
+    if lease is not None and lease.free_requested:
+        raise ULError(ErrorCode.BADPOINTER)
+    if lease is None:
+        lease = _BufferLease(memhandle)
+        _buffer_leases[memhandle] = lease
+
+    c_array = (ctypes_types[dtype] * count).from_address(memhandle)
+    # The ndarray holds the ctypes array through its buffer export, which in
+    # turn holds the lease.
+    c_array._lease = lease
+    return np.ctypeslib.as_array(c_array)
+
+
 _cbw.cbWinBufFree.argtypes = [HGLOBAL]
 
 
@@ -5799,7 +6343,19 @@ def win_buf_free(memhandle):
         A Windows memory handle. This must be a memory handle that was returned by
         :func:`.win_buf_alloc`, :func:`.win_buf_alloc_32`, :func:`.win_buf_alloc_64` or
         :func:`.scaled_win_buf_alloc` when the buffer was allocated.
+
+    Notes
+    -----
+    - If arrays returned by :func:`.buffer_as_ndarray` for this buffer still exist, the buffer is
+      released when the last of them is garbage collected. Freeing the buffer again before then
+      raises a ULError with ErrorCode.BADPOINTER, as freeing a released buffer does.
     """
+    lease = _buffer_leases.get(memhandle)
+    if lease is not None:
+        if lease.free_requested:
+            raise ULError(ErrorCode.BADPOINTER)
+        lease.free_requested = True
+        return
     _check_err(_cbw.cbWinBufFree(memhandle))
 
 
@@ -6119,10 +6675,179 @@ def save_config(config_file_name):
     _check_err(_cbw.cbSaveConfig(config_file_name.encode('utf-8')))
 
 
+_scratch = threading.local()
+
+# (board_num, queued) pairs for which the scan of the *_in_many functions
+# is not supported, so they read channel by channel
+_batch_scan_rejected = set()
+
+# The errors with which a board refuses the scan of the *_in_many functions,
+# rather than failing to run it
+_BATCH_SCAN_UNSUPPORTED = frozenset([
+    ErrorCode.BADBOARDTYPE, ErrorCode.NOQUEUE, ErrorCode.NOPROGGAIN, ErrorCode.TOOMANYGAINS,
+    ErrorCode.ODDCHAN, ErrorCode.EVENODDMISMATCH, ErrorCode.RANGEMISMATCH, ErrorCode.BADOPTION,
+    ErrorCode.BADRATE, ErrorCode.BADCOUNT])
+
+# Boards whose channel/gain queue was loaded with a_load_queue. Scans of
+# these boards follow the queue, which the *_in_many functions must not
+# replace, so they read channel by channel.
+_user_queues = set()
+
+
+def _scratch_values(*datatypes):
+    # ctypes values of datatypes and pointers to them, kept per thread and
+    # reused by the polled wrappers instead of allocating new ones per call.
+    # Returns (values, pointers).
+    try:
+        return _scratch.values[datatypes]
+    except AttributeError:
+        _scratch.values = {}
+    except KeyError:
+        pass
+    values = tuple(datatype() for datatype in datatypes)
+    entry = _scratch.values[datatypes] = (values, tuple(pointer(value) for value in values))
+    return entry
+
+
+def _scratch_value(datatype):
+    # As _scratch_values, for one value: returns (value, pointer)
+    try:
+        return _scratch.value[datatype]
+    except AttributeError:
+        _scratch.value = {}
+    except KeyError:
+        pass
+    value = datatype()
+    entry = _scratch.value[datatype] = (value, pointer(value))
+    return entry
+
+
+def _scratch_buffer(count, scaled):
+    # A per-thread scan buffer of at least count points and an ndarray view of
+    # it, reallocated only when a larger one is needed
+    import numpy as np
+
+    name = 'scaled_buffer' if scaled else 'buffer'
+    memhandle, view = getattr(_scratch, name, (None, ()))
+    if len(view) < count:
+        if memhandle:
+            win_buf_free(memhandle)
+        memhandle = scaled_win_buf_alloc(count) if scaled else win_buf_alloc(count)
+        if not memhandle:
+            raise ULError(ErrorCode.NOTENOUGHMEMORY)
+        view = buffer_as_ndarray(memhandle, count, np.float64 if scaled else np.uint16)
+        setattr(_scratch, name, (memhandle, view))
+    return memhandle, view
+
+
+def _batch_arguments(channels, ul_ranges, out, dtype):
+    import numpy as np
+
+    channels = [int(channel) for channel in channels]
+    if isinstance(ul_ranges, int):
+        ul_ranges = [int(ul_ranges)] * len(channels)
+    else:
+        ul_ranges = [int(ul_range) for ul_range in ul_ranges]
+        if len(ul_ranges) != len(channels):
+            raise ValueError('ul_ranges must be one range, or one per channel')
+    if out is None:
+        out = np.empty(len(channels), dtype)
+    return channels, ul_ranges, out
+
+
+def _scan_many(board_num, channels, ul_ranges, out, scan, rate, scaled):
+    # Samples channels with one foreground scan into out. Returns False if the
+    # channels must be read one by one instead.
+    count = len(channels)
+    if scan is False or not count:
+        return False
+    first = channels[0]
+    queued = (ul_ranges.count(ul_ranges[0]) != count
+              or channels != list(range(first, first + count)))
+    if board_num in _user_queues:
+        if scan:
+            raise ValueError('The channel/gain queue of board {} was loaded with a_load_queue; '
+                             'disable it to read with a scan'.format(board_num))
+        return False
+    if scan is None and (board_num, queued) in _batch_scan_rejected:
+        return False
+
+    try:
+        memhandle, view = _scratch_buffer(count, scaled)
+        options = ScanOptions.SCALEDATA if scaled else 0
+        if queued:
+            _load_queue(board_num, channels, ul_ranges, count)
+            try:
+                a_in_scan(board_num, min(channels), max(channels), count, rate, ul_ranges[0],
+                          memhandle, options)
+            finally:
+                _load_queue(board_num, [], [], 0)
+        else:
+            a_in_scan(board_num, first, channels[-1], count, rate, ul_ranges[0], memhandle,
+                      options)
+    except ULError as e:
+        if scan or e.errorcode not in _BATCH_SCAN_UNSUPPORTED:
+            raise
+        _batch_scan_rejected.add((board_num, queued))
+        return False
+    out[:] = view[:count]
+    return True
+
+
 def _to_ctypes_array(list_, datatype):
+    # ctypes arrays of datatype and writable C-contiguous NumPy arrays of the
+    # same type are passed as they are, so that callers can convert a list once and
+    # reuse it; anything else is copied into a new ctypes array
+    if isinstance(list_, Array) and list_._type_ is datatype:
+        return list_
+    if not isinstance(list_, (list, tuple)) and hasattr(list_, 'dtype'):
+        array = _ndarray_as_ctypes(list_, datatype)
+        if array is not None:
+            return array
     return (datatype * len(list_))(*list_)
 
 
+# NumPy dtypes of ctypes types, as numpy.dtype() is slow to look them up
+_ndarray_dtypes = {}
+
+
+def _ndarray_as_ctypes(array, datatype):
+    # A ctypes array of datatype sharing the memory of a NumPy array, or None
+    # if the type or layout of the array does not allow it
+    dtype = _ndarray_dtypes.get(datatype)
+    if dtype is None:
+        import numpy as np
+        dtype = _ndarray_dtypes[datatype] = np.dtype(datatype)
+    flags = array.flags
+    if array.dtype != dtype or not flags.c_contiguous or not flags.writeable:
+        return None
+    return (datatype * array.size).from_buffer(array)
+
+
+def _conversion_resolution(board_num, preferred_res_item):
+    # Mirror the resolution rules of cbFromEngUnits/cbToEngUnits: use the
+    # preferred converter if the board has one, then the other converter,
+    # then fall back to the 12-bit default.
+    if preferred_res_item == BoardInfo.DACRES:
+        candidates = [(BoardInfo.NUMDACHANS, BoardInfo.DACRES),
+                      (BoardInfo.NUMADCHANS, BoardInfo.ADRES)]
+    else:
+        candidates = [(BoardInfo.NUMADCHANS, BoardInfo.ADRES),
+                      (BoardInfo.NUMDACHANS, BoardInfo.DACRES)]
+    for num_chans_item, res_item in candidates:
+        if get_config(InfoType.BOARDINFO, board_num, 0, num_chans_item) > 0:
+            return get_config(InfoType.BOARDINFO, board_num, 0, res_item)
+    return 12
+
+
+def _conversion_scale(ul_range, resolution):
+    full_scale_eng = ul_range.range_max - ul_range.range_min
+    if full_scale_eng <= 0:
+        raise ULError(ErrorCode.BADRANGE)
+    full_scale_counts = (1 << resolution) - 1
+    return full_scale_eng, full_scale_counts
+
+
 def _check_err(errcode):
     if errcode:
         raise ULError(errcode)
@@ -0,0 +1,423 @@
+# -*- coding: UTF-8 -*-
+
+"""
+asyncio front end for background scans.
+
+Each function returns a :class:`ScanStream` that starts a
+:const:`~mcculw.enums.ScanOptions.BACKGROUND` | :const:`~mcculw.enums.ScanOptions.CONTINUOUS`
+scan when iteration begins, and yields :class:`~mcculw.continuous_scan.ScanChunk` objects. A
+stream must be iterated within an ``async with`` block::
+
+    async with ul_async.a_in_stream(board_num, 0, 3, 1000, ULRange.BIP10VOLTS) as stream:
+        async for chunk in stream:
+            process(chunk.data)
+
+Input streams wake on EventType.ON_DATA_AVAILABLE events where the board supports them, and poll
+:func:`.get_status` otherwise. Leaving the ``async with`` block stops the scan with
+:func:`.stop_background` and frees the buffer, including when the block is left by breaking out
+of the loop, by an exception or by cancelling the task that runs it.
+
+This module requires NumPy.
+"""
+import asyncio
+import time
+from ctypes import c_void_p
+
+import numpy as np
+
+from mcculw import ul
+from mcculw.continuous_scan import ScanChunk, ScanCursor, alloc_buffer, plan_buffer
+from mcculw.enums import ScanOptions, FunctionType, Status, EventType
+from mcculw.ul import ULError
+
+_INPUT_EVENTS = (EventType.ON_DATA_AVAILABLE | EventType.ON_END_OF_INPUT_SCAN
+                 | EventType.ON_SCAN_ERROR)
+
+
+class ScanStream(object):
+    """An asynchronous iterator over the chunks of a continuous background scan. Use the functions
+    of this module to create one, and iterate over it within ``async with``: the scan is stopped
+    when the block is left, whereas an abandoned iteration would leave it running.
+
+    For input scans, each chunk holds a copy of the data. For output scans, each chunk holds a
+    writable view of the part of the UL buffer that the scan has just output: write the values to
+    output next into it before the next iteration, or leave it to repeat the old ones. The
+    first_sample (and first_scan) of an output chunk is the index of the point (and scan) its data
+    will be output as.
+
+    Attributes
+    ----------
+    rate : int
+        The actual per-channel rate of the scan, once started.
+    events_enabled : bool
+        True if the stream is woken by UL events, False if it polls.
+    overruns : int
+        Number of times input data was overwritten before it was read, or for output scans, the
+        number of times the scan output a chunk before it was refilled.
+    lost_samples : int
+        Number of samples skipped because of overruns.
+    """
+    def __init__(self, board_num, function_type, num_chans, rate, dtype, start_scan,
+                 chunk_size=None, buffer_count=None, initial_data=None, use_events=True):
+        self.board_num = board_num
+        self.function_type = function_type
+        self.num_chans = num_chans
+        self.rate = rate
+        self.dtype = np.dtype(dtype)
+        self.chunk_size, self.buffer_count = plan_buffer(rate, num_chans, chunk_size,
+                                                         buffer_count)
+        self.cursor = ScanCursor(self.buffer_count, self.chunk_size * num_chans,
+                                 rate * num_chans)
+        self.is_output = function_type == FunctionType.AOFUNCTION
+        self.events_enabled = False
+        self.memhandle = None
+        self._start_scan = start_scan
+        self._initial_data = initial_data
+        self._use_events = use_events and not self.is_output
+        self._callback = None
+        self._user_data = c_void_p()
+        self._loop = None
+        self._wake = None
+        self._entered = False
+        self._iterator = None
+
+    @property
+    def overruns(self):
+        return self.cursor.overruns
+
+    @property
+    def lost_samples(self):
+        return self.cursor.lost_samples
+
+    async def __aenter__(self):
+        self._entered = True
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    def __aiter__(self):
+        if not self._entered:
+            raise RuntimeError('A ScanStream must be iterated within "async with", which stops '
+                               'the scan when the block is left')
+        if self._iterator is not None:
+            raise RuntimeError('A ScanStream can only be iterated once')
+        self._iterator = self._output_chunks() if self.is_output else self._input_chunks()
+        return self._iterator
+
+    async def aclose(self):
+        """Stops the scan and frees the buffer."""
+        if self._iterator is not None:
+            await self._iterator.aclose()
+        self._stop()
+
+    def _start(self):
+        self.memhandle = alloc_buffer(self.buffer_count, self.dtype)
+        try:
+            data = ul.buffer_as_ndarray(self.memhandle, self.buffer_count, self.dtype)
+            if self._initial_data is not None:
+                data[:] = self._initial_data
+            if self._use_events:
+                self._enable_events()
+            self.rate = self._start_scan(self.memhandle, self.buffer_count)
+        except BaseException:
+            self._stop()
+            raise
+        return data
+
+    def _enable_events(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        # Keep a reference to the callback for as long as events can occur
+        self._callback = ul.ULEventCallback(self._on_event)
+        try:
+            ul.enable_event(self.board_num, _INPUT_EVENTS, self.cursor.chunk_count,
+                            self._callback, self._user_data)
+            self.events_enabled = True
+        except ULError:
+            self._callback = None
+
+    def _on_event(self, board_num, event_type, event_data, user_data):
+        # Called on a UL thread
+        try:
+            self._loop.call_soon_threadsafe(self._wake.set)
+        except RuntimeError:
+            # The event loop is closed
+            pass
+
+    def _stop(self):
+        if self.memhandle is None:
+            return
+        try:
+            ul.stop_background(self.board_num, self.function_type)
+            if self.events_enabled:
+                ul.disable_event(self.board_num, _INPUT_EVENTS)
+                self.events_enabled = False
+        finally:
+            ul.win_buf_free(self.memhandle)
+            self.memhandle = None
+            self._callback = None
+
+    async def _wait(self):
+        if self.events_enabled:
+            # Poll anyway every now and then, in case an event was missed
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.cursor.max_interval)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            await asyncio.sleep(self.cursor.poll_interval)
+
+    def _status(self):
+        if self._wake is not None:
+            self._wake.clear()
+        return ul.get_status(self.board_num, self.function_type)
+
+    async def _input_chunks(self):
+        data = self._start()
+        cursor = self.cursor
+        try:
+            while True:
+                status, cur_count, _ = self._status()
+                cursor.update(cur_count)
+                ready = cursor.ready
+                for _ in range(ready):
+                    first_sample = cursor.drained
+                    block = data[cursor.index:cursor.index + cursor.chunk_count].copy()
+                    timestamp = time.monotonic()
+                    # Make sure the block was not overwritten while it was
+                    # being copied
+                    _, cur_count, _ = ul.get_status(self.board_num, self.function_type)
+                    if not cursor.update(cur_count):
+                        break
+                    cursor.advance()
+                    yield ScanChunk(block.reshape(-1, self.num_chans), first_sample, timestamp,
+                                    first_sample // self.num_chans)
+                if status == Status.IDLE:
+                    return
+                cursor.adapt(ready)
+                await self._wait()
+        finally:
+            self._stop()
+
+    async def _output_chunks(self):
+        data = self._start()
+        cursor = self.cursor
+        try:
+            while True:
+                status, cur_count, _ = self._status()
+                cursor.update(cur_count)
+                ready = cursor.ready
+                for _ in range(ready):
+                    block = data[cursor.index:cursor.index + cursor.chunk_count]
+                    first_sample = cursor.drained + self.buffer_count
+                    yield ScanChunk(block.reshape(-1, self.num_chans), first_sample,
+                                    time.monotonic(), first_sample // self.num_chans)
+                    # Make sure the scan did not output the block before it
+                    # was refilled
+                    _, cur_count, _ = ul.get_status(self.board_num, self.function_type)
+                    if not cursor.update(cur_count):
+                        break
+                    cursor.advance()
+                if status == Status.IDLE:
+                    return
+                cursor.adapt(ready)
+                await self._wait()
+        finally:
+            self._stop()
+
+
+def a_in_stream(board_num, low_chan, high_chan, rate, ul_range, options=ScanOptions.SCALEDATA,
+                chunk_size=None, buffer_count=None, use_events=True):
+    """Streams a continuous :func:`.a_in_scan`.
+
+    Parameters
+    ----------
+    board_num : int
+        The number associated with the board when it was installed with InstaCal or created
+        with :func:`.create_daq_device`.
+    low_chan : int
+        First A/D channel of the scan.
+    high_chan : int
+        Last A/D channel of the scan.
+    rate : int
+        The requested per-channel sample rate.
+    ul_range : ULRange
+        The A/D range of the scan.
+    options : ScanOptions, optional
+        Additional scan options. BACKGROUND and CONTINUOUS are always added. With SCALEDATA (the
+        default) chunks hold volts; without it they hold raw counts.
+    chunk_size : int, optional
+        Number of scans per chunk. Defaults to about 50 ms of data.
+    buffer_count : int, optional
+        Size of the UL buffer in samples. Defaults to one second of data, and at least eight
+        chunks.
+    use_events : bool, optional
+        Set to False to poll even if the board supports ON_DATA_AVAILABLE events.
+
+    Returns
+    -------
+    ScanStream
+        The stream; the scan starts when iteration begins
+    """
+    options |= ScanOptions.BACKGROUND | ScanOptions.CONTINUOUS
+    if options & ScanOptions.SCALEDATA:
+        dtype = np.float64
+    else:
+        from mcculw.device_info import AiInfo
+        dtype = np.uint16 if AiInfo(board_num).resolution <= 16 else np.uint32
+
+    def start_scan(memhandle, count):
+        return ul.a_in_scan(board_num, low_chan, high_chan, count, rate, ul_range, memhandle,
+                            options)
+
+    return ScanStream(board_num, FunctionType.AIFUNCTION, high_chan - low_chan + 1, rate, dtype,
+                      start_scan, chunk_size, buffer_count, use_events=use_events)
+
+
+def c_in_stream(board_num, first_ctr, last_ctr, rate, options=ScanOptions.CTR32BIT,
+                chunk_size=None, buffer_count=None, use_events=True):
+    """Streams a continuous :func:`.c_in_scan`.
+
+    Parameters
+    ----------
+    board_num : int
+        The number associated with the board when it was installed with InstaCal or created
+        with :func:`.create_daq_device`.
+    first_ctr : int
+        First counter channel of the scan.
+    last_ctr : int
+        Last counter channel of the scan.
+    rate : int
+        The requested per-channel sample rate.
+    options : ScanOptions, optional
+        Additional scan options, CTR32BIT by default. BACKGROUND and CONTINUOUS are always
+        added. The counter resolution option selects the data type of the chunks: numpy.uint32
+        for CTR32BIT, numpy.uint64 for CTR48BIT and CTR64BIT, and numpy.uint16 for CTR16BIT or
+        no resolution option.
+    chunk_size : int, optional
+        Number of scans per chunk. Defaults to about 50 ms of data.
+    buffer_count : int, optional
+        Size of the UL buffer in samples. Defaults to one second of data, and at least eight
+        chunks.
+    use_events : bool, optional
+        Set to False to poll even if the board supports ON_DATA_AVAILABLE events.
+
+    Returns
+    -------
+    ScanStream
+        The stream; the scan starts when iteration begins
+    """
+    options |= ScanOptions.BACKGROUND | ScanOptions.CONTINUOUS
+    # CTR16BIT is 0, the resolution used when no other one is set
+    if options & (ScanOptions.CTR48BIT | ScanOptions.CTR64BIT):
+        dtype = np.uint64
+    elif options & ScanOptions.CTR32BIT:
+        dtype = np.uint32
+    else:
+        dtype = np.uint16
+
+    def start_scan(memhandle, count):
+        return ul.c_in_scan(board_num, first_ctr, last_ctr, count, rate, memhandle, options)
+
+    return ScanStream(board_num, FunctionType.CTRFUNCTION, last_ctr - first_ctr + 1, rate, dtype,
+                      start_scan, chunk_size, buffer_count, use_events=use_events)
+
+
+def daq_in_stream(board_num, chan_list, chan_type_list, gain_list, rate, options=0,
+                  chunk_size=None, buffer_count=None, dtype=None, use_events=True):
+    """Streams a continuous :func:`.daq_in_scan`.
+
+    Parameters
+    ----------
+    board_num : int
+        The number associated with the board when it was installed with InstaCal or created
+        with :func:`.create_daq_device`.
+    chan_list : list of int or DigitalPortType
+        The channels of the scan.
+    chan_type_list : list of ChannelType
+        The type of each channel in chan_list.
+    gain_list : list of ULRange
+        The range of each channel in chan_list.
+    rate : int
+        The requested per-channel sample rate.
+    options : ScanOptions, optional
+        Additional scan options. BACKGROUND and CONTINUOUS are always added.
+    chunk_size : int, optional
+        Number of scans per chunk. Defaults to about 50 ms of data.
+    buffer_count : int, optional
+        Size of the UL buffer in samples. Defaults to one second of data, and at least eight
+        chunks.
+    dtype : numpy.dtype, optional
+        The data type of the buffer: numpy.uint16 (the default), numpy.uint32 or numpy.uint64.
+        Scans with SCALEDATA always use numpy.float64.
+    use_events : bool, optional
+        Set to False to poll even if the board supports ON_DATA_AVAILABLE events.
+
+    Returns
+    -------
+    ScanStream
+        The stream; the scan starts when iteration begins
+    """
+    options |= ScanOptions.BACKGROUND | ScanOptions.CONTINUOUS
+    if options & ScanOptions.SCALEDATA:
+        dtype = np.float64
+    elif dtype is None:
+        dtype = np.uint16
+    chan_count = len(chan_list)
+
+    def start_scan(memhandle, count):
+        actual_rate, _, _ = ul.daq_in_scan(board_num, chan_list, chan_type_list, gain_list,
+                                           chan_count, rate, 0, count, memhandle, options)
+        return actual_rate
+
+    return ScanStream(board_num, FunctionType.DAQIFUNCTION, chan_count, rate, dtype, start_scan,
+                      chunk_size, buffer_count, use_events=use_events)
+
+
+def a_out_stream(board_num, low_chan, high_chan, rate, ul_range, data,
+                 options=ScanOptions.SCALEDATA, chunk_size=None):
+    """Streams a continuous :func:`.a_out_scan`. The stream yields the parts of the buffer that
+    have been output, to be refilled; see :class:`ScanStream`. Output streams always poll, as
+    there is no data event for output scans.
+
+    Parameters
+    ----------
+    board_num : int
+        The number associated with the board when it was installed with InstaCal or created
+        with :func:`.create_daq_device`.
+    low_chan : int
+        First D/A channel of the scan.
+    high_chan : int
+        Last D/A channel of the scan.
+    rate : int
+        The requested per-channel sample rate.
+    ul_range : ULRange
+        The D/A range of the scan.
+    data : numpy.ndarray
+        The initial contents of the buffer, interleaved by channel or with shape
+        (scans, channels). Its size sets the size of the buffer.
+    options : ScanOptions, optional
+        Additional scan options. BACKGROUND and CONTINUOUS are always added. With SCALEDATA (the
+        default) the data is in volts; without it, in counts.
+    chunk_size : int, optional
+        Number of scans per chunk. Defaults to half of the buffer.
+
+    Returns
+    -------
+    ScanStream
+        The stream; the scan starts when iteration begins
+    """
+    options |= ScanOptions.BACKGROUND | ScanOptions.CONTINUOUS
+    num_chans = high_chan - low_chan + 1
+    dtype = np.float64 if options & ScanOptions.SCALEDATA else np.uint16
+    data = np.asarray(data, dtype).reshape(-1)
+    if chunk_size is None:
+        chunk_size = len(data) // num_chans // 2
+
+    def start_scan(memhandle, count):
+        return ul.a_out_scan(board_num, low_chan, high_chan, count, rate, ul_range, memhandle,
+                             options)
+
+    return ScanStream(board_num, FunctionType.AOFUNCTION, num_chans, rate, dtype, start_scan,
+                      chunk_size, len(data), initial_data=data)
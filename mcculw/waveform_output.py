@@ -0,0 +1,307 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Periodic waveform output that can be updated while it plays.
+
+:class:`WaveformOutput` runs a :const:`~mcculw.enums.ScanOptions.BACKGROUND` |
+:const:`~mcculw.enums.ScanOptions.CONTINUOUS` :func:`.a_out_scan` over a buffer split into two
+halves, each holding a whole number of periods of the waveform. A service thread follows the
+output position with :func:`.get_status` and only ever rewrites the half that is not being output,
+so updates take effect at a half boundary (which is also a period boundary) without stopping the
+scan or tearing the waveform.
+
+This module requires NumPy.
+"""
+import collections
+import threading
+import time
+
+import numpy as np
+
+from mcculw import ul
+from mcculw.continuous_scan import alloc_buffer
+from mcculw.waveforms import tile
+from mcculw.enums import ScanOptions, FunctionType
+
+# A half is only rewritten if the output is at least this long (in seconds)
+# away from reaching it, so that the write completes first
+_MIN_LEAD_TIME = 0.005
+
+_Segment = collections.namedtuple("_Segment", "amplitude offset halves")
+
+
+class WaveformOutput(object):
+    """Outputs a periodic waveform on one D/A channel, with an amplitude and offset that can be
+    changed while the output runs.
+
+    The output is ``offset + amplitude * shape``, repeated.
+
+    Parameters
+    ----------
+    board_num : int
+        The number associated with the board when it was installed with InstaCal or created
+        with :func:`.create_daq_device`.
+    channel : int
+        The D/A channel.
+    rate : int
+        The sample rate in samples per second.
+    ul_range : ULRange
+        The D/A range.
+    shape : numpy.ndarray
+        One period of the waveform, normalized to an amplitude of 1. Its length is the period in
+        samples. The ``samples`` of a :func:`.period_table` can be used.
+    amplitude : float, optional
+        The initial amplitude, in volts. Defaults to 0.
+    offset : float, optional
+        The initial offset, in volts. Defaults to 0.
+    latency : float, optional
+        The target duration of a buffer half, in seconds, rounded to whole periods. Amplitude
+        changes take effect within about one half. Defaults to 0.1.
+    resolution : int, optional
+        The D/A resolution in bits. By default it is read from the device.
+
+    Attributes
+    ----------
+    half_size : int
+        Number of samples in each half of the buffer.
+    start_time : float
+        time.monotonic() in the middle of the call that started the output scan.
+    late_halves : int
+        Number of halves the service thread failed to write in time; each of them output the
+        contents of the half from a buffer cycle earlier, in place of its share of the queued
+        segments.
+    torn_writes : int
+        Number of halves that started being output while they were being rewritten.
+    """
+    def __init__(self, board_num, channel, rate, ul_range, shape, amplitude=0.0, offset=0.0,
+                 latency=0.1, resolution=None):
+        self.board_num = board_num
+        self.channel = channel
+        self.rate = rate
+        self.ul_range = ul_range
+        self.shape = np.asarray(shape, np.float64)
+        if resolution is None:
+            from mcculw.device_info import AoInfo
+            resolution = AoInfo(board_num).resolution
+        self.resolution = resolution
+        self.dtype = np.dtype(np.uint16 if resolution <= 16 else np.uint32)
+
+        period = len(self.shape)
+        self.half_size = max(int(round(latency * rate / period)), 1) * period
+        self.buffer_count = 2 * self.half_size
+        self.late_halves = 0
+        self.torn_writes = 0
+        self.start_time = None
+
+        self._lock = threading.Lock()
+        self._steady = (float(amplitude), float(offset))
+        self._segments = collections.deque()
+        self._half_cache = {}
+        # Sequence number and contents of the last half written. Half number
+        # seq lives in buffer half seq % 2.
+        self._written_seq = -1
+        self._written_key = None
+        self._last_segment_seq = -1
+        self._queue_done = threading.Event()
+        self._queue_done.set()
+        self._stop_requested = threading.Event()
+        self._thread = None
+        self.memhandle = None
+        self._data = None
+
+    @property
+    def amplitude(self):
+        """The amplitude output once the queued segments have played."""
+        return self._steady[0]
+
+    @property
+    def period(self):
+        """The period of the waveform, in samples."""
+        return len(self.shape)
+
+    # Control
+
+    def start(self):
+        """Fills the buffer and starts the output scan and the service thread."""
+        self.memhandle = alloc_buffer(self.buffer_count, self.dtype)
+        self._data = ul.buffer_as_ndarray(self.memhandle, self.buffer_count, self.dtype)
+        self._write_half(0)
+        self._write_half(1)
+        try:
+            before = time.monotonic()
+            self.rate = ul.a_out_scan(self.board_num, self.channel, self.channel,
+                                      self.buffer_count, self.rate, self.ul_range, self.memhandle,
+                                      ScanOptions.BACKGROUND | ScanOptions.CONTINUOUS)
+            self.start_time = (before + time.monotonic()) / 2
+        except ul.ULError:
+            self._free()
+            raise
+        self._thread = threading.Thread(target=self._run, name='WaveformOutput service')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self, park_voltage=0.0):
+        """Stops the output scan and the service thread, and frees the buffer.
+
+        Parameters
+        ----------
+        park_voltage : float, optional
+            The voltage to leave the channel at, 0 by default. None leaves the channel at the last
+            value output by the scan.
+        """
+        self._stop_requested.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.memhandle:
+            ul.stop_background(self.board_num, FunctionType.AOFUNCTION)
+            if park_voltage is not None:
+                ul.a_out(self.board_num, self.channel, self.ul_range, int(ul.from_eng_units_array(
+                    self.board_num, self.ul_range, [park_voltage], self.resolution)[0]))
+            self._free()
+        self._queue_done.set()
+
+    def _free(self):
+        self._data = None
+        ul.win_buf_free(self.memhandle)
+        self.memhandle = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    # Updates
+
+    def set_amplitude(self, amplitude, offset=None):
+        """Changes the amplitude (and optionally the offset) of the output. The change takes
+        effect at the next half boundary that the service thread can still write ahead of,
+        after any queued segments have played."""
+        with self._lock:
+            self._steady = (float(amplitude),
+                            self._steady[1] if offset is None else float(offset))
+
+    def queue_segment(self, amplitude, duration, offset=None):
+        """Queues a segment of the waveform at the given amplitude. Queued segments play back to
+        back, in order, each for duration seconds rounded up to whole buffer halves; then the
+        output returns to the amplitude set by :meth:`set_amplitude`. Segments queued before
+        :meth:`start` play from the first sample of the scan.
+
+        Parameters
+        ----------
+        amplitude : float
+            The amplitude of the segment, in volts.
+        duration : float
+            The duration of the segment, in seconds.
+        offset : float, optional
+            The offset of the segment, in volts. Defaults to the current offset.
+
+        Returns
+        -------
+        int
+            The length of the segment in samples
+        """
+        halves = max(int(np.ceil(duration * self.rate / self.half_size - 1e-9)), 1)
+        with self._lock:
+            if offset is None:
+                offset = self._steady[1]
+            self._segments.append(_Segment(float(amplitude), float(offset), halves))
+            self._queue_done.clear()
+        return halves * self.half_size
+
+    @property
+    def pending_segments(self):
+        """Number of queued segments that have not started being written."""
+        return len(self._segments)
+
+    def wait_segments(self, timeout=None):
+        """Waits until every queued segment has been output. Returns False on timeout."""
+        return self._queue_done.wait(timeout)
+
+    # Service thread
+
+    def _half_counts(self, key):
+        counts = self._half_cache.get(key)
+        if counts is None:
+            amplitude, offset = key
+            # Convert one period, then tile the counts over the half
+            period = ul.from_eng_units_array(self.board_num, self.ul_range,
+                                             offset + amplitude * self.shape, self.resolution)
+            counts = np.empty(self.half_size, period.dtype)
+            tile(period, counts)
+            if len(self._half_cache) >= 8:
+                self._half_cache.clear()
+            self._half_cache[key] = counts
+        return counts
+
+    def _next_key(self, seq):
+        # Decide what half number seq holds, consuming queued segments
+        with self._lock:
+            if not self._segments:
+                return self._steady, False
+            segment = self._segments[0]
+            if segment.halves > 1:
+                self._segments[0] = segment._replace(halves=segment.halves - 1)
+            else:
+                self._segments.popleft()
+            self._last_segment_seq = seq
+            return (segment.amplitude, segment.offset), True
+
+    def _write_half(self, seq):
+        key, is_segment = self._next_key(seq)
+        start = (seq % 2) * self.half_size
+        self._data[start:start + self.half_size] = self._half_counts(key)
+        self._written_seq = seq
+        # Only steady contents may be rewritten by a later set_amplitude
+        self._written_key = None if is_segment else key
+
+    def _run(self):
+        half_time = self.half_size / float(self.rate)
+        poll_interval = max(min(half_time / 4, 0.05), 0.001)
+        lead = int(_MIN_LEAD_TIME * self.rate)
+        total = 0
+        last_count = 0
+        while not self._stop_requested.wait(poll_interval):
+            _, cur_count, _ = ul.get_status(self.board_num, FunctionType.AOFUNCTION)
+            # cur_count is a 32-bit value that eventually rolls over
+            total += (cur_count - last_count) & 0xFFFFFFFF
+            last_count = cur_count
+
+            playing = total // self.half_size
+            with self._lock:
+                if playing > self._last_segment_seq and not self._segments:
+                    self._queue_done.set()
+            if self._written_seq < playing:
+                # The output reached halves that were never written. They
+                # repeat older contents, but still use up their share of the
+                # queued segments, so that the later segments start at the
+                # samples that the lengths returned by queue_segment imply.
+                self.late_halves += playing - self._written_seq
+                for seq in range(self._written_seq + 1, playing + 1):
+                    self._next_key(seq)
+                self._written_seq = playing
+                self._written_key = None
+            next_seq = playing + 1
+            if self.half_size - total % self.half_size < lead:
+                continue
+
+            # Write the next half, or rewrite it if it holds steady contents
+            # that a set_amplitude or queue_segment call has since replaced.
+            # Both are read under the lock that those calls hold.
+            with self._lock:
+                queued = bool(self._segments)
+                steady = self._steady
+            if not (self._written_seq < next_seq or self._written_key is not None and (
+                    queued or self._written_key != steady)):
+                continue
+            self._write_half(next_seq)
+
+            # Check that the output did not reach the half while it was
+            # being written
+            _, cur_count, _ = ul.get_status(self.board_num, FunctionType.AOFUNCTION)
+            total += (cur_count - last_count) & 0xFFFFFFFF
+            last_count = cur_count
+            if total // self.half_size >= next_seq:
+                self.torn_writes += 1
@@ -0,0 +1,246 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Waveform synthesis for analog output buffers.
+
+A waveform is described by a shape, a frequency and the output sample rate. :func:`period_table`
+computes the shortest table of samples that holds a whole number of cycles of it, so that the
+table can be repeated without a discontinuity, and :func:`counts_table` converts one to D/A
+counts. Both are cached, so that filling a buffer usually comes down to :func:`tile`, which copies
+the table into the buffer with vectorized copies.
+
+:class:`WaveformSynth` generates consecutive segments of a waveform, keeping the phase continuous
+across amplitude, frequency and shape changes.
+
+Built-in shapes, each normalized to an amplitude of 1 and starting at phase 0:
+
+============  ======================================================================
+sine          sin(2 pi phase)
+square        1 for the first half of the cycle, -1 for the second
+triangle      0 to 1 to -1 and back to 0
+sawtooth      0 to 1, jump to -1, back to 0
+ramp          0 to 1, then jump back to 0 (unipolar)
+============  ======================================================================
+
+Other shapes can be added with :func:`register_shape`.
+
+This module requires NumPy.
+"""
+import collections
+import functools
+from fractions import Fraction
+
+import numpy as np
+
+from mcculw import ul
+
+# Longest table period_table will build, in samples. Frequencies that do
+# not fit a whole number of cycles in this many samples are rounded.
+MAX_TABLE_LENGTH = 1 << 20
+
+PeriodTable = collections.namedtuple("PeriodTable", "samples cycles frequency")
+PeriodTable.__doc__ = """A table of samples holding a whole number of cycles of a waveform.
+
+samples : numpy.ndarray
+    The samples, normalized to an amplitude of 1. Read-only.
+cycles : int
+    The number of cycles in the table.
+frequency : float
+    The frequency the table actually produces at the sample rate it was built for, which differs
+    from the requested frequency only if that could not fit in MAX_TABLE_LENGTH samples.
+"""
+
+
+def _sine(phase):
+    return np.sin(2 * np.pi * phase)
+
+
+def _square(phase):
+    return np.where(phase < 0.5, 1.0, -1.0)
+
+
+def _triangle(phase):
+    return 1 - 2 * np.abs(2 * ((phase + 0.25) % 1) - 1)
+
+
+def _sawtooth(phase):
+    return 2 * ((phase + 0.5) % 1) - 1
+
+
+def _ramp(phase):
+    return phase
+
+
+_shapes = {
+    'sine': _sine,
+    'square': _square,
+    'triangle': _triangle,
+    'sawtooth': _sawtooth,
+    'ramp': _ramp,
+}
+
+
+def register_shape(name, samples):
+    """Adds an arbitrary shape, given as one cycle of samples, under name. Tables are built from it
+    by linear interpolation, so samples can have any length.
+
+    Registering a name again replaces the shape and clears the table caches.
+    """
+    samples = np.array(samples, np.float64)
+    positions = np.arange(len(samples)) / float(len(samples))
+    _shapes[name] = lambda phase: np.interp(phase, positions, samples, period=1.0)
+    period_table.cache_clear()
+    _counts_table.cache_clear()
+
+
+def shapes():
+    """Returns the names of the available shapes."""
+    return sorted(_shapes)
+
+
+@functools.lru_cache(maxsize=64)
+def period_table(shape, frequency, rate):
+    """Returns the :class:`PeriodTable` of shape at frequency, for output at rate samples per
+    second. Tables are cached.
+
+    Raises
+    ------
+    ValueError
+        If the shape is unknown or the frequency is not between 0 and half of rate.
+    """
+    if shape not in _shapes:
+        raise ValueError('Unknown waveform shape: {}'.format(shape))
+    if not 0 < frequency <= rate / 2:
+        raise ValueError('frequency must be greater than 0 and at most rate / 2')
+    # Samples per cycle as a fraction: the numerator is the table length and
+    # the denominator the number of cycles it holds
+    samples_per_cycle = Fraction(rate) / Fraction(frequency)
+    if samples_per_cycle.numerator > MAX_TABLE_LENGTH:
+        samples_per_cycle = samples_per_cycle.limit_denominator(
+            max(MAX_TABLE_LENGTH // int(samples_per_cycle + 1), 1))
+    length = samples_per_cycle.numerator
+    cycles = samples_per_cycle.denominator
+    phase = (np.arange(length) * cycles % length) / float(length)
+    samples = _shapes[shape](phase)
+    samples.flags.writeable = False
+    return PeriodTable(samples, cycles, float(rate * cycles) / length)
+
+
+def counts_table(board_num, shape, frequency, rate, ul_range, amplitude, offset=0.0,
+                 resolution=None):
+    """Returns the samples of :func:`period_table` scaled to ``offset + amplitude * samples``
+    volts and converted to D/A counts with :func:`.from_eng_units_array`. Tables are cached;
+    the returned array is read-only.
+    """
+    return _counts_table(board_num, shape, frequency, rate, ul_range, float(amplitude),
+                         float(offset), resolution)
+
+
+@functools.lru_cache(maxsize=256)
+def _counts_table(board_num, shape, frequency, rate, ul_range, amplitude, offset, resolution):
+    table = period_table(shape, frequency, rate)
+    counts = ul.from_eng_units_array(board_num, ul_range, offset + amplitude * table.samples,
+                                     resolution)
+    counts.flags.writeable = False
+    return counts
+
+
+def tile(table, out, start=0):
+    """Fills out with table repeated, beginning at index start of the table.
+
+    Returns
+    -------
+    int
+        The table index of the sample that would follow the end of out
+    """
+    length = len(table)
+    count = len(out)
+    start %= length
+    head = min(length - start, count)
+    out[:head] = table[start:start + head]
+    if head == count:
+        return (start + head) % length
+    # The rest of out starts at the beginning of the table: whole tables are
+    # copied with one broadcast copy, then the remainder
+    rest = out[head:]
+    whole = len(rest) // length * length
+    rest[:whole].reshape(-1, length)[:] = table
+    rest[whole:] = table[:len(rest) - whole]
+    return len(rest) - whole
+
+
+class WaveformSynth(object):
+    """Generates consecutive segments of a waveform in D/A counts for one channel, keeping the
+    phase continuous across changes of shape, frequency, amplitude and offset: each segment starts
+    at the phase where the previous one ended.
+
+    Parameters
+    ----------
+    board_num : int
+        The number associated with the board when it was installed with InstaCal or created
+        with :func:`.create_daq_device`.
+    rate : int
+        The output sample rate in samples per second.
+    ul_range : ULRange
+        The D/A range.
+    resolution : int, optional
+        The D/A resolution in bits. By default it is read from the device.
+
+    Attributes
+    ----------
+    phase : float
+        The phase of the next sample, as a fraction of a cycle.
+    """
+    def __init__(self, board_num, rate, ul_range, resolution=None):
+        self.board_num = board_num
+        self.rate = rate
+        self.ul_range = ul_range
+        if resolution is None:
+            from mcculw.device_info import AoInfo
+            resolution = AoInfo(board_num).resolution
+        self.resolution = resolution
+        self.dtype = np.dtype(np.uint16 if resolution <= 16 else np.uint32)
+        self.phase = 0.0
+
+    def generate(self, num_samples, shape, frequency, amplitude, offset=0.0, out=None):
+        """Returns the next num_samples samples of ``offset + amplitude * shape`` at frequency,
+        in counts.
+
+        Parameters
+        ----------
+        num_samples : int
+            The number of samples to generate.
+        shape : str
+            One of :func:`shapes`.
+        frequency : float
+            The frequency in Hz.
+        amplitude : float
+            The amplitude in volts.
+        offset : float, optional
+            The offset in volts. Defaults to 0.
+        out : numpy.ndarray, optional
+            An array of num_samples counts to fill, such as a view of part of an AO buffer
+            returned by :func:`.buffer_as_ndarray`. By default a new array is returned.
+        """
+        if out is None:
+            out = np.empty(num_samples, self.dtype)
+        table = period_table(shape, frequency, self.rate)
+        counts = counts_table(self.board_num, shape, frequency, self.rate, self.ul_range,
+                              amplitude, offset, self.resolution)
+        length = len(counts)
+        # The table holds cycles cycles, so its index i is at phase
+        # i * cycles / length; find the index nearest to the current phase
+        step = int(round(self.phase * length)) % length
+        start = step * _mod_inverse(table.cycles, length) % length
+        end = tile(counts, out[:num_samples], start)
+        self.phase = (end * table.cycles % length) / float(length)
+        return out
+
+    def reset(self, phase=0.0):
+        """Sets the phase of the next sample."""
+        self.phase = phase % 1.0
+
+
+def _mod_inverse(value, modulus):
+    # value and modulus are coprime: period_table reduces their fraction
+    return pow(value, -1, modulus) if modulus > 1 else 0
@@ -47,12 +47,14 @@ setup(
 
         # Specify the Python versions you support here. In particular, ensure
         # that you indicate whether you support Python 2, Python 3 or both.
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
         'Programming Language :: Python :: 3.8',
     ],
 
+    # mcculw.waveforms uses pow() with a negative exponent and a modulus
+    python_requires='>=3.8',
+
     # What does your project relate to?
     keywords='development mcc daq data acquisition',
 
@@ -71,11 +73,7 @@ setup(
     # your project is installed. For an analysis of "install_requires" vs pip's
     # requirements files see:
     # https://packaging.python.org/en/latest/requirements.html
-    install_requires=[
-        'aenum;python_version<"3.6"',
-        'enum34;python_version<"3.4"',
-        'future;python_version<"3.0"',
-        ],
+    install_requires=[],
 
     # List additional groups of dependencies here (e.g. development
     # dependencies). You can install these using the following syntax,
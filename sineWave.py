@@ -143,9 +143,8 @@ def sineWave(
         ):
     t = np.linspace(0, 1, num_samples, endpoint=True)
     sine_wave = amplitude * np.sin(2*np.pi * frequency * t)
-    for i, point in enumerate(sine_wave):
-        raw_value = ul.from_eng_units(board_num, ao_range, point)
-        buffer[i] = raw_value
+    raw_values = ul.from_eng_units_array(board_num, ao_range, sine_wave)
+    np.ctypeslib.as_array(buffer, shape=raw_values.shape)[:] = raw_values
 
 def squareWave(
         board_num,
@@ -158,9 +157,8 @@ def squareWave(
         ):
     t = np.linspace(0, duration, int(duration*num_samples), endpoint=True)
     sine_wave = amplitude * np.sign(np.sin(2*np.pi * frequency * t))
-    for i, point in enumerate(sine_wave):
-        raw_value = ul.from_eng_units(board_num, ao_range, point)
-        buffer[i] = raw_value
+    raw_values = ul.from_eng_units_array(board_num, ao_range, sine_wave)
+    np.ctypeslib.as_array(buffer, shape=raw_values.shape)[:] = raw_values
 
 def add_example_data(board_num, data_array, ao_range, num_chans, rate,
                      points_per_channel):
@@ -3,38 +3,223 @@
 '''
 
 from mcculw import ul
-from mcculw.enums import InterfaceType
+from mcculw.enums import ErrorCode, InterfaceType
 from mcculw.device_info import DaqDeviceInfo
+from mcculw import waveforms
 import numpy as np
-from typing import Dict, List
+from typing import Dict, Optional, Sequence, Union
 from ctypes import POINTER
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
 
 
-def configure_devices() -> Dict:
+DEFAULT_NET_PORT = 54211
+BOARD_CACHE_VERSION = 1
+MAX_BOARD_NUM = 99
+
+logger = logging.getLogger(__name__)
+
+
+def discover_devices(
+        interface_type:InterfaceType=InterfaceType.USB,
+        hosts:Sequence[str]=(),
+        port:int=DEFAULT_NET_PORT,
+        timeout_ms:int=1000,
+        max_workers:int=8) -> Dict[str, ul.DaqDeviceDescriptor]:
+    '''
+        Find DAQ devices, keyed by unique_id.
+
+        The inventory of interface_type and one get_net_device_descriptor probe per host (for
+        Ethernet DAQs on other subnets) run concurrently on a thread pool, so absent hosts cost
+        one timeout_ms in total rather than one each. Hosts that do not answer are left out.
+    '''
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        inventory = pool.submit(ul.get_daq_device_inventory, interface_type)
+        probes = [pool.submit(_probe_host, host, port, timeout_ms) for host in hosts]
+        found = {device.unique_id: device for device in inventory.result()}
+        for probe in probes:
+            device = probe.result()
+            if device is not None:
+                found.setdefault(device.unique_id, device)
+    return found
+
+
+def _probe_host(host:str, port:int, timeout_ms:int) -> Optional[ul.DaqDeviceDescriptor]:
+    try:
+        return ul.get_net_device_descriptor(host, port, timeout_ms)
+    except ul.ULError:
+        return None
+
+
+def register_devices(
+        descriptors:Dict[str, ul.DaqDeviceDescriptor],
+        board_numbers:Optional[Dict[str, int]]=None,
+        max_workers:int=8) -> Dict[str, int]:
+    '''
+        Create DAQ devices in the UL concurrently.
+
+        descriptors maps unique_id to descriptor, as returned by discover_devices. Devices listed
+        in board_numbers (unique_id -> board number) keep that number, devices already created
+        keep theirs, and the others get the lowest numbers that are not taken. A device whose
+        number turns out to be used by another device (BOARDNUMINUSE) is created again with the
+        next free number. Devices that fail to be created otherwise are left out.
+
+        Return:
+            dict of unique_id -> board number of the created devices.
+    '''
+    board_numbers = dict(board_numbers or {})
+    assignments = {}
+    for unique_id, descriptor in descriptors.items():
+        board_num = ul.get_board_number(descriptor)
+        if board_num >= 0:
+            board_numbers[unique_id] = board_num
+        elif unique_id in board_numbers:
+            assignments[unique_id] = board_numbers[unique_id]
+
+    taken = set(board_numbers.values())
+    free = (board_num for board_num in range(MAX_BOARD_NUM + 1) if board_num not in taken)
+    for unique_id in descriptors:
+        if unique_id not in board_numbers:
+            assignments[unique_id] = next(free, None)
+
+    created = {unique_id: board_numbers[unique_id] for unique_id in descriptors
+               if unique_id in board_numbers and unique_id not in assignments}
+    in_use = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {unique_id: pool.submit(ul.create_daq_device, board_num, descriptors[unique_id])
+                   for unique_id, board_num in assignments.items() if board_num is not None}
+        for unique_id, future in futures.items():
+            try:
+                future.result()
+            except ul.ULError as e:
+                if e.errorcode == ErrorCode.BOARDNUMINUSE:
+                    in_use.append(unique_id)
+                continue
+            created[unique_id] = assignments[unique_id]
+
+    # Numbers taken by devices created since the numbers were saved: retry
+    # one at a time, since the free numbers are handed out in order
+    for unique_id in in_use:
+        for board_num in free:
+            try:
+                ul.create_daq_device(board_num, descriptors[unique_id])
+            except ul.ULError as e:
+                if e.errorcode == ErrorCode.BOARDNUMINUSE:
+                    continue
+                break
+            created[unique_id] = board_num
+            break
+    return created
+
+
+def connect_devices(
+        hosts:Sequence[str]=(),
+        cache_path:Optional[str]=None,
+        interface_type:InterfaceType=InterfaceType.USB,
+        port:int=DEFAULT_NET_PORT,
+        timeout_ms:int=1000,
+        max_workers:int=8,
+        refresh:bool=False) -> Dict[str, int]:
+    '''
+        Create every DAQ device, keyed by unique_id, reusing the board numbers saved at cache_path.
+
+        Warm start: the devices in the cache are created straight from their saved descriptors,
+        and if all of them are created, discovery is skipped, so devices attached since the cache
+        was written are not found. Pass refresh=True to run discovery anyway. Otherwise
+        discover_devices runs for the rest and new devices are registered. The cache is rewritten
+        when devices are added or get a new board number (because theirs was used by another
+        device). Devices missing from this run keep their board numbers in the cache.
+
+        Return:
+            dict of unique_id -> board number.
+    '''
+    ul.ignore_instacal()
+    cache = _read_board_cache(cache_path) if cache_path else {}
+    board_numbers = {unique_id: entry['board_num'] for unique_id, entry in cache.items()}
+    created = {}
+    if cache:
+        descriptors = {unique_id: ul.DaqDeviceDescriptor.from_buffer_copy(
+                           bytes.fromhex(entry['descriptor']))
+                       for unique_id, entry in cache.items()}
+        created = register_devices(descriptors, board_numbers, max_workers)
+
+    found = {}
+    if refresh or not cache or len(created) < len(cache):
+        found = discover_devices(interface_type, hosts, port, timeout_ms, max_workers)
+        missing = {unique_id: device for unique_id, device in found.items()
+                   if unique_id not in created}
+        created.update(register_devices(missing, {**board_numbers, **created}, max_workers))
+
+    if cache_path:
+        changed = False
+        for unique_id, board_num in created.items():
+            entry = cache.get(unique_id)
+            if entry is None:
+                device = found[unique_id]
+                cache[unique_id] = {'board_num': board_num,
+                                    'product_name': device.product_name,
+                                    'descriptor': bytes(device).hex()}
+                changed = True
+            elif entry['board_num'] != board_num:
+                entry['board_num'] = board_num
+                changed = True
+        if changed:
+            _write_board_cache(cache_path, cache)
+    return created
+
+
+def _read_board_cache(path:str) -> Dict[str, dict]:
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (IOError, ValueError):
+        return {}
+    if cache.get('version') != BOARD_CACHE_VERSION:
+        return {}
+    return cache.get('boards', {})
+
+
+def _write_board_cache(path:str, boards:Dict[str, dict]):
+    with open(path, 'w') as f:
+        json.dump({'version': BOARD_CACHE_VERSION, 'boards': boards}, f, indent=2)
+
+
+def configure_devices(
+        hosts:Sequence[str]=(),
+        cache_path:Optional[str]=None,
+        refresh:bool=False) -> Dict:
     '''
         Assign DAQ's to device nubers.
 
         MCCLW Python interface (ul) assigns connected devices to board numbers.
         ex/ USB-3101FS (2128658) - Device ID = 224 -> referenced with board num 0.
 
-        DAQ Devices can then be commanded with board number as reference.
+        DAQ Devices can then be commanded with board number as reference. Devices are found and
+        created with connect_devices; pass a cache_path to keep board numbers across runs and
+        skip discovery on warm restarts. A warm restart does not find devices attached since the
+        cache was written: pass refresh=True to discover them too.
+
+        The assignments are logged at INFO level to the tdy_utils.utils_daq logger.
 
         Return:
-            list of device names to keep track of assigned board num as index in list.
+            dict of device name -> board num. The name is the product name, followed by the
+            unique_id when several devices share a product name.
     '''
-    ul.ignore_instacal()
-    devices:List[ul.DaqDeviceDescriptor] = ul.get_daq_device_inventory(InterfaceType.USB)
+    devices = connect_devices(hosts, cache_path, refresh=refresh)
 
     if not devices:
-        raise Exception("ERROR: No USB DAQ devices connected")
+        raise Exception("ERROR: No DAQ devices connected")
 
+    names = {unique_id: ul.get_board_name(board_num) for unique_id, board_num in devices.items()}
     connected_devices = {}
-    print(f"\nConfiguring {len(devices)} USB DAQs. ")
-    for board_num, device in enumerate(devices):
-        print(f"Board Number: {board_num} | {device.product_name}")
-        connected_devices[device.product_name] = board_num
-        ul.create_daq_device(board_num, device)
-    print()
+    logger.info("Configuring %d DAQs", len(devices))
+    for unique_id, board_num in sorted(devices.items(), key=lambda item: item[1]):
+        name = names[unique_id]
+        if list(names.values()).count(name) > 1:
+            name = f"{name} ({unique_id})"
+        logger.info("Board Number: %d | %s", board_num, name)
+        connected_devices[name] = board_num
 
     return connected_devices
 
@@ -42,27 +227,34 @@ def configure_devices() -> Dict:
 def waveform(
         waveform_type:str,
         daq:DaqDeviceInfo,
-        buffer:POINTER,
+        buffer:Union[POINTER, np.ndarray],
         duration:int,
         num_samples:int,
         amplitude:float,
         frequency:int):
     '''
-        Adjust waveform in memory. Currently parameter waveform_type only supports 'sine' and 'square'.
+        Adjust waveform in memory. waveform_type is one of mcculw.waveforms.shapes():
+        'sine', 'square', 'triangle', 'sawtooth', 'ramp' or a shape added with
+        mcculw.waveforms.register_shape.
+
+        One period table per waveform is converted to counts and cached, so refilling the
+        buffer with a waveform used before only tiles the cached table into it.
     '''
     if not daq.supports_analog_output:
-        raise f"[ERROR] Daq does not support Analog Output: {daq.product_name}"
-    
-    t = np.linspace(0, duration, num_samples, endpoint=True)
-    if waveform_type == "sine":
-        wave = amplitude * np.sin(2*np.pi * frequency * t)
-    elif waveform_type == "square":
-        wave = amplitude * np.sign(np.sin(2*np.pi * frequency * t))
-    else:
-        raise "[ERROR] Waveform only supports string 'sine' and 'square'. \n"
+        raise ValueError(f"[ERROR] Daq does not support Analog Output: {daq.product_name}")
+    if waveform_type not in waveforms.shapes():
+        raise ValueError(f"[ERROR] Waveform must be one of {waveforms.shapes()}.")
 
-    for i, sample in enumerate(wave):
-        raw_value = ul.from_eng_units(daq.board_num, daq.get_ai_info().supported_ranges[0], sample)
-        buffer[i] = raw_value
+    # Pass a DaqDeviceInfo created with cached=True so that the range probe
+    # runs once, not on every refill
+    ao_info = daq.get_ao_info()
+    counts = waveforms.counts_table(daq.board_num, waveform_type, frequency,
+                                    num_samples / duration, ao_info.supported_ranges[0],
+                                    amplitude, resolution=ao_info.resolution)
+    if isinstance(buffer, np.ndarray):
+        # View from ul.buffer_as_ndarray: write straight into the AO buffer
+        waveforms.tile(counts, buffer[:num_samples])
+    else:
+        waveforms.tile(counts, np.ctypeslib.as_array(buffer, shape=(num_samples,)))
 
 # configure_devices()
\ No newline at end of file
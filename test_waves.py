@@ -1,6 +1,8 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import pandas as pd
+import os
+from mcculw.recorder import ColumnarRecording, convert_csv
+from mcculw.rolling_stats import RollingStats
 
 if __name__ == "__main__":
     f=10
@@ -12,11 +14,17 @@ if __name__ == "__main__":
     
     FILE_NUM = 6
     n = 200
-    data = pd.read_csv(f'scan_data_{FILE_NUM}.csv')
-    data_avg = data['Channel 0'].rolling(window=n).mean().dropna()
+    path = f'scan_data_{FILE_NUM}.mccol'
+    if not os.path.exists(path):
+        # Convert the CSV once; later runs map the binary file directly.
+        # float64 keeps the values pandas would read from the CSV.
+        convert_csv(f'scan_data_{FILE_NUM}.csv', path, dtype=np.float64)
+    recording = ColumnarRecording(path)
+    # Same values as pandas rolling(window=n).mean().dropna(), in one pass
+    data_avg = RollingStats(n).update(recording.window(channels=[0]).data).mean[n - 1:, 0]
 
     plt.figure(figsize=(10, 4))
-    plt.plot(data_avg, marker='o')
+    plt.plot(np.arange(n - 1, n - 1 + len(data_avg)), data_avg, marker='o')
     plt.title('BV Curve')
     plt.xlabel(f'Index Every {n} steps')
     plt.ylabel('Intensity')
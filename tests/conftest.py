@@ -0,0 +1,23 @@
+import os
+
+# The tests run on the simulated backend, also on Windows
+os.environ['MCCULW_BACKEND'] = 'sim'
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def sim(monkeypatch):
+    """A simulator with a virtual clock and a SIM-DAQ created as board 0."""
+    from mcculw import ul
+    from mcculw.enums import InterfaceType
+    from mcculw.simulator import DEFAULT_PROFILES, SIM_DAQ, VirtualClock
+
+    library = ul.get_backend()
+    monkeypatch.setattr(library, 'clock', VirtualClock())
+    library.reset()
+    library.set_profiles([SIM_DAQ])
+    ul.create_daq_device(0, ul.get_daq_device_inventory(InterfaceType.USB)[0])
+    yield library
+    library.reset()
+    library.set_profiles(DEFAULT_PROFILES)
@@ -0,0 +1,98 @@
+import threading
+
+import numpy as np
+import pytest
+
+from mcculw import ul
+from mcculw.enums import (DigitalIODirection, DigitalPortType, ErrorCode, InterfaceType,
+                          ScanOptions, ULRange)
+from mcculw.simulator import USB_202
+
+
+@pytest.fixture(autouse=True)
+def rejected(monkeypatch):
+    # The scratch buffers of earlier tests were freed by the simulator reset
+    monkeypatch.setattr(ul, '_scratch', threading.local())
+    scans = set()
+    monkeypatch.setattr(ul, '_batch_scan_rejected', scans)
+    return scans
+
+
+@pytest.fixture
+def signals(sim):
+    for channel in range(4):
+        sim.set_signal(0, channel, lambda t, channel=channel: np.full(len(t), 0.1 * channel))
+    return sim
+
+
+def test_queued_v_in_many(signals):
+    volts = ul.v_in_many(0, [3, 1, 2], [ULRange.BIP10VOLTS, ULRange.BIP1VOLTS,
+                                         ULRange.BIP10VOLTS], scan=True)
+    np.testing.assert_allclose(volts, [0.3, 0.1, 0.2], atol=1e-3)
+    # The queue is disabled again afterwards
+    np.testing.assert_allclose(ul.v_in_many(0, [0, 1], ULRange.BIP10VOLTS, scan=True),
+                               [0.0, 0.1], atol=1e-3)
+
+
+def test_a_in_many_fills_out(signals):
+    out = np.zeros(3, np.uint16)
+    assert ul.a_in_many(0, [1, 2, 3], ULRange.BIP10VOLTS, out=out) is out
+    expected = [ul.a_in(0, channel, ULRange.BIP10VOLTS) for channel in (1, 2, 3)]
+    np.testing.assert_array_equal(out, expected)
+    np.testing.assert_array_equal(ul.a_in_many(0, [1, 2, 3], ULRange.BIP10VOLTS, scan=False),
+                                  expected)
+
+
+def test_rejected_scan_falls_back(sim, rejected):
+    # The USB-202 has no channel/gain queue
+    sim.set_profiles([USB_202])
+    ul.create_daq_device(1, ul.get_daq_device_inventory(InterfaceType.USB)[0])
+    sim.set_signal(1, 0, lambda t: np.full(len(t), 1.0))
+    sim.set_signal(1, 1, lambda t: np.full(len(t), 2.0))
+    np.testing.assert_allclose(ul.v_in_many(1, [1, 0], ULRange.BIP10VOLTS), [2.0, 1.0],
+                               atol=1e-2)
+    assert rejected == {(1, True)}
+    # Consecutive channels can still be scanned
+    np.testing.assert_allclose(ul.v_in_many(1, [0, 1], ULRange.BIP10VOLTS), [1.0, 2.0],
+                               atol=1e-2)
+    assert rejected == {(1, True)}
+    with pytest.raises(ul.ULError):
+        ul.v_in_many(1, [1, 0], ULRange.BIP10VOLTS, scan=True)
+
+
+def test_c_in_many_and_d_in_many(sim):
+    sim.set_counter_signal(0, 2, lambda t: np.floor(t * 1000))
+    sim.advance(0.0075)
+    np.testing.assert_array_equal(ul.c_in_many(0, [0, 2]), [0, 7])
+    ul.d_config_port(0, DigitalPortType.AUXPORT, DigitalIODirection.OUT)
+    ul.d_out(0, DigitalPortType.AUXPORT, 0x5A)
+    np.testing.assert_array_equal(ul.d_in_many(0, [DigitalPortType.AUXPORT] * 2), [0x5A] * 2)
+
+
+def test_transient_errors_are_raised(signals, rejected, monkeypatch):
+    monkeypatch.setitem(ul._cbw.__dict__, 'cbAInScan', lambda *args: ErrorCode.DEADDEV)
+    with pytest.raises(ul.ULError) as e:
+        ul.v_in_many(0, [0, 1], ULRange.BIP10VOLTS)
+    assert e.value.errorcode == ErrorCode.DEADDEV
+    assert rejected == set()
+
+
+def test_user_queue_is_kept(signals, monkeypatch):
+    monkeypatch.setattr(ul, '_user_queues', set())
+    ul.a_load_queue(0, [2, 3], [ULRange.BIP10VOLTS] * 2, 2)
+    # Read channel by channel, without disabling the queue
+    np.testing.assert_allclose(ul.v_in_many(0, [0, 1], ULRange.BIP10VOLTS), [0.0, 0.1],
+                               atol=1e-3)
+    with pytest.raises(ValueError):
+        ul.v_in_many(0, [0, 1], ULRange.BIP10VOLTS, scan=True)
+    memhandle = ul.scaled_win_buf_alloc(2)
+    try:
+        ul.a_in_scan(0, 0, 1, 2, 1000, ULRange.BIP10VOLTS, memhandle, ScanOptions.SCALEDATA)
+        np.testing.assert_allclose(ul.buffer_as_ndarray(memhandle, 2, np.float64), [0.2, 0.3],
+                                   atol=1e-3)
+    finally:
+        ul.win_buf_free(memhandle)
+
+    ul.a_load_queue(0, [], [], 0)
+    np.testing.assert_allclose(ul.v_in_many(0, [3, 1], ULRange.BIP10VOLTS, scan=True),
+                               [0.3, 0.1], atol=1e-3)
@@ -0,0 +1,89 @@
+import gc
+
+import numpy as np
+import pytest
+
+from mcculw import ul
+from mcculw.enums import ErrorCode
+
+
+@pytest.fixture
+def freed(monkeypatch):
+    # The memhandles released to the library
+    handles = []
+    free = ul._cbw.cbWinBufFree
+
+    def win_buf_free(memhandle):
+        handles.append(memhandle)
+        return free(memhandle)
+    monkeypatch.setitem(ul._cbw.__dict__, 'cbWinBufFree', win_buf_free)
+    return handles
+
+
+def test_views_alias_the_buffer():
+    memhandle = ul.win_buf_alloc_32(8)
+    first = ul.buffer_as_ndarray(memhandle, 8, np.uint32)
+    second = ul.buffer_as_ndarray(memhandle, 8, np.uint32)
+    first[3] = 123456
+    assert second[3] == 123456
+    data = (ul.c_ulong * 8)()
+    ul.win_buf_to_array_32(memhandle, data, 0, 8)
+    assert data[3] == 123456
+    del first, second
+    ul.win_buf_free(memhandle)
+
+
+def test_free_waits_for_the_last_view(freed):
+    memhandle = ul.win_buf_alloc(16)
+    data = ul.buffer_as_ndarray(memhandle, 16)
+    view = data[4:8]
+    other = ul.buffer_as_ndarray(memhandle, 16)
+    del data
+    ul.win_buf_free(memhandle)
+    assert freed == []
+    view[:] = 7
+    del other
+    gc.collect()
+    assert freed == []
+    del view
+    gc.collect()
+    assert freed == [memhandle]
+
+
+def test_free_without_views_is_immediate(freed):
+    memhandle = ul.win_buf_alloc(16)
+    ul.win_buf_free(memhandle)
+    assert freed == [memhandle]
+
+
+def test_rejects_unknown_dtype():
+    memhandle = ul.win_buf_alloc(4)
+    with pytest.raises(ValueError):
+        ul.buffer_as_ndarray(memhandle, 4, np.int8)
+    ul.win_buf_free(memhandle)
+
+
+def test_double_free_is_rejected(freed):
+    memhandle = ul.win_buf_alloc(16)
+    ul.win_buf_free(memhandle)
+    with pytest.raises(ul.ULError) as e:
+        ul.win_buf_free(memhandle)
+    assert e.value.errorcode == ErrorCode.BADPOINTER
+    assert freed == [memhandle, memhandle]
+
+
+def test_pending_free_is_rejected(freed):
+    memhandle = ul.win_buf_alloc(16)
+    data = ul.buffer_as_ndarray(memhandle, 16)
+    ul.win_buf_free(memhandle)
+    with pytest.raises(ul.ULError) as e:
+        ul.win_buf_free(memhandle)
+    assert e.value.errorcode == ErrorCode.BADPOINTER
+    with pytest.raises(ul.ULError) as e:
+        ul.buffer_as_ndarray(memhandle, 16)
+    assert e.value.errorcode == ErrorCode.BADPOINTER
+    assert freed == []
+    # The traceback holds the frames that saw the lease
+    del data, e
+    gc.collect()
+    assert freed == [memhandle]
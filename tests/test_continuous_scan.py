@@ -0,0 +1,163 @@
+import time
+import warnings
+
+import numpy as np
+import pytest
+
+from mcculw.continuous_scan import (BufferPlan, ContinuousScan, OverrunWarning, ScanCursor,
+                                    plan_buffer)
+from mcculw.enums import ULRange
+
+
+def _wait_until(condition, timeout=5.0):
+    # The drain thread polls in real time, whatever the simulator's clock
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_chunks_in_order(sim):
+    sim.set_signal(0, 0, lambda t: t)
+    sim.set_signal(0, 1, lambda t: -t)
+    chunks = []
+    with ContinuousScan(0, 0, 1, 1000, ULRange.BIP10VOLTS, chunk_size=50) as scan:
+        while len(chunks) < 6:
+            sim.advance(0.05)
+            chunk = scan.read(timeout=5.0)
+            assert chunk is not None
+            assert chunk.first_scan == chunk.first_sample // 2
+            chunks.append((chunk.data.copy(), chunk.first_sample))
+    assert [first_sample for _, first_sample in chunks] == list(range(0, 600, 100))
+    data = np.concatenate([data for data, _ in chunks])
+    times = np.arange(300) / 1000.0
+    np.testing.assert_allclose(data[:, 0], times, atol=1e-3)
+    np.testing.assert_allclose(data[:, 1], -times, atol=1e-3)
+    assert scan.overruns == 0
+    assert scan.dropped_chunks == 0
+
+
+def test_slow_consumer_drops_chunks(sim):
+    with ContinuousScan(0, 0, 0, 1000, ULRange.BIP10VOLTS, chunk_size=50, buffer_count=1000,
+                        num_blocks=4) as scan:
+        for step in range(1, 11):
+            sim.advance(0.05)
+            _wait_until(lambda: scan.chunks_published + scan.dropped_chunks == step)
+        assert scan.chunks_published == 4
+        assert scan.dropped_chunks == 6
+        assert scan.pending_chunks == 4
+        assert [scan.read().first_sample for _ in range(4)] == [0, 50, 100, 150]
+    assert scan.read() is None
+
+
+def test_overrun_resyncs(sim):
+    with ContinuousScan(0, 0, 0, 1000, ULRange.BIP10VOLTS, chunk_size=50,
+                        buffer_count=200) as scan:
+        sim.advance(0.05)
+        assert scan.read(timeout=5.0).first_sample == 0
+        # Four buffers' worth at once: the drain skips to the oldest intact
+        # chunk
+        sim.advance(0.8)
+        chunk = scan.read(timeout=5.0)
+        assert scan.overruns == 1
+        assert chunk.first_sample == 700
+        assert scan.lost_samples == 650
+
+
+def test_cursor_resync_after_overrun():
+    cursor = ScanCursor(1000, 100, 1000)
+    assert cursor.update(350)
+    assert cursor.ready == 3
+    cursor.advance()
+    # The scan overwrote the chunks from 100 to 350; the cursor skips to the
+    # oldest intact chunk, one chunk ahead of the scan
+    assert not cursor.update(1250)
+    assert cursor.drained == 400
+    assert cursor.index == 400
+    assert cursor.overruns == 1
+    assert cursor.lost_samples == 300
+    assert cursor.ready == 8
+    assert cursor.update(1300)
+
+
+def test_cursor_cur_count_rollover():
+    cursor = ScanCursor(1000, 100, 1000)
+    assert not cursor.update(0xFFFFFF00)
+    assert cursor.drained == 4294966200
+    assert cursor.ready == 8
+    for _ in range(8):
+        cursor.advance()
+    # cur_count wraps around to 0x100
+    assert cursor.update(0x100)
+    assert cursor.total == (1 << 32) + 0x100
+    assert cursor.overruns == 1
+    assert cursor.ready == 5
+    assert cursor.index == 4294967000 % 1000
+
+
+def test_plan_buffer_defaults():
+    # 50 ms chunks, and a second of data
+    assert plan_buffer(1000, 2) == BufferPlan(50, 2000)
+    # At least eight chunks
+    assert plan_buffer(10, 1, chunk_size=50) == (50, 400)
+    chunk_size, buffer_count = plan_buffer(1000, 1, buffer_count=300, chunk_size=100)
+    assert (chunk_size, buffer_count) == (100, 300)
+    with pytest.raises(ValueError):
+        plan_buffer(1000, 1, chunk_size=100, buffer_count=250)
+    with pytest.raises(ValueError):
+        plan_buffer(1000, 1, chunk_size=100, buffer_count=100)
+
+
+def test_plan_buffer_whole_packets():
+    # Four channels in 64-sample packets: chunks of a multiple of 16 scans
+    assert plan_buffer(1000, 4, packet_size=64) == (64, 4096)
+    # Three channels: the packets only line up every 64 scans
+    assert plan_buffer(1000, 3, chunk_size=65, packet_size=64) == (128, 3072)
+    assert plan_buffer(1000, 4, chunk_size=16, packet_size=64) == (16, 4032)
+
+
+def test_plan_buffer_from_drain_rate():
+    # 50 samples per chunk, drained at 10 kS/s during stalls of up to 0.25 s:
+    # 2 * (1000 * (0.25 + 0.005) + 50) = 610, in whole chunks
+    assert plan_buffer(1000, 1, drain_rate=10000) == (50, 650)
+    # Never less than four chunks
+    assert plan_buffer(1000, 1, drain_rate=1e9, max_stall=0) == (50, 200)
+    with pytest.raises(ValueError):
+        plan_buffer(1000, 1, drain_rate=1000)
+
+
+def test_telemetry_reports_occupancy(sim):
+    scan = ContinuousScan(0, 0, 0, 1000, ULRange.BIP10VOLTS, chunk_size=50, buffer_count=200,
+                          adaptive=True)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        with scan:
+            # 160 samples at once, above 75% of the buffer
+            sim.advance(0.16)
+            _wait_until(lambda: caught and scan.chunks_published == 3)
+            telemetry = scan.telemetry()
+    assert [warning.category for warning in caught] == [OverrunWarning]
+    assert telemetry.buffer_count == 200
+    assert telemetry.chunk_count == 50
+    assert telemetry.pending == 10
+    assert telemetry.high_water == 160
+    assert telemetry.fill == 0.8
+    assert telemetry.near_overruns == 1
+    assert telemetry.overruns == 0
+    assert telemetry.drain_rate > 0
+
+    # Twice the high-water mark, in whole chunks
+    assert scan.suggested_buffer_count() >= 350
+    assert scan.suggested_buffer_count() % 50 == 0
+    suggested = scan.suggested_buffer_count()
+    with scan:
+        assert scan.buffer_count == suggested
+        assert scan.telemetry().high_water == 0
+
+
+def test_suggested_buffer_count_after_overrun(sim):
+    with ContinuousScan(0, 0, 0, 1000, ULRange.BIP10VOLTS, chunk_size=50,
+                        buffer_count=200) as scan:
+        sim.advance(0.5)
+        _wait_until(lambda: scan.overruns == 1)
+    assert scan.suggested_buffer_count() >= 1000
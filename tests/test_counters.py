@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from mcculw import ul
+from mcculw.continuous_scan import ScanChunk
+from mcculw.counters import CounterAnalyzer
+
+
+@pytest.mark.parametrize('bits', [16, 32, 48, 64])
+def test_rollover_chunked_matches_whole(bits):
+    rng = np.random.default_rng(bits)
+    increments = rng.integers(0, 2 ** min(bits - 1, 40), size=(3000, 2), dtype=np.uint64)
+    totals = np.cumsum(increments, axis=0, dtype=np.uint64)
+    raw = totals & np.uint64((1 << bits) - 1) if bits < 64 else totals
+
+    whole = CounterAnalyzer(1000, 2, bits).update(raw)
+    np.testing.assert_array_equal(whole.deltas, increments)
+    np.testing.assert_array_equal(whole.totals, totals)
+
+    analyzer = CounterAnalyzer(1000, 2, bits)
+    parts = [analyzer.update(raw[start:start + 333]) for start in range(0, 3000, 333)]
+    np.testing.assert_array_equal(np.concatenate([p.deltas for p in parts]), increments)
+    np.testing.assert_allclose(np.concatenate([p.rates for p in parts]), increments * 1000.0)
+    np.testing.assert_array_equal(analyzer.totals, totals[-1])
+
+
+def test_multiple_counters_with_scan_chunks():
+    # Two counters counting 1 and 3 counts per sample, read in chunks of a
+    # two-channel scan: rates must not depend on the number of counters
+    num_scans = 1000
+    counts = np.column_stack([np.arange(1, num_scans + 1), 3 * np.arange(1, num_scans + 1)])
+    raw = (counts % (1 << 16)).astype(np.uint16)
+    analyzer = CounterAnalyzer(1000, num_counters=2, bits=16)
+    rates = []
+    for first_scan in range(0, num_scans, 250):
+        chunk = ScanChunk(raw[first_scan:first_scan + 250], first_scan * 2, 0.0, first_scan)
+        rates.append(analyzer.update(chunk.data, chunk.first_scan).rates)
+    np.testing.assert_allclose(np.concatenate(rates), [[1000.0, 3000.0]] * num_scans)
+    np.testing.assert_array_equal(analyzer.totals, counts[-1])
+
+
+def test_gap_spans_missing_samples():
+    analyzer = CounterAnalyzer(100, 2, 16)
+    analyzer.update(np.array([[10, 0], [20, 0]], np.uint16))
+    result = analyzer.update(np.array([[60000, 8]], np.uint16), 5)
+    np.testing.assert_allclose(result.rates, [[59980 * 100 / 4.0, 8 * 100 / 4.0]])
+
+
+def test_count_down_and_unknown_initial():
+    analyzer = CounterAnalyzer(100, bits=16, count_down=True, initial_count=65535)
+    assert analyzer.update([65530, 2, 65000]).deltas.ravel().tolist() == [5, 65528, 538]
+    result = CounterAnalyzer(100, bits=16, initial_count=None).update([5, 7])
+    assert result.deltas.ravel().tolist() == [0, 2]
+    assert np.isnan(result.rates[0, 0])
+
+
+def test_clear_on_read():
+    result = CounterAnalyzer(10, bits=16, clear_on_read=True).update([4, 0, 2])
+    assert result.deltas.ravel().tolist() == [4, 0, 2]
+    assert result.totals.ravel().tolist() == [4, 4, 6]
+    assert result.periods[1, 0] == np.inf
+
+
+def test_c_in_scan_rollovers(sim):
+    # 50 and 3 counts per sample: the first counter rolls over its 16 bits
+    # every 1311 samples
+    sim.set_counter_signal(0, 0, lambda t: np.round(t * 50000))
+    sim.set_counter_signal(0, 1, lambda t: np.round(t * 3000))
+    memhandle = ul.win_buf_alloc(6000)
+    try:
+        ul.c_in_scan(0, 0, 1, 6000, 1000, memhandle, 0)
+        raw = ul.buffer_as_ndarray(memhandle, 6000).reshape(-1, 2).copy()
+    finally:
+        ul.win_buf_free(memhandle)
+    assert raw[:, 0].max() > 60000
+    analyzer = CounterAnalyzer(1000, num_counters=2, bits=16, initial_count=None)
+    rates = np.concatenate([analyzer.update(raw[start:start + 500]).rates
+                            for start in range(0, 3000, 500)])
+    np.testing.assert_allclose(rates[1:], [[50000.0, 3000.0]] * 2999)
+    np.testing.assert_array_equal(analyzer.totals, [50 * 2999, 3 * 2999])
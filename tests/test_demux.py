@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from mcculw.demux import channels, daq_columns, demux, latest
+from mcculw.enums import ChannelType
+
+
+def test_contiguous_region_is_a_view():
+    buffer = np.arange(12)
+    rows = demux(buffer, 3, 3, 6)
+    np.testing.assert_array_equal(rows, [[3, 4, 5], [6, 7, 8]])
+    assert np.shares_memory(rows, buffer)
+
+
+def test_wrapping_region_is_copied():
+    buffer = np.arange(12)
+    rows = demux(buffer, 3, 9, 6)
+    np.testing.assert_array_equal(rows, [[9, 10, 11], [0, 1, 2]])
+    assert not np.shares_memory(rows, buffer)
+    out = np.empty((2, 3), buffer.dtype)
+    assert demux(buffer, 3, 21, 6, out) is out
+    np.testing.assert_array_equal(out, rows)
+
+
+def test_latest_after_wrap():
+    buffer = np.arange(12)
+    # 19 points collected: 6 complete scans, the last one ending at point 17
+    np.testing.assert_array_equal(latest(buffer, 3, 19, 3),
+                                  [[9, 10, 11], [0, 1, 2], [3, 4, 5]])
+    with pytest.raises(ValueError):
+        latest(buffer, 3, 19, 5)
+
+
+def test_channels_are_views():
+    rows = demux(np.arange(12), 3)
+    columns = channels(rows)
+    np.testing.assert_array_equal(columns[1], [1, 4, 7, 10])
+    assert all(np.shares_memory(column, rows) for column in columns)
+
+
+def test_daq_columns_recombine_counters():
+    counts = np.array([0x12345678, 0xFFFF0001], np.uint64)
+    wide = np.array([0x0123456789ABCDEF, 42], np.uint64)
+    rows = np.array([[(count >> np.uint64(shift)) & np.uint64(0xFFFF) for shift in (16, 0)]
+                     + [7, 0]
+                     + [(value >> np.uint64(16 * word)) & np.uint64(0xFFFF) for word in range(4)]
+                     for count, value in zip(counts, wide)], np.uint16)
+    chan_list = [1, 1, 0, 0, 2, 2, 2, 2]
+    chan_type_list = [ChannelType.CTR32HIGH, ChannelType.CTR32LOW,
+                      ChannelType.ANALOG | ChannelType.SETPOINT_ENABLE, ChannelType.PADZERO,
+                      ChannelType.CTRBANK0, ChannelType.CTRBANK1, ChannelType.CTRBANK2,
+                      ChannelType.CTRBANK3]
+    columns = daq_columns(rows, chan_list, chan_type_list)
+    assert [(column.chan_type, column.channel) for column in columns] == [
+        (ChannelType.CTR32LOW, 1), (ChannelType.ANALOG, 0), (ChannelType.CTRBANK0, 2)]
+    assert columns[0].data.dtype == np.uint32
+    np.testing.assert_array_equal(columns[0].data, counts)
+    np.testing.assert_array_equal(columns[1].data, [7, 7])
+    assert np.shares_memory(columns[1].data, rows)
+    assert columns[2].data.dtype == np.uint64
+    np.testing.assert_array_equal(columns[2].data, wide)
+    with pytest.raises(ValueError):
+        daq_columns(rows, chan_list[:-1], chan_type_list[:-1])
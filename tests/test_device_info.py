@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from mcculw import ul
+from mcculw.device_info import DaqDeviceInfo
+from mcculw.device_info.daq_device_info import PROFILE_VERSION
+from mcculw.device_info.info_cache import InfoCache
+from mcculw.enums import ULRange, InfoType, BoardInfo
+
+
+@pytest.fixture
+def queries(sim, monkeypatch):
+    # The get_config calls made by the info classes
+    calls = []
+    get_config = ul.get_config
+
+    def counting_get_config(*args):
+        calls.append(args)
+        return get_config(*args)
+    monkeypatch.setattr(ul, 'get_config', counting_get_config)
+    return calls
+
+
+def test_uncached_queries_every_access(queries):
+    ai_info = DaqDeviceInfo(0).get_ai_info()
+    del queries[:]
+    assert ai_info.num_chans == ai_info.num_chans == 8
+    assert len(queries) == 2
+
+
+def test_uncached_board_type_read_on_creation(queries):
+    ai_info = DaqDeviceInfo(0).get_ai_info()
+    board_type_query = (InfoType.BOARDINFO, 0, 0, BoardInfo.BOARDTYPE)
+    assert queries[-1] == board_type_query
+    del queries[:]
+    ai_info.analog_trig_resolution
+    assert board_type_query not in queries
+
+
+def test_cached_queries_once(queries):
+    info = DaqDeviceInfo(0, cached=True)
+    ai_info = info.get_ai_info()
+    ranges = ai_info.supported_ranges
+    del queries[:]
+    assert ai_info.num_chans == ai_info.num_chans == 8
+    assert ai_info.supported_ranges == ranges
+    assert len(queries) == 1
+    info.invalidate()
+    assert ai_info.num_chans == 8
+    assert len(queries) == 2
+
+
+def test_info_cache():
+    cache = InfoCache({'resolution': 16, 'ranges': [1, 0], 'ai': {'num_chans': 4}})
+    assert cache.get('resolution', lambda: pytest.fail('probed')) == 16
+    assert cache.get('ranges', lambda: None, ULRange) == [ULRange.BIP10VOLTS,
+                                                         ULRange.BIP5VOLTS]
+    assert cache.get('num_chans', lambda: 2) == 2
+    assert cache.child('ai').get('num_chans', lambda: 8) == 4
+    assert cache.child('ctr', 1).get('counter_num', lambda: 1) == 1
+    profile = cache.to_profile()
+    assert profile['num_chans'] == 2
+    assert profile['ranges'] == [1, 0]
+    assert profile['ctr'] == [{}, {'counter_num': 1}]
+    json.dumps(profile)
+    cache.clear()
+    assert cache.get('resolution', lambda: 12) == 12
+
+
+def test_profile_round_trip(queries, tmp_path):
+    path = str(tmp_path / 'profiles.json')
+    info = DaqDeviceInfo(0)
+    info.save_profile(path)
+    with open(path) as f:
+        contents = json.load(f)
+    assert contents['version'] == PROFILE_VERSION
+    assert list(contents['devices']) == [info.unique_id]
+
+    del queries[:]
+    loaded = DaqDeviceInfo.load_profile(0, path)
+    ai_info = loaded.get_ai_info()
+    assert loaded.product_name == 'SIM-DAQ'
+    assert ai_info.num_chans == 8
+    assert ai_info.resolution == 16
+    assert ai_info.supported_ranges == [ULRange.BIP10VOLTS, ULRange.BIP1VOLTS]
+    assert loaded.get_ctr_info().num_chans == 4
+    # Only the board type checks of the constructor
+    assert len(queries) == 2
+
+
+def test_profile_version_mismatch(queries, tmp_path):
+    path = str(tmp_path / 'profiles.json')
+    info = DaqDeviceInfo(0)
+    info.save_profile(path)
+    with open(path) as f:
+        contents = json.load(f)
+    contents['version'] = PROFILE_VERSION + 1
+    contents['devices'][info.unique_id]['ai']['num_chans'] = 99
+    with open(path, 'w') as f:
+        json.dump(contents, f)
+
+    # The profile is ignored, and the values are read from the device
+    loaded = DaqDeviceInfo.load_profile(0, path)
+    assert loaded.get_ai_info().num_chans == 8
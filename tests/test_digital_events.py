@@ -0,0 +1,55 @@
+import numpy as np
+
+from mcculw import ul
+from mcculw.digital_events import EdgeDetector
+from mcculw.enums import DigitalPortType
+
+# Bit 0 has a 2 sample pulse at 2, a rising edge at 7, a falling edge at 11
+# and a 1 sample pulse at 15; bit 1 has a 1 sample pulse at 5
+_WORDS = np.array([0, 0, 1, 1, 0, 2, 0, 1, 1, 1, 1, 0, 0, 0, 0, 1, 0, 0])
+
+
+def test_debounce_per_bit():
+    detector = EdgeDetector(num_bits=2, initial=0, debounce=[3, 0])
+    events = detector.update(_WORDS)
+    assert events['sample'].tolist() == [5, 6, 7, 11]
+    assert events['bit'].tolist() == [1, 1, 0, 0]
+    assert events['rising'].tolist() == [True, False, True, False]
+    np.testing.assert_array_equal(detector.edge_counts, [[1, 1], [1, 1]])
+    np.testing.assert_array_equal(detector.levels, [0, 0])
+
+
+def test_debounce_across_chunks():
+    whole = EdgeDetector(num_bits=2, initial=0, debounce=[3, 0]).update(_WORDS)
+    for size in (1, 4, 5):
+        detector = EdgeDetector(num_bits=2, initial=0, debounce=[3, 0], keep_log=True)
+        for start in range(0, len(_WORDS), size):
+            detector.update(_WORDS[start:start + size])
+        np.testing.assert_array_equal(detector.event_log(), whole)
+
+
+def test_immediate_edges_with_mask():
+    detector = EdgeDetector(num_bits=2, mask=0b01, initial=0)
+    events = detector.update(_WORDS)
+    assert events['sample'].tolist() == [2, 4, 7, 11, 15, 16]
+    assert set(events['bit'].tolist()) == {0}
+    assert events['rising'].tolist() == [True, False] * 3
+    np.testing.assert_array_equal(detector.edge_counts, [[3, 3], [0, 0]])
+
+
+def test_d_in_scan_edges(sim):
+    # Bit 3 toggles every 10 samples at 1 kHz
+    sim.set_digital_signal(0, lambda t: (np.round(t * 1000).astype(np.int64) // 10 % 2) << 3)
+    memhandle = ul.win_buf_alloc(200)
+    try:
+        ul.d_in_scan(0, DigitalPortType.AUXPORT, 200, 1000, memhandle, 0)
+        words = ul.buffer_as_ndarray(memhandle, 200).copy()
+    finally:
+        ul.win_buf_free(memhandle)
+    detector = EdgeDetector()
+    events = np.concatenate([detector.update(words[start:start + 32])
+                             for start in range(0, 200, 32)])
+    assert set(events['bit'].tolist()) == {3}
+    assert np.all(np.diff(events['sample']) == 10)
+    assert events['rising'].tolist() == [bool(word & 8) for word in words[events['sample']]]
+    assert detector.edge_counts[3].sum() == len(events) >= 18
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from mcculw import ul
+from mcculw.enums import ULRange
+
+# One LSB of a 16-bit converter on a 20 V span
+_LSB = 20.0 / 65535
+
+
+@pytest.mark.parametrize('volts, counts', [
+    (-10.0, 0),
+    (10.0, 65535),
+    # Zero is half way between counts 32767 and 32768, and rounds up
+    (0.0, 32768),
+    # The codes either side of the zero code
+    (-10.0 + 32767 * _LSB, 32767),
+    (-10.0 + 32769 * _LSB, 32769),
+    (-10.0 + _LSB, 1),
+    (10.0 - _LSB, 65534),
+    # Values outside of the range are clipped
+    (-12.0, 0),
+    (10.0 + _LSB, 65535),
+    (1e6, 65535),
+])
+def test_from_eng_units_array_reference_counts(volts, counts):
+    result = ul.from_eng_units_array(0, ULRange.BIP10VOLTS, [volts], 16)
+    assert result.dtype == np.uint16
+    assert result.tolist() == [counts]
+
+
+def test_from_eng_units_array_resolutions():
+    assert ul.from_eng_units_array(0, ULRange.UNI10VOLTS, [0.0, 5.0, 10.0], 16).tolist() == [
+        0, 32768, 65535]
+    assert ul.from_eng_units_array(0, ULRange.BIP5VOLTS, [-5.0, 0.0, 5.0], 12).tolist() == [
+        0, 2048, 4095]
+    counts = ul.from_eng_units_array(0, ULRange.BIP10VOLTS, [-10.0, 0.0, 10.0], 18)
+    assert counts.dtype == np.uint32
+    assert counts.tolist() == [0, 131072, 262143]
+
+
+def test_to_eng_units_array_reference_values():
+    volts = ul.to_eng_units_array(0, ULRange.BIP10VOLTS, [0, 1, 32768, 65535], 16)
+    assert volts.dtype == np.float32
+    np.testing.assert_allclose(volts, [-10.0, -10.0 + _LSB, 1.5259022e-4, 10.0], rtol=1e-6,
+                               atol=1e-7)
+    volts = ul.to_eng_units_array(0, ULRange.UNI10VOLTS, [0, 131072, 262143], 18)
+    assert volts.dtype == np.float64
+    np.testing.assert_allclose(volts, [0.0, 5.000019073, 10.0], rtol=1e-9)
+
+
+@pytest.mark.parametrize('resolution', [12, 16, 18])
+def test_round_trip(resolution):
+    counts = np.arange(0, 1 << resolution, 7)
+    volts = ul.to_eng_units_array(0, ULRange.BIP5VOLTS, counts, resolution)
+    np.testing.assert_array_equal(
+        ul.from_eng_units_array(0, ULRange.BIP5VOLTS, volts, resolution), counts)
@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from mcculw import instrumentation, ul
+from mcculw.enums import ErrorCode, ULRange
+
+
+@pytest.fixture
+def enabled(sim):
+    instrumentation.reset()
+    instrumentation.enable()
+    yield
+    instrumentation.disable()
+    instrumentation.reset()
+
+
+def _a_in_calls():
+    for _ in range(100):
+        ul.a_in(0, 0, ULRange.BIP10VOLTS)
+    with pytest.raises(ul.ULError):
+        ul.a_in(5, 0, ULRange.BIP10VOLTS)
+
+
+def test_enable_and_disable(sim):
+    assert not instrumentation.is_enabled()
+    instrumentation.enable()
+    try:
+        assert instrumentation.is_enabled()
+        assert ul._cbw.cbAIn.__name__ == 'cbAIn'
+        assert hasattr(ul._cbw.cbAIn, '__wrapped__')
+    finally:
+        instrumentation.disable()
+    assert not instrumentation.is_enabled()
+    # The backend functions are called directly again
+    assert not hasattr(ul._cbw.cbAIn, '__wrapped__')
+    instrumentation.reset()
+    ul.a_in(0, 0, ULRange.BIP10VOLTS)
+    assert instrumentation.snapshot().functions == {}
+
+
+def test_counts_calls_and_errors(enabled):
+    _a_in_calls()
+    stats = instrumentation.snapshot()
+    a_in = stats.functions['cbAIn']
+    assert a_in.calls == 101
+    assert a_in.errors == 1
+    assert a_in.error_codes == {ErrorCode.BADBOARD: 1}
+    assert sum(a_in.buckets) == 101
+    assert 0 < a_in.min_time <= a_in.p50 <= a_in.p90 <= a_in.p99 <= a_in.max_time
+    assert stats.raised == {ErrorCode.BADBOARD: 1}
+
+    instrumentation.reset()
+    assert instrumentation.snapshot().functions == {}
+    assert instrumentation.snapshot().raised == {}
+
+
+def test_to_prometheus(enabled):
+    _a_in_calls()
+    lines = instrumentation.to_prometheus().splitlines()
+    assert 'mcculw_ul_calls_total{function="cbAIn"} 101' in lines
+    assert ('mcculw_ul_call_errors_total{function="cbAIn",code="%d",error="BADBOARD"} 1'
+            % ErrorCode.BADBOARD) in lines
+    assert ('mcculw_ul_errors_raised_total{code="%d",error="BADBOARD"} 1'
+            % ErrorCode.BADBOARD) in lines
+    # Histogram buckets are cumulative, up to the call count
+    prefix = 'mcculw_ul_call_seconds_bucket{function="cbAIn",'
+    buckets = [int(line.rsplit(' ', 1)[1]) for line in lines if line.startswith(prefix)]
+    assert len(buckets) == len(instrumentation.BUCKET_BOUNDS) + 1
+    assert buckets == sorted(buckets)
+    assert buckets[-1] == 101
+    assert 'mcculw_ul_call_seconds_count{function="cbAIn"} 101' in lines
+
+
+def test_to_json(enabled):
+    _a_in_calls()
+    stats = instrumentation.snapshot()
+    data = json.loads(instrumentation.to_json(stats))
+    a_in = data['functions']['cbAIn']
+    assert a_in['calls'] == 101
+    assert a_in['error_codes'] == {'BADBOARD': 1}
+    assert a_in['buckets']['+Inf'] == stats.functions['cbAIn'].buckets[-1]
+    assert sum(a_in['buckets'].values()) == 101
+    assert data['raised'] == {'BADBOARD': 1}
+    assert data['duration'] == stats.duration
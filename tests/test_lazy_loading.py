@@ -0,0 +1,58 @@
+import subprocess
+import sys
+import threading
+import time
+
+from mcculw import ul
+from mcculw.enums import BoardInfo, InfoType
+
+
+def _run(code):
+    # A fresh interpreter, so that nothing has been imported or loaded yet
+    result = subprocess.run([sys.executable, '-c', code], check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True)
+    return result.stdout.split()
+
+
+def test_import_does_not_load_the_backend():
+    code = ('import sys\n'
+            'import mcculw.ul\n'
+            'print("mcculw.simulator" in sys.modules, "ctypes.util" in sys.modules)\n'
+            'mcculw.ul.get_backend()\n'
+            'print("mcculw.simulator" in sys.modules)\n')
+    assert _run(code) == ['False', 'False', 'True']
+
+
+def test_device_info_imports_classes_on_first_access():
+    code = ('import sys\n'
+            'import mcculw.device_info as device_info\n'
+            'print("mcculw.device_info.ai_info" in sys.modules)\n'
+            'device_info.AiInfo\n'
+            'print("mcculw.device_info.ai_info" in sys.modules,\n'
+            '      "mcculw.device_info.ctr_info" in sys.modules)\n')
+    assert _run(code) == ['False', 'True', 'False']
+
+
+def test_prototypes_are_bound_on_first_call(sim):
+    ul.get_config(InfoType.BOARDINFO, 0, 0, BoardInfo.BOARDTYPE)
+    # The placeholder has been replaced by the backend's function
+    assert ul._cbw.__dict__['cbGetConfig'] is getattr(ul.get_backend(), 'cbGetConfig')
+
+
+def test_concurrent_first_calls_load_the_backend_once():
+    loads = []
+
+    def slow_loader():
+        loads.append(None)
+        time.sleep(0.05)
+        return object()
+    library = ul._LazyLibrary(slow_loader)
+    backends = []
+    threads = [threading.Thread(target=lambda: backends.append(library._load()))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(loads) == 1
+    assert len(set(map(id, backends))) == 1
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from mcculw.continuous_scan import ScanChunk
+from mcculw.enums import TrigType
+from mcculw.pretrigger import PretriggerCapture, SoftwareTrigger
+
+
+def _pulses(num_scans, num_chans, positions):
+    data = np.zeros((num_scans, num_chans))
+    data[:, 1:] = np.arange(num_scans)[:, None]
+    for position in positions:
+        data[position:position + 5, 0] = 1.0
+    return data
+
+
+def _chunks(data, chunk_scans):
+    num_chans = data.shape[1]
+    for first_scan in range(0, len(data), chunk_scans):
+        yield ScanChunk(data[first_scan:first_scan + chunk_scans], first_scan * num_chans, 0.0,
+                        first_scan)
+
+
+@pytest.mark.parametrize('num_chans', [1, 2, 3])
+@pytest.mark.parametrize('chunk_scans', [1, 7, 500, 4000])
+def test_multichannel_chunks(num_chans, chunk_scans):
+    triggers = [480, 1490, 1500, 2700]
+    data = _pulses(4000, num_chans, triggers)
+    capture = PretriggerCapture(SoftwareTrigger(TrigType.TRIG_ABOVE, high_threshold=0.5),
+                                num_chans, pretrig_count=100, posttrig_count=200)
+    events = []
+    for chunk in _chunks(data, chunk_scans):
+        events += capture.update(chunk.data, chunk.first_scan)
+    assert [event.trigger_sample for event in events] == triggers
+    assert capture.lost_events == 0
+    for event in events:
+        assert event.data.shape == (300, num_chans)
+        np.testing.assert_array_equal(event.data,
+                                      data[event.first_sample:event.first_sample + 300])
+
+
+def test_overlapping_windows_and_holdoff():
+    data = _pulses(3000, 2, [500, 520, 540, 1500])
+    trigger = SoftwareTrigger(TrigType.TRIG_ABOVE, high_threshold=0.5)
+    capture = PretriggerCapture(trigger, 2, 100, 200)
+    assert [e.trigger_sample for e in capture.update(data)] == [500, 520, 540, 1500]
+    capture = PretriggerCapture(SoftwareTrigger(TrigType.TRIG_ABOVE, high_threshold=0.5), 2,
+                                100, 200, holdoff=100)
+    assert [e.trigger_sample for e in capture.update(data)] == [500, 1500]
+
+
+def test_single_shot():
+    data = _pulses(3000, 1, [500, 1500])
+    capture = PretriggerCapture(SoftwareTrigger(TrigType.TRIG_ABOVE, high_threshold=0.5), 1,
+                                100, 200, single_shot=True)
+    assert [e.trigger_sample for e in capture.update(data[:1000])] == [500]
+    assert not capture.armed
+    assert capture.update(data[1000:2000]) == []
+    capture.arm()
+    assert [e.trigger_sample for e in capture.update(_pulses(1000, 1, [300]))] == [2300]
+
+
+def test_gap_restarts_history():
+    data = _pulses(3000, 2, [480, 990, 2200])
+    capture = PretriggerCapture(SoftwareTrigger(TrigType.TRIG_ABOVE, high_threshold=0.5), 2,
+                                100, 200)
+    events = capture.update(data[:1000], 0)
+    events += capture.update(data[2000:], 2000)
+    assert [e.trigger_sample for e in events] == [480, 2200]
+    assert capture.lost_events == 1
+
+
+def test_rising_hysteresis_matches_reference():
+    rng = np.random.default_rng(0)
+    values = np.sin(np.arange(20000) / 20.0) + 0.1 * rng.standard_normal(20000)
+    trigger = SoftwareTrigger(TrigType.TRIG_RISING, -0.5, 0.5)
+    found = np.concatenate([trigger.find(values[start:start + 333])
+                            + start for start in range(0, len(values), 333)])
+    expected, state = [], True
+    for index, value in enumerate(values):
+        new_state = False if value < -0.5 else True if value > 0.5 else state
+        if new_state and not state:
+            expected.append(index)
+        state = new_state
+    assert found.tolist() == expected
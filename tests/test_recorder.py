@@ -0,0 +1,169 @@
+import numpy as np
+import pytest
+
+from mcculw import recorder, ul
+from mcculw.continuous_scan import ScanChunk
+from mcculw.enums import FunctionType, ScanOptions, ULRange
+from mcculw.recorder import ColumnarRecording, ScanRecorder, convert_csv, read_recording
+
+
+@pytest.mark.parametrize('name', ['scan.mccscan', 'scan.npy'])
+def test_round_trip(tmp_path, name):
+    path = str(tmp_path / name)
+    data = np.arange(30, dtype=np.float64)
+    with ScanRecorder(path, 2, 4, ULRange.BIP5VOLTS, 1000, resolution=16) as rec:
+        rec.write(data[:12])
+        # A chunk that wraps around the end of the UL buffer
+        rec.write(data[12:18], data[18:30])
+    header, recorded = read_recording(path)
+    assert header['channels'] == [2, 3, 4]
+    assert header['range'] == 'BIP5VOLTS'
+    assert header['rate'] == 1000
+    assert header['resolution'] == 16
+    np.testing.assert_array_equal(recorded, data.reshape(-1, 3))
+
+
+def test_rollback(tmp_path):
+    path = str(tmp_path / 'scan.mccscan')
+    with ScanRecorder(path, 0, 1, ULRange.BIP10VOLTS, 10) as rec:
+        rec.write(np.zeros(4))
+        position = rec.mark()
+        rec.write(np.ones(4))
+        rec.rollback(position)
+        assert rec.samples_written == 4
+    np.testing.assert_array_equal(read_recording(path).data, np.zeros((2, 2)))
+
+
+def test_record_continuous_scan(sim, tmp_path, monkeypatch):
+    # Polling advances the virtual clock
+    monkeypatch.setattr(recorder.time, 'sleep', sim.advance)
+    sim.set_signal(0, 0, lambda t: t)
+    sim.set_signal(0, 1, lambda t: -t)
+    memhandle = ul.win_buf_alloc(40)
+    ul.a_in_scan(0, 0, 1, 40, 100, ULRange.BIP10VOLTS, memhandle,
+                 ScanOptions.BACKGROUND | ScanOptions.CONTINUOUS)
+    path = str(tmp_path / 'scan.mccscan')
+    with ScanRecorder(path, 0, 1, ULRange.BIP10VOLTS, 100, np.uint16, 16) as rec:
+        assert rec.record(0, memhandle, 40, 10, total_count=200) == 200
+    ul.stop_background(0, FunctionType.AIFUNCTION)
+    ul.win_buf_free(memhandle)
+
+    data = read_recording(path).data
+    assert data.shape == (100, 2)
+    volts = ul.to_eng_units_array(0, ULRange.BIP10VOLTS, data, 16)
+    times = np.arange(100) / 100.0
+    np.testing.assert_allclose(volts[:, 0], times, atol=1e-3)
+    np.testing.assert_allclose(volts[:, 1], -times, atol=1e-3)
+
+
+def test_record_partial_last_chunk(sim, tmp_path, monkeypatch):
+    monkeypatch.setattr(recorder.time, 'sleep', sim.advance)
+    memhandle = ul.win_buf_alloc(40)
+    ul.a_in_scan(0, 0, 1, 40, 100, ULRange.BIP10VOLTS, memhandle,
+                 ScanOptions.BACKGROUND | ScanOptions.CONTINUOUS)
+    path = str(tmp_path / 'scan.mccscan')
+    chunks = []
+    with ScanRecorder(path, 0, 1, ULRange.BIP10VOLTS, 100, np.uint16, 16) as rec:
+        assert rec.record(0, memhandle, 40, 10, total_count=46, on_chunk=chunks.append) == 46
+        with pytest.raises(ValueError):
+            rec.record(0, memhandle, 40, 10, total_count=45)
+    ul.stop_background(0, FunctionType.AIFUNCTION)
+    ul.win_buf_free(memhandle)
+    assert chunks == [10, 20, 30, 40, 46]
+    assert read_recording(path).data.shape == (23, 2)
+
+
+def test_record_until_scan_stops(sim, tmp_path, monkeypatch):
+    monkeypatch.setattr(recorder.time, 'sleep', sim.advance)
+    memhandle = ul.win_buf_alloc(40)
+    # A finite scan of 26 samples, which is not a multiple of the chunk size
+    ul.a_in_scan(0, 0, 1, 26, 100, ULRange.BIP10VOLTS, memhandle, ScanOptions.BACKGROUND)
+    path = str(tmp_path / 'scan.mccscan')
+    with ScanRecorder(path, 0, 1, ULRange.BIP10VOLTS, 100, np.uint16, 16) as rec:
+        assert rec.record(0, memhandle, 40, 10) == 26
+    ul.win_buf_free(memhandle)
+    assert read_recording(path).data.shape == (13, 2)
+
+
+def _record_columns(path, close=True):
+    # Scans 0 to 9 and, after an overrun, 14 to 19 of a two-channel scan at
+    # 10 scans per second, in blocks of 4 scans
+    data = np.arange(40, dtype=np.float64).reshape(-1, 2)
+    rec = ScanRecorder(path, 0, 1, ULRange.BIP10VOLTS, 10, block_scans=4)
+    for first_scan, stop in ((0, 6), (6, 10), (14, 20)):
+        rec.write_chunk(ScanChunk(data[first_scan:stop], first_scan * 2, 0.0, first_scan))
+    if close:
+        rec.close()
+    return data
+
+
+def test_window_spans_blocks_and_gaps(tmp_path):
+    path = str(tmp_path / 'scan.mccol')
+    data = _record_columns(path)
+    recording = ColumnarRecording(path)
+    assert recording.num_scans == 16
+    assert recording.duration == 2.0
+    assert recording.index['first_scan'].tolist() == [0, 4, 8, 14, 18]
+    assert recording.index['scans'].tolist() == [4, 4, 2, 4, 2]
+
+    window = recording.window(0.3, 1.6, channels=[1])
+    scans = [3, 4, 5, 6, 7, 8, 9, 14, 15]
+    np.testing.assert_allclose(window.times, np.array(scans) / 10.0)
+    np.testing.assert_array_equal(window.data, data[scans][:, [1]])
+
+    whole = recording.window()
+    np.testing.assert_array_equal(whole.data, data[list(range(10)) + list(range(14, 20))])
+
+
+def test_window_in_gap_is_empty(tmp_path):
+    path = str(tmp_path / 'scan.mccol')
+    _record_columns(path)
+    window = ColumnarRecording(path).window(1.05, 1.35)
+    assert window.times.shape == (0,)
+    assert window.data.shape == (0, 2)
+
+
+def test_unclosed_recording_reads_complete_blocks(tmp_path):
+    path = str(tmp_path / 'scan.mccol')
+    rec = ScanRecorder(path, 0, 1, ULRange.BIP10VOLTS, 10, block_scans=4)
+    data = np.arange(20, dtype=np.float64).reshape(-1, 2)
+    rec.write(data.reshape(-1))
+    rec._file.flush()
+    recording = ColumnarRecording(path)
+    # The last two scans are still staged in memory
+    assert recording.num_scans == 8
+    np.testing.assert_array_equal(recording.window().data, data[:8])
+    rec.close()
+
+
+def test_storage_dtype_and_volts(tmp_path):
+    path = str(tmp_path / 'scan.mccol')
+    counts = np.array([0, 32768, 65535, 65535, 32768, 0], np.uint16)
+    with ScanRecorder(path, 0, 1, ULRange.BIP10VOLTS, 100, np.uint16, resolution=16,
+                      block_scans=4) as rec:
+        rec.write(counts)
+    recording = ColumnarRecording(path)
+    data = recording.window().data
+    assert data.dtype == np.uint16
+    np.testing.assert_allclose(recording.to_volts(data[:, 0]),
+                               ul.to_eng_units_array(0, ULRange.BIP10VOLTS, counts[::2], 16))
+
+    path = str(tmp_path / 'volts.mccol')
+    with ScanRecorder(path, 0, 0, ULRange.BIP10VOLTS, 100, storage_dtype=np.float32) as rec:
+        rec.write(np.array([0.1, 0.2, 0.3]))
+    data = ColumnarRecording(path).window().data
+    assert data.dtype == np.float32
+    np.testing.assert_allclose(data[:, 0], [0.1, 0.2, 0.3], rtol=1e-7)
+
+
+def test_convert_csv(tmp_path):
+    csv_path = tmp_path / 'scan.csv'
+    csv_path.write_text('Channel 2,Channel 3,\n' +
+                        ''.join('{},{},\n'.format(i, -i) for i in range(10)))
+    path = convert_csv(str(csv_path), rate=5, dtype=np.float64, block_scans=4,
+                       batch_scans=3)
+    assert path == str(tmp_path / 'scan.mccol')
+    recording = ColumnarRecording(path)
+    assert recording.channels == [2, 3]
+    np.testing.assert_array_equal(recording.window(1.0).data, [[5, -5], [6, -6], [7, -7],
+                                                                [8, -8], [9, -9]])
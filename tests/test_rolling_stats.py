@@ -0,0 +1,46 @@
+import numpy as np
+
+from mcculw.rolling_stats import RollingStats, StepStats
+
+
+def _chunks(data, sizes):
+    bounds = np.concatenate(([0], np.cumsum(sizes)))
+    return [(start, data[start:stop]) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def test_rolling_stats_match_naive_windows():
+    rng = np.random.default_rng(1)
+    # A large offset makes naive sums of squares lose precision
+    data = 1000.0 + rng.normal(size=(200, 2))
+    window = 7
+    stats = RollingStats(window, num_chans=2)
+    parts = [stats.update(chunk) for _, chunk in _chunks(data, [3, 1, 50, 7, 6, 133])]
+    mean, std, low, high = (np.concatenate(column) for column in zip(*parts))
+
+    assert np.isnan(mean[:window - 1]).all()
+    windows = [data[end - window:end] for end in range(window, len(data) + 1)]
+    np.testing.assert_allclose(mean[window - 1:], [w.mean(axis=0) for w in windows])
+    np.testing.assert_allclose(std[window - 1:], [w.std(axis=0, ddof=1) for w in windows],
+                               rtol=1e-6)
+    np.testing.assert_array_equal(low[window - 1:], [w.min(axis=0) for w in windows])
+    np.testing.assert_array_equal(high[window - 1:], [w.max(axis=0) for w in windows])
+
+
+def test_step_stats_match_naive_steps():
+    rng = np.random.default_rng(2)
+    data = rng.normal(size=(140, 2)) + np.arange(140)[:, None] // 40
+    stats = StepStats(num_chans=2, settle_samples=5)
+    stats.add_steps([0.5, 1.0, 1.5], [30, 45, 25], start=10)
+    completed = []
+    for first, chunk in _chunks(data, [12, 40, 1, 60, 27]):
+        completed.extend(stats.update(chunk, first))
+
+    assert [point.step for point in completed] == [0, 1, 2]
+    assert stats.pending_steps == 0
+    for point, (start, stop) in zip(completed, [(10, 40), (40, 85), (85, 110)]):
+        samples = data[start + 5:stop]
+        assert point.count == len(samples)
+        np.testing.assert_allclose(point.mean, samples.mean(axis=0))
+        np.testing.assert_allclose(point.std, samples.std(axis=0, ddof=1))
+        np.testing.assert_allclose(point.min, samples.min(axis=0))
+        np.testing.assert_allclose(point.max, samples.max(axis=0))
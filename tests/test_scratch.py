@@ -0,0 +1,59 @@
+import threading
+from ctypes import addressof, c_float, c_long
+
+import numpy as np
+
+from mcculw import ul
+from mcculw.enums import ULRange
+
+
+def _in_thread(function):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(function()))
+    thread.start()
+    thread.join()
+    return results[0]
+
+
+def test_scratch_values_are_per_thread():
+    value, pointer_ = ul._scratch_value(c_float)
+    assert ul._scratch_value(c_float)[0] is value
+    other, other_pointer = _in_thread(lambda: ul._scratch_value(c_float))
+    assert other is not value
+    assert addressof(other) != addressof(value)
+    assert addressof(other_pointer.contents) == addressof(other)
+    assert addressof(pointer_.contents) == addressof(value)
+
+
+def test_concurrent_polls_keep_their_values(sim):
+    for channel in range(4):
+        sim.set_signal(0, channel, lambda t, channel=channel: np.full(len(t), channel + 1.0))
+    errors = []
+
+    def poll(channel):
+        for _ in range(200):
+            volts = ul.v_in(0, channel, ULRange.BIP10VOLTS)
+            if abs(volts - (channel + 1)) > 1e-2:
+                errors.append((channel, volts))
+
+    threads = [threading.Thread(target=poll, args=(channel,)) for channel in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_converted_arrays_are_passed_through():
+    array = ul._to_ctypes_array([1, 2, 3], c_long)
+    assert ul._to_ctypes_array(array, c_long) is array
+    ndarray = np.arange(3, dtype=np.dtype(c_long))
+    converted = ul._to_ctypes_array(ndarray, c_long)
+    converted[0] = 7
+    assert ndarray[0] == 7
+    # Other types and read-only arrays are copied
+    assert list(ul._to_ctypes_array(ndarray.astype(np.int8), c_long)) == [7, 1, 2]
+    ndarray.flags.writeable = False
+    copied = ul._to_ctypes_array(ndarray, c_long)
+    copied[1] = 9
+    assert ndarray[1] == 1
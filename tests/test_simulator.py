@@ -0,0 +1,156 @@
+from ctypes import c_float, c_void_p
+
+import numpy as np
+import pytest
+
+from mcculw import ul
+from mcculw.enums import (ChannelType, DigitalIODirection, DigitalPortType, ErrorCode,
+                          EventType, FunctionType, ScanOptions, Status, TempScale, ULRange)
+
+
+def test_loopback_scan(sim):
+    sim.connect(0, 1, 0, 2)
+    ul.v_out(0, 1, ULRange.BIP10VOLTS, 2.5)
+    memhandle = ul.win_buf_alloc(20)
+    ul.a_in_scan(0, 2, 2, 20, 100, ULRange.BIP10VOLTS, memhandle, ScanOptions.BACKGROUND)
+    assert ul.get_status(0, FunctionType.AIFUNCTION).status == Status.RUNNING
+    sim.advance(0.2)
+    status = ul.get_status(0, FunctionType.AIFUNCTION)
+    assert status.status == Status.IDLE
+    assert status.cur_count == 20
+    data = ul.buffer_as_ndarray(memhandle, 20)
+    volts = ul.to_eng_units_array(0, ULRange.BIP10VOLTS, data)
+    np.testing.assert_allclose(volts, 2.5, atol=1e-3)
+    del data
+    ul.win_buf_free(memhandle)
+
+
+def test_queued_scan(sim):
+    for channel in range(4):
+        sim.set_signal(0, channel, lambda t, channel=channel: np.full(len(t), 0.1 * channel))
+    ul.a_load_queue(0, [3, 1, 2], [ULRange.BIP10VOLTS, ULRange.BIP1VOLTS,
+                                   ULRange.BIP10VOLTS], 3)
+    memhandle = ul.win_buf_alloc(30)
+    ul.a_in_scan(0, 0, 0, 30, 100, ULRange.BIP10VOLTS, memhandle, 0)
+    rows = ul.buffer_as_ndarray(memhandle, 30).reshape(-1, 3)
+    np.testing.assert_allclose(ul.to_eng_units_array(0, ULRange.BIP10VOLTS, rows[:, 0]), 0.3,
+                               atol=1e-3)
+    np.testing.assert_allclose(ul.to_eng_units_array(0, ULRange.BIP1VOLTS, rows[:, 1]), 0.1,
+                               atol=1e-4)
+    # Loading an empty queue goes back to low_chan..high_chan
+    ul.a_load_queue(0, [], [], 0)
+    ul.a_in_scan(0, 1, 2, 30, 100, ULRange.BIP10VOLTS, memhandle, 0)
+    np.testing.assert_allclose(ul.to_eng_units_array(0, ULRange.BIP10VOLTS, rows[0]),
+                               [0.1, 0.2, 0.1], atol=1e-3)
+    del rows
+    ul.win_buf_free(memhandle)
+
+
+def test_counter_scan(sim):
+    sim.set_counter_signal(0, 1, lambda t: 1000 * t)
+    memhandle = ul.win_buf_alloc_32(20)
+    ul.c_in_scan(0, 0, 1, 20, 100, memhandle, ScanOptions.BACKGROUND | ScanOptions.CTR32BIT)
+    sim.advance(0.2)
+    assert ul.get_status(0, FunctionType.CTRFUNCTION).status == Status.IDLE
+    data = ul.buffer_as_ndarray(memhandle, 20, np.uint32).reshape(-1, 2)
+    np.testing.assert_array_equal(data[:, 0], 0)
+    np.testing.assert_array_equal(data[:, 1], np.arange(10) * 10)
+    assert ul.c_in_32(0, 1) == 200
+    ul.c_clear(0, 1)
+    assert ul.c_in_32(0, 1) == 0
+    del data
+    ul.win_buf_free(memhandle)
+
+
+def test_digital_scan(sim):
+    sim.set_digital_signal(0, lambda t: np.round(t * 1000).astype(np.int64) % 256)
+    memhandle = ul.win_buf_alloc(50)
+    ul.d_in_scan(0, DigitalPortType.AUXPORT, 50, 1000, memhandle, 0)
+    data = ul.buffer_as_ndarray(memhandle, 50)
+    np.testing.assert_array_equal(data, np.arange(50))
+    del data
+    ul.win_buf_free(memhandle)
+
+
+def test_digital_direction(sim):
+    sim.set_digital_signal(0, lambda t: np.full(len(t), 0x0F))
+    port = DigitalPortType.AUXPORT
+    ul.d_config_port(0, port, DigitalIODirection.OUT)
+    ul.d_out(0, port, 0xA0)
+    assert ul.d_in(0, port) == 0xA0
+    ul.d_config_port(0, port, DigitalIODirection.IN)
+    assert ul.d_in(0, port) == 0x0F
+    ul.d_config_bit(0, port, 7, DigitalIODirection.OUT)
+    ul.d_config_bit(0, port, 5, DigitalIODirection.IN)
+    assert ul.d_in(0, port) == 0x8F
+
+
+def test_daq_scan(sim):
+    sim.set_signal(0, 0, lambda t: np.full(len(t), -5.0))
+    sim.set_counter_signal(0, 1, lambda t: 100000 * t)
+    sim.set_temperature(0, 3, lambda t: np.full(len(t), 100.0))
+    sim.set_temperature(0, 5, lambda t: np.full(len(t), np.nan))
+    chan_list = [0, 1, 3, 1, 5]
+    chan_type_list = [ChannelType.ANALOG, ChannelType.CTR32LOW, ChannelType.TC,
+                      ChannelType.CTR32HIGH, ChannelType.TC]
+    gain_list = [ULRange.BIP10VOLTS] * 5
+    memhandle = ul.win_buf_alloc(50)
+    ul.daq_in_scan(0, chan_list, chan_type_list, gain_list, 5, 10, 0, 50, memhandle, 0)
+    rows = ul.buffer_as_ndarray(memhandle, 50).reshape(-1, 5)
+    np.testing.assert_array_equal(rows[:, 0], 16384)
+    counts = rows[:, 1] + (rows[:, 3].astype(np.uint32) << 16)
+    np.testing.assert_array_equal(counts, np.arange(10) * 10000)
+
+    temperatures = (c_float * 20)()
+    err_code, _ = ul.get_tc_values(0, chan_list, chan_type_list, 5, memhandle, 0, 10,
+                                   TempScale.CELSIUS, temperatures)
+    assert err_code == ErrorCode.OUTOFRANGE
+    values = np.ctypeslib.as_array(temperatures).reshape(-1, 2)
+    np.testing.assert_allclose(values[:, 0], 100.0)
+    np.testing.assert_array_equal(values[:, 1], -9999.0)
+    del rows
+    ul.win_buf_free(memhandle)
+
+
+def test_get_tc_values_rejects_bad_scale(sim):
+    memhandle = ul.win_buf_alloc(1)
+    with pytest.raises(ul.ULError) as e:
+        ul.get_tc_values(0, [0], [ChannelType.TC], 1, memhandle, 0, 1, 99, (c_float * 1)())
+    assert e.value.errorcode == ErrorCode.BADTEMPSCALE
+    ul.win_buf_free(memhandle)
+
+
+def test_temperatures(sim):
+    sim.set_temperature(0, 1, lambda t: np.full(len(t), 100.0))
+    assert ul.t_in(0, 1, TempScale.FAHRENHEIT) == pytest.approx(212.0)
+    err_code, data_array = ul.t_in_scan(0, 0, 1, TempScale.KELVIN)
+    assert err_code == ErrorCode.NOERRORS
+    np.testing.assert_allclose(list(data_array), [293.15, 373.15], rtol=1e-6)
+    sim.set_temperature(0, 0, lambda t: np.full(len(t), np.nan))
+    with pytest.raises(ul.ULError) as e:
+        ul.t_in(0, 0, TempScale.CELSIUS)
+    assert e.value.errorcode == ErrorCode.OPENCONNECTION
+
+
+def test_events_on_advance(sim):
+    calls = []
+    callback = ul.ULEventCallback(
+        lambda board_num, event_type, event_data, user_data: calls.append(
+            (event_type, event_data)))
+    ul.enable_event(0, EventType.ON_DATA_AVAILABLE | EventType.ON_END_OF_INPUT_SCAN, 10,
+                    callback, c_void_p())
+    memhandle = ul.win_buf_alloc(40)
+    ul.a_in_scan(0, 0, 1, 40, 100, ULRange.BIP10VOLTS, memhandle, ScanOptions.BACKGROUND)
+    for _ in range(5):
+        sim.advance(0.05)
+    ul.disable_event(0, EventType.ALL_EVENT_TYPES)
+    assert calls == [(EventType.ON_DATA_AVAILABLE, 10), (EventType.ON_DATA_AVAILABLE, 20),
+                     (EventType.ON_DATA_AVAILABLE, 30), (EventType.ON_DATA_AVAILABLE, 40),
+                     (EventType.ON_END_OF_INPUT_SCAN, 40)]
+    ul.win_buf_free(memhandle)
+
+
+def test_unsupported_entry_point(sim):
+    with pytest.raises(ul.ULError) as e:
+        ul.a_in(0, 99, ULRange.BIP10VOLTS)
+    assert e.value.errorcode == ErrorCode.BADADCHAN
@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+
+from mcculw.continuous_scan import ScanChunk
+from mcculw.sweep import AdaptiveSteps, SettleCriterion, Sweep, SweepPoint
+
+
+class _FakeScan(object):
+    # Replays the chunks of a one-channel scan whose scan index 0 was
+    # sampled at time.monotonic() == 0
+    def __init__(self, chunks, rate=1000):
+        self.rate = rate
+        self.num_chans = 1
+        self.start_time = 0.0
+        self.error = None
+        self._chunks = iter(chunks)
+
+    def read(self, timeout=None):
+        return next(self._chunks, None)
+
+
+def _chunk(first_scan, values):
+    values = np.asarray(values, np.float64).reshape(-1, 1)
+    return ScanChunk(values, first_scan, 0.0, first_scan)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # The sweep sets each level at t = 0, so its first scan has index 0
+    monkeypatch.setattr('mcculw.sweep.time.monotonic', lambda: 0.0)
+
+
+def test_settle_criterion():
+    criterion = SettleCriterion(0.01, max_slope=1.0, max_std=0.5)
+    assert criterion.window_samples(1000) == 10
+    settled, mean, std, slope = criterion.evaluate(np.arange(10) * 0.002, 1000)
+    assert slope == pytest.approx(2.0)
+    assert mean == pytest.approx(0.009)
+    assert not settled
+    settled, mean, std, slope = criterion.evaluate(np.full(10, 3.0), 1000)
+    assert settled
+    assert (mean, std) == (3.0, 0.0)
+    assert slope == pytest.approx(0.0, abs=1e-9)
+
+
+def test_settle_criterion_averages_ripple():
+    ripple = np.tile([1.0, -1.0], 10)
+    assert not SettleCriterion(0.02, max_std=0.1).evaluate(ripple, 1000)[0]
+    criterion = SettleCriterion(0.02, max_std=0.1, average=2)
+    assert criterion.window_samples(1000) == 20
+    assert criterion.evaluate(ripple, 1000)[0]
+
+
+def test_adaptive_steps():
+    steps = AdaptiveSteps(0.0, 1.0, 0.1, max_change=0.05)
+    points = []
+
+    def measure(voltage, mean):
+        points.append(SweepPoint(voltage, mean, 0.0, 0.0, 0.0, True))
+        return steps.next_level(points)
+
+    assert steps.next_level(points) == 0.0
+    assert measure(0.0, 0.0) == pytest.approx(0.1)
+    # The response changed by 0.2 over 0.1 V: a quarter of the step
+    assert measure(0.1, 0.2) == pytest.approx(0.125)
+    # No change: the largest step, clamped to stop
+    assert measure(0.125, 0.2) == pytest.approx(0.525)
+    assert measure(0.525, 0.2) == 0.925
+    assert measure(0.925, 0.2) == 1.0
+    assert measure(1.0, 0.2) is None
+
+
+def test_dead_time_skips_samples(clock):
+    # The first 20 samples are sampled during the dead time
+    chunks = [_chunk(0, [9.0] * 20 + [1.0] * 30), _chunk(50, np.full(50, 1.0))]
+    levels = []
+    sweep = Sweep(levels.append, _FakeScan(chunks), SettleCriterion(0.05, max_std=0.01),
+                  dead_time=0.02)
+    point = sweep.measure(2.0)
+    assert levels == [2.0]
+    assert point.settled
+    assert point.mean == 1.0
+    # Whole chunks are taken
+    assert point.dwell == pytest.approx(0.1)
+
+
+def test_run_levels(clock):
+    chunks = [_chunk(100 * k, np.full(100, float(k))) for k in range(3)]
+    sweep = Sweep(lambda level: None, _FakeScan(chunks), SettleCriterion(0.05, max_std=0.01))
+    points = sweep.run([0.5, 1.0, 1.5])
+    assert [point.voltage for point in points] == [0.5, 1.0, 1.5]
+    assert [point.mean for point in points] == [0.0, 1.0, 2.0]
+
+
+def test_window_does_not_span_a_gap(clock):
+    # Joined across the gap, the first 100 samples would look settled at 2.0
+    chunks = [_chunk(0, np.full(60, 2.0)),
+              _chunk(500, np.full(40, 2.0)),
+              _chunk(540, np.full(100, 3.0))]
+    sweep = Sweep(lambda level: None, _FakeScan(chunks), SettleCriterion(0.1, max_std=0.01))
+    point = sweep.measure(1.0)
+    assert point.settled
+    assert point.mean == pytest.approx(3.0)
+    assert point.dwell == pytest.approx(0.64)
+
+
+def test_contiguous_chunks_settle(clock):
+    chunks = [_chunk(100 * k, np.linspace(0, 1, 100) if k == 0 else np.full(100, 1.5))
+              for k in range(5)]
+    sweep = Sweep(lambda level: None, _FakeScan(chunks), SettleCriterion(0.15, max_slope=0.01))
+    point = sweep.measure(0.5)
+    assert point.settled
+    assert point.mean == pytest.approx(1.5)
+    assert point.dwell == pytest.approx(0.3)
+
+
+def test_max_dwell_stops_an_unsettled_level(clock):
+    chunks = [_chunk(100 * k, np.arange(100 * k, 100 * k + 100, dtype=float)) for k in range(50)]
+    sweep = Sweep(lambda level: None, _FakeScan(chunks), SettleCriterion(0.1, max_slope=0.01),
+                  max_dwell=0.5)
+    point = sweep.measure(0.5)
+    assert not point.settled
+    assert point.dwell == pytest.approx(0.5)
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from mcculw import ul
+from mcculw.enums import ScanOptions, ULRange
+from mcculw.sync_scan import SyncScan, _Scan
+
+
+def test_records_align_output_and_input(sim):
+    # The output loops back into the input, so every record reads back what
+    # it wrote
+    sim.connect(0, 0, 0, 0)
+    written = {}
+
+    def source(out, first_sample):
+        out[:, 0] = (first_sample + np.arange(len(out))) % 1000 / 100.0
+        written[first_sample] = out.copy()
+
+    acquisition = SyncScan(1000, chunk_size=50, buffer_chunks=4, num_records=8)
+    acquisition.add_output('out', 0, 0, 0, ULRange.BIP10VOLTS, source, ScanOptions.SCALEDATA)
+    acquisition.add_input('in', 0, 0, 0, ULRange.BIP10VOLTS)
+    records = []
+    with acquisition:
+        assert acquisition.rate == 1000
+        while len(records) < 6:
+            sim.advance(0.01)
+            record = acquisition.read(timeout=0.05)
+            if record is not None:
+                records.append((record.index, record.first_sample,
+                                {name: data.copy() for name, data in record.data.items()}))
+    assert acquisition.start_skew < 0.1
+
+    assert [index for index, _, _ in records] == list(range(6))
+    for index, first_sample, data in records:
+        assert first_sample == index * 50
+        np.testing.assert_array_equal(data['out'], written[first_sample])
+        np.testing.assert_allclose(data['in'], data['out'], atol=1e-3)
+    assert acquisition.overruns == 0
+    assert acquisition.late_chunks == 0
+    assert acquisition.dropped_records == 0
+
+
+def _fake_starts(monkeypatch, rates, durations):
+    # Each start call returns the rate of its scan and takes the given time
+    now = [0.0]
+    monkeypatch.setattr('mcculw.sync_scan.time.monotonic', lambda: now[0])
+
+    def start(scan, rate, buffer_count):
+        now[0] += durations[scan.name]
+        return rates[scan.name]
+    monkeypatch.setattr(_Scan, 'start', start)
+    monkeypatch.setattr(SyncScan, '_schedule', lambda self: None)
+    stopped = []
+    monkeypatch.setattr(ul, 'stop_background',
+                        lambda board_num, function_type: stopped.append(board_num))
+    return stopped
+
+
+def _acquisition():
+    acquisition = SyncScan(1000, chunk_size=100, buffer_chunks=8, num_records=4)
+    acquisition.add_output('out', 0, 0, 0, ULRange.BIP10VOLTS,
+                           lambda out, first_sample: out.fill(first_sample),
+                           ScanOptions.SCALEDATA)
+    acquisition.add_input('in', 1, 0, 0, ULRange.BIP10VOLTS)
+    return acquisition
+
+
+def test_rate_mismatch(monkeypatch):
+    stopped = _fake_starts(monkeypatch, {'out': 1000.0, 'in': 1000.5}, {'out': 0, 'in': 0})
+    acquisition = _acquisition()
+    with pytest.raises(ValueError, match='out at 1000.0, in at 1000.5'):
+        acquisition.start()
+    assert sorted(stopped) == [0, 1]
+    assert all(scan.memhandle is None for scan in acquisition.scans.values())
+
+
+def test_output_ring_covers_start_skew(monkeypatch):
+    # The input starts 0.6 s (6 chunks) after the output
+    _fake_starts(monkeypatch, {'out': 1000.0, 'in': 1000.0}, {'out': 0.0, 'in': 1.2})
+    acquisition = _acquisition()
+    acquisition.start()
+    try:
+        out = acquisition.scans['out']
+        assert acquisition.start_skew == pytest.approx(0.6)
+        # 8 chunks ahead, 4 records, 2 chunks for the polling and 18 for the
+        # skew and the start call duration
+        assert len(out.ring) == 8 + 4 + 2 + 18
+        assert np.array_equal(out.ring[:8, 0, 0], np.arange(8) * 100)
+        assert not out.ring[8:].any()
+    finally:
+        acquisition.stop()
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from mcculw import ul
+from mcculw.enums import ChannelType, ErrorCode, TempScale
+from mcculw.temperature import TemperatureReader
+
+
+@pytest.fixture
+def thermocouples(sim):
+    # Channel 2 has an open thermocouple, channel 5 is out of range
+    sim.set_temperature(0, 2, lambda t: np.full(len(t), np.nan))
+    sim.set_temperature(0, 5, lambda t: np.full(len(t), 5000.0))
+    return sim
+
+
+def test_failed_channels_are_nan_and_flagged(thermocouples):
+    reader = TemperatureReader(0, 0, 7, TempScale.CELSIUS)
+    reading = reader.read()
+    assert reading.values.dtype == np.float32
+    assert np.isnan(reading.values[[2, 5]]).all()
+    assert not np.isnan(np.delete(reading.values, [2, 5])).any()
+    expected = np.zeros(8, np.int16)
+    expected[2] = ErrorCode.OPENCONNECTION
+    expected[5] = ErrorCode.OUTOFRANGE
+    np.testing.assert_array_equal(reading.flags, expected)
+    # The buffers are reused by the next read
+    assert reader.read().values is reading.values
+
+
+def test_history_ring(thermocouples):
+    reader = TemperatureReader(0, 0, 3, TempScale.CELSIUS, history=4)
+    assert len(reader.history().timestamps) == 0
+    for _ in range(6):
+        thermocouples.advance(0.1)
+        reader.read()
+    history = reader.history()
+    assert history.values.shape == (4, 4)
+    assert (np.diff(history.timestamps) >= 0).all()
+    np.testing.assert_array_equal(history.flags[:, 2], ErrorCode.OPENCONNECTION)
+    assert not history.flags[:, [0, 1, 3]].any()
+    assert len(reader.history(2).timestamps) == 2
+
+
+def test_daq_in_scan_reader_uses_call_code(monkeypatch):
+    def get_tc_values(board_num, chans, types, count, memhandle, first, samples, scale, data):
+        for index in range(samples * 2):
+            data[index] = -9999.0 if index == 1 else first + index
+        return ErrorCode.OUTOFRANGE
+    monkeypatch.setitem(ul._cbw.__dict__, 'cbGetTCValues', get_tc_values)
+    reader = TemperatureReader.for_daq_in_scan(
+        0, [0, 1, 0], [ChannelType.TC, ChannelType.TC, ChannelType.DIGITAL8], 1, TempScale.CELSIUS,
+        count=2)
+    reading = reader.read(5)
+    assert reading.values.shape == (2, 2)
+    assert reading.flags.tolist() == [[0, ErrorCode.OUTOFRANGE], [0, 0]]
@@ -0,0 +1,119 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from mcculw import ul, ul_async
+from mcculw.enums import FunctionType, ScanOptions, Status, ULRange
+
+
+async def _ticking(sim, coroutine):
+    # Advances the virtual clock while the coroutine runs, no faster than real
+    # time
+    async def tick():
+        while True:
+            sim.advance(0.001)
+            await asyncio.sleep(0.001)
+    ticker = asyncio.ensure_future(tick())
+    try:
+        return await coroutine
+    finally:
+        ticker.cancel()
+
+
+def test_a_in_stream(sim):
+    sim.set_signal(0, 0, lambda t: t)
+    sim.set_signal(0, 1, lambda t: -t)
+
+    async def read(use_events):
+        chunks = []
+        async with ul_async.a_in_stream(0, 0, 1, 1000, ULRange.BIP10VOLTS, chunk_size=50,
+                                        use_events=use_events) as stream:
+            async for chunk in stream:
+                chunks.append(chunk)
+                if len(chunks) == 4:
+                    break
+        return stream, chunks
+
+    for use_events in (True, False):
+        stream, chunks = asyncio.run(_ticking(sim, read(use_events)))
+        assert stream.events_enabled is False
+        assert stream.memhandle is None
+        assert ul.get_status(0, FunctionType.AIFUNCTION).status == Status.IDLE
+        assert [chunk.first_sample for chunk in chunks] == [0, 100, 200, 300]
+        assert [chunk.first_scan for chunk in chunks] == [0, 50, 100, 150]
+        data = np.concatenate([chunk.data for chunk in chunks])
+        assert data.shape == (200, 2)
+        np.testing.assert_allclose(data[1:, 0] - data[:-1, 0], 0.001, atol=1e-3)
+        np.testing.assert_allclose(data[:, 1], -data[:, 0], atol=1e-3)
+
+
+def test_a_out_stream_refills(sim):
+    sim.connect(0, 0, 0, 0)
+
+    async def write():
+        first_samples = []
+        async with ul_async.a_out_stream(0, 0, 0, 1000, ULRange.BIP10VOLTS,
+                                         np.zeros(100)) as stream:
+            async for chunk in stream:
+                first_samples.append(chunk.first_sample)
+                chunk.data[:] = 1.0
+                if len(first_samples) == 4:
+                    break
+        return first_samples
+
+    # The first chunk refilled is the one the scan outputs after the initial
+    # buffer
+    assert asyncio.run(_ticking(sim, write())) == [100, 150, 200, 250]
+    assert ul.get_status(0, FunctionType.AOFUNCTION).status == Status.IDLE
+
+
+def test_c_in_stream_dtype(sim):
+    sim.set_counter_signal(0, 0, lambda t: np.round(70000 * t))
+
+    async def first_chunk(options):
+        async with ul_async.c_in_stream(0, 0, 0, 1000, options, chunk_size=10,
+                                        use_events=False) as stream:
+            async for chunk in stream:
+                return chunk.data.copy()
+
+    data = asyncio.run(_ticking(sim, first_chunk(ScanOptions.CTR16BIT)))
+    assert data.dtype == np.uint16
+    data = asyncio.run(_ticking(sim, first_chunk(ScanOptions.CTR48BIT)))
+    assert data.dtype == np.uint64
+    np.testing.assert_array_equal(np.diff(data[:, 0].astype(np.int64)), 70)
+
+
+def test_iteration_requires_async_with(sim):
+    async def read():
+        stream = ul_async.a_in_stream(0, 0, 0, 1000, ULRange.BIP10VOLTS, use_events=False)
+        with pytest.raises(RuntimeError):
+            async for _ in stream:
+                pass
+        return stream
+
+    stream = asyncio.run(read())
+    assert stream.memhandle is None
+    assert ul.get_status(0, FunctionType.AIFUNCTION).status == Status.IDLE
+
+
+def test_cancelling_stops_the_scan(sim):
+    async def read(started):
+        async with ul_async.a_in_stream(0, 0, 0, 1000, ULRange.BIP10VOLTS, chunk_size=10,
+                                        use_events=False) as stream:
+            async for _ in stream:
+                started.set_result(stream)
+                await asyncio.sleep(3600)
+
+    async def cancel():
+        started = asyncio.get_running_loop().create_future()
+        task = asyncio.ensure_future(read(started))
+        stream = await started
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return stream
+
+    stream = asyncio.run(_ticking(sim, cancel()))
+    assert stream.memhandle is None
+    assert ul.get_status(0, FunctionType.AIFUNCTION).status == Status.IDLE
@@ -0,0 +1,128 @@
+import copy
+import json
+
+import pytest
+
+from mcculw import ul
+from mcculw.enums import ErrorCode
+from mcculw.simulator import SIM_DAQ, USB_202, USB_3101FS
+from tdy_utils import utils_daq
+
+
+@pytest.fixture
+def devices(sim):
+    # The default devices, none of them created yet
+    sim.reset()
+    sim.set_profiles([USB_3101FS, USB_202])
+    return sim
+
+
+def test_configure_devices(devices, caplog, capsys):
+    with caplog.at_level('INFO', logger='tdy_utils.utils_daq'):
+        assert utils_daq.configure_devices() == {'USB-3101FS': 0, 'USB-202': 1}
+    assert ul.get_board_name(1) == 'USB-202'
+    assert 'Board Number: 1 | USB-202' in caplog.messages
+    assert capsys.readouterr().out == ''
+
+
+def test_warm_start_skips_discovery(devices, tmp_path, monkeypatch):
+    cache_path = str(tmp_path / 'boards.json')
+    first = utils_daq.connect_devices(cache_path=cache_path)
+    assert sorted(first.values()) == [0, 1]
+
+    # The next process, with no devices created yet
+    devices.reset()
+    devices.set_profiles([USB_202, USB_3101FS])
+    monkeypatch.setattr(utils_daq, 'discover_devices', pytest.fail)
+    assert utils_daq.connect_devices(cache_path=cache_path) == first
+    assert ul.get_board_name(first[USB_202.unique_id]) == 'USB-202'
+
+
+def test_existing_and_unreachable_devices(devices):
+    ul.create_daq_device(5, ul.get_daq_device_inventory(utils_daq.InterfaceType.USB)[1])
+    # The host probe fails and is left out
+    found = utils_daq.discover_devices(hosts=['192.0.2.1'], timeout_ms=10)
+    assert sorted(found) == sorted([USB_3101FS.unique_id, USB_202.unique_id])
+    assert utils_daq.register_devices(found) == {USB_3101FS.unique_id: 0,
+                                                 USB_202.unique_id: 5}
+
+
+def test_shared_product_names(devices):
+    twin = copy.copy(SIM_DAQ)
+    twin.unique_id = 'F0000002'
+    devices.set_profiles([SIM_DAQ, twin])
+    assert utils_daq.configure_devices() == {'SIM-DAQ (F0000001)': 0, 'SIM-DAQ (F0000002)': 1}
+
+
+def _descriptor(unique_id):
+    descriptor = ul.DaqDeviceDescriptor()
+    descriptor.product_name = 'USB-202'
+    descriptor.unique_id = unique_id
+    return descriptor
+
+
+class _FakeUL(object):
+    # The board numbers of the UL, some of them used by other devices
+    def __init__(self, monkeypatch, attached, used=()):
+        self.attached = [_descriptor(unique_id) for unique_id in attached]
+        self.boards = {board_num: None for board_num in used}
+        monkeypatch.setattr(ul, 'ignore_instacal', lambda: None)
+        monkeypatch.setattr(ul, 'get_daq_device_inventory',
+                            lambda interface_type: list(self.attached))
+        monkeypatch.setattr(ul, 'get_board_number', self.get_board_number)
+        monkeypatch.setattr(ul, 'create_daq_device', self.create_daq_device)
+
+    def get_board_number(self, descriptor):
+        for board_num, unique_id in self.boards.items():
+            if unique_id == descriptor.unique_id:
+                return board_num
+        return -1
+
+    def create_daq_device(self, board_num, descriptor):
+        if board_num in self.boards:
+            raise ul.ULError(ErrorCode.BOARDNUMINUSE)
+        if descriptor.unique_id not in [device.unique_id for device in self.attached]:
+            raise ul.ULError(ErrorCode.DEADDEV)
+        self.boards[board_num] = descriptor.unique_id
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / 'boards.json')
+
+
+def _cached_numbers(path):
+    with open(path) as f:
+        boards = json.load(f)['boards']
+    return {unique_id: entry['board_num'] for unique_id, entry in boards.items()}
+
+
+def test_board_number_in_use_is_replaced(monkeypatch, cache_path):
+    _FakeUL(monkeypatch, ['A', 'B'])
+    assert utils_daq.connect_devices(cache_path=cache_path) == {'A': 0, 'B': 1}
+
+    # Next run, board number 0 was taken by another device first
+    fake = _FakeUL(monkeypatch, ['A', 'B'], used=[0, 2])
+    assert utils_daq.connect_devices(cache_path=cache_path) == {'A': 3, 'B': 1}
+    assert fake.boards[3] == 'A'
+    assert _cached_numbers(cache_path) == {'A': 3, 'B': 1}
+
+
+def test_warm_start_refresh(monkeypatch, cache_path):
+    _FakeUL(monkeypatch, ['A'])
+    utils_daq.connect_devices(cache_path=cache_path)
+
+    _FakeUL(monkeypatch, ['A', 'B'])
+    assert utils_daq.connect_devices(cache_path=cache_path) == {'A': 0}
+    _FakeUL(monkeypatch, ['A', 'B'])
+    assert utils_daq.connect_devices(cache_path=cache_path, refresh=True) == {'A': 0, 'B': 1}
+    assert _cached_numbers(cache_path) == {'A': 0, 'B': 1}
+
+
+def test_missing_device_keeps_its_number(monkeypatch, cache_path):
+    _FakeUL(monkeypatch, ['A', 'B'])
+    utils_daq.connect_devices(cache_path=cache_path)
+
+    _FakeUL(monkeypatch, ['B', 'C'])
+    assert utils_daq.connect_devices(cache_path=cache_path) == {'B': 1, 'C': 2}
+    assert _cached_numbers(cache_path) == {'A': 0, 'B': 1, 'C': 2}
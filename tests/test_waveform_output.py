@@ -0,0 +1,142 @@
+import time
+
+import numpy as np
+
+from mcculw import ul
+from mcculw.enums import ULRange
+from mcculw.waveform_output import WaveformOutput
+
+_SHAPE = np.sin(2 * np.pi * np.arange(10) / 10)
+
+
+def _wait_until(condition, timeout=5.0):
+    # The service thread polls in real time, whatever the simulator's clock
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def _halves(output):
+    # The amplitude each buffer half holds
+    volts = ul.to_eng_units_array(output.board_num, output.ul_range, output._data,
+                                  output.resolution).reshape(2, -1)
+    shape = np.tile(_SHAPE, output.half_size // output.period)
+    return [round(float(np.dot(half, shape) / np.dot(shape, shape)), 3) for half in volts]
+
+
+def test_half_size_is_whole_periods(sim):
+    output = WaveformOutput(0, 0, 1000, ULRange.BIP10VOLTS, np.zeros(30), latency=0.1)
+    assert output.resolution == 16
+    assert output.half_size == 90
+    assert output.buffer_count == 180
+
+
+def test_set_amplitude_takes_effect_at_a_half_boundary(sim):
+    with WaveformOutput(0, 0, 1000, ULRange.BIP10VOLTS, _SHAPE, amplitude=1.0,
+                        latency=0.05) as output:
+        assert output.half_size == 50
+        assert _halves(output) == [1.0, 1.0]
+        output.set_amplitude(2.0)
+        sim.advance(0.01)
+        # Only the half that is not being output is rewritten
+        _wait_until(lambda: _halves(output) == [1.0, 2.0])
+        sim.advance(0.05)
+        _wait_until(lambda: _halves(output) == [2.0, 2.0])
+        assert output.late_halves == 0
+        assert output.torn_writes == 0
+
+
+def test_queued_segments_play_in_order(sim):
+    with WaveformOutput(0, 0, 1000, ULRange.BIP10VOLTS, _SHAPE, latency=0.05) as output:
+        output.queue_segment(3.0, 0.05)
+        output.queue_segment(4.0, 0.1)
+        assert not output.wait_segments(0)
+        sim.advance(0.01)
+        _wait_until(lambda: _halves(output) == [0.0, 3.0])
+        sim.advance(0.05)
+        _wait_until(lambda: _halves(output) == [4.0, 3.0])
+        sim.advance(0.05)
+        _wait_until(lambda: _halves(output) == [4.0, 4.0])
+        assert output.pending_segments == 0
+        assert not output.wait_segments(0)
+        sim.advance(0.05)
+        _wait_until(lambda: _halves(output) == [0.0, 4.0])
+        sim.advance(0.05)
+        assert output.wait_segments(5.0)
+        assert output.late_halves == 0
+
+
+def test_segments_queued_before_start(sim):
+    output = WaveformOutput(0, 0, 1000, ULRange.BIP10VOLTS, _SHAPE, latency=0.05)
+    # Rounded up to whole halves
+    assert output.queue_segment(2.0, 0.07) == 100
+    assert output.queue_segment(3.0, 0.01) == 50
+    with output:
+        assert output.start_time is not None
+        assert _halves(output) == [2.0, 2.0]
+        sim.advance(0.06)
+        _wait_until(lambda: _halves(output) == [3.0, 2.0])
+
+
+class _Polls(object):
+    # Stands in for the stop event of the service thread: lets it poll once
+    # per scripted output position
+    def __init__(self, output, counts, monkeypatch):
+        self._counts = iter(counts)
+        self.current = 0
+        monkeypatch.setattr(ul, 'get_status', lambda board_num, function_type: (
+            1, self.current, 0))
+        output._stop_requested = self
+
+    def wait(self, timeout=None):
+        self.current = next(self._counts, None)
+        return self.current is None
+
+
+def _output():
+    output = WaveformOutput(0, 0, 1000, ULRange.BIP10VOLTS, np.ones(10), latency=0.05,
+                            resolution=16)
+    output._data = np.zeros(output.buffer_count, np.uint16)
+    return output
+
+
+def test_late_halves_consume_queued_segments(monkeypatch):
+    output = _output()
+    half = output.half_size
+    for amplitude in (1.0, 2.0, 3.0, 4.0):
+        assert output.queue_segment(amplitude, half / 1000.0) == half
+    keys = []
+    real_next_key = output._next_key
+
+    def next_key(seq):
+        key, is_segment = real_next_key(seq)
+        keys.append((seq, key[0], is_segment))
+        return key, is_segment
+    monkeypatch.setattr(output, '_next_key', next_key)
+
+    output._write_half(0)
+    output._write_half(1)
+    # The output jumps from half 0 to the middle of half 3: halves 2 and 3
+    # were never written, but the segments they stood for are used up
+    _Polls(output, [0, 3 * half + half // 2], monkeypatch)
+    output._run()
+
+    assert output.late_halves == 2
+    # Half 4, written ahead of the output, returns to the steady amplitude
+    assert [seq for seq, _, _ in keys] == [0, 1, 2, 3, 4]
+    assert [amplitude for _, amplitude, _ in keys] == [1.0, 2.0, 3.0, 4.0, 0.0]
+    assert [is_segment for _, _, is_segment in keys] == [True] * 4 + [False]
+    assert output.pending_segments == 0
+    assert output._written_seq == 4
+
+
+def test_steady_half_written_ahead(monkeypatch):
+    output = _output()
+    half = output.half_size
+    output._write_half(0)
+    output._write_half(1)
+    _Polls(output, [half // 2, half + half // 2], monkeypatch)
+    output._run()
+    assert output.late_halves == 0
+    assert output._written_seq == 2
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from mcculw import ul
+from mcculw.enums import ULRange
+from mcculw.waveforms import WaveformSynth, period_table, register_shape, shapes, tile
+
+
+def _volts(counts):
+    return ul.to_eng_units_array(0, ULRange.BIP10VOLTS, counts, 16)
+
+
+def test_period_table_holds_whole_cycles():
+    table = period_table('sine', 300, 1000)
+    assert len(table.samples) == 10
+    assert table.cycles == 3
+    assert table.frequency == 300.0
+    np.testing.assert_allclose(table.samples, np.sin(2 * np.pi * 0.3 * np.arange(10)),
+                               atol=1e-12)
+    assert not table.samples.flags.writeable
+    assert period_table('sine', 300, 1000) is table
+
+
+def test_period_table_shapes():
+    np.testing.assert_array_equal(period_table('square', 250, 1000).samples, [1, 1, -1, -1])
+    np.testing.assert_allclose(period_table('triangle', 250, 1000).samples, [0, 1, 0, -1])
+    np.testing.assert_allclose(period_table('ramp', 250, 1000).samples, [0, 0.25, 0.5, 0.75])
+    with pytest.raises(ValueError):
+        period_table('sine', 600, 1000)
+    with pytest.raises(ValueError):
+        period_table('unknown', 100, 1000)
+
+
+def test_register_shape():
+    register_shape('steps', [0.0, 1.0])
+    assert 'steps' in shapes()
+    np.testing.assert_allclose(period_table('steps', 250, 1000).samples, [0, 0.5, 1, 0.5])
+
+
+def test_tile():
+    out = np.zeros(11, np.int64)
+    assert tile(np.arange(4), out, start=3) == 2
+    np.testing.assert_array_equal(out, [3, 0, 1, 2, 3, 0, 1, 2, 3, 0, 1])
+
+
+def test_phase_continuous_across_segments():
+    # 300 Hz at 1000 samples per second: the table holds 3 cycles in 10
+    # samples, and segments start in the middle of it
+    synth = WaveformSynth(0, 1000, ULRange.BIP10VOLTS, resolution=16)
+    counts = np.concatenate([synth.generate(size, 'sine', 300, 5.0) for size in (7, 13, 4)])
+    expected = 5.0 * np.sin(2 * np.pi * 0.3 * np.arange(24))
+    np.testing.assert_allclose(_volts(counts), expected, atol=1e-3)
+    assert abs(synth.phase - 0.2) < 1e-9
+
+
+def test_phase_carries_over_frequency_change():
+    synth = WaveformSynth(0, 1000, ULRange.BIP10VOLTS, resolution=16)
+    synth.generate(8, 'sine', 50, 5.0)
+    assert abs(synth.phase - 0.4) < 1e-9
+    counts = synth.generate(16, 'sine', 100, 2.0, offset=1.0)
+    expected = 1.0 + 2.0 * np.sin(2 * np.pi * (0.4 + 0.1 * np.arange(16)))
+    np.testing.assert_allclose(_volts(counts), expected, atol=1e-3)
+    synth.reset(0.25)
+    np.testing.assert_allclose(_volts(synth.generate(1, 'sine', 50, 5.0)), [5.0], atol=1e-3)